@@ -0,0 +1,219 @@
+"""
+WSGI 与 ASGI 服务模式对比：在同一份合成数据上分别启动两种服务，用 load_test 的同一负载施压，
+并在压测期间挂上若干空闲 keep-alive 连接或 /api/events（SSE）订阅，比较吞吐、延迟分位数、错误率
+以及长连接是否都被服务。
+
+用法:
+    python bench/compare_servers.py --scale 1 --concurrency 32 --duration 15 --idle 0,1000 --sse 200
+    python bench/compare_servers.py --modes asgi --idle 0,5000 --sse 2000,5000 --out servers.json
+
+默认命令（需要已安装 gunicorn / uvicorn，可用 --wsgi-cmd / --asgi-cmd 覆盖，{python} {port} {threads} 会被替换）:
+    wsgi: python -m gunicorn server.app:app -k gthread -w 1 --threads {threads} --worker-connections 10000
+    asgi: python -m uvicorn server.asgi:app --limit-concurrency 100000（线程池大小由 ASGI_DB_WORKERS={threads} 指定）
+两者的 keep-alive 超时都放宽到 300s，保证空闲连接在压测期间不被服务端主动关闭。
+"""
+import argparse
+import http.client
+import json
+import os
+import shlex
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+ROOT_DIR = Path(__file__).parent.parent
+if str(ROOT_DIR) not in sys.path:
+    sys.path.insert(0, str(ROOT_DIR))
+
+from bench.load_test import Client, Recorder, Workload, discover_shop_names, login_users, parse_users, run_step
+from bench.run_benchmarks import prepare_db
+
+DEFAULT_COMMANDS = {
+    "wsgi": "{python} -m gunicorn server.app:app -k gthread -w 1 --threads {threads} --worker-connections 10000 "
+            "--keep-alive 300 -b 127.0.0.1:{port} --log-level warning",
+    "asgi": "{python} -m uvicorn server.asgi:app --host 127.0.0.1 --port {port} --limit-concurrency 100000 "
+            "--timeout-keep-alive 300 --log-level warning",
+}
+
+
+def wait_ready(port: int, timeout: float) -> bool:
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=2)
+            conn.request("GET", "/api/ready")
+            if conn.getresponse().status == 200:
+                return True
+        except OSError:
+            pass
+        time.sleep(0.2)
+    return False
+
+
+def read_response(sock: socket.socket) -> bytes:
+    """读完一个带 Content-Length 的响应，返回状态行与响应头"""
+    data = b""
+    while b"\r\n\r\n" not in data:
+        chunk = sock.recv(65536)
+        if not chunk:
+            raise OSError("连接被关闭")
+        data += chunk
+    head, _, body = data.partition(b"\r\n\r\n")
+    length = 0
+    for line in head.split(b"\r\n")[1:]:
+        name, _, value = line.partition(b":")
+        if name.strip().lower() == b"content-length":
+            length = int(value)
+    while len(body) < length:
+        chunk = sock.recv(65536)
+        if not chunk:
+            raise OSError("连接被关闭")
+        body += chunk
+    return head
+
+
+def open_idle_connections(port: int, count: int) -> List[socket.socket]:
+    """每个连接先完成一次 keep-alive 请求，然后保持空闲（模拟长连接客户端）"""
+    request = b"GET /api/health HTTP/1.1\r\nHost: 127.0.0.1\r\nConnection: keep-alive\r\n\r\n"
+    sockets = []
+    for _ in range(count):
+        try:
+            s = socket.create_connection(("127.0.0.1", port), timeout=10)
+            s.sendall(request)
+            read_response(s)
+            sockets.append(s)
+        except OSError:
+            break
+    return sockets
+
+
+def open_sse_subscribers(port: int, count: int, timeout: float) -> List[socket.socket]:
+    """订阅 /api/events；收到首个事件之前超时的订阅（没有空闲线程服务它）不计入"""
+    request = b"GET /api/events HTTP/1.1\r\nHost: 127.0.0.1\r\nAccept: text/event-stream\r\n\r\n"
+    sockets = []
+    for _ in range(count):
+        s = None
+        try:
+            s = socket.create_connection(("127.0.0.1", port), timeout=timeout)
+            s.sendall(request)
+            data = b""
+            while b"event: catalog" not in data:
+                chunk = s.recv(65536)
+                if not chunk:
+                    raise OSError("连接被关闭")
+                data += chunk
+            sockets.append(s)
+        except OSError:
+            if s is not None:
+                s.close()
+            break
+    return sockets
+
+
+def alive(sockets: List[socket.socket]) -> int:
+    """压测结束后仍能在原连接上完成请求的空闲连接数"""
+    request = b"GET /api/health HTTP/1.1\r\nHost: 127.0.0.1\r\n\r\n"
+    count = 0
+    for s in sockets:
+        try:
+            s.sendall(request)
+            if read_response(s).startswith(b"HTTP/1.1 200"):
+                count += 1
+        except OSError:
+            pass
+    return count
+
+
+def bench_mode(mode: str, command: str, db_path: str, args, levels: List[Tuple[str, int]]) -> Dict[str, Any]:
+    # 每种模式用一份独立的数据库副本（toggle 场景会写库）
+    mode_db = os.path.join(args.workdir, f"servers_{mode}.db")
+    shutil.copyfile(db_path, mode_db)
+    env = dict(os.environ, DB_PATH=mode_db, RATE_LIMIT_RATE="0", SHED_MAX_IN_FLIGHT="0", SHED_P99_MS="0",
+               ASGI_DB_WORKERS=str(args.threads), ASGI_MAX_PENDING=str(args.threads * 64))
+    argv = shlex.split(command.format(python=sys.executable, port=args.port, threads=args.threads))
+    # 单独的进程组：结束时连同 gunicorn / uvicorn 的 worker 子进程一起终止
+    proc = subprocess.Popen(argv, cwd=str(ROOT_DIR), env=env, start_new_session=True)
+    try:
+        if not wait_ready(args.port, args.startup_timeout):
+            raise RuntimeError(f"{mode} 服务未能在 {args.startup_timeout}s 内就绪")
+        client = Client(f"http://127.0.0.1:{args.port}", args.timeout)
+        user_tokens = login_users(client, parse_users(args.users), args.password)
+        shop_names = discover_shop_names(client)
+        steps = {}
+        for kind, count in levels:
+            if kind == "sse":
+                sockets = open_sse_subscribers(args.port, count, args.sse_timeout)
+            else:
+                sockets = open_idle_connections(args.port, count)
+            workload = Workload(client, Recorder(), user_tokens, shop_names, {
+                "page_load": 3, "home_feed": 4, "search": 2, "toggle": 1}, args.seed)
+            step = run_step(workload, args.concurrency, 0, args.duration)
+            overall = step["overall"]
+            overall["held_requested"] = count
+            overall["held_opened"] = len(sockets)
+            # SSE 连接上不能再发请求，只检查空闲 keep-alive 连接压测后是否仍可用
+            overall["held_alive"] = len(sockets) if kind == "sse" else alive(sockets)
+            for s in sockets:
+                s.close()
+            steps[f"{kind}={count}"] = step
+            print(f"  {mode} {kind}={count:<6} 请求/s={overall['throughput_per_s']:<8} p50={overall['p50_ms']}ms "
+                  f"p99={overall['p99_ms']}ms 错误率={overall['error_rate']:.2%} "
+                  f"长连接={overall['held_alive']}/{count}")
+        return {"command": " ".join(argv), "steps": steps}
+    finally:
+        os.killpg(proc.pid, signal.SIGTERM)
+        try:
+            proc.wait(10)
+        except subprocess.TimeoutExpired:
+            os.killpg(proc.pid, signal.SIGKILL)
+            proc.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SaveBite WSGI / ASGI 服务模式对比")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--scale", type=float, default=1.0)
+    parser.add_argument("--modes", default="wsgi,asgi")
+    parser.add_argument("--wsgi-cmd", default=DEFAULT_COMMANDS["wsgi"])
+    parser.add_argument("--asgi-cmd", default=DEFAULT_COMMANDS["asgi"])
+    parser.add_argument("--threads", type=int, default=16, help="WSGI 线程数 / ASGI 数据库线程池大小")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=15)
+    parser.add_argument("--idle", default="0,1000", help="逗号分隔的空闲 keep-alive 连接数")
+    parser.add_argument("--sse", default="200", help="逗号分隔的 /api/events 订阅数")
+    parser.add_argument("--sse-timeout", type=float, default=3, help="等待 SSE 首个事件的超时（秒）")
+    parser.add_argument("--port", type=int, default=5077)
+    parser.add_argument("--users", default="user0-user99")
+    parser.add_argument("--password", default="123456")
+    parser.add_argument("--timeout", type=float, default=10)
+    parser.add_argument("--startup-timeout", type=float, default=60)
+    parser.add_argument("--workdir", default=os.path.join(tempfile.gettempdir(), "savebite_bench"))
+    parser.add_argument("--out", help="结果 JSON 输出路径")
+    args = parser.parse_args()
+
+    os.makedirs(args.workdir, exist_ok=True)
+    db_path = prepare_db(args.seed, args.scale, args.workdir)
+    levels = [("idle", int(n)) for n in args.idle.split(",") if n != ""]
+    levels += [("sse", int(n)) for n in args.sse.split(",") if n != ""]
+    commands = {"wsgi": args.wsgi_cmd, "asgi": args.asgi_cmd}
+
+    results = {}
+    for mode in args.modes.split(","):
+        print(f"▶ {mode}: {commands[mode]}")
+        results[mode] = bench_mode(mode, commands[mode], db_path, args, levels)
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump({"concurrency": args.concurrency, "threads": args.threads, "duration": args.duration,
+                       "results": results}, f, ensure_ascii=False, indent=2)
+        print(f"✅ 结果已写入 {args.out}")
+
+
+if __name__ == "__main__":
+    main()
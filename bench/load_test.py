@@ -0,0 +1,326 @@
+"""
+流量回放压测：按前端真实调用比例对本地实例施压，报告各接口延迟直方图、错误率与饱和点。
+
+场景（权重可调）:
+    page_load  /api/auth/me → /api/user/favorites      (app.js 页面加载)
+    home_feed  /api/restaurants/search                  (home.js 首页推荐)
+    search     /api/restaurants/search?keyword=...      (search.js 搜索)
+    toggle     /api/favorite/toggle                     (收藏 / 取消收藏)
+
+用法:
+    python server/app.py &     # 或 gunicorn server.app:app -w 4
+    python bench/load_test.py --base-url http://127.0.0.1:5000 --concurrency 32 --rate 50 --duration 20
+    python bench/load_test.py --ramp 10,20,40,80,160 --duration 15 --out load.json
+"""
+import argparse
+import bisect
+import http.client
+import json
+import random
+import sys
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import quote, urlsplit
+
+ROOT_DIR = Path(__file__).parent.parent
+if str(ROOT_DIR) not in sys.path:
+    sys.path.insert(0, str(ROOT_DIR))
+
+from bench.run_benchmarks import summarize
+from bench.synthetic_data import CUISINE_WORDS
+
+DEFAULT_MIX = {"page_load": 3, "home_feed": 4, "search": 2, "toggle": 1}
+HIST_BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+
+
+class Recorder:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+        self.status: Dict[int, int] = defaultdict(int)
+        self.scenarios_started = 0
+        self.scenarios_dropped = 0
+
+    def add(self, name: str, elapsed: float, status: int) -> None:
+        with self.lock:
+            self.latencies[name].append(elapsed)
+            self.status[status] += 1
+            if status == 0 or status >= 400:
+                self.errors[name] += 1
+
+
+class Client:
+    """每个线程一个 keep-alive 连接"""
+
+    def __init__(self, base_url: str, timeout: float):
+        parts = urlsplit(base_url)
+        self.host = parts.hostname or "127.0.0.1"
+        self.port = parts.port or 80
+        self.timeout = timeout
+        self.local = threading.local()
+
+    def _conn(self) -> http.client.HTTPConnection:
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = self.local.conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+        return conn
+
+    def request(self, method: str, path: str, headers: Optional[Dict[str, str]] = None,
+                body: Optional[Dict[str, Any]] = None) -> Tuple[int, Optional[Dict[str, Any]]]:
+        headers = dict(headers or {})
+        payload = None
+        if body is not None:
+            payload = json.dumps(body).encode()
+            headers["Content-Type"] = "application/json"
+        try:
+            conn = self._conn()
+            conn.request(method, path, body=payload, headers=headers)
+            resp = conn.getresponse()
+            data = resp.read()
+            try:
+                parsed = json.loads(data) if data else None
+            except ValueError:
+                parsed = None
+            return resp.status, parsed
+        except (OSError, http.client.HTTPException):
+            # 连接出错时丢弃，下次重建
+            self.local.conn = None
+            return 0, None
+
+
+class Workload:
+    def __init__(self, client: Client, recorder: Recorder, user_tokens: List[str],
+                 shop_names: List[str], mix: Dict[str, int], seed: int):
+        self.client = client
+        self.recorder = recorder
+        self.user_tokens = user_tokens
+        self.shop_names = shop_names or ["安格斯·牛肉拌饭"]
+        self.names = list(mix)
+        self.weights = [mix[n] for n in self.names]
+        self.rng = random.Random(seed)
+        self.rng_lock = threading.Lock()
+
+    def _call(self, name: str, method: str, path: str, headers=None, body=None, start: Optional[float] = None):
+        """start：计时起点，默认为发出请求时；开环模式传入计划到达时间，排队等待也计入延迟"""
+        if start is None:
+            start = time.perf_counter()
+        status, data = self.client.request(method, path, headers, body)
+        self.recorder.add(name, time.perf_counter() - start, status)
+        return status, data
+
+    def run_one(self, scheduled_at: Optional[float] = None) -> None:
+        """scheduled_at：开环模式下该场景的计划到达时间（避免协调遗漏：线程池积压的时间算进第一个请求的延迟）"""
+        with self.rng_lock:
+            scenario = self.rng.choices(self.names, self.weights)[0]
+            token = self.rng.choice(self.user_tokens)
+            keyword = self.rng.choice(CUISINE_WORDS)
+            shop = self.rng.choice(self.shop_names)
+        headers = {"Authorization": f"Bearer {token}"}
+        if scenario == "page_load":
+            status, _ = self._call("auth_me", "GET", "/api/auth/me", headers, start=scheduled_at)
+            if status == 200:
+                self._call("user_favorites", "GET", "/api/user/favorites", headers)
+        elif scenario == "home_feed":
+            self._call("home_feed", "GET", "/api/restaurants/search", headers, start=scheduled_at)
+        elif scenario == "search":
+            self._call("search", "GET", f"/api/restaurants/search?keyword={quote(keyword)}", headers,
+                       start=scheduled_at)
+        elif scenario == "toggle":
+            self._call("toggle", "POST", "/api/favorite/toggle", headers, {"shop_name": shop}, start=scheduled_at)
+
+
+def login_users(client: Client, usernames: List[str], password: str) -> List[str]:
+    """压测前逐个登录，拿到签名令牌后复用（登录本身不计入压测结果）"""
+    tokens = []
+    for username in usernames:
+        status, data = client.request("POST", "/api/auth/login", body={"username": username, "password": password})
+        if status == 200 and data and data.get("token"):
+            tokens.append(data["token"])
+    return tokens
+
+
+def discover_shop_names(client: Client, limit: int = 200) -> List[str]:
+    names = []
+    for keyword in CUISINE_WORDS:
+        status, data = client.request("GET", f"/api/restaurants/search?keyword={quote(keyword)}")
+        if status == 200 and data:
+            names.extend(r["name"] for r in data.get("restaurants", []))
+        if len(names) >= limit:
+            break
+    return names[:limit]
+
+
+def run_step(workload: Workload, concurrency: int, rate: float, duration: float) -> Dict[str, Any]:
+    """
+    rate > 0：开环，按固定到达率派发场景（积压超过 concurrency*4 时丢弃并计数），延迟从计划到达时间算起；
+    rate = 0：闭环，concurrency 个线程尽快循环执行。
+    """
+    recorder = Recorder()
+    workload.recorder = recorder
+    deadline = time.perf_counter() + duration
+    start = time.perf_counter()
+
+    if rate <= 0:
+        def loop():
+            while time.perf_counter() < deadline:
+                workload.run_one()
+                with recorder.lock:
+                    recorder.scenarios_started += 1
+        threads = [threading.Thread(target=loop, daemon=True) for _ in range(concurrency)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+    else:
+        inflight = threading.Semaphore(concurrency * 4)
+        interval = 1.0 / rate
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            next_at = time.perf_counter()
+            while next_at < deadline:
+                now = time.perf_counter()
+                if next_at > now:
+                    time.sleep(next_at - now)
+                scheduled_at = next_at
+                next_at += interval
+                if not inflight.acquire(blocking=False):
+                    recorder.scenarios_dropped += 1
+                    continue
+                recorder.scenarios_started += 1
+                future = pool.submit(workload.run_one, scheduled_at)
+                future.add_done_callback(lambda _f: inflight.release())
+    wall = time.perf_counter() - start
+
+    endpoints = {}
+    all_samples = []
+    for name, samples in recorder.latencies.items():
+        stats = summarize(samples, wall)
+        stats["errors"] = recorder.errors.get(name, 0)
+        stats["error_rate"] = round(stats["errors"] / len(samples), 4) if samples else 0
+        stats["histogram_ms"] = histogram(samples)
+        endpoints[name] = stats
+        all_samples.extend(samples)
+
+    total_errors = sum(recorder.errors.values())
+    overall = summarize(all_samples, wall)
+    overall.update({
+        "target_rate": rate,
+        "concurrency": concurrency,
+        "scenarios_per_s": round(recorder.scenarios_started / wall, 2),
+        "scenarios_dropped": recorder.scenarios_dropped,
+        "errors": total_errors,
+        "error_rate": round(total_errors / len(all_samples), 4) if all_samples else 0,
+        "status": dict(sorted(recorder.status.items()))
+    })
+    return {"overall": overall, "endpoints": endpoints}
+
+
+def histogram(samples: List[float]) -> Dict[str, int]:
+    """按 HIST_BUCKETS_MS 顺序返回各桶计数（省略空桶）"""
+    labels = [f"<={b}" for b in HIST_BUCKETS_MS] + [f">{HIST_BUCKETS_MS[-1]}"]
+    counts = [0] * len(labels)
+    for s in samples:
+        counts[bisect.bisect_left(HIST_BUCKETS_MS, s * 1000)] += 1
+    return {label: c for label, c in zip(labels, counts) if c}
+
+
+def is_saturated(step: Dict[str, Any], p99_limit_ms: float, max_error_rate: float) -> bool:
+    o = step["overall"]
+    behind = o["target_rate"] > 0 and o["scenarios_per_s"] < 0.9 * o["target_rate"]
+    return behind or o["scenarios_dropped"] > 0 or o["p99_ms"] > p99_limit_ms or o["error_rate"] > max_error_rate
+
+
+def print_step(step: Dict[str, Any]) -> None:
+    o = step["overall"]
+    print(f"\n▶ rate={o['target_rate'] or 'closed-loop'} concurrency={o['concurrency']} "
+          f"场景/s={o['scenarios_per_s']} 请求/s={o['throughput_per_s']} "
+          f"p50={o['p50_ms']}ms p99={o['p99_ms']}ms 错误率={o['error_rate']:.2%} 丢弃={o['scenarios_dropped']}")
+    for name, s in sorted(step["endpoints"].items()):
+        print(f"  {name:<15} n={s['n']:<6} p50={s['p50_ms']:<8} p90={s['p90_ms']:<8} p99={s['p99_ms']:<8} "
+              f"err={s['error_rate']:.2%}")
+        total = max(1, s["n"])
+        for bucket, count in s["histogram_ms"].items():
+            print(f"      {bucket:>8}ms {'█' * max(1, int(40 * count / total))} {count}")
+
+
+def parse_users(text: str) -> List[str]:
+    """"user0-user99" 形式的范围或逗号分隔的用户名列表"""
+    if "," not in text and "-" in text:
+        lo, _, hi = text.partition("-")
+        prefix = lo.rstrip("0123456789")
+        if prefix and hi.startswith(prefix) and lo[len(prefix):].isdigit() and hi[len(prefix):].isdigit():
+            return [f"{prefix}{i}" for i in range(int(lo[len(prefix):]), int(hi[len(prefix):]) + 1)]
+    return [u for u in text.split(",") if u]
+
+
+def parse_mix(text: Optional[str]) -> Dict[str, int]:
+    if not text:
+        return dict(DEFAULT_MIX)
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        if name not in DEFAULT_MIX:
+            raise ValueError(f"未知场景: {name}")
+        mix[name] = int(weight)
+    return mix
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SaveBite 流量回放压测")
+    parser.add_argument("--base-url", default="http://127.0.0.1:5000")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--rate", type=float, default=0, help="每秒场景数，0 为闭环")
+    parser.add_argument("--ramp", help="逐级提高速率寻找饱和点，如 10,20,40,80")
+    parser.add_argument("--duration", type=float, default=15, help="每级持续秒数")
+    parser.add_argument("--mix", help="场景权重，如 page_load=3,home_feed=4,search=2,toggle=1")
+    parser.add_argument("--users", default="user0-user99",
+                        help="登录用户名范围（合成数据为 user0..userN），或逗号分隔的用户名")
+    parser.add_argument("--password", default="123456")
+    parser.add_argument("--timeout", type=float, default=10)
+    parser.add_argument("--p99-limit-ms", type=float, default=500)
+    parser.add_argument("--max-error-rate", type=float, default=0.01)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--out", help="结果 JSON 输出路径")
+    args = parser.parse_args()
+
+    client = Client(args.base_url, args.timeout)
+    user_tokens = login_users(client, parse_users(args.users), args.password)
+    if not user_tokens:
+        print("❌ 没有用户登录成功，请检查 --users / --password")
+        sys.exit(1)
+    shop_names = discover_shop_names(client)
+    if not shop_names:
+        print(f"❌ 无法从 {args.base_url} 获取店铺列表，请确认服务已启动")
+        sys.exit(1)
+
+    workload = Workload(client, Recorder(), user_tokens, shop_names, parse_mix(args.mix), args.seed)
+    rates = [float(r) for r in args.ramp.split(",")] if args.ramp else [args.rate]
+
+    steps = []
+    saturation = None
+    for rate in rates:
+        step = run_step(workload, args.concurrency, rate, args.duration)
+        steps.append(step)
+        print_step(step)
+        if is_saturated(step, args.p99_limit_ms, args.max_error_rate):
+            saturation = rate
+            print(f"\n⚠️ 在 rate={rate} 处达到饱和")
+            break
+
+    if args.ramp and saturation is None:
+        print("\n✅ 所有速率均未饱和")
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump({
+                "base_url": args.base_url, "concurrency": args.concurrency,
+                "mix": parse_mix(args.mix), "saturation_rate": saturation, "steps": steps
+            }, f, ensure_ascii=False, indent=2)
+        print(f"✅ 结果已写入 {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,407 @@
+"""
+基准测试：在合成数据上测量各接口与导入流程的延迟分位数、吞吐量和峰值内存，结果写成 JSON 便于跨提交对比。
+
+用法:
+    python bench/run_benchmarks.py --seed 42 --scale 10 --out results.json
+    python bench/run_benchmarks.py --scale 10 --compare old.json --out new.json
+    python bench/run_benchmarks.py --scale 1 --only search_keyword,dish_compare
+    python bench/run_benchmarks.py --only recommend --recommend-scale 100   # 10 万店铺组的推荐相似度
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import random
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+ROOT_DIR = Path(__file__).parent.parent
+if str(ROOT_DIR) not in sys.path:
+    sys.path.insert(0, str(ROOT_DIR))
+
+from bench.synthetic_data import SyntheticCatalog, CITY_CENTER, CUISINE_WORDS, DISH_MAIN
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    k = (len(sorted_values) - 1) * q
+    lo = int(k)
+    hi = min(lo + 1, len(sorted_values) - 1)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (k - lo)
+
+
+def summarize(samples: List[float], wall: float, peak_bytes: Optional[int] = None) -> Dict[str, Any]:
+    ordered = sorted(samples)
+    ms = lambda v: round(v * 1000, 3)
+    return {
+        "n": len(samples),
+        "mean_ms": ms(sum(samples) / len(samples)) if samples else 0,
+        "p50_ms": ms(percentile(ordered, 0.50)),
+        "p90_ms": ms(percentile(ordered, 0.90)),
+        "p99_ms": ms(percentile(ordered, 0.99)),
+        "max_ms": ms(ordered[-1]) if ordered else 0,
+        "throughput_per_s": round(len(samples) / wall, 2) if wall > 0 else 0,
+        "peak_mem_kb": round(peak_bytes / 1024, 1) if peak_bytes is not None else None
+    }
+
+
+def measure(fn: Callable[[int], Any], iterations: int, warmup: int = 3) -> Dict[str, Any]:
+    """先跑若干次热身，再计时 iterations 次；最后单独跑一次 tracemalloc 测峰值内存（避免干扰计时）"""
+    for i in range(warmup):
+        fn(i)
+    gc.collect()
+    samples = []
+    wall_start = time.perf_counter()
+    for i in range(iterations):
+        start = time.perf_counter()
+        fn(i)
+        samples.append(time.perf_counter() - start)
+    wall = time.perf_counter() - wall_start
+
+    tracemalloc.start()
+    fn(iterations)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return summarize(samples, wall, peak)
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT_DIR, stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except Exception:
+        return None
+
+
+# ======================
+# 导入基准
+# ======================
+def bench_ingest(seed: int, scale: float, workdir: str) -> Dict[str, Any]:
+    """load_data_from_json 在 scale 规模 JSON 上的耗时 / 行吞吐 / 峰值内存（逐行提交，规模宜小）"""
+    from server.FoodPriceDB import FoodPriceDB
+    from server.utils import load_data_from_json
+
+    json_path = os.path.join(workdir, f"ingest_{seed}_{scale}.json")
+    SyntheticCatalog(seed, scale).write_json(json_path)
+    with open(json_path, encoding="utf-8") as f:
+        data = json.load(f)
+    rows = sum(len(data[k]) for k in ("users", "shops", "dishes", "coupons"))
+
+    db_path = os.path.join(workdir, f"ingest_{seed}_{scale}.db")
+    if os.path.exists(db_path):
+        os.remove(db_path)
+    db = FoodPriceDB()
+    db.initialize(db_path)
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    load_data_from_json(db, json_path)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    db.close_thread_resources()
+    return {
+        "rows": rows,
+        "seconds": round(elapsed, 3),
+        "rows_per_s": round(rows / elapsed, 1) if elapsed else 0,
+        "peak_mem_kb": round(peak / 1024, 1)
+    }
+
+
+# ======================
+# 集合查询基准
+# ======================
+SET_QUERY_SIZES = (10, 1000, 50000)
+
+
+def bench_set_queries(db_path: str, seed: int, iterations: int = 30) -> Dict[str, Any]:
+    """
+    按 ID 集合查店铺的三种写法：动态占位符 IN (?,?,...)、json_each(?)、临时表。
+    cold_ms 为新连接上第一次执行（含语句编译），prepare_ms ≈ cold_ms - p50_ms；
+    占位符写法每次集合大小略有不同（真实请求如此），语句文本随之变化，无法命中语句缓存。
+    """
+    from server.FoodPriceDB import id_set
+
+    conn = sqlite3.connect(db_path)
+    all_ids = [r[0] for r in conn.execute("SELECT shop_id FROM shops")]
+    conn.close()
+    rng = random.Random(seed)
+    limit_conn = sqlite3.connect(":memory:")
+    max_variables = limit_conn.getlimit(sqlite3.SQLITE_LIMIT_VARIABLE_NUMBER) \
+        if hasattr(limit_conn, "getlimit") else 32766
+    limit_conn.close()
+
+    def placeholders(conn, ids):
+        return conn.execute(
+            f"SELECT shop_id, shop_name FROM shops WHERE shop_id IN ({','.join('?' * len(ids))})", ids).fetchall()
+
+    def json_each(conn, ids):
+        return conn.execute(
+            "SELECT shop_id, shop_name FROM shops WHERE shop_id IN (SELECT value FROM json_each(?))",
+            (id_set(ids),)).fetchall()
+
+    def temp_table(conn, ids):
+        conn.execute("CREATE TEMP TABLE IF NOT EXISTS id_set (id INTEGER PRIMARY KEY)")
+        conn.execute("DELETE FROM id_set")
+        conn.executemany("INSERT OR IGNORE INTO id_set (id) VALUES (?)", ((i,) for i in ids))
+        return conn.execute(
+            "SELECT s.shop_id, s.shop_name FROM id_set t JOIN shops s ON s.shop_id = t.id").fetchall()
+
+    results: Dict[str, Any] = {"max_variables": max_variables}
+    for size in SET_QUERY_SIZES:
+        sets = [rng.sample(all_ids, min(len(all_ids), max(1, size + rng.randint(-5, 5))))
+                for _ in range(iterations + 1)]
+        for name, fn in (("placeholders", placeholders), ("json_each", json_each), ("temp_table", temp_table)):
+            key = f"{name}_{size}"
+            if name == "placeholders" and size + 5 > max_variables:
+                results[key] = {"error": f"超过 SQLITE_MAX_VARIABLE_NUMBER ({max_variables})"}
+                continue
+            conn = sqlite3.connect(db_path)
+            start = time.perf_counter()
+            fn(conn, sets[0])
+            cold = time.perf_counter() - start
+            samples = []
+            wall_start = time.perf_counter()
+            for ids in sets[1:]:
+                start = time.perf_counter()
+                fn(conn, ids)
+                samples.append(time.perf_counter() - start)
+            stats = summarize(samples, time.perf_counter() - wall_start)
+            conn.close()
+            stats.pop("peak_mem_kb")
+            stats["cold_ms"] = round(cold * 1000, 3)
+            stats["prepare_ms"] = round(max(0.0, stats["cold_ms"] - stats["p50_ms"]), 3)
+            results[key] = stats
+    return results
+
+
+# ======================
+# 接口基准
+# ======================
+def prepare_db(seed: int, scale: float, workdir: str) -> str:
+    """按 (seed, scale) 缓存批量导入后的数据库文件，重复运行时直接复用"""
+    from server.FoodPriceDB import FoodPriceDB
+
+    db_path = os.path.join(workdir, f"synthetic_{seed}_{scale}.db")
+    if os.path.exists(db_path):
+        return db_path
+    tmp_path = db_path + ".partial"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    db = FoodPriceDB()
+    db.initialize(tmp_path)
+    start = time.perf_counter()
+    counts = SyntheticCatalog(seed, scale).bulk_load(db)
+    print(f"📦 已生成基准数据库 {counts}，耗时 {time.perf_counter() - start:.1f}s")
+    os.replace(tmp_path, db_path)
+    return db_path
+
+
+def endpoint_cases(client, tokens, db_path: str, seed: int) -> Dict[str, Callable[[int], Any]]:
+    conn = sqlite3.connect(db_path)
+    rng = random.Random(seed)
+    # 收藏最多的若干用户，以及一批已存在的店名
+    heavy_users = [r[0] for r in conn.execute(
+        "SELECT user_id FROM user_favorites GROUP BY user_id ORDER BY COUNT(*) DESC LIMIT 20")] or [1]
+    shop_names = [r[0] for r in conn.execute("SELECT shop_name FROM shops ORDER BY RANDOM() LIMIT 200")]
+    conn.close()
+    keywords = CUISINE_WORDS[:]
+    dishes = DISH_MAIN[:]
+    auth = {uid: {"Authorization": f"Bearer {tokens.issue(uid)}"} for uid in heavy_users}
+    user = heavy_users[0]
+    token = tokens.issue(user)
+
+    def check(resp):
+        if resp.status_code >= 400:
+            raise RuntimeError(f"{resp.request.path} -> {resp.status_code}")
+        return resp
+
+    return {
+        "home_feed": lambda i: check(client.get("/api/restaurants/search")),
+        "home_feed_personal": lambda i: check(client.get(
+            "/api/restaurants/search", headers=auth[heavy_users[i % len(heavy_users)]])),
+        "search_keyword": lambda i: check(client.get(
+            "/api/restaurants/search", query_string={"keyword": keywords[i % len(keywords)]},
+            headers=auth[user])),
+        "get_favorites": lambda i: check(client.get(
+            "/api/user/favorites", headers=auth[heavy_users[i % len(heavy_users)]])),
+        "toggle_favorite": lambda i: check(client.post(
+            "/api/favorite/toggle", json={"shop_name": shop_names[(i // 2) % len(shop_names)]},
+            headers=auth[user])),
+        "nearby_search": lambda i: check(client.get(
+            "/api/restaurants/search", query_string={
+                "lat": CITY_CENTER[0] + (i % 7 - 3) * 0.02, "lng": CITY_CENTER[1] + (i % 5 - 2) * 0.02,
+                "radius": 3}, headers=auth[user])),
+        "dish_search": lambda i: check(client.get(
+            "/api/dishes/search", query_string={"q": dishes[i % len(dishes)], "page": 1 + i % 3})),
+        "dish_compare": lambda i: check(client.get(
+            "/api/dish/compare", query_string={"dish_name": dishes[i % len(dishes)]})),
+        "auth_me": lambda i: check(client.get("/api/auth/me", headers=auth[user])),
+        # 令牌校验本身的开销（不经过 HTTP 层）
+        "token_verify": lambda i: tokens.verify(token),
+        "token_issue": lambda i: tokens.issue(user),
+    }
+
+
+def bench_endpoints(db_path: str, seed: int, iterations: int, only: Optional[List[str]]) -> Dict[str, Any]:
+    os.environ["DB_PATH"] = db_path
+    os.environ.setdefault("SQL_TRACE", "0")
+    os.environ.setdefault("STARTUP_MODE", "sync")
+    # 基准测试单客户端高频调用，关闭限流与降载
+    os.environ.setdefault("RATE_LIMIT_RATE", "0")
+    os.environ.setdefault("SHED_MAX_IN_FLIGHT", "0")
+    os.environ.setdefault("SHED_P99_MS", "0")
+    from server.app import app, router, tokens
+
+    # 推荐相似度在快照替换后由后台线程构建，计时前同步建好
+    for shard in router.shards:
+        shard.recommender.rebuild(shard.catalog.current)
+    client = app.test_client()
+    results = {}
+    for name, fn in endpoint_cases(client, tokens, db_path, seed).items():
+        if only and name not in only:
+            continue
+        print(f"⏱  {name} ...")
+        results[name] = measure(fn, iterations)
+    return results
+
+
+# ======================
+# 推荐相似度基准
+# ======================
+def bench_recommend(seed: int, scale: float, workdir: str, iterations: int) -> Dict[str, Any]:
+    """
+    离线：在 scale 规模（1.0 ≈ 1000 个店铺组）的目录快照上构建 top-k 邻居表的耗时与表大小；
+    在线：收藏数不同的用户合并邻居列表的延迟（不含卡片构建）
+    """
+    from server.FoodPriceDB import FoodPriceDB
+    from server.catalog import CatalogStore
+    from server.recommend import ItemSimilarity, Recommender
+
+    db_path = prepare_db(seed, scale, workdir)
+    db = FoodPriceDB()
+    db.initialize(db_path)
+    snapshot = CatalogStore(db, use_file=False).rebuild()
+    pairs = db.get_favorite_pairs()
+
+    gc.collect()
+    start = time.perf_counter()
+    index = ItemSimilarity.build(snapshot, pairs)
+    build_seconds = time.perf_counter() - start
+    table_bytes = sum(a.itemsize * len(a) for a in (index.offsets, index.neighbors, index.scores))
+
+    recommender = Recommender(db)
+    recommender.current = index
+    favorites: Dict[int, set] = {}
+    for user_id, shop_id in pairs:
+        favorites.setdefault(user_id, set()).add(shop_id)
+    users = sorted(favorites, key=lambda u: (-len(favorites[u]), u))[:max(1, iterations)]
+    rng = random.Random(seed)
+    samples = []
+    wall_start = time.perf_counter()
+    for i in range(iterations):
+        shop_ids = favorites[users[i % len(users)]] if i % 2 == 0 else favorites[rng.choice(users)]
+        start = time.perf_counter()
+        recommender.recommend(snapshot, shop_ids, 6)
+        samples.append(time.perf_counter() - start)
+    online = summarize(samples, time.perf_counter() - wall_start)
+    online.pop("peak_mem_kb")
+    db.close_thread_resources()
+    return {
+        "groups": len(index.group_names),
+        "favorites": len(pairs),
+        "seconds": round(build_seconds, 3),
+        "neighbors": len(index.neighbors),
+        "table_kb": round(table_bytes / 1024, 1),
+        "online": online,
+        "max_user_favorites": max((len(f) for f in favorites.values()), default=0)
+    }
+
+
+def compare(old: Dict[str, Any], new: Dict[str, Any]) -> None:
+    print(f"\n对比 {old['meta'].get('commit')} → {new['meta'].get('commit')}")
+    for name, cur in new["results"].items():
+        prev = old["results"].get(name)
+        if not prev:
+            continue
+        for key in ("p50_ms", "p99_ms", "seconds", "rows_per_s"):
+            if key in cur and key in prev and prev[key]:
+                delta = (cur[key] - prev[key]) / prev[key] * 100
+                print(f"  {name:<18} {key:<10} {prev[key]:>10} → {cur[key]:>10} ({delta:+.1f}%)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SaveBite 基准测试")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--scale", type=float, default=1.0, help="接口基准的数据规模（1.0 ≈ 1000 个店铺组）")
+    parser.add_argument("--ingest-scale", type=float, default=0.2, help="load_data_from_json 基准规模，0 跳过")
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--recommend-scale", type=float, default=0,
+                        help="推荐相似度基准的数据规模（100 ≈ 10 万店铺组），0 跳过")
+    parser.add_argument("--only", help="逗号分隔的用例名")
+    parser.add_argument("--workdir", default=os.path.join(tempfile.gettempdir(), "savebite_bench"))
+    parser.add_argument("--out", help="结果 JSON 输出路径")
+    parser.add_argument("--compare", help="与之前的结果 JSON 对比")
+    args = parser.parse_args()
+
+    os.makedirs(args.workdir, exist_ok=True)
+    only = args.only.split(",") if args.only else None
+
+    results: Dict[str, Any] = {}
+    if args.ingest_scale > 0 and (not only or "ingest" in only):
+        print("⏱  ingest ...")
+        results["ingest"] = bench_ingest(args.seed, args.ingest_scale, args.workdir)
+
+    if args.recommend_scale > 0 and (not only or "recommend" in only):
+        print("⏱  recommend ...")
+        results["recommend"] = bench_recommend(args.seed, args.recommend_scale, args.workdir, args.iterations)
+
+    db_path = prepare_db(args.seed, args.scale, args.workdir)
+    conn = sqlite3.connect(db_path)
+    row_counts = {t: conn.execute(f"SELECT COUNT(*) FROM {t}").fetchone()[0]
+                  for t in ("shops", "dishes", "coupons", "users", "user_favorites")}
+    conn.close()
+    if not only or "set_queries" in only:
+        print("⏱  set_queries ...")
+        results["set_queries"] = bench_set_queries(db_path, args.seed)
+    results.update(bench_endpoints(db_path, args.seed, args.iterations, only))
+
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "machine": platform.machine(),
+            "cpus": os.cpu_count(),
+            "seed": args.seed,
+            "scale": args.scale,
+            "ingest_scale": args.ingest_scale,
+            "recommend_scale": args.recommend_scale,
+            "iterations": args.iterations,
+            "rows": row_counts
+        },
+        "results": results
+    }
+
+    print(json.dumps(results, ensure_ascii=False, indent=2))
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"✅ 结果已写入 {args.out}")
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            compare(json.load(f), report)
+
+
+if __name__ == "__main__":
+    main()
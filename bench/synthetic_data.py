@@ -0,0 +1,267 @@
+"""
+合成数据生成器：按 seed + scale 确定性地生成与 server/data.json 同结构的店铺 / 菜品 / 满减 / 用户 / 收藏数据。
+
+scale=1 约为 1,000 个店铺组（约 1,850 个店铺、2.6 万菜品），行数随 scale 线性增长；
+scale≈400 时菜品约 10^7 行。
+
+用法:
+    python bench/synthetic_data.py --seed 42 --scale 0.5 --json /tmp/synthetic.json
+    python bench/synthetic_data.py --seed 42 --scale 50 --db /tmp/synthetic.db
+"""
+import argparse
+import json
+import os
+import random
+import sqlite3
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Tuple
+
+ROOT_DIR = Path(__file__).parent.parent
+if str(ROOT_DIR) not in sys.path:
+    sys.path.insert(0, str(ROOT_DIR))
+
+PLATFORMS = ("美团", "饿了么")
+GROUPS_PER_SCALE = 1000
+USERS_PER_SCALE = 200
+
+# 名称词表
+BRAND_WORDS = ["老", "张记", "李家", "阿婆", "小", "大", "胖哥", "川味", "湘", "粤", "东北", "西北", "金牌",
+               "一品", "好再来", "食尚", "味道", "正宗", "老街", "巷口", "吉祥", "福满", "鸿运", "兰州", "重庆"]
+CUISINE_WORDS = ["麻辣烫", "牛肉拌饭", "黄焖鸡", "烧烤", "酸菜鱼", "螺蛳粉", "牛肉面", "炸鸡", "汉堡", "披萨",
+                 "寿司", "盖浇饭", "砂锅", "饺子", "馄饨", "煲仔饭", "麻辣香锅", "冒菜", "米线", "烤肉饭",
+                 "奶茶", "咖啡", "轻食沙拉", "卤味", "鸭血粉丝"]
+BRANCH_WORDS = ["光谷", "街道口", "中关村", "世界城", "汉街", "江汉路", "关山", "鲁巷", "珞喻路", "武广",
+                "徐东", "楚河", "洪山", "青山", "汉阳", "王家湾", "积玉桥", "黄浦路", "虎泉", "卓刀泉"]
+DISH_MAIN = ["牛肉", "鸡腿", "猪排", "鸡排", "鱼片", "虾仁", "肥牛", "鸭血", "豆腐", "土豆", "排骨", "鸡丁",
+             "羊肉", "培根", "鳗鱼", "番茄", "青椒", "茄子", "蘑菇", "鸡蛋"]
+DISH_STYLE = ["香辣", "麻辣", "黑椒", "照烧", "红烧", "酸汤", "番茄", "咖喱", "孜然", "蒜香", "糖醋", "清炖"]
+DISH_STAPLE = ["拌饭", "盖饭", "面", "米线", "粉", "饭团", "汉堡", "卷饼", "套餐", "煲", "锅", "沙拉"]
+# 店铺坐标：以武汉市中心为中心的正态分布（标准差约 10km）
+CITY_CENTER = (30.5928, 114.3055)
+CITY_SPREAD_DEG = 0.09
+COUPON_LADDER = [(20, 3), (25, 4), (30, 5), (35, 6), (40, 8), (50, 10), (60, 12), (80, 16), (100, 22), (150, 35)]
+
+
+def _shop_group_name(rng: random.Random, index: int) -> str:
+    brand = rng.choice(BRAND_WORDS)
+    cuisine = rng.choice(CUISINE_WORDS)
+    branch = rng.choice(BRANCH_WORDS)
+    # 序号保证在任意 scale 下店名唯一
+    return f"{brand}{cuisine}({branch}{index}店)"
+
+
+def _dish_name(rng: random.Random) -> str:
+    return f"{rng.choice(DISH_STYLE)}{rng.choice(DISH_MAIN)}{rng.choice(DISH_STAPLE)}"
+
+
+def _menu(rng: random.Random, size: int) -> List[Tuple[str, float]]:
+    names = set()
+    while len(names) < size:
+        names.add(_dish_name(rng))
+    return [(name, round(rng.uniform(8, 68), 1)) for name in sorted(names)]
+
+
+class SyntheticCatalog:
+    """确定性合成数据；各部分按 (seed, 分组序号) 派生独立随机流，可流式生成任意规模"""
+
+    def __init__(self, seed: int = 42, scale: float = 1.0,
+                 both_platform_ratio: float = 0.85, shared_dish_ratio: float = 0.8):
+        self.seed = seed
+        self.scale = scale
+        self.group_count = max(1, int(GROUPS_PER_SCALE * scale))
+        self.user_count = max(1, int(USERS_PER_SCALE * scale))
+        self.both_platform_ratio = both_platform_ratio
+        self.shared_dish_ratio = shared_dish_ratio
+
+    def _group_rng(self, index: int) -> random.Random:
+        return random.Random(self.seed * 1_000_003 + index)
+
+    def iter_groups(self) -> Iterator[Dict[str, Any]]:
+        """每个店铺组：同名店铺在一或两个平台上的店铺信息、菜单和满减"""
+        for index in range(self.group_count):
+            rng = self._group_rng(index)
+            name = _shop_group_name(rng, index)
+            if rng.random() < self.both_platform_ratio:
+                platforms = list(PLATFORMS)
+            else:
+                platforms = [rng.choice(PLATFORMS)]
+
+            # 菜单：共享部分跨平台同名（价格略有差异），其余为平台独有
+            menu_size = rng.randint(6, 22)
+            shared = _menu(rng, max(1, int(menu_size * self.shared_dish_ratio)))
+            base_rating = rng.uniform(3.8, 4.9)
+            base_sales = int(rng.paretovariate(1.2) * 80)
+            base_time = rng.randint(20, 55)
+            distance = round(rng.uniform(0.3, 8.0), 1)
+            # 坐标用独立随机流生成，不改变其余字段的取值
+            geo_rng = random.Random(self.seed * 7919 + index)
+            latitude = round(CITY_CENTER[0] + geo_rng.gauss(0, CITY_SPREAD_DEG), 6)
+            longitude = round(CITY_CENTER[1] + geo_rng.gauss(0, CITY_SPREAD_DEG), 6)
+
+            shops = []
+            for platform in platforms:
+                extra = _menu(rng, menu_size - len(shared))
+                dishes = {n: round(p * rng.uniform(0.9, 1.15), 1) for n, p in shared}
+                for n, p in extra:
+                    dishes.setdefault(n, p)
+                coupons = rng.sample(COUPON_LADDER, rng.choice((0, 1, 1, 2, 2, 3)))
+                shops.append({
+                    "platform_name": platform,
+                    "shop_name": name,
+                    "delivery_distance": distance,
+                    "rating": round(min(5.0, base_rating + rng.uniform(-0.2, 0.2)), 1),
+                    "delivery_time": base_time + rng.randint(-5, 5),
+                    "delivery_fee": round(rng.choice((0, 0.9, 1.0, 1.5, 2.0, 2.5, 3.0, 4.0)), 1),
+                    "monthly_sales": max(0, int(base_sales * rng.uniform(0.6, 1.4))),
+                    "min_order": rng.choice((0, 15, 20, 20, 25, 30)),
+                    "avg_consumption": round(sum(dishes.values()) / len(dishes), 1),
+                    "image_url": None,
+                    "latitude": latitude,
+                    "longitude": longitude,
+                    "dishes": sorted(dishes.items()),
+                    "coupons": sorted(coupons)
+                })
+            yield {"shop_name": name, "shops": shops}
+
+    def iter_users(self) -> Iterator[Dict[str, str]]:
+        for i in range(self.user_count):
+            yield {"username": f"user{i}", "email": f"user{i}@example.com", "password": "123456"}
+
+    def iter_favorites(self) -> Iterator[Tuple[str, str]]:
+        """(username, shop_name)：收藏集中在热门店铺上（Zipf 分布）"""
+        rng = random.Random(self.seed ^ 0x5EED)
+        for i in range(self.user_count):
+            picked = set()
+            for _ in range(rng.randint(0, 12)):
+                index = min(self.group_count - 1, int(rng.paretovariate(1.1)) - 1)
+                picked.add(index if rng.random() < 0.6 else rng.randrange(self.group_count))
+            for index in sorted(picked):
+                yield f"user{i}", _shop_group_name(self._group_rng(index), index)
+
+    # ======================
+    # 输出
+    # ======================
+    def to_json_dict(self) -> Dict[str, Any]:
+        """生成 load_data_from_json 可读的字典（仅适合小规模）"""
+        data = {
+            "users": list(self.iter_users()),
+            "platforms": [{"platform_name": p} for p in PLATFORMS],
+            "shops": [], "dishes": [], "coupons": []
+        }
+        for group in self.iter_groups():
+            for shop in group["shops"]:
+                key = {"platform_name": shop["platform_name"], "shop_name": shop["shop_name"]}
+                data["shops"].append({k: v for k, v in shop.items() if k not in ("dishes", "coupons")})
+                data["dishes"].extend(dict(key, dish_name=n, price=p) for n, p in shop["dishes"])
+                data["coupons"].extend(dict(key, condition_amount=c, discount_amount=d) for c, d in shop["coupons"])
+        return data
+
+    def write_json(self, path: str) -> None:
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_json_dict(), f, ensure_ascii=False)
+
+    def bulk_load(self, db, batch_size: int = 50000) -> Dict[str, int]:
+        """
+        绕过逐行提交，按批 executemany 直接写入已 initialize() 的 FoodPriceDB，用于构造大规模基准数据。
+        用户密码使用与 FoodPriceDB 相同的哈希。
+        """
+        conn = sqlite3.connect(db.db_path)
+        cursor = conn.cursor()
+        cursor.execute("PRAGMA synchronous = OFF")
+        cursor.execute("PRAGMA journal_mode = MEMORY")
+        platform_ids = {}
+        for platform in PLATFORMS:
+            cursor.execute("INSERT OR IGNORE INTO platforms (platform_name) VALUES (?)", (platform,))
+            cursor.execute("SELECT platform_id FROM platforms WHERE platform_name = ?", (platform,))
+            platform_ids[platform] = cursor.fetchone()[0]
+
+        hashed = db._hash_password("123456")
+        cursor.executemany(
+            "INSERT OR IGNORE INTO users (username, email, password) VALUES (?, ?, ?)",
+            ((u["username"], u["email"], hashed) for u in self.iter_users())
+        )
+
+        counts = {"shops": 0, "dishes": 0, "coupons": 0, "favorites": 0}
+        dish_batch, coupon_batch = [], []
+
+        def flush():
+            cursor.executemany("INSERT OR IGNORE INTO dishes (shop_id, dish_name, price) VALUES (?, ?, ?)", dish_batch)
+            cursor.executemany(
+                "INSERT INTO coupons (shop_id, condition_amount, discount_amount) VALUES (?, ?, ?)", coupon_batch)
+            dish_batch.clear()
+            coupon_batch.clear()
+            conn.commit()
+
+        for group in self.iter_groups():
+            for shop in group["shops"]:
+                cursor.execute(
+                    """INSERT INTO shops (
+                        platform_id, shop_name, delivery_distance, rating, delivery_time,
+                        delivery_fee, monthly_sales, min_order, avg_consumption, image_url,
+                        latitude, longitude
+                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                    (platform_ids[shop["platform_name"]], shop["shop_name"], shop["delivery_distance"],
+                     shop["rating"], shop["delivery_time"], shop["delivery_fee"], shop["monthly_sales"],
+                     shop["min_order"], shop["avg_consumption"], shop["image_url"],
+                     shop["latitude"], shop["longitude"])
+                )
+                shop_id = cursor.lastrowid
+                counts["shops"] += 1
+                dish_batch.extend((shop_id, n, p) for n, p in shop["dishes"])
+                coupon_batch.extend((shop_id, c, d) for c, d in shop["coupons"])
+                counts["dishes"] += len(shop["dishes"])
+                counts["coupons"] += len(shop["coupons"])
+            if len(dish_batch) >= batch_size:
+                flush()
+        flush()
+
+        # 收藏：与前端一致，收藏一个店铺组即收藏它在所有平台上的店铺
+        cursor.execute("CREATE TEMP TABLE fav_src (username TEXT, shop_name TEXT)")
+        cursor.executemany("INSERT INTO fav_src VALUES (?, ?)", self.iter_favorites())
+        cursor.execute("""
+            INSERT OR IGNORE INTO user_favorites (user_id, shop_id)
+            SELECT u.user_id, s.shop_id
+            FROM fav_src f
+            JOIN users u ON u.username = f.username
+            JOIN shops s ON s.shop_name = f.shop_name
+        """)
+        counts["favorites"] = cursor.rowcount
+        cursor.execute("DROP TABLE fav_src")
+        conn.commit()
+        conn.close()
+        counts["users"] = self.user_count
+        return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="生成确定性合成数据")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--scale", type=float, default=1.0, help="1.0 ≈ 1000 个店铺组")
+    parser.add_argument("--json", help="输出 data.json 格式文件（小规模）")
+    parser.add_argument("--db", help="直接批量写入 SQLite 数据库文件")
+    args = parser.parse_args()
+
+    if not args.json and not args.db:
+        parser.error("至少指定 --json 或 --db")
+
+    catalog = SyntheticCatalog(args.seed, args.scale)
+    if args.json:
+        catalog.write_json(args.json)
+        print(f"✅ 已写入 {args.json}")
+    if args.db:
+        from server.FoodPriceDB import FoodPriceDB
+        if os.path.exists(args.db):
+            print(f"❌ {args.db} 已存在")
+            sys.exit(1)
+        db = FoodPriceDB()
+        if not db.initialize(args.db):
+            sys.exit(1)
+        start = time.perf_counter()
+        counts = catalog.bulk_load(db)
+        print(f"✅ 已写入 {args.db}: {counts}，耗时 {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -50,10 +50,9 @@ async function checkLoginStatus() {
     logoutUI();
     return;
   }
-  const userData = JSON.parse(user);
   try {
-    const res = await fetch('/api/auth/me', {
-      headers: { 'X-User-ID': userData.user_id }
+    const res = await apiFetch('/api/auth/me', {
+      headers: authHeaders()
     });
     const data = await res.json();
     if (data.success) {
@@ -73,7 +72,7 @@ async function checkLoginStatus() {
   }
 }
 
-// 👇 新增：加载用户收藏
+// 👇 加载用户收藏：本地缓存店名集合 + 版本号，只向后端拉取增量
 async function loadUserFavorites() {
   const user = localStorage.getItem('currentUser');
   if (!user) {
@@ -81,23 +80,63 @@ async function loadUserFavorites() {
     return;
   }
   const userData = JSON.parse(user);
+  let cache = null;
+  try {
+    cache = JSON.parse(localStorage.getItem('favoritesCache'));
+  } catch {
+    cache = null;
+  }
+  if (!cache || cache.user_id !== userData.user_id) {
+    cache = { user_id: userData.user_id, version: 0, names: [] };
+  }
   try {
-    const res = await fetch('/api/user/favorites', {
-      headers: { 'X-User-ID': userData.user_id }
+    const res = await apiFetch(`/api/user/favorites/ids?since=${cache.version}`, {
+      headers: authHeaders()
     });
     const data = await res.json();
-    userFavorites.clear();
-    if (data.success && Array.isArray(data.favorites)) {
-      data.favorites.forEach(r => userFavorites.add(r.name));
+    if (!data.success) {
+      userFavorites.clear();
+      localStorage.removeItem('favoritesCache');
+      return;
     }
+    const names = new Set(data.full ? [] : cache.names);
+    data.added.forEach(name => names.add(name));
+    data.removed.forEach(name => names.delete(name));
+    userFavorites.clear();
+    names.forEach(name => userFavorites.add(name));
+    localStorage.setItem('favoritesCache', JSON.stringify({
+      user_id: userData.user_id, version: data.version, names: [...names]
+    }));
   } catch (err) {
     userFavorites.clear();
   }
 }
 
+// 👇 认证请求头：携带登录时下发的签名令牌
+function authHeaders() {
+  const token = localStorage.getItem('authToken');
+  return token ? { 'Authorization': `Bearer ${token}` } : {};
+}
+
+// 所有 /api 请求都经过这里：服务刚启动（冷启动实例）时返回 503 + Retry-After，按提示等待后重试，最多重试 5 次
+const API_MAX_RETRIES = 5;
+
+async function apiFetch(url, options = {}) {
+  for (let attempt = 0; ; attempt++) {
+    const res = await fetch(url, options);
+    if (res.status !== 503 || attempt >= API_MAX_RETRIES) {
+      return res;
+    }
+    const retryAfter = parseFloat(res.headers.get('Retry-After'));
+    const delaySeconds = Number.isFinite(retryAfter) ? retryAfter : 1;
+    await new Promise(resolve => setTimeout(resolve, Math.min(delaySeconds, 10) * 1000));
+  }
+}
+
 function logoutUI() {
   localStorage.removeItem('currentUser');
   localStorage.removeItem('authToken');
+  localStorage.removeItem('favoritesCache');
   currentUser = null;
   userFavorites.clear(); // 👈 清空收藏
   document.getElementById('userInfo').style.display = 'none';
@@ -113,4 +152,5 @@ function logout() {
 
 window.logout = logout;
 window.userFavorites = userFavorites; // 暴露给其他模块使用
-window.loadUserFavorites = loadUserFavorites;
\ No newline at end of file
+window.loadUserFavorites = loadUserFavorites;
+window.authHeaders = authHeaders;
\ No newline at end of file
@@ -13,10 +13,9 @@ async function renderFavoritesPage() {
     document.getElementById('goToLogin').addEventListener('click', () => window.navigateTo('login'));
     return;
   }
-  const userData = JSON.parse(user);
   try {
-    const res = await fetch('/api/user/favorites', {
-      headers: { 'X-User-ID': userData.user_id }
+    const res = await apiFetch('/api/user/favorites', {
+      headers: authHeaders()
     });
     const data = await res.json();
     if (data.success && data.favorites?.length > 0) {
@@ -63,13 +63,12 @@ async function toggleFavorite(restaurantName) {
     window.navigateTo('login');
     return;
   }
-  const userData = JSON.parse(user);
   try {
-    const res = await fetch('/api/favorite/toggle', {
+    const res = await apiFetch('/api/favorite/toggle', {
       method: 'POST',
       headers: {
         'Content-Type': 'application/json',
-        'X-User-ID': userData.user_id
+        ...authHeaders()
       },
       body: JSON.stringify({ shop_name: restaurantName })
     });
@@ -209,7 +208,8 @@ async function renderHomeRecommendations() {
   const container = document.getElementById('recommendList');
   container.innerHTML = '<div class="empty-state"><i class="fas fa-spinner fa-spin"></i><p>加载中...</p></div>';
   try {
-    const res = await fetch('/api/restaurants/search');
+    // 带上登录令牌：已登录用户返回基于收藏的个性化推荐，未登录时服务端回退到热门抽样
+    const res = await apiFetch('/api/restaurants/search', { headers: authHeaders() });
     const data = await res.json();
     container.innerHTML = '';
     if (data.success && data.restaurants) {
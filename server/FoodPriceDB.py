@@ -1,15 +1,64 @@
+import json
+import os
 import sqlite3
-import hashlib
 import threading
+import time
+import weakref
 from datetime import datetime
 from typing import Tuple, List, Dict, Any, Optional
 
+try:
+    from server import metrics
+    from server.sql_trace import TracingConnection
+    from server.auth import UserCache
+    from server.passwords import PasswordHasher, PasswordPoolBusy, password_rehashes
+    from server.write_queue import WriteQueue
+    from server.sqlite_tuning import SqliteTuning, maintain, page_cache_status, storage_stats
+except ImportError:  # 以脚本方式在 server/ 目录下运行时
+    import metrics
+    from sql_trace import TracingConnection
+    from auth import UserCache
+    from passwords import PasswordHasher, PasswordPoolBusy, password_rehashes
+    from write_queue import WriteQueue
+    from sqlite_tuning import SqliteTuning, maintain, page_cache_status, storage_stats
+
+# 由触发器增量维护行数的业务表
+COUNTED_TABLES = ("users", "shops", "dishes", "coupons", "user_favorites")
+
+# 每个连接缓存的预编译语句数（sqlite3 默认 128）
+CACHED_STATEMENTS = int(os.getenv("SQLITE_CACHED_STATEMENTS", "256"))
+# 定期维护（PRAGMA optimize + 增量 VACUUM，由后台任务调度执行）的间隔，0 表示只按需执行
+SQLITE_MAINTENANCE_SECONDS = float(os.getenv("SQLITE_MAINTENANCE_SECONDS", "0"))
+# 每次定期维护最多归还的空闲页数（auto_vacuum=incremental 时生效）
+SQLITE_VACUUM_PAGES = int(os.getenv("SQLITE_VACUUM_PAGES", "1000"))
+# 收藏变更日志每个用户保留的最近版本数（更早的由后台任务清理）；since 早于该窗口时返回全量
+FAVORITE_CHANGES_KEEP = int(os.getenv("FAVORITE_CHANGES_KEEP", "500"))
+
+
+def id_set(ids) -> str:
+    """
+    把 ID 集合编码成单个 JSON 参数，配合 `IN (SELECT value FROM json_each(?))` 使用：
+    语句文本与集合大小无关，可以命中语句缓存，也不受 SQLite 绑定变量个数上限限制
+    """
+    return json.dumps([int(i) for i in ids])
+
 class FoodPriceDB:
-    def __init__(self):
+    def __init__(self, tuning: Optional[SqliteTuning] = None):
         self.initialized = False
         self.db_path = None
         self.lock = threading.Lock()
         self.local = threading.local()
+        # 每个连接打开时执行的 PRAGMA（默认读取 SQLITE_* 环境变量）
+        self.tuning = tuning or SqliteTuning.from_env()
+        # 各线程的连接（弱引用），汇总页缓存计数用；关闭连接与读取计数互斥
+        self.connections: "weakref.WeakSet[sqlite3.Connection]" = weakref.WeakSet()
+        self.connections_lock = threading.Lock()
+        # 用户信息缓存：get_user_by_id 命中时不访问数据库，用户数据变更时失效
+        self.user_cache = UserCache()
+        # 密码哈希：加盐 KDF，计算在有界进程池中进行
+        self.password_hasher = PasswordHasher()
+        # 组提交写队列：小的变更操作由单个写线程合并成一个事务提交
+        self.writes = WriteQueue(self)
 
     def initialize(self, db_path: str = "food_price.db") -> bool:
         with self.lock:
@@ -19,6 +68,7 @@ class FoodPriceDB:
             self.db_path = db_path
             try:
                 conn = sqlite3.connect(db_path)
+                self.tuning.apply_database(conn)
                 cursor = conn.cursor()
 
                 # 用户表（不变）
@@ -55,6 +105,8 @@ class FoodPriceDB:
                     min_order REAL DEFAULT 0,
                     avg_consumption REAL DEFAULT 0,
                     image_url TEXT,
+                    latitude REAL,
+                    longitude REAL,
                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                     FOREIGN KEY (platform_id) REFERENCES platforms(platform_id) ON DELETE CASCADE,
                     UNIQUE(platform_id, shop_name)
@@ -106,6 +158,138 @@ class FoodPriceDB:
                 )
                 ''')
 
+                # 旧库迁移：店铺坐标（附近搜索按用户位置实时计算配送距离）
+                shop_columns = {row[1] for row in cursor.execute("PRAGMA table_info(shops)")}
+                for column in ("latitude", "longitude"):
+                    if column not in shop_columns:
+                        cursor.execute(f"ALTER TABLE shops ADD COLUMN {column} REAL")
+
+                # 按店名查询（收藏切换、收藏卡片、增量同步）使用的索引
+                cursor.execute("CREATE INDEX IF NOT EXISTS idx_shops_name ON shops(shop_name)")
+
+                # 分片部署时全局库里的店铺目录：shop_id → 所在区域（店铺行本身只保留收藏用到的字段）
+                cursor.execute('''
+                CREATE TABLE IF NOT EXISTS shop_regions (
+                    shop_id INTEGER PRIMARY KEY,
+                    region TEXT NOT NULL
+                )
+                ''')
+
+                # 收藏版本号与变更日志：由触发器维护，供 /api/user/favorites/ids 增量同步
+                cursor.execute('''
+                CREATE TABLE IF NOT EXISTS favorite_versions (
+                    user_id INTEGER PRIMARY KEY,
+                    version INTEGER NOT NULL DEFAULT 0
+                )
+                ''')
+                cursor.execute('''
+                CREATE TABLE IF NOT EXISTS favorite_changes (
+                    user_id INTEGER NOT NULL,
+                    version INTEGER NOT NULL,
+                    shop_name TEXT NOT NULL,
+                    PRIMARY KEY (user_id, version, shop_name)
+                ) WITHOUT ROWID
+                ''')
+                for event, row in (("INSERT", "NEW"), ("DELETE", "OLD")):
+                    cursor.execute(f'''
+                    CREATE TRIGGER IF NOT EXISTS trg_user_favorites_version_{event.lower()}
+                    AFTER {event} ON user_favorites
+                    BEGIN
+                        INSERT INTO favorite_versions (user_id, version) VALUES ({row}.user_id, 1)
+                            ON CONFLICT(user_id) DO UPDATE SET version = version + 1;
+                        INSERT OR IGNORE INTO favorite_changes (user_id, version, shop_name)
+                            SELECT {row}.user_id,
+                                   (SELECT version FROM favorite_versions WHERE user_id = {row}.user_id),
+                                   shop_name
+                            FROM shops WHERE shop_id = {row}.shop_id;
+                    END
+                    ''')
+
+                # 批量导入记录：文件内容哈希未变的数据文件再次导入时跳过
+                cursor.execute('''
+                CREATE TABLE IF NOT EXISTS ingest_files (
+                    path TEXT PRIMARY KEY,
+                    content_hash TEXT NOT NULL,
+                    row_count INTEGER NOT NULL DEFAULT 0,
+                    error_count INTEGER NOT NULL DEFAULT 0,
+                    ingested_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+                ''')
+
+                # 后台任务：调度状态（下次运行时间 / 跨进程租约）与运行历史
+                cursor.execute('''
+                CREATE TABLE IF NOT EXISTS jobs (
+                    name TEXT PRIMARY KEY,
+                    interval_seconds REAL,
+                    next_run_at REAL,
+                    locked_by TEXT,
+                    locked_until REAL,
+                    last_status TEXT,
+                    last_run_at REAL,
+                    last_duration REAL
+                )
+                ''')
+                cursor.execute('''
+                CREATE TABLE IF NOT EXISTS job_runs (
+                    run_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    name TEXT NOT NULL,
+                    worker TEXT NOT NULL,
+                    started_at REAL NOT NULL,
+                    duration REAL NOT NULL,
+                    status TEXT NOT NULL,
+                    message TEXT
+                )
+                ''')
+                cursor.execute("CREATE INDEX IF NOT EXISTS idx_job_runs_name ON job_runs(name, run_id)")
+
+                # 目录版本号：店铺 / 菜品 / 满减任何变更都会递增，内存快照据此判断是否需要重建
+                cursor.execute('''
+                CREATE TABLE IF NOT EXISTS catalog_meta (
+                    id INTEGER PRIMARY KEY CHECK (id = 1),
+                    generation INTEGER NOT NULL DEFAULT 0
+                )
+                ''')
+                cursor.execute("INSERT OR IGNORE INTO catalog_meta (id, generation) VALUES (1, 0)")
+                for table in ("shops", "dishes", "coupons"):
+                    for event in ("INSERT", "UPDATE", "DELETE"):
+                        cursor.execute(f'''
+                        CREATE TRIGGER IF NOT EXISTS trg_{table}_generation_{event.lower()}
+                        AFTER {event} ON {table}
+                        BEGIN
+                            UPDATE catalog_meta SET generation = generation + 1 WHERE id = 1;
+                        END
+                        ''')
+
+                # 行数统计表：由触发器增量维护，避免每次查询都 COUNT(*) 全表扫描
+                cursor.execute('''
+                CREATE TABLE IF NOT EXISTS table_counts (
+                    table_name TEXT PRIMARY KEY,
+                    row_count INTEGER NOT NULL DEFAULT 0
+                )
+                ''')
+                for table in COUNTED_TABLES:
+                    cursor.execute(f'''
+                    CREATE TRIGGER IF NOT EXISTS trg_{table}_count_ins AFTER INSERT ON {table}
+                    BEGIN
+                        UPDATE table_counts SET row_count = row_count + 1 WHERE table_name = '{table}';
+                    END
+                    ''')
+                    cursor.execute(f'''
+                    CREATE TRIGGER IF NOT EXISTS trg_{table}_count_del AFTER DELETE ON {table}
+                    BEGIN
+                        UPDATE table_counts SET row_count = row_count - 1 WHERE table_name = '{table}';
+                    END
+                    ''')
+                # 旧数据库首次升级时做一次全量计数作为初值
+                cursor.execute("SELECT table_name FROM table_counts")
+                seeded = {row[0] for row in cursor.fetchall()}
+                for table in COUNTED_TABLES:
+                    if table not in seeded:
+                        cursor.execute(
+                            f"INSERT OR IGNORE INTO table_counts (table_name, row_count) SELECT ?, COUNT(*) FROM {table}",
+                            (table,)
+                        )
+
                 # 插入默认平台
                 default_platforms = ["美团", "饿了么"]
                 for name in default_platforms:
@@ -127,8 +311,12 @@ class FoodPriceDB:
         if not hasattr(self.local, 'conn'):
             if not self.initialized:
                 raise RuntimeError("数据库未初始化，请先调用 initialize()")
-            self.local.conn = sqlite3.connect(self.db_path)
-            self.local.conn.row_factory = sqlite3.Row
+            conn = sqlite3.connect(self.db_path, factory=TracingConnection, cached_statements=CACHED_STATEMENTS)
+            conn.row_factory = sqlite3.Row
+            self.tuning.apply(conn)
+            self.local.conn = conn
+            with self.connections_lock:
+                self.connections.add(conn)
         return self.local.conn
 
     def _get_thread_cursor(self) -> sqlite3.Cursor:
@@ -136,70 +324,501 @@ class FoodPriceDB:
 
     def close_thread_resources(self) -> None:
         if hasattr(self.local, 'conn'):
-            self.local.conn.close()
+            with self.connections_lock:
+                self.connections.discard(self.local.conn)
+                self.local.conn.close()
             del self.local.conn
 
+    @staticmethod
+    def _method_name(operation) -> str:
+        # operation 都是公共方法里的闭包，用外层方法名作为指标标签
+        return operation.__qualname__.split(".<locals>")[0].rsplit(".", 1)[-1]
+
+    def _write(self, operation) -> Any:
+        """经写队列执行变更操作并等待提交（锁定重试由写线程整批处理）"""
+        method = self._method_name(operation)
+        start = time.perf_counter()
+        try:
+            return self.writes.run(operation)
+        except Exception:
+            metrics.db_method_errors.inc(method=method)
+            raise
+        finally:
+            metrics.db_method_duration.observe(time.perf_counter() - start, method=method)
+
     def _retry_operation(self, operation, max_retries: int = 3, delay: float = 0.1) -> Any:
-        for i in range(max_retries):
-            try:
-                return operation()
-            except sqlite3.OperationalError as e:
-                if "database is locked" in str(e) and i < max_retries - 1:
-                    import time
-                    time.sleep(delay * (i + 1))
+        method = self._method_name(operation)
+        start = time.perf_counter()
+        try:
+            for i in range(max_retries):
+                try:
+                    result = operation()
+                    rows = metrics.payload_rows(result)
+                    if rows is not None:
+                        metrics.db_method_rows.observe(rows, method=method)
+                    return result
+                except sqlite3.OperationalError as e:
+                    if "database is locked" in str(e) and i < max_retries - 1:
+                        metrics.db_retries_total.inc(method=method)
+                        time.sleep(delay * (i + 1))
+                        continue
+                    metrics.db_method_errors.inc(method=method)
+                    raise
+                except Exception as e:
+                    metrics.db_method_errors.inc(method=method)
+                    raise
+        finally:
+            metrics.db_method_duration.observe(time.perf_counter() - start, method=method)
+
+    def get_catalog_generation(self) -> int:
+        """目录版本号（店铺 / 菜品 / 满减每次变更递增）"""
+        def operation():
+            cursor = self._get_thread_cursor()
+            cursor.execute("SELECT generation FROM catalog_meta WHERE id = 1")
+            row = cursor.fetchone()
+            return row["generation"] if row else 0
+        return self._retry_operation(operation)
+
+    def reserve_shop_id_range(self, offset: int) -> None:
+        """分片库：让 AUTOINCREMENT 从 offset 之后开始分配 shop_id，保证各分片的店铺 ID 全局不重复"""
+        def operation():
+            cursor = self._get_thread_cursor()
+            cursor.execute(
+                "INSERT INTO sqlite_sequence (name, seq) SELECT 'shops', ? "
+                "WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = 'shops')", (offset,))
+            cursor.execute("UPDATE sqlite_sequence SET seq = ? WHERE name = 'shops' AND seq < ?", (offset, offset))
+            self._get_thread_connection().commit()
+        return self._retry_operation(operation)
+
+    def list_shop_keys(self) -> List[Tuple[int, str, str]]:
+        """所有店铺的 (shop_id, platform_name, shop_name)"""
+        def operation():
+            cursor = self._get_thread_cursor()
+            cursor.execute("""
+                SELECT s.shop_id, p.platform_name, s.shop_name
+                FROM shops s JOIN platforms p ON s.platform_id = p.platform_id
+            """)
+            return [(row["shop_id"], row["platform_name"], row["shop_name"]) for row in cursor.fetchall()]
+        return self._retry_operation(operation)
+
+    def register_shop_directory(self, region: str, shops: List[Tuple[int, str, str]]) -> int:
+        """
+        全局库：登记分片中的店铺（沿用分片分配的 shop_id），供收藏 / 增量同步按店名和 ID 关联。
+        同一平台上的同名店铺只能属于一个区域，冲突时保留先登记的。返回新登记的店铺数。
+        """
+        def operation():
+            conn = self._get_thread_connection()
+            cursor = conn.cursor()
+            platform_ids = {row["platform_name"]: row["platform_id"]
+                            for row in cursor.execute("SELECT platform_id, platform_name FROM platforms")}
+            added = 0
+            for shop_id, platform_name, shop_name in shops:
+                platform_id = platform_ids.get(platform_name)
+                if platform_id is None:
+                    cursor.execute("INSERT INTO platforms (platform_name) VALUES (?)", (platform_name,))
+                    platform_id = platform_ids[platform_name] = cursor.lastrowid
+                cursor.execute(
+                    "INSERT OR IGNORE INTO shops (shop_id, platform_id, shop_name) VALUES (?, ?, ?)",
+                    (shop_id, platform_id, shop_name))
+                if cursor.rowcount == 0:
+                    print(f"⚠️ 店铺 {shop_name} ({platform_name}) 已登记在其它区域，忽略 {region} 中的同名店铺")
                     continue
-                raise
-            except Exception as e:
-                raise
+                cursor.execute("INSERT OR REPLACE INTO shop_regions (shop_id, region) VALUES (?, ?)",
+                               (shop_id, region))
+                added += 1
+            conn.commit()
+            return added
+        return self._retry_operation(operation)
+
+    def get_shop_regions(self, shop_ids: List[int]) -> Dict[int, str]:
+        """shop_id → 区域（未登记的 ID 不出现在结果中）"""
+        def operation():
+            cursor = self._get_thread_cursor()
+            cursor.execute(
+                "SELECT shop_id, region FROM shop_regions WHERE shop_id IN (SELECT value FROM json_each(?))",
+                (id_set(shop_ids),))
+            return {row["shop_id"]: row["region"] for row in cursor.fetchall()}
+        return self._retry_operation(operation)
+
+    def get_ingested_hashes(self) -> Dict[str, str]:
+        """已导入数据文件的 路径 → 内容哈希"""
+        def operation():
+            cursor = self._get_thread_cursor()
+            cursor.execute("SELECT path, content_hash FROM ingest_files")
+            return {row["path"]: row["content_hash"] for row in cursor.fetchall()}
+        return self._retry_operation(operation)
+
+    def record_ingested_file(self, path: str, content_hash: str, row_count: int, error_count: int) -> None:
+        def operation():
+            self._get_thread_cursor().execute(
+                "INSERT OR REPLACE INTO ingest_files (path, content_hash, row_count, error_count) VALUES (?, ?, ?, ?)",
+                (path, content_hash, row_count, error_count))
+        return self._write(operation)
+
+    def bulk_insert_users(self, users: List[Tuple[str, str, str]]) -> int:
+        """批量导入用户 (username, email, 已哈希的密码)，用户名或邮箱已存在的跳过；返回新增数"""
+        def operation():
+            cursor = self._get_thread_cursor()
+            cursor.executemany(
+                "INSERT OR IGNORE INTO users (username, email, password) VALUES (?, ?, ?)", users)
+            return max(cursor.rowcount, 0)
+        added = self._write(operation)
+        if added:
+            self.user_cache.invalidate()
+        return added
+
+    def bulk_upsert_catalog(
+        self,
+        shops: List[tuple],
+        dishes: List[Tuple[str, str, str, float]],
+        coupons: List[Tuple[str, str, float, float, Optional[str], Optional[str]]]
+    ) -> Tuple[Dict[str, int], List[str]]:
+        """
+        在一个事务里批量写入一个数据文件的店铺 / 菜品 / 满减：
+        - shops: (platform_name, shop_name, delivery_distance, rating, delivery_time, delivery_fee,
+                  monthly_sales, min_order, avg_consumption, image_url, latitude, longitude)，
+          同平台同名店铺已存在时更新其字段
+        - dishes: (platform_name, shop_name, dish_name, price)，同店同名菜品更新价格
+        - coupons: (platform_name, shop_name, condition_amount, discount_amount, valid_from, valid_to)，
+          文件里出现了满减的店铺，其原有满减整体替换为文件中的
+        所属店铺既不在本批也不在库中的行记为错误。返回 ({"shops": n, "dishes": n, "coupons": n}, 错误列表)
+        """
+        def operation():
+            cursor = self._get_thread_cursor()
+            platform_ids = {}
+            for name in {row[0] for rows in (shops, dishes, coupons) for row in rows}:
+                cursor.execute("INSERT OR IGNORE INTO platforms (platform_name) VALUES (?)", (name,))
+                cursor.execute("SELECT platform_id FROM platforms WHERE platform_name = ?", (name,))
+                platform_ids[name] = cursor.fetchone()["platform_id"]
+
+            shop_ids: Dict[Tuple[str, str], int] = {}
+            for row in shops:
+                cursor.execute(
+                    """INSERT INTO shops (
+                        platform_id, shop_name, delivery_distance, rating, delivery_time, delivery_fee,
+                        monthly_sales, min_order, avg_consumption, image_url, latitude, longitude
+                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT(platform_id, shop_name) DO UPDATE SET
+                        delivery_distance = excluded.delivery_distance, rating = excluded.rating,
+                        delivery_time = excluded.delivery_time, delivery_fee = excluded.delivery_fee,
+                        monthly_sales = excluded.monthly_sales, min_order = excluded.min_order,
+                        avg_consumption = excluded.avg_consumption, image_url = excluded.image_url,
+                        latitude = excluded.latitude, longitude = excluded.longitude
+                    RETURNING shop_id""",
+                    (platform_ids[row[0]],) + tuple(row[1:]))
+                shop_ids[(row[0], row[1])] = cursor.fetchone()["shop_id"]
+
+            errors = []
+
+            def resolve(platform_name, shop_name):
+                key = (platform_name, shop_name)
+                if key not in shop_ids:
+                    cursor.execute("SELECT shop_id FROM shops WHERE platform_id = ? AND shop_name = ?",
+                                   (platform_ids[platform_name], shop_name))
+                    found = cursor.fetchone()
+                    shop_ids[key] = found["shop_id"] if found else None
+                return shop_ids[key]
+
+            dish_rows = []
+            for platform_name, shop_name, dish_name, price in dishes:
+                shop_id = resolve(platform_name, shop_name)
+                if shop_id is None:
+                    errors.append(f"菜品 {dish_name} 所属店铺未找到: ({platform_name}, {shop_name})")
+                    continue
+                dish_rows.append((shop_id, dish_name, price))
+            cursor.executemany(
+                """INSERT INTO dishes (shop_id, dish_name, price) VALUES (?, ?, ?)
+                   ON CONFLICT(shop_id, dish_name) DO UPDATE SET price = excluded.price""", dish_rows)
+
+            coupon_rows = []
+            for platform_name, shop_name, *values in coupons:
+                shop_id = resolve(platform_name, shop_name)
+                if shop_id is None:
+                    errors.append(f"优惠券所属店铺未找到: ({platform_name}, {shop_name})")
+                    continue
+                coupon_rows.append((shop_id, *values))
+            if coupon_rows:
+                cursor.execute("DELETE FROM coupons WHERE shop_id IN (SELECT value FROM json_each(?))",
+                               (id_set({row[0] for row in coupon_rows}),))
+                cursor.executemany(
+                    """INSERT INTO coupons (shop_id, condition_amount, discount_amount, valid_from, valid_to)
+                       VALUES (?, ?, ?, ?, ?)""", coupon_rows)
+            return {"shops": len(shops), "dishes": len(dish_rows), "coupons": len(coupon_rows)}, errors
+        return self._write(operation)
+
+    def get_table_counts(self) -> Dict[str, int]:
+        """读取触发器维护的各表行数（单次小表查询，不做全表扫描）"""
+        def operation():
+            cursor = self._get_thread_cursor()
+            cursor.execute("SELECT table_name, row_count FROM table_counts")
+            return {row["table_name"]: row["row_count"] for row in cursor.fetchall()}
+        return self._retry_operation(operation)
+
+    def recount_tables(self) -> Dict[str, int]:
+        """用 COUNT(*) 校正触发器维护的行数（后台任务执行），返回有偏差的表及偏差值"""
+        def operation():
+            cursor = self._get_thread_cursor()
+            drift = {}
+            for table in COUNTED_TABLES:
+                cursor.execute(
+                    f"""SELECT (SELECT COUNT(*) FROM {table}) -
+                               (SELECT row_count FROM table_counts WHERE table_name = ?)""", (table,))
+                delta = cursor.fetchone()[0]
+                if delta:
+                    cursor.execute("UPDATE table_counts SET row_count = row_count + ? WHERE table_name = ?",
+                                   (delta, table))
+                    drift[table] = delta
+            return drift
+        return self._write(operation)
+
+    def delete_expired_coupons(self) -> int:
+        """删除已过期（valid_to 早于当前本地时间）的满减；无法解析的 valid_to 保留。返回删除条数"""
+        def operation():
+            cursor = self._get_thread_cursor()
+            cursor.execute("""
+                DELETE FROM coupons
+                WHERE valid_to IS NOT NULL AND julianday(valid_to) < julianday('now', 'localtime')
+            """)
+            return cursor.rowcount
+        return self._write(operation)
+
+    def prune_favorite_changes(self, keep: int = FAVORITE_CHANGES_KEEP) -> int:
+        """每个用户只保留最近 keep 个版本的收藏变更日志，返回删除条数"""
+        def operation():
+            cursor = self._get_thread_cursor()
+            cursor.execute("""
+                DELETE FROM favorite_changes
+                WHERE version <= (SELECT v.version FROM favorite_versions v
+                                  WHERE v.user_id = favorite_changes.user_id) - ?
+            """, (keep,))
+            return cursor.rowcount
+        return self._write(operation)
+
+    # ======================
+    # 后台任务
+    # ======================
+    def register_job(self, name: str, interval_seconds: Optional[float], next_run_at: Optional[float]) -> None:
+        """登记任务；已存在时只更新周期（保留其他进程排好的下次运行时间）"""
+        def operation():
+            cursor = self._get_thread_cursor()
+            cursor.execute("""
+                INSERT INTO jobs (name, interval_seconds, next_run_at) VALUES (?, ?, ?)
+                ON CONFLICT(name) DO UPDATE SET interval_seconds = excluded.interval_seconds,
+                    next_run_at = CASE WHEN excluded.interval_seconds IS NULL THEN jobs.next_run_at
+                                       ELSE COALESCE(jobs.next_run_at, excluded.next_run_at) END
+            """, (name, interval_seconds, next_run_at))
+        self._write(operation)
+
+    def get_due_jobs(self, now: float) -> Dict[str, float]:
+        """
+        可领取的任务 {名称: 到期时间}：已到运行时间、或租约已过期（持有者运行中崩溃）的任务。
+        只读，调度线程每个周期调用一次
+        """
+        def operation():
+            cursor = self._get_thread_cursor()
+            cursor.execute("""
+                SELECT name, COALESCE(next_run_at, locked_until) AS due_at FROM jobs
+                WHERE (locked_until IS NULL OR locked_until < ?) AND (next_run_at <= ? OR locked_by IS NOT NULL)
+            """, (now, now))
+            return {row["name"]: row["due_at"] for row in cursor.fetchall()}
+        return self._retry_operation(operation)
+
+    def claim_job(self, name: str, worker: str, now: float, lease_seconds: float) -> bool:
+        """
+        条件更新抢占租约：多个进程同时抢同一任务时只有一个更新成功。
+        领取后清空 next_run_at，运行期间的按需触发会重新写入，结束时保留
+        """
+        def operation():
+            cursor = self._get_thread_cursor()
+            cursor.execute("""
+                UPDATE jobs SET locked_by = ?, locked_until = ?, next_run_at = NULL
+                WHERE name = ? AND (locked_until IS NULL OR locked_until < ?)
+                  AND (next_run_at <= ? OR locked_by IS NOT NULL)
+            """, (worker, now + lease_seconds, name, now, now))
+            return cursor.rowcount == 1
+        return self._write(operation)
+
+    def request_job(self, name: str, now: float) -> None:
+        """按需运行：把下次运行时间提前到现在（由任一进程的调度线程领取）"""
+        def operation():
+            self._get_thread_cursor().execute(
+                "UPDATE jobs SET next_run_at = ? WHERE name = ? AND (next_run_at IS NULL OR next_run_at > ?)",
+                (now, name, now))
+        self._write(operation)
+
+    def finish_job(self, name: str, worker: str, started_at: float, duration: float, status: str,
+                   message: Optional[str], next_run_at: Optional[float], release: bool, history: int) -> None:
+        """
+        记录一次运行；release 时释放本进程持有的租约并排好下次运行时间（运行期间被按需触发过则保留更早的那个）。
+        每个任务只保留最近 history 条记录
+        """
+        def operation():
+            cursor = self._get_thread_cursor()
+            if release:
+                cursor.execute("""
+                    UPDATE jobs SET locked_by = NULL, locked_until = NULL,
+                        next_run_at = CASE WHEN next_run_at IS NULL THEN ?
+                                           ELSE MIN(next_run_at, COALESCE(?, next_run_at)) END,
+                        last_status = ?, last_run_at = ?, last_duration = ?
+                    WHERE name = ? AND locked_by = ?
+                """, (next_run_at, next_run_at, status, started_at, duration, name, worker))
+            cursor.execute("""
+                INSERT INTO job_runs (name, worker, started_at, duration, status, message)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, (name, worker, started_at, duration, status, message))
+            cursor.execute("""
+                DELETE FROM job_runs WHERE name = ? AND run_id <= (
+                    SELECT run_id FROM job_runs WHERE name = ? ORDER BY run_id DESC LIMIT 1 OFFSET ?)
+            """, (name, name, history))
+        self._write(operation)
+
+    def get_jobs(self) -> List[Dict[str, Any]]:
+        def operation():
+            cursor = self._get_thread_cursor()
+            cursor.execute("SELECT * FROM jobs ORDER BY name")
+            return [dict(row) for row in cursor.fetchall()]
+        return self._retry_operation(operation)
+
+    def get_job_runs(self, name: Optional[str] = None, limit: int = 50) -> List[Dict[str, Any]]:
+        def operation():
+            cursor = self._get_thread_cursor()
+            if name:
+                cursor.execute("SELECT * FROM job_runs WHERE name = ? ORDER BY run_id DESC LIMIT ?", (name, limit))
+            else:
+                cursor.execute("SELECT * FROM job_runs ORDER BY run_id DESC LIMIT ?", (limit,))
+            return [dict(row) for row in cursor.fetchall()]
+        return self._retry_operation(operation)
+
+    # ======================
+    # 存储统计 / 维护
+    # ======================
+    def page_cache_stats(self) -> Optional[Dict[str, int]]:
+        """所有存活连接的页缓存命中 / 未命中 / 写出次数之和；无法读取 sqlite3_db_status 时返回 None"""
+        totals = {"connections": 0, "hits": 0, "misses": 0, "writes": 0, "used_bytes": 0}
+        with self.connections_lock:
+            for conn in list(self.connections):
+                status = page_cache_status(conn, self.db_path)
+                if status is None:
+                    return None
+                totals["connections"] += 1
+                for key, value in status.items():
+                    totals[key] += value
+        lookups = totals["hits"] + totals["misses"]
+        totals["hit_ratio"] = round(totals["hits"] / lookups, 4) if lookups else None
+        return totals
+
+    def storage_stats(self, objects: bool = True) -> Dict[str, Any]:
+        """页数 / 空闲页 / 文件与 WAL 大小 / 各表与索引占用 / 页缓存计数 / 当前调优设置"""
+        def operation():
+            stats = storage_stats(self._get_thread_connection(), self.db_path, objects)
+            stats["page_cache"] = self.page_cache_stats()
+            stats["tuning"] = self.tuning.to_dict()
+            return stats
+        return self._retry_operation(operation)
+
+    def maintain(self, analyze: bool = False, optimize: bool = True, vacuum_pages: int = 0) -> Dict[str, Any]:
+        """ANALYZE / PRAGMA optimize / 增量 VACUUM，经写队列执行（与业务写入串行，不会互相锁定）"""
+        start = time.perf_counter()
+        result = self._write(lambda: maintain(self._get_thread_connection(), analyze, optimize, vacuum_pages))
+        result["seconds"] = round(time.perf_counter() - start, 4)
+        return result
 
     def _hash_password(self, password: str) -> str:
-        """对密码进行 SHA256 哈希（课程作业简化版）"""
-        return hashlib.sha256(password.encode()).hexdigest()
+        """按当前 KDF 参数同步计算密码哈希（不经过进程池，供离线脚本使用）"""
+        return self.password_hasher.hash_inline(password)
 
     # ======================
     # 用户管理
     # ======================
     def register_user(self, username: str, email: str, password: str) -> Tuple[bool, Optional[int], str]:
-        """用户注册，返回 (成功, user_id, 消息)"""
+        """
+        用户注册，返回 (成功, user_id, 消息)
+        哈希池饱和时抛出 PasswordPoolBusy，由调用方转换为 429
+        """
+        def check():
+            cursor = self._get_thread_cursor()
+            cursor.execute("SELECT user_id FROM users WHERE username = ? OR email = ?", (username, email))
+            return cursor.fetchone() is not None
+
+        try:
+            if self._retry_operation(check):
+                return (False, None, "用户名或邮箱已存在")
+        except Exception as e:
+            return (False, None, f"注册失败: {e}")
+
+        # 哈希在数据库操作之外完成，重试时不会重复计算
+        hashed_pwd = self.password_hasher.hash(password)
+
         def operation():
             cursor = self._get_thread_cursor()
-            try:
-                cursor.execute("SELECT user_id FROM users WHERE username = ? OR email = ?", (username, email))
-                if cursor.fetchone():
-                    return (False, None, "用户名或邮箱已存在")
+            cursor.execute(
+                "INSERT INTO users (username, email, password) VALUES (?, ?, ?)",
+                (username, email, hashed_pwd)
+            )
+            return cursor.lastrowid
 
-                hashed_pwd = self._hash_password(password)
-                cursor.execute(
-                    "INSERT INTO users (username, email, password) VALUES (?, ?, ?)",
-                    (username, email, hashed_pwd)
-                )
-                user_id = cursor.lastrowid
-                self._get_thread_connection().commit()
-                return (True, user_id, "注册成功")
-            except Exception as e:
-                return (False, None, f"注册失败: {e}")
-        return self._retry_operation(operation)
+        try:
+            user_id = self._write(operation)
+        except sqlite3.IntegrityError:
+            return (False, None, "用户名或邮箱已存在")
+        except Exception as e:
+            return (False, None, f"注册失败: {e}")
+        self.user_cache.invalidate(user_id)
+        return (True, user_id, "注册成功")
 
     def login_user(self, username: str, password: str) -> Tuple[bool, Optional[int], str]:
-        """用户登录，返回 (成功, user_id, 消息)"""
+        """
+        用户登录，返回 (成功, user_id, 消息)
+        旧格式（无盐 SHA-256）或旧参数的哈希在登录成功后透明升级；哈希池饱和时抛出 PasswordPoolBusy
+        """
         def operation():
             cursor = self._get_thread_cursor()
+            cursor.execute("SELECT user_id, password FROM users WHERE username = ?", (username,))
+            return cursor.fetchone()
+
+        try:
+            user = self._retry_operation(operation)
+        except Exception as e:
+            return (False, None, f"登录异常: {e}")
+        if not user:
+            return (False, None, "用户不存在")
+
+        ok, needs_rehash = self.password_hasher.verify(password, user['password'])
+        if not ok:
+            return (False, None, "密码错误")
+
+        if needs_rehash:
             try:
-                cursor.execute("SELECT user_id, password FROM users WHERE username = ?", (username,))
-                user = cursor.fetchone()
-                if not user:
-                    return (False, None, "用户不存在")
+                self._update_password_hash(user['user_id'], user['password'], self.password_hasher.hash(password))
+            except PasswordPoolBusy:
+                pass  # 升级失败不影响本次登录，下次登录再试
+        return (True, user['user_id'], "登录成功")
 
-                if self._hash_password(password) == user['password']:
-                    return (True, user['user_id'], "登录成功")
-                else:
-                    return (False, None, "密码错误")
-            except Exception as e:
-                return (False, None, f"登录异常: {e}")
-        return self._retry_operation(operation)
+    def _update_password_hash(self, user_id: int, old_hash: str, new_hash: str) -> bool:
+        """比较并替换：只有库中仍是 old_hash 时才写入，避免覆盖并发修改"""
+        def operation():
+            cursor = self._get_thread_cursor()
+            cursor.execute(
+                "UPDATE users SET password = ? WHERE user_id = ? AND password = ?",
+                (new_hash, user_id, old_hash)
+            )
+            return cursor.rowcount == 1
+
+        try:
+            updated = self._write(operation)
+        except Exception as e:
+            print(f"密码哈希升级失败: {e}")
+            return False
+        if updated:
+            password_rehashes.inc()
+        return updated
 
     def get_user_by_id(self, user_id: int) -> Tuple[bool, Optional[Dict[str, Any]]]:
-        """根据 user_id 获取用户信息（不含密码）"""
+        """根据 user_id 获取用户信息（不含密码），优先读缓存"""
+        cached = self.user_cache.get(user_id)
+        if cached is not None:
+            return (True, cached)
+
         def operation():
             cursor = self._get_thread_cursor()
             try:
@@ -207,12 +826,14 @@ class FoodPriceDB:
                 row = cursor.fetchone()
                 if not row:
                     return (False, None)
-                return (True, {
+                user_info = {
                     "user_id": row["user_id"],
                     "username": row["username"],
                     "email": row["email"],
                     "created_at": row["created_at"]
-                })
+                }
+                self.user_cache.put(user_id, user_info)
+                return (True, user_info)
             except Exception as e:
                 return (False, None)
         return self._retry_operation(operation)
@@ -241,11 +862,10 @@ class FoodPriceDB:
                     "INSERT INTO user_favorites (user_id, shop_id) VALUES (?, ?)",
                     (user_id, shop_id)
                 )
-                self._get_thread_connection().commit()
                 return (True, "收藏成功")
             except Exception as e:
                 return (False, f"收藏失败: {e}")
-        return self._retry_operation(operation)
+        return self._write(operation)
 
     def remove_favorite(self, user_id: int, shop_id: int) -> Tuple[bool, str]:
         """取消收藏"""
@@ -258,11 +878,10 @@ class FoodPriceDB:
                 )
                 if cursor.rowcount == 0:
                     return (False, "未收藏该店铺或店铺/用户不存在")
-                self._get_thread_connection().commit()
                 return (True, "取消收藏成功")
             except Exception as e:
                 return (False, f"取消收藏失败: {e}")
-        return self._retry_operation(operation)
+        return self._write(operation)
 
     def get_user_favorites(self, user_id: int) -> Tuple[bool, List[Dict[str, Any]]]:
         """获取用户收藏的店铺列表（含平台、评分、image_url 等信息）"""
@@ -307,6 +926,120 @@ class FoodPriceDB:
                 return (False, [])
         return self._retry_operation(operation)
 
+    def get_favorite_shop_ids(self, user_id: int) -> set:
+        """用户收藏的店铺 ID 集合（搜索结果标记收藏状态用）"""
+        def operation():
+            cursor = self._get_thread_cursor()
+            cursor.execute("SELECT shop_id FROM user_favorites WHERE user_id = ?", (user_id,))
+            return {row["shop_id"] for row in cursor.fetchall()}
+        return self._retry_operation(operation)
+
+    def get_favorite_pairs(self) -> List[Tuple[int, int]]:
+        """全部收藏 (user_id, shop_id)，按用户聚集、同一用户内最近收藏的在前（推荐的共同收藏统计用）"""
+        def operation():
+            cursor = self._get_thread_cursor()
+            cursor.execute('''
+                SELECT user_id, shop_id FROM user_favorites
+                ORDER BY user_id, created_at DESC, shop_id
+            ''')
+            return [(row["user_id"], row["shop_id"]) for row in cursor.fetchall()]
+        return self._retry_operation(operation)
+
+    def get_favorite_changes(self, user_id: int, since: int = 0) -> Tuple[bool, Dict[str, Any]]:
+        """
+        收藏增量同步：返回自版本 since 之后新增 / 移除的店铺组（按店名）。
+        since 为 0 或不可用（大于当前版本，或早于保留的最近 FAVORITE_CHANGES_KEEP 个版本）时返回全量店名，full=True。
+        """
+        def operation():
+            cursor = self._get_thread_cursor()
+            try:
+                cursor.execute("SELECT user_id FROM users WHERE user_id = ?", (user_id,))
+                if not cursor.fetchone():
+                    return (False, {})
+
+                cursor.execute("SELECT version FROM favorite_versions WHERE user_id = ?", (user_id,))
+                row = cursor.fetchone()
+                version = row["version"] if row else 0
+
+                if since <= 0 or since > version or since < version - FAVORITE_CHANGES_KEEP:
+                    cursor.execute('''
+                        SELECT DISTINCT s.shop_name
+                        FROM user_favorites uf
+                        JOIN shops s ON uf.shop_id = s.shop_id
+                        WHERE uf.user_id = ?
+                    ''', (user_id,))
+                    return (True, {
+                        "version": version,
+                        "full": True,
+                        "added": sorted(r["shop_name"] for r in cursor.fetchall()),
+                        "removed": []
+                    })
+
+                # 同一店铺组在区间内可能多次变更，只看其当前是否仍被收藏
+                cursor.execute('''
+                    SELECT c.shop_name,
+                           EXISTS (
+                               SELECT 1 FROM user_favorites uf
+                               JOIN shops s ON uf.shop_id = s.shop_id
+                               WHERE uf.user_id = ? AND s.shop_name = c.shop_name
+                           ) AS is_favorite
+                    FROM (
+                        SELECT DISTINCT shop_name FROM favorite_changes
+                        WHERE user_id = ? AND version > ?
+                    ) c
+                ''', (user_id, user_id, since))
+                added, removed = [], []
+                for r in cursor.fetchall():
+                    (added if r["is_favorite"] else removed).append(r["shop_name"])
+                return (True, {"version": version, "full": False, "added": sorted(added), "removed": sorted(removed)})
+            except Exception as e:
+                return (False, {})
+        return self._retry_operation(operation)
+
+    def bulk_update_favorites(
+        self,
+        user_id: int,
+        add_shop_names: List[str],
+        remove_shop_names: List[str]
+    ) -> Tuple[bool, str, Dict[str, Any]]:
+        """
+        在一个事务中按店名批量收藏 / 取消收藏（同名店铺在所有平台上一并处理）。
+        返回 (成功, 消息, {"added": 新增店铺行数, "removed": 删除店铺行数, "version": 新版本号})
+        """
+        def operation():
+            cursor = self._get_thread_cursor()
+            cursor.execute("SELECT user_id FROM users WHERE user_id = ?", (user_id,))
+            if not cursor.fetchone():
+                return (False, "用户不存在", {})
+
+            added = removed = 0
+            for name in remove_shop_names:
+                cursor.execute('''
+                    DELETE FROM user_favorites
+                    WHERE user_id = ? AND shop_id IN (SELECT shop_id FROM shops WHERE shop_name = ?)
+                ''', (user_id, name))
+                removed += max(cursor.rowcount, 0)
+            for name in add_shop_names:
+                cursor.execute('''
+                    INSERT OR IGNORE INTO user_favorites (user_id, shop_id)
+                    SELECT ?, shop_id FROM shops WHERE shop_name = ?
+                ''', (user_id, name))
+                added += max(cursor.rowcount, 0)
+
+            cursor.execute("SELECT version FROM favorite_versions WHERE user_id = ?", (user_id,))
+            row = cursor.fetchone()
+            return (True, "批量更新成功", {
+                "added": added,
+                "removed": removed,
+                "version": row["version"] if row else 0
+            })
+
+        # 操作抛异常时写线程只回滚它自己的 SAVEPOINT，整个批量更新要么全部生效要么都不生效
+        try:
+            return self._write(operation)
+        except Exception as e:
+            return (False, f"批量更新失败: {e}", {})
+
     # ======================
     # 平台、店铺、优惠券、菜品管理
     # ======================
@@ -318,11 +1051,10 @@ class FoodPriceDB:
                 if cursor.fetchone():
                     return (False, "平台已存在")
                 cursor.execute("INSERT INTO platforms (platform_name) VALUES (?)", (platform_name,))
-                self._get_thread_connection().commit()
                 return (True, "平台添加成功")
             except Exception as e:
                 return (False, f"添加失败: {e}")
-        return self._retry_operation(operation)
+        return self._write(operation)
 
     def add_shop(
         self,
@@ -335,7 +1067,9 @@ class FoodPriceDB:
         monthly_sales: int = 0,
         min_order: float = 0,
         avg_consumption: float = 0,
-        image_url: Optional[str] = None
+        image_url: Optional[str] = None,
+        latitude: Optional[float] = None,
+        longitude: Optional[float] = None
     ) -> Tuple[bool, str, Optional[int]]:
         def operation():
             cursor = self._get_thread_cursor()
@@ -349,20 +1083,19 @@ class FoodPriceDB:
                     """INSERT INTO shops (
                         platform_id, shop_name, delivery_distance, rating,
                         delivery_time, delivery_fee, monthly_sales,
-                        min_order, avg_consumption, image_url
-                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                        min_order, avg_consumption, image_url, latitude, longitude
+                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
                     (
                         platform['platform_id'], shop_name, delivery_distance, rating,
                         delivery_time, delivery_fee, monthly_sales,
-                        min_order, avg_consumption, image_url
+                        min_order, avg_consumption, image_url, latitude, longitude
                     )
                 )
                 shop_id = cursor.lastrowid
-                self._get_thread_connection().commit()
                 return (True, "店铺添加成功", shop_id)
             except Exception as e:
                 return (False, f"添加失败: {e}", None)
-        return self._retry_operation(operation)
+        return self._write(operation)
 
     def add_coupon(
         self,
@@ -384,11 +1117,10 @@ class FoodPriceDB:
                        VALUES (?, ?, ?, ?, ?)""",
                     (shop_id, condition_amount, discount_amount, valid_from, valid_to)
                 )
-                self._get_thread_connection().commit()
                 return (True, "满减优惠添加成功")
             except Exception as e:
                 return (False, f"添加失败: {e}")
-        return self._retry_operation(operation)
+        return self._write(operation)
 
     def add_dish(self, shop_id: int, dish_name: str, price: float) -> Tuple[bool, str]:
         def operation():
@@ -402,11 +1134,10 @@ class FoodPriceDB:
                     "INSERT INTO dishes (shop_id, dish_name, price) VALUES (?, ?, ?)",
                     (shop_id, dish_name, price)
                 )
-                self._get_thread_connection().commit()
                 return (True, "菜品添加成功")
             except Exception as e:
                 return (False, f"添加失败: {e}")
-        return self._retry_operation(operation)
+        return self._write(operation)
 
     def compare_dish_price(
         self, 
@@ -499,11 +1230,15 @@ class FoodPriceDB:
             cursor = self._get_thread_cursor()
             try:
                 cursor.execute("DELETE FROM user_favorites")
+                cursor.execute("DELETE FROM favorite_changes")
+                cursor.execute("DELETE FROM favorite_versions")
                 cursor.execute("DELETE FROM dishes")
                 cursor.execute("DELETE FROM coupons")
                 cursor.execute("DELETE FROM shops")
+                cursor.execute("DELETE FROM shop_regions")
                 cursor.execute("DELETE FROM users")
                 self._get_thread_connection().commit()
+                self.user_cache.invalidate()
                 print("✅ 所有业务数据已清空")
                 return True
             except Exception as e:
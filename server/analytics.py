@@ -0,0 +1,311 @@
+import math
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict, defaultdict
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # 已列入 requirements.txt；缺失时（如精简部署）退回标准库 array + 循环计算，结果一致
+    np = None
+
+try:
+    from server import metrics
+    from server.catalog import ELEME, MEITUAN
+except ImportError:  # 以脚本方式在 server/ 目录下运行时
+    import metrics
+    from catalog import ELEME, MEITUAN
+
+analytics_compute_seconds = metrics.metrics.histogram(
+    "analytics_compute_seconds", "目录统计计算耗时（秒）", ("backend",))
+
+PERCENTILES = (10, 25, 50, 75, 90, 99)
+# 满减节省金额分桶上界（元）
+SAVINGS_BUCKETS = (0, 2, 4, 6, 8, 10, 15, 20, 30)
+# 两个平台到手价相差不超过该值视为持平
+TIE_EPSILON = 0.005
+
+
+class Columns:
+    """
+    一个或多个快照的店铺级列（按 shop_id 升序，分片间 shop_id 不重复）；
+    菜品行直接使用快照里的 array 列，NumPy 实现零拷贝包装后向量化计算，标准库实现逐行遍历。
+    """
+
+    def __init__(self, snapshots: Sequence[Any]):
+        self.snapshots = list(snapshots)
+        self.platforms: List[str] = [MEITUAN, ELEME]
+        self.shop_ids = array("q")
+        self.shop_platform = array("i")
+        self.shop_fee = array("d")
+        # 每个店铺的满减档位 [(门槛, 减免)]
+        self.shop_coupons: List[Tuple[Tuple[float, float], ...]] = []
+        shops = sorted((shop_id, shop) for snapshot in self.snapshots for shop_id, shop in snapshot.shops.items())
+        for shop_id, shop in shops:
+            if shop.platform not in self.platforms:
+                self.platforms.append(shop.platform)
+            self.shop_ids.append(shop_id)
+            self.shop_platform.append(self.platforms.index(shop.platform))
+            self.shop_fee.append(shop.delivery_fee or 0.0)
+            self.shop_coupons.append(tuple(shop.coupons))
+        self.rows = sum(len(snapshot.dish_names) for snapshot in self.snapshots)
+        # (店铺组, 菜名) 组合键：菜名编号只在同一快照内有意义，店铺组不跨快照，组合后仍唯一
+        self.name_stride = max((len(s.dish_index.names) for s in self.snapshots), default=1) or 1
+
+    def group_offsets(self) -> List[int]:
+        offsets, total = [], 0
+        for snapshot in self.snapshots:
+            offsets.append(total)
+            total += len(snapshot.group_names)
+        return offsets
+
+
+# ======================
+# NumPy 实现
+# ======================
+def _numpy_stats(cols: Columns) -> Dict[str, Any]:
+    parts = cols.snapshots
+    price = np.concatenate([np.frombuffer(s.dish_prices, dtype=np.float64) for s in parts] or [np.zeros(0)])
+    row_shop_ids = np.concatenate([np.frombuffer(s.dish_shop_ids, dtype=np.int64) for s in parts]
+                                  or [np.zeros(0, dtype=np.int64)])
+    dish_shop = np.searchsorted(np.frombuffer(cols.shop_ids, dtype=np.int64), row_shop_ids)
+    shop_platform = np.frombuffer(cols.shop_platform, dtype=np.int32)
+    shop_fee = np.frombuffer(cols.shop_fee, dtype=np.float64)
+    platform = shop_platform[dish_shop]
+    total = price + shop_fee[dish_shop]
+
+    # 满减档位补齐成 (店铺数, 最大档位数) 矩阵，未用的档位门槛为 +inf
+    width = max((len(c) for c in cols.shop_coupons), default=0)
+    discount = np.zeros(len(price))
+    has_coupon = np.zeros(len(price), dtype=bool)
+    if width:
+        conditions = np.full((len(cols.shop_coupons), width), np.inf)
+        amounts = np.zeros((len(cols.shop_coupons), width))
+        for i, coupons in enumerate(cols.shop_coupons):
+            for j, (condition, amount) in enumerate(coupons):
+                conditions[i, j] = condition
+                amounts[i, j] = amount
+        met = conditions[dish_shop] <= total[:, None]
+        discount = np.where(met, amounts[dish_shop], 0.0).max(axis=1)
+        has_coupon = np.isfinite(conditions[dish_shop, 0])
+    final = total - discount
+
+    result = {"price": {}, "delivery_fee": {}}
+    for code, name in enumerate(cols.platforms):
+        result["price"][name] = _np_distribution(price[platform == code])
+        result["delivery_fee"][name] = _np_distribution(shop_fee[shop_platform == code])
+
+    eligible = discount[has_coupon]
+    bins = np.bincount(np.searchsorted(np.array(SAVINGS_BUCKETS, dtype=float), discount, side="left"),
+                       minlength=len(SAVINGS_BUCKETS) + 1)
+    result["coupons"] = _coupon_summary(
+        rows=len(price), with_coupon=int(has_coupon.sum()), met=int((discount > 0).sum()),
+        saving_sum=float(discount.sum()), eligible_sum=float(eligible.sum()), histogram=bins.tolist())
+
+    # 平台比价：同一店铺组里两个平台上同名菜品的到手价
+    keys = []
+    for snapshot, offset in zip(parts, cols.group_offsets()):
+        names = np.empty(len(snapshot.dish_names), dtype=np.int64)
+        for name_id, name_rows in enumerate(snapshot.dish_index.rows):
+            names[np.frombuffer(name_rows, dtype=np.int32)] = name_id
+        groups = np.frombuffer(snapshot.dish_group_ids, dtype=np.int32).astype(np.int64) + offset
+        keys.append(groups * cols.name_stride + names)
+    key = np.concatenate(keys or [np.zeros(0, dtype=np.int64)])
+    mt, ele = platform == 0, platform == 1
+    _, mt_idx, ele_idx = np.intersect1d(key[mt], key[ele], assume_unique=True, return_indices=True)
+    gap = final[mt][mt_idx] - final[ele][ele_idx]
+    result["platform_win_rate"] = _win_summary(
+        pairs=len(gap), meituan=int((gap < -TIE_EPSILON).sum()), ele=int((gap > TIE_EPSILON).sum()),
+        abs_gap_sum=float(np.abs(gap).sum()))
+    return result
+
+
+def _np_distribution(values) -> Dict[str, Any]:
+    if len(values) == 0:
+        return {"count": 0}
+    pct = np.percentile(values, PERCENTILES)
+    return {
+        "count": int(len(values)),
+        "mean": round(float(values.mean()), 2),
+        "min": round(float(values.min()), 2),
+        "max": round(float(values.max()), 2),
+        "percentiles": {f"p{p}": round(float(v), 2) for p, v in zip(PERCENTILES, pct)}
+    }
+
+
+# ======================
+# 标准库实现
+# ======================
+def _python_stats(cols: Columns) -> Dict[str, Any]:
+    fee_of, platform_of = cols.shop_fee, cols.shop_platform
+    shop_index = {shop_id: i for i, shop_id in enumerate(cols.shop_ids)}
+    by_platform = defaultdict(list)
+    rows_with_coupon = met = 0
+    saving_sum = eligible_sum = 0.0
+    histogram = [0] * (len(SAVINGS_BUCKETS) + 1)
+    # (店铺组, 菜名) → 各平台到手价
+    finals: Dict[int, Dict[int, float]] = defaultdict(dict)
+
+    for snapshot, offset in zip(cols.snapshots, cols.group_offsets()):
+        names = array("q", bytes(8 * len(snapshot.dish_names)))
+        for name_id, name_rows in enumerate(snapshot.dish_index.rows):
+            for row in name_rows:
+                names[row] = name_id
+        prices, groups = snapshot.dish_prices, snapshot.dish_group_ids
+        for row, shop_id in enumerate(snapshot.dish_shop_ids):
+            shop = shop_index[shop_id]
+            total = prices[row] + fee_of[shop]
+            coupons = cols.shop_coupons[shop]
+            discount = 0.0
+            for condition, amount in coupons:
+                if condition <= total and amount > discount:
+                    discount = amount
+            if coupons:
+                rows_with_coupon += 1
+                eligible_sum += discount
+            if discount > 0:
+                met += 1
+            saving_sum += discount
+            histogram[bisect_left(SAVINGS_BUCKETS, discount)] += 1
+            by_platform[platform_of[shop]].append(prices[row])
+            if platform_of[shop] in (0, 1):
+                finals[(groups[row] + offset) * cols.name_stride + names[row]][platform_of[shop]] = total - discount
+
+    fees = defaultdict(list)
+    for shop, code in enumerate(platform_of):
+        fees[code].append(fee_of[shop])
+
+    result = {"price": {}, "delivery_fee": {}}
+    for code, name in enumerate(cols.platforms):
+        result["price"][name] = _py_distribution(by_platform.get(code, []))
+        result["delivery_fee"][name] = _py_distribution(fees.get(code, []))
+    result["coupons"] = _coupon_summary(
+        rows=cols.rows, with_coupon=rows_with_coupon, met=met,
+        saving_sum=saving_sum, eligible_sum=eligible_sum, histogram=histogram)
+
+    pairs = mt_wins = ele_wins = 0
+    abs_gap_sum = 0.0
+    for platform_finals in finals.values():
+        if len(platform_finals) < 2:
+            continue
+        gap = platform_finals[0] - platform_finals[1]
+        pairs += 1
+        abs_gap_sum += abs(gap)
+        if gap < -TIE_EPSILON:
+            mt_wins += 1
+        elif gap > TIE_EPSILON:
+            ele_wins += 1
+    result["platform_win_rate"] = _win_summary(pairs, mt_wins, ele_wins, abs_gap_sum)
+    return result
+
+
+def _py_distribution(values: List[float]) -> Dict[str, Any]:
+    if not values:
+        return {"count": 0}
+    ordered = sorted(values)
+
+    def percentile(q: float) -> float:
+        # 与 numpy.percentile 默认的线性插值一致
+        k = (len(ordered) - 1) * q / 100
+        lo = int(math.floor(k))
+        hi = min(lo + 1, len(ordered) - 1)
+        return ordered[lo] + (ordered[hi] - ordered[lo]) * (k - lo)
+
+    return {
+        "count": len(ordered),
+        "mean": round(math.fsum(ordered) / len(ordered), 2),
+        "min": round(ordered[0], 2),
+        "max": round(ordered[-1], 2),
+        "percentiles": {f"p{p}": round(percentile(p), 2) for p in PERCENTILES}
+    }
+
+
+# ======================
+# 汇总
+# ======================
+def _coupon_summary(rows: int, with_coupon: int, met: int, saving_sum: float,
+                    eligible_sum: float, histogram: List[int]) -> Dict[str, Any]:
+    """按单点一道菜计算：到手价 = 菜价 + 配送费 - 可用的最大满减"""
+    labels = [str(b) for b in SAVINGS_BUCKETS] + ["+Inf"]
+    return {
+        "dishes_with_coupon_shop": with_coupon,
+        "meets_rate": round(met / rows, 4) if rows else 0,
+        "avg_saving": round(saving_sum / rows, 2) if rows else 0,
+        "avg_saving_with_coupon_shop": round(eligible_sum / with_coupon, 2) if with_coupon else 0,
+        "saving_histogram": [{"le": label, "count": int(count)} for label, count in zip(labels, histogram)]
+    }
+
+
+def _win_summary(pairs: int, meituan: int, ele: int, abs_gap_sum: float) -> Dict[str, Any]:
+    """两个平台都有售的同一道菜（同店铺组、同菜名），哪个平台到手价更低"""
+    return {
+        "pairs": pairs,
+        "meituan": round(meituan / pairs, 4) if pairs else 0,
+        "ele": round(ele / pairs, 4) if pairs else 0,
+        "tie": round((pairs - meituan - ele) / pairs, 4) if pairs else 0,
+        "avg_abs_gap": round(abs_gap_sum / pairs, 2) if pairs else 0
+    }
+
+
+class CatalogAnalytics:
+    """
+    按快照选择（全部分片 / 单个区域）分别缓存统计结果，某个选择的快照替换后第一次请求时重新计算。
+    缓存最多 max_entries 项（分片数 + 1 即可覆盖每个区域加全部）；同一选择只由一个请求计算，
+    不同选择之间互不阻塞。
+    """
+
+    def __init__(self, use_numpy: Optional[bool] = None, max_entries: int = 8):
+        self.use_numpy = np is not None if use_numpy is None else (use_numpy and np is not None)
+        self.max_entries = max(1, max_entries)
+        self.lock = threading.Lock()
+        # 选择（各快照所属目录的 id）→ (快照版本键, 结果)，按最近使用排序
+        self.cache: "OrderedDict[Tuple, Tuple[Tuple, Dict[str, Any]]]" = OrderedDict()
+        self.computing: Dict[Tuple, threading.Lock] = {}
+
+    @property
+    def backend(self) -> str:
+        return "numpy" if self.use_numpy else "array"
+
+    def _lookup(self, selection: Tuple, version: Tuple) -> Optional[Dict[str, Any]]:
+        entry = self.cache.get(selection)
+        if entry is None or entry[0] != version:
+            return None
+        self.cache.move_to_end(selection)
+        return entry[1]
+
+    def stats(self, snapshots: Sequence[Any], selection: Optional[Tuple] = None) -> Dict[str, Any]:
+        """selection：调用方对这组快照的稳定标识（如区域名元组），默认按快照对象区分"""
+        version = tuple((id(s), s.generation) for s in snapshots)
+        selection = version if selection is None else tuple(selection)
+        with self.lock:
+            cached = self._lookup(selection, version)
+            if cached is not None:
+                return cached
+            computing = self.computing.setdefault(selection, threading.Lock())
+        with computing:
+            with self.lock:
+                cached = self._lookup(selection, version)  # 等待期间可能已由其他请求算好
+                if cached is not None:
+                    return cached
+            start = time.perf_counter()
+            cols = Columns(snapshots)
+            result = _numpy_stats(cols) if self.use_numpy else _python_stats(cols)
+            elapsed = time.perf_counter() - start
+            analytics_compute_seconds.observe(elapsed, backend=self.backend)
+            result = {
+                "backend": self.backend,
+                "generations": [s.generation for s in snapshots],
+                "dishes": cols.rows,
+                "shops": len(cols.shop_fee),
+                "computed_ms": round(elapsed * 1000, 1),
+                **result
+            }
+            with self.lock:
+                self.cache[selection] = (version, result)
+                self.cache.move_to_end(selection)
+                while len(self.cache) > self.max_entries:
+                    evicted, _ = self.cache.popitem(last=False)
+                    self.computing.pop(evicted, None)
+            return result
@@ -1,9 +1,14 @@
-from flask import Flask, request, jsonify, send_from_directory
+import time
+_IMPORT_START = time.perf_counter()  # 用于统计模块导入耗时
+
+from flask import Flask, request, jsonify, send_from_directory, Response, g
 from flask_cors import CORS
-import os, random
+import os
+import hmac
+import subprocess
+import json
 import sys
 from pathlib import Path
-from collections import defaultdict
 
 # 将项目根目录（即 server 的父目录）加入 Python 路径
 ROOT_DIR = Path(__file__).parent.parent
@@ -11,66 +16,254 @@ if str(ROOT_DIR) not in sys.path:
     sys.path.insert(0, str(ROOT_DIR))
 
 # 现在可以正常导入 server.xxx
-from server.FoodPriceDB import FoodPriceDB
-from server.utils import load_data_from_json
+from server.FoodPriceDB import FoodPriceDB, id_set, SQLITE_MAINTENANCE_SECONDS, SQLITE_VACUUM_PAGES
+from server import metrics
+from server.sql_trace import tracer
+from server.profiler import profiler
+from server.startup import Startup
+from server.auth import TokenService, bearer_token
+from server.passwords import PasswordPoolBusy
+from server.shards import ShardRouter
+from server.dish_search import SORT_MODES, paginate, parse_terms
+from server.analytics import CatalogAnalytics
+from server.images import ImageCache, image_requests, placeholder
+from server.export import ExportError, export as export_catalog
+from server.scheduler import Scheduler, JOB_LEASE_SECONDS, LOCAL
 
 app = Flask(__name__)
 CORS(app)  # 允许跨域
-
-# 全局 db 实例
-db = None
-
-# 初始化数据库（Vercel 适配）
-def init_db():
-    global db
-    if db is None:
-        db = FoodPriceDB()
-        db_path = os.getenv("DB_PATH", "/tmp/food_price.db")  # Vercel 使用 /tmp 目录
+metrics.init_app(app)  # 按路由统计请求数 / 状态码 / 延迟
+
+# 全局 db 实例（导入时只创建对象，建表和加载数据在后台启动线程中完成）
+db = FoodPriceDB()
+startup = Startup()
+# 区域分片路由：每个分片各有一份内存目录快照，搜索 / 比价 / 收藏卡片都从快照读取
+# （未配置 SHARD_REGIONS 时只有一个分片，即全局库本身）
+router = ShardRouter(db)
+# 目录统计（有 NumPy 时向量化计算），结果按区域选择与快照版本缓存（每个区域一项 + 全部分片一项）
+analytics = CatalogAnalytics(max_entries=len(router.shards) + 1)
+# 后台任务调度（周期 / 按需任务，任务表在全局库）
+scheduler = Scheduler(db)
+# 店铺图片缩略图的磁盘 LRU 缓存（远程原图在后台抓取，接口从不等待远程主机）
+images = ImageCache()
+
+# 启动阶段 1：建表（Vercel 适配）
+def init_schema():
+    db_path = os.getenv("DB_PATH", "/tmp/food_price.db")  # Vercel 使用 /tmp 目录
+    if not db.initialize(db_path):
+        # 如果初始化失败，尝试使用内存数据库
+        db_path = ":memory:"
         if not db.initialize(db_path):
-            # 如果初始化失败，尝试使用内存数据库
-            db_path = ":memory:"
-            if not db.initialize(db_path):
-                raise RuntimeError("数据库初始化失败")
-        
-        # 只在数据库为空时加载数据
-        conn = db._get_thread_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT COUNT(*) as count FROM shops")
-        count = cursor.fetchone()["count"]
-        if count == 0:
-            # 尝试从多个可能的位置加载数据
-            possible_paths = [
-                "./server/data.json",  # 相对路径
-                "server/data.json",    # 相对路径
-                "/tmp/data.json",      # Vercel 临时目录
-                "data.json"            # 根目录
-            ]
-            
-            data_loaded = False
-            for data_path in possible_paths:
-                try:
-                    if os.path.exists(data_path):
-                        print(f"从 {data_path} 加载数据...")
-                        load_data_from_json(db, data_path)
-                        data_loaded = True
-                        print("数据加载成功")
-                        break
-                except Exception as e:
-                    print(f"从 {data_path} 加载数据失败: {e}")
-                    continue
-            
-            if not data_loaded:
-                print("警告: 无法从任何路径加载数据文件")
-
-# 确保在应用启动时初始化数据库
-init_db()
-
-# 工具函数：从请求头获取用户 ID
-def get_user_id_from_request():
-    user_id = request.headers.get("X-User-ID")
-    if not user_id or not user_id.isdigit():
+            raise RuntimeError("数据库初始化失败")
+    if not router.initialize():
+        raise RuntimeError("区域分片初始化失败")
+
+# 启动阶段 2：只在数据库为空时加载数据
+def init_catalog():
+    count = router.shop_count()
+    if count == 0:
+        # 尝试从多个可能的位置加载数据
+        possible_paths = [
+            "./server/data.json",  # 相对路径
+            "server/data.json",    # 相对路径
+            "/tmp/data.json",      # Vercel 临时目录
+            "data.json"            # 根目录
+        ]
+
+        data_loaded = False
+        for data_path in possible_paths:
+            try:
+                if os.path.exists(data_path):
+                    print(f"从 {data_path} 加载数据...")
+                    router.ingest_json(data_path)
+                    data_loaded = True
+                    print("数据加载成功")
+                    break
+            except Exception as e:
+                print(f"从 {data_path} 加载数据失败: {e}")
+                continue
+
+        if not data_loaded:
+            print("警告: 无法从任何路径加载数据文件")
+
+# 启动阶段 3：预热（把店铺 / 菜品页读入操作系统页缓存，失败不影响服务）
+def warm_caches():
+    for shard in router.shards:
+        cursor = shard.db._get_thread_cursor()
+        cursor.execute("SELECT shop_id, shop_name, platform_id, monthly_sales, rating FROM shops")
+        cursor.fetchall()
+        cursor.execute("SELECT shop_id, dish_name, price FROM dishes")
+        while cursor.fetchmany(10000):
+            pass
+        shard.db.close_thread_resources()
+
+# 启动阶段 4：构建内存目录快照，并开始监视数据库目录版本（reload_data.py 重载后自动后台重建）；随后启动后台任务调度
+def build_snapshot():
+    router.rebuild_all()
+    router.start_watchers(float(os.getenv("CATALOG_POLL_SECONDS", "2")))
+    scheduler.start()
+
+# ========== 后台任务 ==========
+# 周期（秒）均可用环境变量调整，0 表示只按需运行（POST /api/admin/jobs/<name>/run）
+
+def job_sqlite_maintenance():
+    return {name: database.maintain(optimize=True, vacuum_pages=SQLITE_VACUUM_PAGES)
+            for name, database in router.databases().items()}
+
+def job_sqlite_analyze():
+    return {name: database.maintain(analyze=True, optimize=False)
+            for name, database in router.databases().items()}
+
+def job_coupon_sweep():
+    return {name: database.delete_expired_coupons() for name, database in router.databases().items()}
+
+def job_favorite_changes_prune():
+    # 收藏只在全局库
+    return db.prune_favorite_changes()
+
+def job_table_recount():
+    return {name: database.recount_tables() for name, database in router.databases().items()}
+
+def job_recommend_rebuild():
+    # 共同收藏随收藏变化，目录不变时也需要定期刷新
+    for shard in router.shards:
+        if shard.catalog.current is not None:
+            shard.recommender.rebuild(shard.catalog.current)
+    return {shard.region: shard.recommender.current.stats() if shard.recommender.current else None
+            for shard in router.shards}
+
+def job_catalog_reload():
+    router.rebuild_all()
+    return router.stats()
+
+scheduler.register("sqlite_maintenance", job_sqlite_maintenance, SQLITE_MAINTENANCE_SECONDS,
+                   description="PRAGMA optimize + 增量 VACUUM")
+scheduler.register("sqlite_analyze", job_sqlite_analyze, float(os.getenv("JOB_ANALYZE_SECONDS", "86400")),
+                   description="ANALYZE 更新查询规划统计")
+scheduler.register("coupon_sweep", job_coupon_sweep, float(os.getenv("JOB_COUPON_SWEEP_SECONDS", "3600")),
+                   description="删除已过期的满减（目录版本随之递增，快照自动重建）")
+scheduler.register("favorite_changes_prune", job_favorite_changes_prune,
+                   float(os.getenv("JOB_FAVORITE_PRUNE_SECONDS", "3600")),
+                   description="清理收藏变更日志（每个用户保留最近 FAVORITE_CHANGES_KEEP 个版本）")
+scheduler.register("table_recount", job_table_recount, float(os.getenv("JOB_RECOUNT_SECONDS", "86400")),
+                   description="COUNT(*) 校正触发器维护的行数")
+scheduler.register("recommend_rebuild", job_recommend_rebuild,
+                   float(os.getenv("RECOMMEND_REFRESH_SECONDS", "3600")), scope=LOCAL,
+                   description="重建推荐相似度（刷新共同收藏）")
+scheduler.register("catalog_reload", job_catalog_reload, scope=LOCAL, description="强制重建内存目录快照")
+scheduler.register("cache_warm", warm_caches, scope=LOCAL, description="把店铺 / 菜品页读入页缓存")
+
+# 配置了 INGEST_DIR 时定期增量导入该目录下的数据文件（内容未变的文件跳过）；
+# 在子进程中运行 ingest.py：解析进程池不从多线程的服务进程 fork，写入经 SQLite 文件锁与服务进程串行
+INGEST_DIR = os.getenv("INGEST_DIR")
+if INGEST_DIR:
+    def job_catalog_ingest():
+        command = [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "ingest.py"),
+                   INGEST_DIR, "--workers", os.getenv("INGEST_WORKERS", "1")]
+        result = subprocess.run(command, capture_output=True, text=True, timeout=JOB_LEASE_SECONDS)
+        output = (result.stdout + result.stderr).strip()[-1000:]
+        if result.returncode != 0:
+            raise RuntimeError(f"ingest.py 退出码 {result.returncode}: {output}")
+        return output
+
+    scheduler.register("catalog_ingest", job_catalog_ingest, float(os.getenv("JOB_INGEST_SECONDS", "600")),
+                       description=f"增量导入 {INGEST_DIR}")
+
+startup.add_phase("schema", init_schema)
+startup.add_phase("catalog", init_catalog)
+startup.add_phase("warmup", warm_caches, required=False)
+startup.add_phase("snapshot", build_snapshot)
+
+# 启动前未就绪时仍可访问的接口
+STARTUP_EXEMPT_PATHS = ('/api/health', '/api/ready', '/api/metrics')
+# 请求到达时最多等待必需阶段（直到目录快照构建完）完成的时间（默认 10 秒），
+# 仍未完成才返回 503（前端 apiFetch 按 Retry-After 重试）
+STARTUP_WAIT_SECONDS = float(os.getenv("STARTUP_WAIT_MS", "10000")) / 1000
+
+@app.before_request
+def reject_until_ready():
+    if not request.path.startswith('/api/') or request.path in STARTUP_EXEMPT_PATHS:
         return None
-    return int(user_id)
+    if startup.ready:
+        return None
+    if STARTUP_WAIT_SECONDS > 0 and startup.wait(timeout=STARTUP_WAIT_SECONDS) and startup.ready:
+        return None
+    response = jsonify({
+        "success": False,
+        "message": "服务正在启动，请稍后重试",
+        "warming_up": True,
+        "phases": startup.status()["phases"]
+    })
+    response.status_code = 503
+    response.headers["Retry-After"] = "1"
+    return response
+
+# 表行数 Gauge：抓取时读取触发器维护的计数表
+metrics.metrics.gauge(
+    "table_rows", "各业务表行数（触发器增量维护）", ("table",),
+    callback=lambda: {(name,): count for name, count in router.table_counts().items()}
+    if startup.is_done("schema") else {}
+)
+
+# SQLite 存储 Gauge：文件 / WAL 大小与页缓存计数（抓取时读取，不扫描 dbstat）
+def _storage_gauges():
+    files, cache = {}, {}
+    if startup.is_done("schema"):
+        for name, database in router.databases().items():
+            stats = database.storage_stats(objects=False)
+            for kind in ("file", "wal", "freelist"):
+                files[(name, kind)] = stats[f"{kind}_bytes"]
+            for kind in ("hits", "misses", "writes"):
+                if stats["page_cache"] is not None:
+                    cache[(name, kind)] = stats["page_cache"][kind]
+    return files, cache
+
+metrics.metrics.gauge(
+    "sqlite_bytes", "SQLite 库文件 / WAL / 空闲页字节数", ("db", "kind"),
+    callback=lambda: _storage_gauges()[0]
+)
+metrics.metrics.gauge(
+    "sqlite_page_cache", "SQLite 页缓存命中 / 未命中 / 写出次数（存活连接累计）", ("db", "kind"),
+    callback=lambda: _storage_gauges()[1]
+)
+
+metrics.metrics.gauge("image_cache_bytes", "图片缓存目录占用字节数", callback=lambda: {(): images.total_bytes})
+metrics.metrics.gauge("image_cache_files", "图片缓存文件数", callback=lambda: {(): len(images.entries)})
+
+# 签名会话令牌（HMAC，进程内校验，无需查库）
+tokens = TokenService()
+# 兼容旧客户端：仅在显式开启时信任 X-User-ID 请求头
+ALLOW_USER_ID_HEADER = os.getenv("ALLOW_USER_ID_HEADER", "0") == "1"
+
+# 工具函数：从请求中获取已认证的用户 ID（同一请求内只校验一次）
+def get_user_id_from_request():
+    if "user_id" in g:
+        return g.user_id
+    user_id = None
+    token = bearer_token(request.headers.get("Authorization"))
+    if token:
+        user_id = tokens.verify(token)
+    elif ALLOW_USER_ID_HEADER:
+        header = request.headers.get("X-User-ID")
+        if header and header.isdigit():
+            user_id = int(header)
+    g.user_id = user_id
+    return user_id
+
+# 管理员令牌（未配置 ADMIN_TOKEN 时所有管理接口均不可用）
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+
+def is_admin_request():
+    token = request.headers.get("X-Admin-Token", "")
+    return bool(ADMIN_TOKEN) and hmac.compare_digest(token, ADMIN_TOKEN)
+
+# 按用户 / IP 的令牌桶限流 + 全局降载（在启动检查之后执行）
+from server import ratelimit
+ratelimit.init_app(app, get_user_id_from_request)
+
+# 按需采样分析（X-Profile 请求头或 /api/admin/profile 启用）
+from server import profiler as profiler_module
+profiler_module.init_app(app, is_admin_request)
 
 # ========== 静态文件服务 ==========
 
@@ -91,45 +284,196 @@ def health_check():
     return jsonify({
         "success": True, 
         "message": "服务正常运行",
-        "data_loaded": db is not None
+        "data_loaded": startup.is_done("catalog")
     })
 
+@app.route('/api/ready', methods=['GET'])
+def readiness_check():
+    """就绪检查：各启动阶段的状态与耗时；必需阶段未完成时返回 503"""
+    status = startup.status()
+    return jsonify({"success": status["ready"], **status}), 200 if status["ready"] else 503
+
 # ========== 数据检查接口 ==========
 
 @app.route('/api/debug/data', methods=['GET'])
 def debug_data():
     """调试接口：检查数据加载状态"""
-    if db is None:
+    if not startup.is_done("schema"):
         return jsonify({"success": False, "message": "数据库未初始化"})
     
-    conn = db._get_thread_connection()
-    cursor = conn.cursor()
-    
-    # 获取各表记录数
-    cursor.execute("SELECT COUNT(*) as count FROM shops")
-    shop_count = cursor.fetchone()["count"]
-    
-    cursor.execute("SELECT COUNT(*) as count FROM dishes")
-    dish_count = cursor.fetchone()["count"]
-    
-    cursor.execute("SELECT COUNT(*) as count FROM users")
-    user_count = cursor.fetchone()["count"]
-    
-    cursor.execute("SELECT COUNT(*) as count FROM user_favorites")
-    favorite_count = cursor.fetchone()["count"]
-    
+    # 各表记录数（读取触发器维护的计数，不做 COUNT(*) 扫描；目录表按分片求和）
+    counts = router.table_counts()
+
     return jsonify({
         "success": True,
         "data": {
-            "shops": shop_count,
-            "dishes": dish_count,
-            "users": user_count,
-            "favorites": favorite_count
-        }
+            "shops": counts.get("shops", 0),
+            "dishes": counts.get("dishes", 0),
+            "users": counts.get("users", 0),
+            "favorites": counts.get("user_favorites", 0)
+        },
+        "snapshots": router.stats() if startup.is_done("snapshot") else None,
+        "images": images.stats()
     })
 
+@app.route('/api/debug/queries', methods=['GET'])
+def debug_queries():
+    """调试接口（管理员）：按总耗时排序的 SQL 语句汇总 + 最近的慢查询（含 EXPLAIN QUERY PLAN）"""
+    if not is_admin_request():
+        return jsonify({"success": False, "message": "无权限"}), 403
+    top = request.args.get('top', '20')
+    order_by = request.args.get('order_by', 'total_time')
+    if order_by not in ('total_time', 'calls', 'max_time', 'rows', 'slow_calls'):
+        return jsonify({"success": False, "message": "无效排序字段"}), 400
+    return jsonify({
+        "success": True,
+        "slow_threshold_ms": tracer.slow_threshold * 1000,
+        "top": tracer.summary(int(top) if top.isdigit() else 20, order_by),
+        "slow": tracer.slow_queries()
+    })
+
+# ========== 采样分析接口（管理员） ==========
+
+@app.route('/api/admin/profile', methods=['GET', 'POST', 'DELETE'])
+def admin_profile():
+    """
+    POST   {"route": "/api/restaurants/search", "requests": 20} 或 {"seconds": 30}：启动采样
+    GET    查看采样状态
+    DELETE 停止采样并清空已聚合的结果
+    """
+    if not is_admin_request():
+        return jsonify({"success": False, "message": "无权限"}), 403
+
+    if request.method == 'POST':
+        data = request.get_json(silent=True) or {}
+        if not isinstance(data, dict):
+            return jsonify({"success": False, "message": "请求体必须是 JSON 对象"}), 400
+        route = data.get('route') or None
+        requests_n = data.get('requests')
+        seconds = data.get('seconds')
+        if requests_n is not None and (not isinstance(requests_n, int) or requests_n <= 0):
+            return jsonify({"success": False, "message": "requests 必须为正整数"}), 400
+        if seconds is not None and (not isinstance(seconds, (int, float)) or seconds <= 0):
+            return jsonify({"success": False, "message": "seconds 必须为正数"}), 400
+        session = profiler.arm(route=route, requests=requests_n, seconds=seconds)
+        return jsonify({"success": True, "session": session.to_dict()})
+
+    if request.method == 'DELETE':
+        profiler.disarm()
+        profiler.reset()
+        return jsonify({"success": True})
+
+    return jsonify({"success": True, "profiler": profiler.status()})
+
+@app.route('/api/admin/profile/collapsed', methods=['GET'])
+def admin_profile_collapsed():
+    """折叠栈文本，可直接交给 flamegraph.pl / speedscope"""
+    if not is_admin_request():
+        return jsonify({"success": False, "message": "无权限"}), 403
+    route = request.args.get('route') or None
+    return Response(profiler.collapsed(route), mimetype='text/plain')
+
+# ========== 存储统计 / 维护接口（管理员） ==========
+
+@app.route('/api/admin/storage', methods=['GET'])
+def admin_storage():
+    """各库的页数、空闲页、WAL 大小、页缓存命中率与各表 / 索引占用（?objects=0 跳过 dbstat 扫描）"""
+    if not is_admin_request():
+        return jsonify({"success": False, "message": "无权限"}), 403
+    objects = request.args.get('objects', '1') != '0'
+    return jsonify({
+        "success": True,
+        "databases": {name: database.storage_stats(objects) for name, database in router.databases().items()}
+    })
+
+@app.route('/api/admin/storage/maintain', methods=['POST'])
+def admin_storage_maintain():
+    """{"analyze": false, "optimize": true, "vacuum_pages": 0}：在各库上执行 ANALYZE / optimize / 增量 VACUUM"""
+    if not is_admin_request():
+        return jsonify({"success": False, "message": "无权限"}), 403
+    data = request.get_json(silent=True) or {}
+    if not isinstance(data, dict):
+        return jsonify({"success": False, "message": "请求体必须是 JSON 对象"}), 400
+    vacuum_pages = data.get('vacuum_pages', 0)
+    if not isinstance(vacuum_pages, int) or vacuum_pages < 0:
+        return jsonify({"success": False, "message": "vacuum_pages 必须为非负整数"}), 400
+    results = {}
+    for name, database in router.databases().items():
+        results[name] = database.maintain(analyze=bool(data.get('analyze', False)),
+                                          optimize=bool(data.get('optimize', True)),
+                                          vacuum_pages=vacuum_pages)
+    return jsonify({"success": True, "results": results})
+
+# ========== 后台任务接口（管理员） ==========
+
+@app.route('/api/admin/jobs', methods=['GET'])
+def admin_jobs():
+    """各任务的周期、范围、下次运行时间、租约持有者与最近一次结果"""
+    if not is_admin_request():
+        return jsonify({"success": False, "message": "无权限"}), 403
+    return jsonify({"success": True, "worker": scheduler.worker_id, "jobs": scheduler.status()})
+
+@app.route('/api/admin/jobs/runs', methods=['GET'])
+@app.route('/api/admin/jobs/<name>/runs', methods=['GET'])
+def admin_job_runs(name=None):
+    """运行历史（新的在前）：?limit=50"""
+    if not is_admin_request():
+        return jsonify({"success": False, "message": "无权限"}), 403
+    if name is not None and name not in scheduler.jobs:
+        return jsonify({"success": False, "message": "未知任务"}), 404
+    limit = min(max(request.args.get('limit', 50, type=int), 1), 1000)
+    return jsonify({"success": True, "runs": scheduler.history(name, limit)})
+
+@app.route('/api/admin/jobs/<name>/run', methods=['POST'])
+def admin_run_job(name):
+    """按需运行：只排队并立即返回 202，结果见运行历史"""
+    if not is_admin_request():
+        return jsonify({"success": False, "message": "无权限"}), 403
+    if not scheduler.trigger(name):
+        return jsonify({"success": False, "message": "未知任务"}), 404
+    return jsonify({"success": True, "queued": name}), 202
+
+# ========== 数据导出接口（管理员） ==========
+
+EXPORT_MIMETYPES = {"csv": "text/csv", "ndjson": "application/x-ndjson"}
+
+@app.route('/api/admin/export/<dataset>', methods=['GET'])
+def admin_export(dataset):
+    """
+    流式导出 shops / dishes / coupons / comparisons：
+    ?format=csv|ndjson&region=&platform=（可多个）&shop=（店铺组名，可多个）&gzip=1
+    """
+    if not is_admin_request():
+        return jsonify({"success": False, "message": "无权限"}), 403
+    fmt = request.args.get('format', 'csv')
+    compress = request.args.get('gzip', '0') == '1'
+    try:
+        chunks = export_catalog(router, dataset, fmt, request.args.get('region', '').strip() or None,
+                                request.args.getlist('platform'), request.args.getlist('shop'), compress)
+    except ExportError as e:
+        return jsonify({"success": False, "message": str(e)}), 400
+    filename = f"{dataset}.{fmt}{'.gz' if compress else ''}"
+    return Response(chunks, mimetype='application/gzip' if compress else EXPORT_MIMETYPES[fmt],
+                    headers={"Content-Disposition": f'attachment; filename="{filename}"',
+                             "Cache-Control": "no-store"})
+
+# ========== 监控指标接口 ==========
+
+@app.route('/api/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Prometheus 文本格式的指标导出"""
+    return Response(metrics.metrics.render(), mimetype=None, content_type=metrics.CONTENT_TYPE)
+
 # ========== 认证接口 ==========
 
+@app.errorhandler(PasswordPoolBusy)
+def password_pool_busy(e):
+    """密码哈希池饱和：快速失败，提示客户端稍后重试"""
+    response = jsonify({"success": False, "message": str(e)})
+    response.status_code = 429
+    response.headers["Retry-After"] = "1"
+    return response
+
 @app.route('/api/auth/register', methods=['POST'])
 def register():
     data = request.json
@@ -142,7 +486,7 @@ def register():
     success, user_id, msg = db.register_user(username, email, password) 
     if success:
         _, user_info = db.get_user_by_id(user_id) 
-        return jsonify({"success": True, "user": user_info})
+        return jsonify({"success": True, "token": tokens.issue(user_id), "user": user_info})
     else:
         return jsonify({"success": False, "message": msg}), 400
 
@@ -158,7 +502,7 @@ def login():
         _, user_info = db.get_user_by_id(user_id)
         return jsonify({
             "success": True,
-            "token": f"mock_jwt_{user_id}",
+            "token": tokens.issue(user_id),
             "user": user_info
         })
     else:
@@ -177,25 +521,6 @@ def me():
 
 # ========== 收藏接口 ==========
 
-def get_image_url(meituan_data, ele_data):
-    """优先使用美团图片，其次饿了么，最后回退到 placeholder"""
-    def safe_image(row):
-        if row is None:
-            return None
-        url = row["image_url"]
-        return url if url not in (None, "") else None
-
-    mt_url = safe_image(meituan_data)
-    ele_url = safe_image(ele_data)
-
-    if mt_url:
-        return mt_url
-    if ele_url:
-        return ele_url
-
-    shop_name = (meituan_data or ele_data)["shop_name"]
-    return f"https://via.placeholder.com/300x160?text={shop_name}"
-
 @app.route('/api/user/favorites', methods=['GET'])
 def get_favorites():
     user_id = get_user_id_from_request()
@@ -209,135 +534,54 @@ def get_favorites():
     if not favorites:
         return jsonify({"success": True, "favorites": []})
 
-    conn = db._get_thread_connection()
-    cursor = conn.cursor()
+    return jsonify({"success": True, "favorites": router.favorite_cards(favorites)})
 
-    favorite_shop_names = list(set(fav["shop_name"] for fav in favorites))
+# 单次批量操作允许的店铺组上限
+MAX_BULK_FAVORITES = 500
 
-    placeholders = ','.join('?' * len(favorite_shop_names))
-    cursor.execute(f"""
-        SELECT s.shop_id, s.shop_name, s.rating, s.delivery_fee, s.min_order, s.monthly_sales,
-               s.delivery_distance, s.delivery_time, s.image_url,
-               p.platform_name
-        FROM shops s
-        JOIN platforms p ON s.platform_id = p.platform_id
-        WHERE s.shop_name IN ({placeholders})
-        ORDER BY s.shop_name, p.platform_name
-    """, favorite_shop_names)
-
-    all_shops = cursor.fetchall()
-
-    grouped_shops = defaultdict(list)
-    for row in all_shops:
-        grouped_shops[row["shop_name"]].append(row)
-
-    all_shop_ids = [row["shop_id"] for row in all_shops]
-    dish_map = {}
-    if all_shop_ids:
-        placeholders_dish = ','.join('?' * len(all_shop_ids))
-        cursor.execute(f"""
-            SELECT dish_id, shop_id, dish_name, price
-            FROM dishes
-            WHERE shop_id IN ({placeholders_dish})
-            ORDER BY dish_name
-        """, all_shop_ids)
-
-        for dish in cursor.fetchall():
-            shop_id = dish["shop_id"]
-            if shop_id not in dish_map:
-                dish_map[shop_id] = []
-            dish_map[shop_id].append({
-                "name": dish["dish_name"],
-                "price": round(dish["price"], 2)
-            })
-
-    result = []
-    for shop_name, platforms in grouped_shops.items():
-        meituan_data = next((p for p in platforms if p["platform_name"] == "美团"), None)
-        ele_data = next((p for p in platforms if p["platform_name"] == "饿了么"), None)
-
-        main_shop = meituan_data or ele_data
-        if not main_shop:
-            continue
-
-        rating = max(
-            meituan_data["rating"] if meituan_data else 0,
-            ele_data["rating"] if ele_data else 0
-        ) or 4.5
-
-        monthly_sales = (meituan_data["monthly_sales"] if meituan_data else 0) + \
-                        (ele_data["monthly_sales"] if ele_data else 0) or 100
-
-        min_order_meituan = meituan_data["min_order"] if meituan_data else None
-        min_order_ele = ele_data["min_order"] if ele_data else None
-
-        avg_meituan = None
-        avg_ele = None
-
-        if meituan_data:
-            mt_dishes = dish_map.get(meituan_data["shop_id"], [])
-            if mt_dishes:
-                avg_meituan = round(sum(d["price"] for d in mt_dishes) / len(mt_dishes), 2)
-
-        if ele_data:
-            ele_dishes = dish_map.get(ele_data["shop_id"], [])
-            if ele_dishes:
-                avg_ele = round(sum(d["price"] for d in ele_dishes) / len(ele_dishes), 2)
-
-        distance_val = main_shop["delivery_distance"] or 1.2
-        distance_str = f"{distance_val:.1f}km"
-
-        delivery_time_val = main_shop["delivery_time"]
-        delivery_time_str = f"{max(10, delivery_time_val - 5)}-{(delivery_time_val or 35) + 5}分钟" \
-            if delivery_time_val else "30-40分钟"
-
-        dish_name_to_platforms = defaultdict(dict)
-        shop_ids = []
-        if meituan_data:
-            shop_ids.append(meituan_data["shop_id"])
-        if ele_data:
-            shop_ids.append(ele_data["shop_id"])
-
-        for shop_id in shop_ids:
-            platform_name = "meituan" if meituan_data and shop_id == meituan_data["shop_id"] else "ele"
-            dishes = dish_map.get(shop_id, [])
-            for d in dishes:
-                dish_name_to_platforms[d["name"]][platform_name] = d["price"]
-
-        dishes_list = []
-        for name, prices in dish_name_to_platforms.items():
-            dish_entry = {"name": name}
-            if "meituan" in prices:
-                dish_entry["meituan"] = prices["meituan"]
-            if "ele" in prices:
-                dish_entry["ele"] = prices["ele"]
-            dishes_list.append(dish_entry)
-
-        # 使用真实 image_url
-        image_url = get_image_url(meituan_data, ele_data)
-
-        result.append({
-            "id": main_shop["shop_id"],
-            "name": shop_name,
-            "rating": rating,
-            "reviews": monthly_sales,
-            "distance": distance_str,
-            "deliveryTime": delivery_time_str,
-            "deliveryFee": f"¥{((meituan_data['delivery_fee'] if meituan_data else 0) + (ele_data['delivery_fee'] if ele_data else 0)) / 2:.1f}",
-            "minimumOrder": {
-                "meituan": min_order_meituan,
-                "ele": min_order_ele
-            },
-            "image": image_url,
-            "prices": {
-                "meituan": {"current": avg_meituan} if avg_meituan is not None else None,
-                "ele": {"current": avg_ele} if avg_ele is not None else None
-            },
-            "isFavorite": True,
-            "dishes": dishes_list
-        })
+@app.route('/api/user/favorites/ids', methods=['GET'])
+def get_favorite_ids():
+    """轻量收藏同步：只返回自 since 版本以来新增 / 移除的店铺组名称"""
+    user_id = get_user_id_from_request()
+    if not user_id:
+        return jsonify({"success": False, "message": "未登录"}), 401
 
-    return jsonify({"success": True, "favorites": result})
+    since = request.args.get('since', '0')
+    if not since.isdigit():
+        return jsonify({"success": False, "message": "无效版本号"}), 400
+
+    success, delta = db.get_favorite_changes(user_id, int(since))
+    if not success:
+        return jsonify({"success": False, "message": "获取收藏失败"}), 404
+    return jsonify({"success": True, **delta})
+
+@app.route('/api/user/favorites/bulk', methods=['POST'])
+def bulk_update_favorites():
+    """批量收藏 / 取消收藏：{"add": [店名...], "remove": [店名...]}，一个事务内完成"""
+    user_id = get_user_id_from_request()
+    if not user_id:
+        return jsonify({"success": False, "message": "未登录"}), 401
+
+    data = request.get_json(silent=True) or {}
+    if not isinstance(data, dict):
+        return jsonify({"success": False, "message": "请求体必须是 JSON 对象"}), 400
+    add_names = data.get('add', [])
+    remove_names = data.get('remove', [])
+    if not isinstance(add_names, list) or not isinstance(remove_names, list) or \
+            not all(isinstance(n, str) and n.strip() for n in add_names + remove_names):
+        return jsonify({"success": False, "message": "无效店铺名"}), 400
+
+    add_names = list(dict.fromkeys(n.strip() for n in add_names))
+    remove_names = list(dict.fromkeys(n.strip() for n in remove_names))
+    if len(add_names) + len(remove_names) > MAX_BULK_FAVORITES:
+        return jsonify({"success": False, "message": f"单次最多操作 {MAX_BULK_FAVORITES} 个店铺"}), 400
+    if set(add_names) & set(remove_names):
+        return jsonify({"success": False, "message": "同一店铺不能同时收藏和取消收藏"}), 400
+
+    success, msg, result = db.bulk_update_favorites(user_id, add_names, remove_names)
+    if not success:
+        return jsonify({"success": False, "message": msg}), 400
+    return jsonify({"success": True, **result})
 
 @app.route('/api/favorite/toggle', methods=['POST'])
 def toggle_favorite():
@@ -364,11 +608,10 @@ def toggle_favorite():
     if not same_name_shop_ids:
         return jsonify({"success": False, "message": "店铺不存在"}), 404
 
-    placeholders = ','.join('?' * len(same_name_shop_ids))
-    cursor.execute(f"""
-        SELECT shop_id FROM user_favorites 
-        WHERE user_id = ? AND shop_id IN ({placeholders})
-    """, [user_id] + same_name_shop_ids)
+    cursor.execute("""
+        SELECT shop_id FROM user_favorites
+        WHERE user_id = ? AND shop_id IN (SELECT value FROM json_each(?))
+    """, (user_id, id_set(same_name_shop_ids)))
 
     already_favorited = cursor.fetchall()
     has_any_favorite = len(already_favorited) > 0
@@ -394,163 +637,187 @@ def toggle_favorite():
 
 # ========== 搜索接口 ==========
 
+def shard_response(key, rows, missing):
+    """分片查询结果；有分片超时 / 出错时标记为部分结果"""
+    body = {"success": True, key: rows}
+    if missing:
+        body["partial"] = True
+        body["missing_regions"] = missing
+    return jsonify(body)
+
+@app.route('/api/regions', methods=['GET'])
+def list_regions():
+    return jsonify({"success": True, "regions": router.regions, "sharded": router.sharded})
+
+# SSE 心跳间隔（秒）；WSGI 模式下每秒检查一次快照版本
+SSE_HEARTBEAT_SECONDS = float(os.getenv("SSE_HEARTBEAT_SECONDS", "15"))
+SSE_POLL_SECONDS = 1.0
+
+def catalog_generations():
+    return {s.region: s.catalog.current.generation if s.catalog.current else None for s in router.shards}
+
+def sse_event(event, data) -> bytes:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n".encode()
+
+@app.route('/api/events', methods=['GET'])
+def catalog_events():
+    """
+    目录版本推送（SSE）：连接时推送一次各区域的快照版本，之后每次快照替换再推送。
+    WSGI 模式下每个订阅占用一个工作线程；大量长连接请使用 ASGI 模式（server/asgi.py 在事件循环上原生处理）
+    """
+    def stream():
+        last, quiet = None, 0.0
+        while True:
+            current = catalog_generations()
+            if current != last:
+                yield sse_event("catalog", {"generations": current})
+                last, quiet = current, 0.0
+            elif quiet >= SSE_HEARTBEAT_SECONDS:
+                yield b": keep-alive\n\n"
+                quiet = 0.0
+            time.sleep(SSE_POLL_SECONDS)
+            quiet += SSE_POLL_SECONDS
+
+    return Response(stream(), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+# 附近搜索的默认 / 最大半径（公里）与返回条数
+NEARBY_DEFAULT_RADIUS_KM = 3.0
+NEARBY_MAX_RADIUS_KM = 50.0
+NEARBY_MAX_LIMIT = 100
+
+def parse_location(args):
+    """解析 lat / lng / radius / limit；未提供坐标返回 None，参数无效抛 ValueError"""
+    lat, lng = args.get('lat'), args.get('lng')
+    if lat is None and lng is None:
+        return None
+    latitude, longitude = float(lat), float(lng)
+    radius = float(args.get('radius', NEARBY_DEFAULT_RADIUS_KM))
+    limit = int(args.get('limit', 20))
+    if not (-90 <= latitude <= 90 and -180 <= longitude <= 180) or \
+            not 0 < radius <= NEARBY_MAX_RADIUS_KM or not 0 < limit <= NEARBY_MAX_LIMIT:
+        raise ValueError
+    return latitude, longitude, radius, limit
+
 @app.route('/api/restaurants/search', methods=['GET'])
 def search_restaurants():
+    """
+    keyword          店名关键词；为空时返回首页推荐
+    lat / lng        用户坐标；提供时为附近搜索：半径 radius（公里，默认 3）内按距离升序，
+                     最多 limit 个，距离按用户位置实时计算，keyword 作为附加过滤条件
+    region           只查询指定区域分片
+    """
     keyword = request.args.get('keyword', '').strip()
+    shards = router.select(request.args.get('region', '').strip())
+    if shards is None:
+        return jsonify({"success": False, "message": "未知区域"}), 400
+    try:
+        location = parse_location(request.args)
+    except (TypeError, ValueError):
+        return jsonify({"success": False, "message": "无效的位置参数"}), 400
     user_id = get_user_id_from_request()
 
-    conn = db._get_thread_connection()
-    cursor = conn.cursor()
-
-    if keyword:
-        cursor.execute("""
-            SELECT s.shop_id, s.shop_name, s.rating, s.delivery_fee, s.min_order, s.monthly_sales,
-                   s.delivery_distance, s.delivery_time, s.image_url,
-                   p.platform_name
-            FROM shops s
-            JOIN platforms p ON s.platform_id = p.platform_id
-            WHERE s.shop_name LIKE ?
-            ORDER BY s.shop_name, p.platform_name
-        """, (f"%{keyword}%",))
-    else:
-        cursor.execute("""
-            SELECT s.shop_id, s.shop_name, s.rating, s.delivery_fee, s.min_order, s.monthly_sales,
-                   s.delivery_distance, s.delivery_time, s.image_url,
-                   p.platform_name
-            FROM shops s
-            JOIN platforms p ON s.platform_id = p.platform_id
-            ORDER BY s.monthly_sales DESC, s.rating DESC
-        """)
-
-    shop_rows = cursor.fetchall()
-
-    grouped_shops = defaultdict(list)
-    for row in shop_rows:
-        grouped_shops[row["shop_name"]].append(row)
-
-    all_shop_ids = [row["shop_id"] for row in shop_rows]
-    dish_map = {}
-
-    if all_shop_ids:
-        placeholders = ','.join('?' * len(all_shop_ids))
-        cursor.execute(f"""
-            SELECT dish_id, shop_id, dish_name, price
-            FROM dishes
-            WHERE shop_id IN ({placeholders})
-            ORDER BY dish_name
-        """, all_shop_ids)
-
-        for dish in cursor.fetchall():
-            shop_id = dish["shop_id"]
-            if shop_id not in dish_map:
-                dish_map[shop_id] = []
-            dish_map[shop_id].append({
-                "name": dish["dish_name"],
-                "price": round(dish["price"], 2)
-            })
-
     user_favorite_shop_ids = set()
     if user_id:
-        cursor.execute("SELECT shop_id FROM user_favorites WHERE user_id = ?", (user_id,))
-        user_favorite_shop_ids = {row["shop_id"] for row in cursor.fetchall()}
-
-    results = []
-    for shop_name, platforms in grouped_shops.items():
-        meituan_data = next((p for p in platforms if p["platform_name"] == "美团"), None)
-        ele_data = next((p for p in platforms if p["platform_name"] == "饿了么"), None)
-
-        main_shop = meituan_data or ele_data
-        if not main_shop:
-            continue
-
-        rating = max(
-            meituan_data["rating"] if meituan_data else 0,
-            ele_data["rating"] if ele_data else 0
-        ) or 4.5
-
-        monthly_sales = (meituan_data["monthly_sales"] if meituan_data else 0) + \
-                        (ele_data["monthly_sales"] if ele_data else 0) or 100
-
-        min_order_meituan = meituan_data["min_order"] if meituan_data else None
-        min_order_ele = ele_data["min_order"] if ele_data else None
-
-        avg_meituan = None
-        avg_ele = None
-
-        if meituan_data:
-            mt_dishes = dish_map.get(meituan_data["shop_id"], [])
-            if mt_dishes:
-                avg_meituan = round(sum(d["price"] for d in mt_dishes) / len(mt_dishes), 2)
-
-        if ele_data:
-            ele_dishes = dish_map.get(ele_data["shop_id"], [])
-            if ele_dishes:
-                avg_ele = round(sum(d["price"] for d in ele_dishes) / len(ele_dishes), 2)
-
-        distance_val = main_shop["delivery_distance"] or 1.2
-        distance_str = f"{distance_val:.1f}km"
-
-        delivery_time_val = main_shop["delivery_time"]
-        delivery_time_str = f"{max(10, delivery_time_val - 5)}-{(delivery_time_val or 35) + 5}分钟" \
-            if delivery_time_val else "30-40分钟"
-
-        dish_name_to_platforms = defaultdict(dict)
-        shop_ids = []
-        if meituan_data:
-            shop_ids.append(meituan_data["shop_id"])
-        if ele_data:
-            shop_ids.append(ele_data["shop_id"])
-
-        for shop_id in shop_ids:
-            platform_name = "meituan" if meituan_data and shop_id == meituan_data["shop_id"] else "ele"
-            dishes = dish_map.get(shop_id, [])
-            for d in dishes:
-                dish_name_to_platforms[d["name"]][platform_name] = d["price"]
-
-        dishes_list = []
-        for name, prices in dish_name_to_platforms.items():
-            dish_entry = {"name": name}
-            if "meituan" in prices:
-                dish_entry["meituan"] = prices["meituan"]
-            if "ele" in prices:
-                dish_entry["ele"] = prices["ele"]
-            dishes_list.append(dish_entry)
-
-        is_favorite = False
-        if user_id:
-            for sid in shop_ids:
-                if sid in user_favorite_shop_ids:
-                    is_favorite = True
-                    break
-
-        # 使用真实 image_url
-        image_url = get_image_url(meituan_data, ele_data)
-
-        results.append({
-            "id": main_shop["shop_id"],
-            "name": shop_name,
-            "rating": rating,
-            "reviews": monthly_sales,
-            "distance": distance_str,
-            "deliveryTime": delivery_time_str,
-            "deliveryFee": f"¥{((meituan_data['delivery_fee'] if meituan_data else 0) + (ele_data['delivery_fee'] if ele_data else 0)) / 2:.1f}",
-            "minimumOrder": {
-                "meituan": min_order_meituan,
-                "ele": min_order_ele
-            },
-            "image": image_url,
-            "prices": {
-                "meituan": {"current": avg_meituan} if avg_meituan is not None else None,
-                "ele": {"current": avg_ele} if avg_ele is not None else None
-            },
-            "isFavorite": is_favorite,
-            "dishes": dishes_list
-        })
+        user_favorite_shop_ids = db.get_favorite_shop_ids(user_id)
+
+    if location is not None:
+        latitude, longitude, radius, limit = location
+        results, missing = router.nearby(latitude, longitude, radius, keyword or None, limit,
+                                         shards, user_favorite_shop_ids)
+    elif keyword:
+        results, missing = router.search(keyword, shards, user_favorite_shop_ids)
+    else:
+        # 首页推荐：先抽样店铺组再构建卡片，不必为全部店铺生成卡片
+        results, missing = router.home_feed(6, shards, user_favorite_shop_ids)
+    return shard_response("restaurants", results, missing)
+
+# ========== 菜品搜索接口 ==========
+
+DISH_SEARCH_MAX_PAGE_SIZE = 50
+
+@app.route('/api/dishes/search', methods=['GET'])
+def search_dishes():
+    """
+    q          菜名关键词，空格分隔的多个词需同时命中
+    sort       score（默认，相关度 / 价格 / 评分综合）| price | rating
+    page / page_size   分页（page_size 最大 50）
+    region     只查询指定区域分片
+    """
+    terms = parse_terms(request.args.get('q', ''))
+    if not terms or sum(len(t) for t in terms) > 50:
+        return jsonify({"success": False, "message": "无效的搜索词"}), 400
+    sort = request.args.get('sort', 'score')
+    if sort not in SORT_MODES:
+        return jsonify({"success": False, "message": "无效排序方式"}), 400
+    try:
+        page = int(request.args.get('page', '1'))
+        page_size = int(request.args.get('page_size', '20'))
+    except ValueError:
+        return jsonify({"success": False, "message": "无效分页参数"}), 400
+    if page < 1 or not 0 < page_size <= DISH_SEARCH_MAX_PAGE_SIZE:
+        return jsonify({"success": False, "message": "无效分页参数"}), 400
+    shards = router.select(request.args.get('region', '').strip())
+    if shards is None:
+        return jsonify({"success": False, "message": "未知区域"}), 400
+
+    groups, missing = router.search_dishes(terms, sort, shards)
+    body = {
+        "success": True,
+        "total": len(groups),
+        "page": page,
+        "page_size": page_size,
+        "results": [hit.source.dish_group_detail(hit, terms) for hit in paginate(groups, page, page_size)]
+    }
+    if missing:
+        body["partial"] = True
+        body["missing_regions"] = missing
+    return jsonify(body)
+
+# ========== 统计接口 ==========
+
+@app.route('/api/stats', methods=['GET'])
+def catalog_stats():
+    """目录统计：各平台价格 / 配送费分布、满减节省、平台比价胜率（按目录版本缓存）"""
+    shards = router.select(request.args.get('region', '').strip())
+    if shards is None:
+        return jsonify({"success": False, "message": "未知区域"}), 400
+    snapshots = [shard.catalog.current for shard in shards]
+    return jsonify({"success": True, "stats": analytics.stats(snapshots, tuple(shard.region for shard in shards))})
+
+# ========== 店铺图片 ==========
+
+# 缩略图按内容摘要寻址，可以长期缓存；占位图在原图抓取完成后会被替换，只短暂缓存
+IMAGE_MAX_AGE = 86400
+PLACEHOLDER_MAX_AGE = 60
+
+@app.route('/api/img/<int:shop_id>', methods=['GET'])
+def shop_image(shop_id):
+    """店铺缩略图：命中本地缓存直接返回；未命中时安排后台抓取并先返回本地占位图。支持 If-None-Match"""
+    shop = router.find_shop(shop_id)
+    if shop is None:
+        return jsonify({"success": False, "message": "店铺不存在"}), 404
 
-    if not keyword and len(results) > 6:
-        results = random.sample(results, 6)
+    cached = images.lookup(shop.image_url) if shop.image_url else None
+    body = None
+    if cached is not None:
+        try:
+            body = cached.read()
+        except OSError:  # 刚被其他进程淘汰
+            cached = None
+    if cached is not None:
+        image_requests.inc(result="hit")
+        content_type, etag, max_age = cached.content_type, cached.etag, IMAGE_MAX_AGE
+    else:
+        pending = bool(shop.image_url) and (images.request(shop.image_url) or shop.image_url in images.in_flight)
+        image_requests.inc(result="pending" if pending else "placeholder")
+        body, content_type, etag = placeholder(shop.shop_name)
+        max_age = PLACEHOLDER_MAX_AGE if shop.image_url else IMAGE_MAX_AGE
 
-    return jsonify({"success": True, "restaurants": results})
+    response = Response(body, content_type=content_type)
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = f"public, max-age={max_age}"
+    return response.make_conditional(request)
 
 # ========== 比价接口 ==========
 
@@ -560,8 +827,22 @@ def compare_dish():
     shop_name = request.args.get('shop_name')
     if not dish_name:
         return jsonify({"success": False, "message": "缺少菜品名"}), 400
-    success, results = db.compare_dish_price(dish_name=dish_name, shop_name=shop_name, exact=False)
-    return jsonify({"success": success, "results": results if success else str(results)})
+    shards = router.select(request.args.get('region', '').strip())
+    if shards is None:
+        return jsonify({"success": False, "message": "未知区域"}), 400
+    results, missing = router.compare_dish_price(dish_name, shop_name, shards)
+    return shard_response("results", results, missing)
+
+# ========== 启动 ==========
+
+# STARTUP_MODE=sync 时在导入阶段同步完成全部启动阶段（脚本 / 基准测试使用）；
+# Vercel 上每个冷启动实例的第一个请求就要用到目录数据，默认同步启动
+STARTUP_MODE = os.getenv("STARTUP_MODE", "sync" if os.getenv("VERCEL") else "background")
+startup.import_seconds = time.perf_counter() - _IMPORT_START
+metrics.metrics.gauge("import_seconds", "server.app 模块导入耗时（秒）").set(startup.import_seconds)
+# PASSWORD_POOL=process 时哈希进程必须在启动阶段的线程之前 fork 出来
+db.password_hasher.start()
+startup.start(background=STARTUP_MODE != "sync")
 
 # ========== Vercel 适配 ==========
 
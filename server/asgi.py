@@ -0,0 +1,275 @@
+"""
+异步（ASGI）服务模式：与 WSGI 模式暴露相同的 /api/* 路由，复用 server.app 中的全部路由、鉴权、限流与聚合逻辑。
+
+- 请求体在事件循环上异步读取，Flask 视图（含所有 FoodPriceDB 调用）在专用的有界线程池中执行，
+  事件循环本身从不阻塞在 SQLite 或 jsonify 上
+- 线程池满且排队数超过 ASGI_MAX_PENDING 时直接返回 503（与全局降载共用 load_shed_rejections_total）
+- 空闲的 keep-alive 连接与 /api/events（SSE）订阅只占用协程，不占线程，单进程可以挂上千个
+
+用法:
+    uvicorn server.asgi:app --host 0.0.0.0 --port 5000
+环境变量: ASGI_DB_WORKERS（默认 16）  ASGI_MAX_PENDING（默认 ASGI_DB_WORKERS * 8）
+         SSE_HEARTBEAT_SECONDS（默认 15）
+"""
+import asyncio
+import io
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+ROOT_DIR = Path(__file__).parent.parent
+if str(ROOT_DIR) not in sys.path:
+    sys.path.insert(0, str(ROOT_DIR))
+
+from server import metrics
+from server.app import app as flask_app, router, catalog_generations, sse_event, SSE_HEARTBEAT_SECONDS
+from server.ratelimit import shed_rejections
+
+ASGI_DB_WORKERS = int(os.getenv("ASGI_DB_WORKERS", "16"))
+ASGI_MAX_PENDING = int(os.getenv("ASGI_MAX_PENDING", str(ASGI_DB_WORKERS * 8)))
+# 每个 SSE 订阅者最多积压的事件数（事件只携带最新版本号，积压时丢弃最旧的）
+SSE_QUEUE_SIZE = 16
+
+asgi_pending = metrics.metrics.gauge(
+    "asgi_executor_pending", "ASGI 模式下排队与执行中的 Flask 请求数")
+asgi_queue_seconds = metrics.metrics.histogram(
+    "asgi_executor_queue_seconds", "ASGI 请求等待线程池空闲线程的耗时（秒）")
+sse_clients = metrics.metrics.gauge(
+    "sse_clients", "当前 /api/events 订阅连接数")
+
+
+class CatalogEvents:
+    """
+    把各分片的快照替换广播给 SSE 订阅者（回调在重建线程中触发，经 call_soon_threadsafe 投递到事件循环）。
+    事件内容与 WSGI 模式的 /api/events 相同：各区域当前的快照版本
+    """
+
+    def __init__(self, router):
+        self.subscribers: Set[Tuple[asyncio.AbstractEventLoop, asyncio.Queue]] = set()
+        for shard in router.shards:
+            shard.catalog.on_rebuild(self.publish)
+
+    def subscribe(self) -> Tuple[asyncio.AbstractEventLoop, asyncio.Queue]:
+        entry = (asyncio.get_running_loop(), asyncio.Queue(SSE_QUEUE_SIZE))
+        self.subscribers.add(entry)
+        sse_clients.set(len(self.subscribers))
+        return entry
+
+    def unsubscribe(self, entry) -> None:
+        self.subscribers.discard(entry)
+        sse_clients.set(len(self.subscribers))
+
+    def publish(self, snapshot) -> None:
+        event = {"generations": catalog_generations()}
+        for loop, queue in list(self.subscribers):
+            try:
+                loop.call_soon_threadsafe(self._offer, queue, event)
+            except RuntimeError:
+                pass  # 事件循环已关闭
+
+    @staticmethod
+    def _offer(queue: asyncio.Queue, event: Dict[str, Any]) -> None:
+        if queue.full():
+            queue.get_nowait()
+        queue.put_nowait(event)
+
+
+def build_environ(scope: Dict[str, Any], body: bytes) -> Dict[str, Any]:
+    """ASGI HTTP scope → WSGI environ（PEP 3333：路径等字段按 latin-1 传递原始字节）"""
+    server = scope.get("server") or ("localhost", 80)
+    client = scope.get("client") or ("", 0)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", "").encode().decode("latin-1"),
+        "PATH_INFO": scope["path"].encode().decode("latin-1"),
+        "QUERY_STRING": scope.get("query_string", b"").decode("latin-1"),
+        "SERVER_NAME": str(server[0]),
+        "SERVER_PORT": str(server[1] or 80),
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "REMOTE_ADDR": client[0],
+        "REMOTE_PORT": str(client[1]),
+        "CONTENT_LENGTH": str(len(body)),
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": False,
+        "wsgi.run_once": False,
+    }
+    for raw_name, raw_value in scope.get("headers", []):
+        name = raw_name.decode("latin-1").upper().replace("-", "_")
+        value = raw_value.decode("latin-1")
+        if name == "CONTENT_TYPE":
+            environ["CONTENT_TYPE"] = value
+            continue
+        if name == "CONTENT_LENGTH":
+            continue
+        key = f"HTTP_{name}"
+        environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+
+class AsgiApp:
+    def __init__(self, wsgi_app, events: CatalogEvents, workers: int = ASGI_DB_WORKERS,
+                 max_pending: int = ASGI_MAX_PENDING):
+        self.wsgi_app = wsgi_app
+        self.events = events
+        self.max_pending = max_pending
+        self.pending = 0  # 只在事件循环线程中读写
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="asgi-db")
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+        elif scope["type"] == "http":
+            if scope["path"] == "/api/events":
+                await self._events(receive, send)
+            else:
+                await self._http(scope, receive, send)
+
+    async def _lifespan(self, receive, send) -> None:
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                self.executor.shutdown(wait=False, cancel_futures=True)
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    # ======================
+    # /api/*：在线程池中执行 Flask 应用
+    # ======================
+    async def _http(self, scope, receive, send) -> None:
+        chunks = []
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return
+            chunks.append(message.get("body", b""))
+            if not message.get("more_body"):
+                break
+
+        if self.pending >= self.max_pending:
+            shed_rejections.inc(reason="asgi_queue")
+            await self._send_simple(send, 503, {"success": False, "message": "服务繁忙，请稍后重试"},
+                                    [(b"retry-after", b"1")])
+            return
+
+        loop = asyncio.get_running_loop()
+        environ = build_environ(scope, b"".join(chunks))
+        self.pending += 1
+        asgi_pending.set(self.pending)
+        try:
+            status, headers, body, iterator = await loop.run_in_executor(
+                self.executor, self._start, environ, time.perf_counter())
+            await send({"type": "http.response.start", "status": status, "headers": headers})
+            if iterator is None:
+                await send({"type": "http.response.body", "body": body})
+                return
+            # 流式响应：逐块在线程池中取下一块，取一块发一块
+            await send({"type": "http.response.body", "body": body, "more_body": True})
+            try:
+                while True:
+                    chunk = await loop.run_in_executor(self.executor, next, iterator, None)
+                    if chunk is None:
+                        break
+                    if chunk:
+                        await send({"type": "http.response.body", "body": chunk, "more_body": True})
+            finally:
+                close = getattr(iterator, "close", None)
+                if close is not None:
+                    await loop.run_in_executor(self.executor, close)
+            await send({"type": "http.response.body", "body": b""})
+        finally:
+            self.pending -= 1
+            asgi_pending.set(self.pending)
+
+    def _start(self, environ, queued_at: float) -> Tuple[int, List[Tuple[bytes, bytes]], bytes, Optional[Any]]:
+        """
+        在工作线程中调用 WSGI 应用。带 Content-Length 的普通响应在这里一次取完，
+        否则（流式响应）返回迭代器，由事件循环逐块拉取。
+        """
+        asgi_queue_seconds.observe(time.perf_counter() - queued_at)
+        started = {}
+
+        def start_response(status, response_headers, exc_info=None):
+            started["status"] = int(status.split(" ", 1)[0])
+            started["headers"] = [(k.lower().encode("latin-1"), v.encode("latin-1")) for k, v in response_headers]
+            return lambda data: None  # 不支持已废弃的 write()
+
+        result = self.wsgi_app(environ, start_response)
+        iterator = iter(result)
+        first = next(iterator, b"")
+        if any(k == b"content-length" for k, _ in started["headers"]):
+            body = first + b"".join(iterator)
+            if hasattr(result, "close"):
+                result.close()
+            return started["status"], started["headers"], body, None
+        return started["status"], started["headers"], first, _Closing(iterator, result)
+
+    @staticmethod
+    async def _send_simple(send, status: int, payload: Dict[str, Any], extra_headers=()) -> None:
+        body = json.dumps(payload, ensure_ascii=False).encode()
+        headers = [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]
+        await send({"type": "http.response.start", "status": status, "headers": headers + list(extra_headers)})
+        await send({"type": "http.response.body", "body": body})
+
+    # ======================
+    # /api/events：目录版本推送（SSE）
+    # ======================
+    async def _events(self, receive, send) -> None:
+        entry = self.events.subscribe()
+        queue = entry[1]
+        disconnected = asyncio.ensure_future(self._wait_disconnect(receive))
+        try:
+            await send({"type": "http.response.start", "status": 200, "headers": [
+                (b"content-type", b"text/event-stream; charset=utf-8"),
+                (b"cache-control", b"no-cache"),
+                (b"x-accel-buffering", b"no"),
+            ]})
+            await send({"type": "http.response.body", "more_body": True,
+                        "body": sse_event("catalog", {"generations": catalog_generations()})})
+            while not disconnected.done():
+                getter = asyncio.ensure_future(queue.get())
+                done, _ = await asyncio.wait({getter, disconnected}, timeout=SSE_HEARTBEAT_SECONDS,
+                                             return_when=asyncio.FIRST_COMPLETED)
+                if getter in done:
+                    body = sse_event("catalog", getter.result())
+                else:
+                    getter.cancel()
+                    if disconnected.done():
+                        break
+                    body = b": keep-alive\n\n"
+                await send({"type": "http.response.body", "body": body, "more_body": True})
+        finally:
+            disconnected.cancel()
+            self.events.unsubscribe(entry)
+
+    @staticmethod
+    async def _wait_disconnect(receive) -> None:
+        while (await receive())["type"] != "http.disconnect":
+            pass
+
+
+class _Closing:
+    """流式响应的迭代器，close() 时关闭 WSGI 返回的可迭代对象（触发 Flask 的 teardown）"""
+
+    def __init__(self, iterator, result):
+        self.iterator = iterator
+        self.result = result
+
+    def __next__(self):
+        return next(self.iterator)
+
+    def close(self) -> None:
+        if hasattr(self.result, "close"):
+            self.result.close()
+
+
+app = AsgiApp(flask_app, CatalogEvents(router))
@@ -0,0 +1,100 @@
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from itsdangerous import BadSignature, SignatureExpired, URLSafeTimedSerializer
+
+try:
+    from server import metrics
+except ImportError:  # 以脚本方式在 server/ 目录下运行时
+    import metrics
+
+token_verifications = metrics.metrics.counter(
+    "auth_token_verifications_total", "会话令牌校验次数", ("result",))
+user_cache_lookups = metrics.metrics.counter(
+    "user_cache_lookups_total", "用户信息缓存查询次数", ("result",))
+
+
+class TokenService:
+    """
+    基于 itsdangerous 的 HMAC 签名令牌：载荷只有 user_id，签名里带时间戳，校验完全在进程内完成。
+    多进程部署时所有 worker 必须配置相同的 SECRET_KEY。
+    """
+
+    def __init__(self, secret_key: Optional[str] = None, max_age: Optional[int] = None,
+                 salt: str = "savebite-session"):
+        secret_key = secret_key or os.getenv("SECRET_KEY")
+        if not secret_key:
+            secret_key = secrets.token_hex(32)
+            print("警告: 未设置 SECRET_KEY，使用随机密钥（重启或多 worker 时令牌会失效）")
+        self.max_age = max_age if max_age is not None else int(os.getenv("TOKEN_TTL_SECONDS", str(7 * 24 * 3600)))
+        self.serializer = URLSafeTimedSerializer(secret_key, salt=salt)
+
+    def issue(self, user_id: int) -> str:
+        return self.serializer.dumps({"uid": user_id})
+
+    def verify(self, token: str) -> Optional[int]:
+        """有效返回 user_id；签名错误、过期或格式不对返回 None"""
+        if not token:
+            return None
+        try:
+            payload = self.serializer.loads(token, max_age=self.max_age)
+        except SignatureExpired:
+            token_verifications.inc(result="expired")
+            return None
+        except BadSignature:
+            token_verifications.inc(result="invalid")
+            return None
+        uid = payload.get("uid") if isinstance(payload, dict) else None
+        if not isinstance(uid, int):
+            token_verifications.inc(result="invalid")
+            return None
+        token_verifications.inc(result="ok")
+        return uid
+
+
+class UserCache:
+    """user_id → 用户信息的 LRU 缓存；条目带 TTL，限制多 worker 下其它进程修改造成的陈旧时间"""
+
+    def __init__(self, max_size: int = 1024, ttl: float = 60.0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.entries: "OrderedDict[int, tuple]" = OrderedDict()
+
+    def get(self, user_id: int) -> Optional[Dict[str, Any]]:
+        with self.lock:
+            entry = self.entries.get(user_id)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self.entries[user_id]
+                user_cache_lookups.inc(result="miss")
+                return None
+            self.entries.move_to_end(user_id)
+        user_cache_lookups.inc(result="hit")
+        return dict(entry[1])
+
+    def put(self, user_id: int, user_info: Dict[str, Any]) -> None:
+        with self.lock:
+            self.entries[user_id] = (time.monotonic() + self.ttl, dict(user_info))
+            self.entries.move_to_end(user_id)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def invalidate(self, user_id: Optional[int] = None) -> None:
+        """失效单个用户；不传 user_id 时清空全部"""
+        with self.lock:
+            if user_id is None:
+                self.entries.clear()
+            else:
+                self.entries.pop(user_id, None)
+
+
+def bearer_token(authorization: Optional[str]) -> Optional[str]:
+    if not authorization:
+        return None
+    scheme, _, value = authorization.partition(" ")
+    return value.strip() if scheme.lower() == "bearer" and value.strip() else None
@@ -0,0 +1,624 @@
+import heapq
+import math
+import os
+import random
+import sqlite3
+import sys
+import threading
+import time
+from array import array
+from collections import defaultdict
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+try:
+    from server import metrics
+    from server.catalog_file import MappedCatalog, StringColumn, catalog_file_load_seconds, catalog_file_path, \
+        shop_rows, write_catalog
+    from server.dish_search import DishIndex, GroupHit, cheapest_platform, term_relevance
+except ImportError:  # 以脚本方式在 server/ 目录下运行时
+    import metrics
+    from catalog_file import MappedCatalog, StringColumn, catalog_file_load_seconds, catalog_file_path, \
+        shop_rows, write_catalog
+    from dish_search import DishIndex, GroupHit, cheapest_platform, term_relevance
+
+catalog_generation = metrics.metrics.gauge(
+    "catalog_generation", "当前内存目录快照对应的数据库目录版本号")
+catalog_rebuild_seconds = metrics.metrics.histogram(
+    "catalog_rebuild_seconds", "内存目录快照构建耗时（秒）")
+geo_query_seconds = metrics.metrics.histogram(
+    "geo_query_seconds", "附近搜索的网格索引查询耗时（秒）",
+    buckets=(0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.05))
+
+MEITUAN = "美团"
+ELEME = "饿了么"
+# 返回给前端的平台键
+PLATFORM_KEYS = {MEITUAN: "meituan", ELEME: "ele"}
+# 菜品搜索结果中每个店铺组内联展示的菜品数
+DISHES_PER_GROUP = 5
+
+# 快照优先从二进制目录文件映射加载（多个 worker 进程共享页缓存，启动无需查库）
+CATALOG_FILE = os.getenv("CATALOG_FILE", "0").lower() in ("1", "true", "yes")
+
+# 网格索引：按经纬度 0.0025°（南北约 280m）划分单元格
+GEO_CELL_DEG = 0.0025
+KM_PER_DEG_LAT = 111.32
+
+
+def geo_cell(latitude: float, longitude: float) -> Tuple[int, int]:
+    return math.floor(latitude / GEO_CELL_DEG), math.floor(longitude / GEO_CELL_DEG)
+
+
+class ShopRecord:
+    """单个平台上的一家店铺；菜品存放在快照的列数组中，这里只记录区间"""
+    __slots__ = ("shop_id", "shop_name", "platform", "rating", "delivery_fee", "min_order",
+                 "monthly_sales", "delivery_distance", "delivery_time", "image_url",
+                 "latitude", "longitude", "dish_start", "dish_end", "coupons")
+
+    def __init__(self, row):
+        self.shop_id = row["shop_id"]
+        self.shop_name = row["shop_name"]
+        self.platform = row["platform_name"]
+        self.rating = row["rating"]
+        self.delivery_fee = row["delivery_fee"]
+        self.min_order = row["min_order"]
+        self.monthly_sales = row["monthly_sales"]
+        self.delivery_distance = row["delivery_distance"]
+        self.delivery_time = row["delivery_time"]
+        self.image_url = row["image_url"]
+        self.latitude = row["latitude"]
+        self.longitude = row["longitude"]
+        self.dish_start = 0
+        self.dish_end = 0
+        self.coupons: Tuple[Tuple[float, float], ...] = ()
+
+
+class CatalogSnapshot:
+    """
+    只读目录快照：店铺为 __slots__ 记录，菜品为按 (shop_id, dish_name) 排序的列数组。
+    构建完成后不再修改，可被任意线程无锁读取。
+    """
+
+    def __init__(self, generation: int = 0):
+        self.generation = generation
+        self.built_at = time.time()
+        self.source = "sqlite"  # sqlite：查库构建；file：映射二进制目录文件
+        self.shops: Dict[int, ShopRecord] = {}
+        # 店名 → 同名店铺（按平台名排序），即前端的一个"店铺组"
+        self.groups: Dict[str, Tuple[ShopRecord, ...]] = {}
+        # 首页顺序：按月销量、评分降序首次出现的店名
+        self.popular_names: Tuple[str, ...] = ()
+        self._names_lower: List[Tuple[str, str]] = []
+        # 网格单元格 → 有坐标的店铺
+        self.geo_cells: Dict[Tuple[int, int], Tuple[ShopRecord, ...]] = {}
+        # 菜品列
+        self.dish_names: List[str] = []
+        self.dish_prices = array("d")
+        self.dish_shop_ids = array("q")
+        # 菜品行 → 店铺组序号（group_names / group_ratings 的下标），菜品搜索按组聚合时使用
+        self.dish_group_ids = array("i")
+        self.group_names: List[str] = []
+        self.group_ratings: List[float] = []
+        self.dish_index: Optional[DishIndex] = None
+
+    # ======================
+    # 构建
+    # ======================
+    @classmethod
+    def build(cls, db_path: str) -> "CatalogSnapshot":
+        conn = sqlite3.connect(db_path)
+        conn.row_factory = sqlite3.Row
+        try:
+            # 单个读事务内完成，保证看到一致的数据
+            conn.execute("BEGIN")
+            row = conn.execute("SELECT generation FROM catalog_meta WHERE id = 1").fetchone()
+            snapshot = cls(row["generation"] if row else 0)
+            snapshot._load(conn)
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+        return snapshot
+
+    def _load(self, conn: sqlite3.Connection) -> None:
+        rows = conn.execute("""
+            SELECT s.shop_id, s.shop_name, s.rating, s.delivery_fee, s.min_order, s.monthly_sales,
+                   s.delivery_distance, s.delivery_time, s.image_url, s.latitude, s.longitude,
+                   p.platform_name
+            FROM shops s
+            JOIN platforms p ON s.platform_id = p.platform_id
+        """).fetchall()
+        for r in rows:
+            shop = ShopRecord(r)
+            self.shops[shop.shop_id] = shop
+        self._index_shops()
+        group_ids = {name: gid for gid, name in enumerate(self.group_names)}
+
+        # 菜品名大量重复，驻留后共享同一个字符串对象
+        interned: Dict[str, str] = {}
+        current_shop, shop, group_id = None, None, 0
+        cursor = conn.execute("SELECT shop_id, dish_name, price FROM dishes ORDER BY shop_id, dish_name")
+        index = 0
+        for shop_id, dish_name, price in cursor:
+            if shop_id != current_shop:
+                if shop is not None:
+                    shop.dish_end = index
+                shop = self.shops.get(shop_id)
+                current_shop = shop_id
+                if shop is not None:
+                    shop.dish_start = index
+                    group_id = group_ids[shop.shop_name]
+            if shop is None:
+                continue  # 孤儿菜品（店铺已删除）
+            name = interned.get(dish_name)
+            if name is None:
+                name = interned[dish_name] = sys.intern(dish_name)
+            self.dish_names.append(name)
+            self.dish_prices.append(price)
+            self.dish_shop_ids.append(shop_id)
+            self.dish_group_ids.append(group_id)
+            index += 1
+        if shop is not None:
+            shop.dish_end = index
+
+        self.dish_index = DishIndex(self.dish_names)
+
+        coupons = defaultdict(list)
+        for shop_id, condition, discount in conn.execute(
+                "SELECT shop_id, condition_amount, discount_amount FROM coupons ORDER BY coupon_id"):
+            coupons[shop_id].append((condition, discount))
+        for shop_id, items in coupons.items():
+            shop = self.shops.get(shop_id)
+            if shop is not None:
+                shop.coupons = tuple(items)
+
+    def _index_shops(self, popular_names: Optional[Tuple[str, ...]] = None) -> None:
+        """由 self.shops 建立店铺组、店名检索列表、网格索引与首页顺序"""
+        grouped = defaultdict(list)
+        for shop in self.shops.values():
+            grouped[shop.shop_name].append(shop)
+        self.groups = {name: tuple(sorted(shops, key=lambda s: s.platform)) for name, shops in grouped.items()}
+        self._names_lower = [(name.lower(), name) for name in sorted(self.groups)]
+        self.group_names = sorted(self.groups)
+        self.group_ratings = [max((s.rating or 0) for s in self.groups[name]) for name in self.group_names]
+
+        cells = defaultdict(list)
+        for shop in self.shops.values():
+            if shop.latitude is not None and shop.longitude is not None:
+                cells[geo_cell(shop.latitude, shop.longitude)].append(shop)
+        self.geo_cells = {cell: tuple(shops) for cell, shops in cells.items()}
+
+        if popular_names is None:
+            ranked = sorted(self.shops.values(), key=lambda s: (-(s.monthly_sales or 0), -(s.rating or 0)))
+            popular_names = tuple(dict.fromkeys(s.shop_name for s in ranked))
+        self.popular_names = popular_names
+
+    @classmethod
+    def from_file(cls, path: str) -> "CatalogSnapshot":
+        """
+        从二进制目录文件加载：菜品的价格 / 店铺 / 店铺组列与菜名行号直接是映射内存上的 memoryview，
+        只有店铺记录与去重后的字符串需要创建 Python 对象。
+        """
+        mapped = MappedCatalog(path)
+        snapshot = cls(mapped.generation)
+        snapshot.source = "file"
+        strings = mapped.strings()
+        for fields, coupons in shop_rows(mapped, strings):
+            shop = ShopRecord(fields)
+            shop.dish_start = fields["dish_start"]
+            shop.dish_end = fields["dish_end"]
+            shop.coupons = coupons
+            snapshot.shops[shop.shop_id] = shop
+        snapshot._index_shops(tuple(strings[ref] for ref in mapped.column("popular")))
+
+        names = [strings[ref] for ref in mapped.column("names.ref")]
+        row_off, name_rows = mapped.column("names.row_off"), mapped.column("names.rows")
+        snapshot.dish_names = StringColumn(mapped.column("dish.name"), names)
+        snapshot.dish_prices = mapped.column("dish.price")
+        snapshot.dish_shop_ids = mapped.column("dish.shop")
+        snapshot.dish_group_ids = mapped.column("dish.group")
+        snapshot.dish_index = DishIndex.from_columns(
+            names, [name_rows[row_off[i]:row_off[i + 1]] for i in range(len(names))])
+        return snapshot
+
+    # ======================
+    # 查询
+    # ======================
+    def dishes_of(self, shop: ShopRecord) -> List[Dict[str, Any]]:
+        """店铺菜品（按菜名排序），与原 SQL 版 dish_map 的元素格式一致"""
+        names, prices = self.dish_names, self.dish_prices
+        return [{"name": names[i], "price": round(prices[i], 2)} for i in range(shop.dish_start, shop.dish_end)]
+
+    def search_names(self, keyword: str) -> List[str]:
+        """店名包含关键词（ASCII 不区分大小写，同 SQLite LIKE），按店名排序"""
+        needle = keyword.lower()
+        return [name for lower, name in self._names_lower if needle in lower]
+
+    def sample_popular(self, k: int) -> List[str]:
+        """首页推荐：从可展示的店铺组中随机抽样 k 个"""
+        eligible = [name for name in self.popular_names if _platform_pair(self.groups[name])[2] is not None]
+        if len(eligible) <= k:
+            return eligible
+        return random.sample(eligible, k)
+
+    def nearby(self, latitude: float, longitude: float, radius_km: float,
+               keyword: Optional[str] = None, limit: int = 20) -> List[Tuple[float, str]]:
+        """
+        半径内的店铺组，按距离升序返回 [(距离 km, 店名)]；同组在两个平台上坐标不同时取较近的一家。
+        从用户所在单元格一圈圈向外扫描，已凑满 limit 个且第 limit 近的距离不超过下一圈的最近可能距离时停止。
+        距离按等距圆柱投影计算，城市范围内与球面距离的误差可忽略。
+        """
+        start = time.perf_counter()
+        needle = keyword.lower() if keyword else None
+        km_lat = KM_PER_DEG_LAT
+        km_lng = KM_PER_DEG_LAT * max(math.cos(math.radians(latitude)), 0.01)
+        # 下一圈单元格与用户的最小距离每圈至少增加一个单元格的短边
+        ring_step = GEO_CELL_DEG * min(km_lat, km_lng)
+        max_ring = int(radius_km / ring_step) + 1
+        center_i, center_j = geo_cell(latitude, longitude)
+        radius_sq = radius_km * radius_km
+        best: Dict[str, float] = {}
+
+        def scan(shops):
+            for shop in shops:
+                if needle is not None and needle not in shop.shop_name.lower():
+                    continue
+                dy = (shop.latitude - latitude) * km_lat
+                dx = (shop.longitude - longitude) * km_lng
+                d2 = dx * dx + dy * dy
+                if d2 <= radius_sq and d2 < best.get(shop.shop_name, math.inf):
+                    best[shop.shop_name] = d2
+
+        cells = self.geo_cells
+        visited = 0
+        for ring in range(max_ring + 1):
+            if visited > len(cells):
+                # 外圈单元格已多于非空单元格：剩余范围改为遍历非空单元格
+                for (i, j), shops in cells.items():
+                    if ring <= max(abs(i - center_i), abs(j - center_j)) <= max_ring:
+                        scan(shops)
+                break
+            if ring == 0:
+                scan(cells.get((center_i, center_j), ()))
+            else:
+                for k in range(-ring, ring + 1):
+                    scan(cells.get((center_i - ring, center_j + k), ()))
+                    scan(cells.get((center_i + ring, center_j + k), ()))
+                for k in range(-ring + 1, ring):
+                    scan(cells.get((center_i + k, center_j - ring), ()))
+                    scan(cells.get((center_i + k, center_j + ring), ()))
+            visited += max(1, 8 * ring)
+            if len(best) >= limit:
+                kth = heapq.nsmallest(limit, best.values())[-1]
+                if kth <= (ring * ring_step) ** 2:
+                    break
+
+        result = [(math.sqrt(d2), name) for d2, name in heapq.nsmallest(limit, ((d2, n) for n, d2 in best.items()))]
+        geo_query_seconds.observe(time.perf_counter() - start)
+        return result
+
+    def compare_dish_price(self, dish_name: str, shop_name: Optional[str] = None) -> List[Dict[str, Any]]:
+        """与 FoodPriceDB.compare_dish_price(exact=False) 相同的结果：每个菜品 × 每张满减券一行，按到手价升序"""
+        needle = dish_name.lower()
+        names, prices, shop_ids = self.dish_names, self.dish_prices, self.dish_shop_ids
+        if shop_name:
+            indices: Iterable[int] = (
+                i for shop in self.groups.get(shop_name, ()) for i in range(shop.dish_start, shop.dish_end))
+        else:
+            # 通过倒排索引只访问菜名命中的行（保持行号顺序，与全表扫描的结果顺序一致）
+            index = self.dish_index
+            indices = sorted(i for name_id in index.match(needle) for i in index.rows[name_id])
+
+        rows = []
+        for i in indices:
+            if needle not in names[i].lower():
+                continue
+            shop = self.shops[shop_ids[i]]
+            total = prices[i] + shop.delivery_fee
+            for condition, discount in (shop.coupons or ((None, None),)):
+                if condition is not None and total >= condition:
+                    final_price, saved, meets = total - (discount or 0), discount or 0, True
+                else:
+                    final_price, saved, meets = total, 0, False
+                rows.append((final_price, {
+                    "platform": shop.platform,
+                    "shop": shop.shop_name,
+                    "dish": names[i],
+                    "dish_price": round(prices[i], 2),
+                    "delivery_fee": round(shop.delivery_fee, 2),
+                    "total_before_discount": round(total, 2),
+                    "final_price": round(final_price, 2),
+                    "saved": round(saved, 2),
+                    "meets_discount": meets
+                }))
+        rows.sort(key=lambda r: r[0])
+        return [r[1] for r in rows]
+
+    def match_dishes(self, terms: Tuple[str, ...]) -> Dict[int, float]:
+        """命中全部查询词的菜名 ID → 平均相关度"""
+        def compute():
+            index = self.dish_index
+            matched: Optional[Dict[int, float]] = None
+            for term in terms:
+                scores = {name_id: term_relevance(term, index.lower[name_id]) for name_id in index.match(term)}
+                if matched is None:
+                    matched = scores
+                else:
+                    matched = {name_id: rel + scores[name_id] for name_id, rel in matched.items() if name_id in scores}
+                if not matched:
+                    return {}
+            return {name_id: rel / len(terms) for name_id, rel in matched.items()}
+        return self.dish_index.cached(("match", terms), compute) if terms else {}
+
+    def search_dishes(self, terms: Tuple[str, ...]) -> List[GroupHit]:
+        """
+        菜品搜索：命中的菜品按店铺组聚合，每组只计算最高相关度和最低价（未排序，由 rank_groups 统一排序），
+        分页后再用 dish_group_detail 展开当页各组的菜品。
+        """
+        return self.dish_index.cached(("groups", terms), lambda: self._search_dishes(terms)) if terms else []
+
+    def _search_dishes(self, terms: Tuple[str, ...]) -> List[GroupHit]:
+        matched = self.match_dishes(terms)
+        rows, prices, group_ids = self.dish_index.rows, self.dish_prices, self.dish_group_ids
+        relevance: Dict[int, float] = {}
+        min_price: Dict[int, float] = {}
+        # 按相关度降序遍历，每组第一次出现时的相关度即为最高相关度
+        for name_id, rel in sorted(matched.items(), key=lambda item: -item[1]):
+            for row in rows[name_id]:
+                gid = group_ids[row]
+                price = prices[row]
+                if gid not in relevance:
+                    relevance[gid] = rel
+                    min_price[gid] = price
+                elif price < min_price[gid]:
+                    min_price[gid] = price
+        names, ratings = self.group_names, self.group_ratings
+        return [GroupHit(names[gid], round(rel, 4), round(min_price[gid], 2), ratings[gid], self)
+                for gid, rel in relevance.items()]
+
+    def dish_group_detail(self, hit: GroupHit, terms: Tuple[str, ...]) -> Dict[str, Any]:
+        """展开一个命中的店铺组：命中菜品的各平台价格与最便宜的平台"""
+        matched = self.match_dishes(terms)
+        index = self.dish_index
+        matched_names = {index.names[name_id]: rel for name_id, rel in matched.items()}
+        group = self.groups[hit.name]
+        meituan_data, ele_data, main_shop = _platform_pair(group)
+
+        dishes: Dict[str, Dict[str, float]] = defaultdict(dict)
+        for shop in group:
+            for i in range(shop.dish_start, shop.dish_end):
+                if self.dish_names[i] in matched_names:
+                    dishes[self.dish_names[i]][PLATFORM_KEYS.get(shop.platform, shop.platform)] = \
+                        round(self.dish_prices[i], 2)
+        entries = []
+        for dish_name, platform_prices in dishes.items():
+            platform, price = cheapest_platform(platform_prices)
+            entries.append(dict(platform_prices, name=dish_name, relevance=round(matched_names[dish_name], 4),
+                                cheapest_platform=platform, cheapest_price=price))
+        entries.sort(key=lambda e: (-e["relevance"], e["cheapest_price"], e["name"]))
+        best = min(entries, key=lambda e: (e["cheapest_price"], e["name"]))
+        return {
+            "id": (main_shop or group[0]).shop_id,
+            "name": hit.name,
+            "rating": hit.rating,
+            "image": shop_image_url(meituan_data, ele_data) if main_shop else None,
+            "score": hit.score,
+            "relevance": hit.relevance,
+            "min_price": hit.min_price,
+            "cheapest_platform": best["cheapest_platform"],
+            "matched": len(entries),
+            "dishes": entries[:DISHES_PER_GROUP]
+        }
+
+    # ======================
+    # 卡片
+    # ======================
+    def build_card(self, shop_name: str, favorite_shop_ids: Optional[Set[int]] = None,
+                   force_favorite: bool = False, distance_km: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """
+        把同名店铺聚合成前端的餐厅卡片（首页 / 搜索 / 收藏共用）。
+        distance_km 为按用户位置实时算出的距离；不传时沿用店铺表里的静态配送距离。
+        """
+        group = self.groups.get(shop_name)
+        if not group:
+            return None
+        meituan_data, ele_data, main_shop = _platform_pair(group)
+        if not main_shop:
+            return None
+
+        rating = max(
+            meituan_data.rating if meituan_data else 0,
+            ele_data.rating if ele_data else 0
+        ) or 4.5
+
+        monthly_sales = (meituan_data.monthly_sales if meituan_data else 0) + \
+                        (ele_data.monthly_sales if ele_data else 0) or 100
+
+        mt_dishes = self.dishes_of(meituan_data) if meituan_data else []
+        ele_dishes = self.dishes_of(ele_data) if ele_data else []
+        avg_meituan = round(sum(d["price"] for d in mt_dishes) / len(mt_dishes), 2) if mt_dishes else None
+        avg_ele = round(sum(d["price"] for d in ele_dishes) / len(ele_dishes), 2) if ele_dishes else None
+
+        if distance_km is not None:
+            distance_str = f"{distance_km:.1f}km"
+        else:
+            distance_val = main_shop.delivery_distance or 1.2
+            distance_str = f"{distance_val:.1f}km"
+
+        delivery_time_val = main_shop.delivery_time
+        delivery_time_str = f"{max(10, delivery_time_val - 5)}-{(delivery_time_val or 35) + 5}分钟" \
+            if delivery_time_val else "30-40分钟"
+
+        dish_name_to_platforms = defaultdict(dict)
+        for d in mt_dishes:
+            dish_name_to_platforms[d["name"]]["meituan"] = d["price"]
+        for d in ele_dishes:
+            dish_name_to_platforms[d["name"]]["ele"] = d["price"]
+        dishes_list = []
+        for name, platform_prices in dish_name_to_platforms.items():
+            dish_entry = {"name": name}
+            if "meituan" in platform_prices:
+                dish_entry["meituan"] = platform_prices["meituan"]
+            if "ele" in platform_prices:
+                dish_entry["ele"] = platform_prices["ele"]
+            dishes_list.append(dish_entry)
+
+        if force_favorite:
+            is_favorite = True
+        else:
+            is_favorite = bool(favorite_shop_ids) and any(
+                s.shop_id in favorite_shop_ids for s in (meituan_data, ele_data) if s)
+
+        return {
+            "id": main_shop.shop_id,
+            "name": shop_name,
+            "rating": rating,
+            "reviews": monthly_sales,
+            "distance": distance_str,
+            "deliveryTime": delivery_time_str,
+            "deliveryFee": f"¥{((meituan_data.delivery_fee if meituan_data else 0) + (ele_data.delivery_fee if ele_data else 0)) / 2:.1f}",
+            "minimumOrder": {
+                "meituan": meituan_data.min_order if meituan_data else None,
+                "ele": ele_data.min_order if ele_data else None
+            },
+            "image": shop_image_url(meituan_data, ele_data),
+            "prices": {
+                "meituan": {"current": avg_meituan} if avg_meituan is not None else None,
+                "ele": {"current": avg_ele} if avg_ele is not None else None
+            },
+            "isFavorite": is_favorite,
+            "dishes": dishes_list
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "generation": self.generation,
+            "built_at": self.built_at,
+            "source": self.source,
+            "shops": len(self.shops),
+            "groups": len(self.groups),
+            "dishes": len(self.dish_names),
+            "geo_shops": sum(len(shops) for shops in self.geo_cells.values()),
+            "geo_cells": len(self.geo_cells),
+            "dish_index": self.dish_index.stats() if self.dish_index else None
+        }
+
+
+def _platform_pair(group: Tuple[ShopRecord, ...]):
+    meituan_data = next((s for s in group if s.platform == MEITUAN), None)
+    ele_data = next((s for s in group if s.platform == ELEME), None)
+    return meituan_data, ele_data, meituan_data or ele_data
+
+
+def shop_image_url(meituan_data: Optional[ShopRecord], ele_data: Optional[ShopRecord]) -> str:
+    """
+    卡片图片统一走本地缓存接口 /api/img/<shop_id>：优先使用有图片的美团店铺，其次饿了么，
+    都没有图片时指向主店铺（接口返回本地生成的占位图）
+    """
+    for shop in (meituan_data, ele_data):
+        if shop is not None and shop.image_url not in (None, ""):
+            return f"/api/img/{shop.shop_id}"
+    return f"/api/img/{(meituan_data or ele_data).shop_id}"
+
+
+class CatalogStore:
+    """
+    持有当前快照的引用。重建在后台线程完成后整体替换引用（Python 赋值是原子的），
+    读者在请求开始时取一次 store.current，之后整个请求都使用同一份快照。
+    """
+
+    def __init__(self, db, use_file: bool = CATALOG_FILE):
+        self.db = db
+        # 开启时快照优先从 <数据库路径>.catalog 映射加载（版本号与库一致才用），否则查库构建后导出该文件
+        self.use_file = use_file
+        self.current: Optional[CatalogSnapshot] = None
+        self.lock = threading.Lock()  # 同一时间只允许一个重建
+        self.watcher: Optional[threading.Thread] = None
+        self.listeners = []
+
+    def rebuild(self) -> CatalogSnapshot:
+        with self.lock:
+            start = time.perf_counter()
+            snapshot = self._load_file()
+            if snapshot is None:
+                snapshot = CatalogSnapshot.build(self.db.db_path)
+                catalog_rebuild_seconds.observe(time.perf_counter() - start)
+                self._export(snapshot)
+            self.current = snapshot
+            catalog_generation.set(snapshot.generation)
+        print(f"目录快照已更新: {snapshot.stats()}，耗时 {(time.perf_counter() - start) * 1000:.1f}ms")
+        for listener in self.listeners:
+            try:
+                listener(snapshot)
+            except Exception as e:
+                print(f"快照更新回调失败: {e}")
+        return snapshot
+
+    @property
+    def file_path(self) -> Optional[str]:
+        # 数据库在启动阶段才初始化，路径在重建时再取
+        db_path = self.db.db_path
+        if not self.use_file or not db_path or db_path == ":memory:":
+            return None
+        return catalog_file_path(db_path)
+
+    def _load_file(self) -> Optional[CatalogSnapshot]:
+        """目录文件存在且版本号等于库中当前版本时映射加载，否则返回 None（回退到查库构建）"""
+        path = self.file_path
+        if path is None or not os.path.exists(path):
+            return None
+        start = time.perf_counter()
+        try:
+            generation = self.db.get_catalog_generation()
+            snapshot = CatalogSnapshot.from_file(path)
+        except Exception as e:
+            print(f"目录文件 {path} 加载失败，改为查库构建: {e}")
+            return None
+        if snapshot.generation != generation:
+            return None
+        catalog_file_load_seconds.observe(time.perf_counter() - start)
+        return snapshot
+
+    def _export(self, snapshot: CatalogSnapshot) -> None:
+        path = self.file_path
+        if path is None:
+            return
+        try:
+            write_catalog(snapshot, path)
+        except Exception as e:
+            print(f"目录文件导出失败: {e}")
+
+    def on_rebuild(self, listener) -> None:
+        """注册快照替换后的回调（派生索引 / 缓存在这里跟着重建）"""
+        self.listeners.append(listener)
+
+    def rebuild_async(self) -> threading.Thread:
+        thread = threading.Thread(target=self.rebuild, name="catalog-rebuild", daemon=True)
+        thread.start()
+        return thread
+
+    def start_watcher(self, interval: float = 2.0) -> None:
+        """
+        轮询 catalog_meta.generation；版本号变化且连续两次轮询不再变化（导入已结束）时后台重建，
+        避免在 reload_data.py 逐行导入的过程中构建出不完整的快照。
+        """
+        if self.watcher is not None:
+            return
+
+        def watch():
+            last_seen = None
+            while True:
+                time.sleep(interval)
+                try:
+                    generation = self.db.get_catalog_generation()
+                except Exception as e:
+                    print(f"读取目录版本失败: {e}")
+                    continue
+                current = self.current.generation if self.current else None
+                if generation != current and generation == last_seen:
+                    try:
+                        self.rebuild()
+                    except Exception as e:
+                        print(f"目录快照重建失败: {e}")
+                last_seen = generation
+
+        self.watcher = threading.Thread(target=watch, name="catalog-watcher", daemon=True)
+        self.watcher.start()
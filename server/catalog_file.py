@@ -0,0 +1,303 @@
+"""
+目录快照的二进制文件格式：启动时直接 mmap 打开，列数据通过 memoryview 原地读取，不查 SQLite、不反序列化。
+同一台机器上的多个 worker 进程映射同一个文件，共享一份页缓存。
+
+文件布局（小端，各段按 8 字节对齐）:
+    头部      magic(8s) version(I) section_count(I) generation(q)
+    段目录    每段 name(24s) format(c) count(Q) offset(Q)，format 为 array / memoryview 的类型码
+    段数据    定长列（店铺 / 菜品 / 满减 / 菜名各列）+ 字符串表（偏移列 strings.offsets + UTF-8 字节 strings.blob）
+
+可空的浮点列用 NaN 表示 NULL，可空的整数列用 INT64_MIN，可空的字符串引用用 NO_STRING。
+
+用法:
+    python server/catalog_file.py export [--out food_price.db.catalog]   # 从 DB_PATH 导出
+    python server/catalog_file.py inspect food_price.db.catalog
+"""
+import argparse
+import mmap
+import os
+import struct
+import sys
+import time
+from array import array
+from typing import Any, Dict, List, Optional, Tuple
+
+try:
+    from server import metrics
+except ImportError:  # 以脚本方式在 server/ 目录下运行时
+    import metrics
+
+MAGIC = b"SBCATLG\0"
+FORMAT_VERSION = 1
+HEADER = struct.Struct("<8sIIq")
+SECTION = struct.Struct("<24sc7xQQ")
+ALIGN = 8
+
+NO_STRING = 0xFFFFFFFF
+NULL_INT = -(1 << 63)
+
+# 段名 → 类型码；读取端用 memoryview.cast 直接按类型码解释（要求本机为小端且类型宽度一致）
+SECTIONS = {
+    "strings.offsets": "Q", "strings.blob": "B",
+    "shop.id": "q", "shop.platform": "I", "shop.name": "I", "shop.image": "I",
+    "shop.rating": "d", "shop.fee": "d", "shop.min_order": "d", "shop.distance": "d",
+    "shop.lat": "d", "shop.lng": "d", "shop.sales": "q", "shop.time": "q",
+    "shop.dish_start": "I", "shop.dish_end": "I", "shop.coupon_start": "I", "shop.coupon_end": "I",
+    "coupon.condition": "d", "coupon.discount": "d",
+    "dish.name": "I", "dish.price": "d", "dish.shop": "q", "dish.group": "i",
+    "names.ref": "I", "names.row_off": "I", "names.rows": "i",
+    "popular": "I",
+}
+ITEM_SIZES = {"B": 1, "i": 4, "I": 4, "q": 8, "Q": 8, "d": 8}
+
+catalog_file_load_seconds = metrics.metrics.histogram(
+    "catalog_file_load_seconds", "从二进制目录文件加载快照的耗时（秒）",
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1))
+catalog_file_exports = metrics.metrics.counter(
+    "catalog_file_exports_total", "导出二进制目录文件的次数", ("result",))
+
+
+def native_compatible() -> bool:
+    """本机字节序与类型宽度是否与文件格式一致（否则不能零拷贝映射，调用方回退到 SQLite 构建）"""
+    return sys.byteorder == "little" and all(array(code).itemsize == size for code, size in ITEM_SIZES.items())
+
+
+def catalog_file_path(db_path: str) -> str:
+    return f"{db_path}.catalog"
+
+
+# ======================
+# 导出
+# ======================
+class _StringTable:
+    def __init__(self):
+        self.refs: Dict[str, int] = {}
+        self.offsets = array("Q", [0])
+        self.blob = bytearray()
+
+    def ref(self, value: Optional[str]) -> int:
+        if value is None:
+            return NO_STRING
+        ref = self.refs.get(value)
+        if ref is None:
+            ref = self.refs[value] = len(self.offsets) - 1
+            self.blob += value.encode("utf-8")
+            self.offsets.append(len(self.blob))
+        return ref
+
+
+def _float(value: Optional[float]) -> float:
+    return float("nan") if value is None else float(value)
+
+
+def _int(value: Optional[int]) -> int:
+    return NULL_INT if value is None else int(value)
+
+
+def write_catalog(snapshot, path: str) -> int:
+    """把快照写成二进制目录文件（先写临时文件再原子替换，正在映射旧文件的进程不受影响），返回字节数"""
+    strings = _StringTable()
+    columns: Dict[str, Any] = {name: array(code) for name, code in SECTIONS.items()
+                               if not name.startswith("strings.")}
+
+    coupon_count = 0
+    for shop_id in sorted(snapshot.shops):
+        shop = snapshot.shops[shop_id]
+        columns["shop.id"].append(shop_id)
+        columns["shop.platform"].append(strings.ref(shop.platform))
+        columns["shop.name"].append(strings.ref(shop.shop_name))
+        columns["shop.image"].append(strings.ref(shop.image_url))
+        for name, value in (("shop.rating", shop.rating), ("shop.fee", shop.delivery_fee),
+                            ("shop.min_order", shop.min_order), ("shop.distance", shop.delivery_distance),
+                            ("shop.lat", shop.latitude), ("shop.lng", shop.longitude)):
+            columns[name].append(_float(value))
+        columns["shop.sales"].append(_int(shop.monthly_sales))
+        columns["shop.time"].append(_int(shop.delivery_time))
+        columns["shop.dish_start"].append(shop.dish_start)
+        columns["shop.dish_end"].append(shop.dish_end)
+        columns["shop.coupon_start"].append(coupon_count)
+        for condition, discount in shop.coupons:
+            columns["coupon.condition"].append(_float(condition))
+            columns["coupon.discount"].append(_float(discount))
+            coupon_count += 1
+        columns["shop.coupon_end"].append(coupon_count)
+
+    index = snapshot.dish_index
+    name_ids = array("I", bytes(4 * len(snapshot.dish_names)))
+    columns["names.row_off"].append(0)
+    for name_id, (name, rows) in enumerate(zip(index.names, index.rows)):
+        columns["names.ref"].append(strings.ref(name))
+        columns["names.rows"].extend(rows)
+        columns["names.row_off"].append(len(columns["names.rows"]))
+        for row in rows:
+            name_ids[row] = name_id
+    columns["dish.name"] = name_ids
+    columns["dish.price"] = array("d", snapshot.dish_prices)
+    columns["dish.shop"] = array("q", snapshot.dish_shop_ids)
+    columns["dish.group"] = array("i", snapshot.dish_group_ids)
+    columns["popular"].extend(strings.ref(name) for name in snapshot.popular_names)
+    columns["strings.offsets"] = strings.offsets
+    columns["strings.blob"] = array("B", bytes(strings.blob))
+
+    payloads = [(name, SECTIONS[name], columns[name]) for name in SECTIONS]
+    offset = HEADER.size + SECTION.size * len(payloads)
+    directory, layout = [], []
+    for name, code, column in payloads:
+        offset = -(-offset // ALIGN) * ALIGN
+        directory.append(SECTION.pack(name.encode(), code.encode(), len(column), offset))
+        layout.append((offset, column))
+        offset += len(column) * ITEM_SIZES[code]
+
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, "wb") as f:
+            f.write(HEADER.pack(MAGIC, FORMAT_VERSION, len(payloads), snapshot.generation))
+            f.write(b"".join(directory))
+            for section_offset, column in layout:
+                f.write(b"\0" * (section_offset - f.tell()))
+                column.tofile(f)
+            size = f.tell()
+        os.replace(tmp_path, path)
+    except Exception:
+        catalog_file_exports.inc(result="error")
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    catalog_file_exports.inc(result="ok")
+    return size
+
+
+# ======================
+# 读取
+# ======================
+class MappedCatalog:
+    """
+    只读映射一个目录文件。column(name) 返回直接指向映射内存的 memoryview（零拷贝），
+    字符串按需从字符串表解码。映射随最后一个引用它的 memoryview 一起释放。
+    """
+
+    def __init__(self, path: str):
+        if not native_compatible():
+            raise ValueError("本机字节序或类型宽度与目录文件格式不一致")
+        with open(path, "rb") as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.path = path
+        self.size = len(self.mm)
+        view = memoryview(self.mm)
+        magic, version, count, self.generation = HEADER.unpack_from(view, 0)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise ValueError(f"不支持的目录文件: magic={magic!r} version={version}")
+        self.sections: Dict[str, memoryview] = {}
+        for i in range(count):
+            raw_name, raw_code, length, offset = SECTION.unpack_from(view, HEADER.size + SECTION.size * i)
+            name, code = raw_name.rstrip(b"\0").decode(), raw_code.decode()
+            end = offset + length * ITEM_SIZES[code]
+            if end > self.size:
+                raise ValueError(f"目录文件已截断: 段 {name}")
+            self.sections[name] = view[offset:end].cast(code)
+        missing = set(SECTIONS) - set(self.sections)
+        if missing:
+            raise ValueError(f"目录文件缺少段: {sorted(missing)}")
+        self._offsets = self.sections["strings.offsets"]
+        self._blob = self.sections["strings.blob"]
+
+    def column(self, name: str) -> memoryview:
+        return self.sections[name]
+
+    def string(self, ref: int) -> Optional[str]:
+        if ref == NO_STRING:
+            return None
+        return str(self._blob[self._offsets[ref]:self._offsets[ref + 1]], "utf-8")
+
+    def strings(self) -> List[str]:
+        """一次解码整个字符串表（店名 / 平台 / 菜名都要用到，逐个 string() 反而更慢）"""
+        offsets, blob = self._offsets, bytes(self._blob)
+        return [blob[offsets[i]:offsets[i + 1]].decode("utf-8") for i in range(len(offsets) - 1)]
+
+    def stats(self) -> Dict[str, Any]:
+        return {"path": self.path, "bytes": self.size, "generation": self.generation,
+                "sections": {name: len(view) for name, view in self.sections.items()}}
+
+
+class StringColumn:
+    """按行的字符串列：行 → 编号（memoryview）→ 已解码的去重字符串，只读序列"""
+    __slots__ = ("ids", "values")
+
+    def __init__(self, ids: memoryview, values: List[str]):
+        self.ids = ids
+        self.values = values
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __getitem__(self, row: int) -> str:
+        return self.values[self.ids[row]]
+
+    def __iter__(self):
+        values = self.values
+        return (values[i] for i in self.ids)
+
+
+def shop_rows(mapped: MappedCatalog, strings: List[str]) -> List[Tuple[Dict[str, Any], Tuple[Tuple[float, float], ...]]]:
+    """把店铺列还原成 ShopRecord 所需的字段字典与满减档位（整列 tolist 后按行组装，比逐个下标访问快得多）"""
+    c = mapped.column
+    conditions, discounts = c("coupon.condition").tolist(), c("coupon.discount").tolist()
+
+    def f(values: memoryview) -> List[Optional[float]]:
+        return [None if v != v else v for v in values.tolist()]
+
+    def n(values: memoryview) -> List[Optional[int]]:
+        return [None if v == NULL_INT else v for v in values.tolist()]
+
+    rows = []
+    for (shop_id, platform, name, image, rating, fee, min_order, sales, distance, delivery_time,
+         lat, lng, dish_start, dish_end, coupon_start, coupon_end) in zip(
+            c("shop.id").tolist(), c("shop.platform").tolist(), c("shop.name").tolist(), c("shop.image").tolist(),
+            f(c("shop.rating")), f(c("shop.fee")), f(c("shop.min_order")), n(c("shop.sales")),
+            f(c("shop.distance")), n(c("shop.time")), f(c("shop.lat")), f(c("shop.lng")),
+            c("shop.dish_start").tolist(), c("shop.dish_end").tolist(),
+            c("shop.coupon_start").tolist(), c("shop.coupon_end").tolist()):
+        rows.append(({
+            "shop_id": shop_id, "shop_name": strings[name], "platform_name": strings[platform],
+            "rating": rating, "delivery_fee": fee, "min_order": min_order, "monthly_sales": sales,
+            "delivery_distance": distance, "delivery_time": delivery_time,
+            "image_url": None if image == NO_STRING else strings[image], "latitude": lat, "longitude": lng,
+            "dish_start": dish_start, "dish_end": dish_end,
+        }, tuple(zip(conditions[coupon_start:coupon_end], discounts[coupon_start:coupon_end]))))
+    return rows
+
+
+def main() -> bool:
+    parser = argparse.ArgumentParser(description="二进制目录文件导出 / 查看")
+    sub = parser.add_subparsers(dest="command", required=True)
+    export = sub.add_parser("export", help="从 DB_PATH 构建快照并导出")
+    export.add_argument("--out", help="输出路径（默认 <数据库路径>.catalog）")
+    inspect = sub.add_parser("inspect", help="查看目录文件的头部与各段长度")
+    inspect.add_argument("path")
+    args = parser.parse_args()
+
+    if args.command == "inspect":
+        start = time.perf_counter()
+        mapped = MappedCatalog(args.path)
+        print(f"映射耗时 {(time.perf_counter() - start) * 1000:.2f}ms")
+        for key, value in mapped.stats().items():
+            print(f"{key}: {value}")
+        return True
+
+    try:
+        from server.catalog import CatalogSnapshot
+    except ImportError:
+        from catalog import CatalogSnapshot
+    db_path = os.getenv("DB_PATH", "food_price.db")
+    out = args.out or catalog_file_path(db_path)
+    start = time.perf_counter()
+    snapshot = CatalogSnapshot.build(db_path)
+    built = time.perf_counter() - start
+    size = write_catalog(snapshot, out)
+    print(f"✅ 已导出 {out}: 版本 {snapshot.generation}，{len(snapshot.shops)} 个店铺，"
+          f"{len(snapshot.dish_names)} 个菜品，{size / 1024:.1f}KB（构建 {built * 1000:.0f}ms）")
+    return True
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
@@ -0,0 +1,153 @@
+import threading
+from array import array
+from collections import OrderedDict, defaultdict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+# 排序权重：相关度 / 价格（越便宜越高）/ 评分
+RELEVANCE_WEIGHT = 0.6
+PRICE_WEIGHT = 0.25
+RATING_WEIGHT = 0.15
+SORT_MODES = ("score", "price", "rating")
+
+
+def _grams(text: str) -> Iterable[str]:
+    """单字 + 相邻两字；中文菜名没有分词边界，用字级 n-gram 建索引"""
+    yield from text
+    for i in range(len(text) - 1):
+        yield text[i:i + 2]
+
+
+def term_relevance(term: str, name: str) -> float:
+    """菜名与查询词的相关度：完全相同 > 前缀 > 包含（越短的菜名越相关）"""
+    if name == term:
+        return 1.0
+    if name.startswith(term):
+        return 0.8 + 0.1 * len(term) / len(name)
+    return 0.5 + 0.3 * len(term) / len(name)
+
+
+class DishIndex:
+    """
+    菜名倒排索引：只对去重后的菜名建索引（菜名大量重复，百万级菜品通常只有几千到几万个不同菜名），
+    n-gram → 菜名 ID 的有序数组，菜名 ID → 该菜名所有菜品在快照列数组中的行号。
+    查询时求 n-gram 倒排表交集得到候选，再用子串匹配去掉假阳性。
+    """
+
+    def __init__(self, dish_names: List[str], cache_size: int = 256):
+        ids: Dict[str, int] = {}
+        self.names: List[str] = []
+        self.rows: List[array] = []
+        for row, name in enumerate(dish_names):
+            name_id = ids.get(name)
+            if name_id is None:
+                name_id = ids[name] = len(self.names)
+                self.names.append(name)
+                self.rows.append(array("i"))
+            self.rows[name_id].append(row)
+        self._build_postings(cache_size)
+
+    @classmethod
+    def from_columns(cls, names: List[str], rows: List[Any], cache_size: int = 256) -> "DishIndex":
+        """由已去重的菜名与各菜名的行号序列直接构建（二进制目录文件加载时使用，行号序列可以是 memoryview）"""
+        index = cls.__new__(cls)
+        index.names = names
+        index.rows = rows
+        index._build_postings(cache_size)
+        return index
+
+    def _build_postings(self, cache_size: int) -> None:
+        self.lower = [name.lower() for name in self.names]
+
+        postings = defaultdict(list)
+        for name_id, lower in enumerate(self.lower):
+            for gram in set(_grams(lower)):
+                postings[gram].append(name_id)
+        self.postings: Dict[str, array] = {gram: array("i", ids) for gram, ids in postings.items()}
+
+        # 快照不可变，查询结果可以一直缓存到快照被替换
+        self.cache: "OrderedDict[Any, Any]" = OrderedDict()
+        self.cache_size = cache_size
+        self.cache_lock = threading.Lock()
+
+    def match(self, term: str) -> List[int]:
+        """包含 term 的菜名 ID（升序）"""
+        term = term.lower()
+        grams = {term[i:i + 2] for i in range(len(term) - 1)} if len(term) >= 2 else {term}
+        lists = []
+        for gram in grams:
+            posting = self.postings.get(gram)
+            if posting is None:
+                return []
+            lists.append(posting)
+        lists.sort(key=len)
+        candidates = set(lists[0]).intersection(*lists[1:]) if len(lists) > 1 else lists[0]
+        return sorted(name_id for name_id in candidates if term in self.lower[name_id])
+
+    def cached(self, key, compute):
+        with self.cache_lock:
+            if key in self.cache:
+                self.cache.move_to_end(key)
+                return self.cache[key]
+        value = compute()
+        with self.cache_lock:
+            self.cache[key] = value
+            while len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+        return value
+
+    def stats(self) -> Dict[str, int]:
+        return {"names": len(self.names), "grams": len(self.postings)}
+
+
+def parse_terms(query: str) -> Tuple[str, ...]:
+    """空白分隔的多个词按 AND 组合"""
+    return tuple(dict.fromkeys(term for term in query.lower().split() if term))
+
+
+class GroupHit:
+    """菜品搜索命中的一个店铺组（只含排序所需字段，详情在分页后再展开）"""
+    __slots__ = ("name", "relevance", "min_price", "rating", "source", "score")
+
+    def __init__(self, name: str, relevance: float, min_price: float, rating: float, source: Any = None):
+        self.name = name
+        self.relevance = relevance
+        self.min_price = min_price
+        self.rating = rating
+        self.source = source  # 产生该结果的快照，用于展开详情
+        self.score = 0.0
+
+
+def rank_groups(hits: List[GroupHit], sort: str = "score") -> List[GroupHit]:
+    """
+    给店铺组打分并排序（分片合并后在全量结果上调用，价格归一化以全部结果中的最低价为基准）。
+    score = 相关度 × 0.6 + 最低价 / 本店最低价 × 0.25 + 评分 / 5 × 0.15
+    """
+    if not hits:
+        return []
+    cheapest = min(h.min_price for h in hits)
+    ranked = []
+    for h in hits:
+        price_score = cheapest / h.min_price if h.min_price > 0 else 1.0
+        scored = GroupHit(h.name, h.relevance, h.min_price, h.rating, h.source)
+        scored.score = round(RELEVANCE_WEIGHT * h.relevance + PRICE_WEIGHT * price_score +
+                             RATING_WEIGHT * min(h.rating or 0, 5) / 5, 4)
+        ranked.append(scored)
+    if sort == "price":
+        ranked.sort(key=lambda h: (h.min_price, -h.score, h.name))
+    elif sort == "rating":
+        ranked.sort(key=lambda h: (-(h.rating or 0), -h.score, h.name))
+    else:
+        ranked.sort(key=lambda h: (-h.score, h.min_price, h.name))
+    return ranked
+
+
+def paginate(items: List[Any], page: int, page_size: int) -> List[Any]:
+    start = (page - 1) * page_size
+    return items[start:start + page_size]
+
+
+def cheapest_platform(prices: Dict[str, float]) -> Tuple[Optional[str], Optional[float]]:
+    if not prices:
+        return None, None
+    platform = min(prices, key=lambda p: (prices[p], p))
+    return platform, prices[platform]
@@ -0,0 +1,268 @@
+"""
+目录数据流式导出：店铺 / 菜品 / 满减 / 两平台菜品比价，输出 CSV 或 NDJSON，可选 gzip。
+
+- 每个库用独立的只读连接，SQLite 游标逐批（fetchmany）取行，经生成器编码后按块输出，
+  内存占用与表大小无关；店铺 / 菜品 / 满减不带 ORDER BY（整表排序要先在临时 B 树里物化全部结果），
+  未过滤时按主键顺序输出，过滤时按索引顺序输出；比价按 (店名, 菜名) 排序，该顺序由唯一索引直接给出，不产生排序步骤
+- 整个导出在一个读事务内完成（WAL 模式下不阻塞写入，导出内容是开始时刻的一致快照）
+- 配置了 SHARD_REGIONS 时依次导出各分片，每行带 region 列
+- 过滤：区域、平台（美团 / 饿了么，也接受 meituan / ele）、店铺组（店名，可多个）；比价数据不按平台过滤
+
+用法:
+    python server/export.py dishes --format csv --out dishes.csv
+    python server/export.py comparisons --format ndjson --gzip --out cmp.ndjson.gz
+    python server/export.py shops --platform 美团 --shop "吉野家(武汉世界城广场)" > shops.csv
+"""
+import argparse
+import contextlib
+import csv
+import io
+import json
+import os
+import sqlite3
+import sys
+import time
+import zlib
+from typing import Dict, Iterable, Iterator, Optional, Sequence, Tuple
+
+try:
+    from server import metrics
+    from server.FoodPriceDB import FoodPriceDB
+    from server.catalog import ELEME, MEITUAN, PLATFORM_KEYS
+    from server.shards import ShardRouter
+except ImportError:  # 以脚本方式在 server/ 目录下运行时
+    import metrics
+    from FoodPriceDB import FoodPriceDB
+    from catalog import ELEME, MEITUAN, PLATFORM_KEYS
+    from shards import ShardRouter
+
+FORMATS = ("csv", "ndjson")
+# 每次从游标取的行数
+FETCH_ROWS = 1000
+# 输出块大小（编码后累计超过该字节数就交给调用方）
+CHUNK_BYTES = 64 * 1024
+GZIP_LEVEL = 6
+
+# 数据集 → (列名, SQL)；{where} 处拼接过滤条件，过滤参数以 JSON 数组绑定（语句文本固定，可命中语句缓存）。
+# 只有比价带 ORDER BY：按 shops(platform_id, shop_name) 与 dishes(shop_id, dish_name) 的唯一索引顺序连接，
+# 查询计划中没有 TEMP B-TREE，排序不需要物化结果，同时保证输出顺序不依赖查询计划
+DATASETS: Dict[str, Tuple[Tuple[str, ...], str]] = {
+    "shops": (
+        ("shop_id", "platform", "shop_name", "rating", "delivery_fee", "min_order", "delivery_distance",
+         "delivery_time", "monthly_sales", "avg_consumption", "image_url", "latitude", "longitude"),
+        '''
+        SELECT s.shop_id, p.platform_name, s.shop_name, s.rating, s.delivery_fee, s.min_order,
+               s.delivery_distance, s.delivery_time, s.monthly_sales, s.avg_consumption, s.image_url,
+               s.latitude, s.longitude
+        FROM shops s JOIN platforms p ON s.platform_id = p.platform_id
+        WHERE 1 = 1 {where}
+        '''
+    ),
+    "dishes": (
+        ("dish_id", "shop_id", "platform", "shop_name", "dish_name", "price"),
+        '''
+        SELECT d.dish_id, d.shop_id, p.platform_name, s.shop_name, d.dish_name, d.price
+        FROM dishes d
+        JOIN shops s ON d.shop_id = s.shop_id
+        JOIN platforms p ON s.platform_id = p.platform_id
+        WHERE 1 = 1 {where}
+        '''
+    ),
+    "coupons": (
+        ("coupon_id", "shop_id", "platform", "shop_name", "condition_amount", "discount_amount",
+         "valid_from", "valid_to"),
+        '''
+        SELECT c.coupon_id, c.shop_id, p.platform_name, s.shop_name, c.condition_amount, c.discount_amount,
+               c.valid_from, c.valid_to
+        FROM coupons c
+        JOIN shops s ON c.shop_id = s.shop_id
+        JOIN platforms p ON s.platform_id = p.platform_id
+        WHERE 1 = 1 {where}
+        '''
+    ),
+    # 同一店铺组在两个平台都有的菜品：价差 = 美团价 - 饿了么价
+    "comparisons": (
+        ("shop_name", "dish_name", "meituan_shop_id", "ele_shop_id", "meituan_price", "ele_price",
+         "difference", "cheaper"),
+        f'''
+        SELECT s.shop_name, d.dish_name, s.shop_id, e.shop_id, d.price, ed.price,
+               ROUND(d.price - ed.price, 2),
+               CASE WHEN d.price < ed.price THEN '{PLATFORM_KEYS[MEITUAN]}'
+                    WHEN d.price > ed.price THEN '{PLATFORM_KEYS[ELEME]}' ELSE 'tie' END
+        FROM shops s
+        JOIN platforms p ON s.platform_id = p.platform_id AND p.platform_name = '{MEITUAN}'
+        JOIN dishes d ON d.shop_id = s.shop_id
+        JOIN shops e ON e.shop_name = s.shop_name
+        JOIN platforms ep ON e.platform_id = ep.platform_id AND ep.platform_name = '{ELEME}'
+        JOIN dishes ed ON ed.shop_id = e.shop_id AND ed.dish_name = d.dish_name
+        WHERE 1 = 1 {{where}}
+        ORDER BY s.shop_name, d.dish_name
+        '''
+    ),
+}
+
+PLATFORM_ALIASES = {key: name for name, key in PLATFORM_KEYS.items()}
+PLATFORM_ALIASES.update({"eleme": ELEME})
+
+export_rows = metrics.metrics.counter(
+    "export_rows_total", "流式导出的行数", ("dataset", "format"))
+export_seconds = metrics.metrics.histogram(
+    "export_seconds", "一次导出从开始到最后一块输出的耗时（秒）", ("dataset",),
+    buckets=(0.1, 0.5, 1, 5, 10, 30, 60, 300, 900))
+
+
+class ExportError(ValueError):
+    """导出参数无效（未知数据集 / 格式 / 平台）"""
+
+
+def normalize_platform(value: str) -> str:
+    name = PLATFORM_ALIASES.get(value.strip().lower(), value.strip())
+    if name not in PLATFORM_KEYS:
+        raise ExportError(f"未知平台: {value}")
+    return name
+
+
+def build_query(dataset: str, platforms: Sequence[str], shop_names: Sequence[str]) -> Tuple[Tuple[str, ...], str, list]:
+    """返回 (列名, SQL, 参数)"""
+    if dataset not in DATASETS:
+        raise ExportError(f"未知数据集: {dataset}（可选 {', '.join(DATASETS)}）")
+    columns, sql = DATASETS[dataset]
+    where, params = [], []
+    if platforms and dataset != "comparisons":
+        where.append("AND p.platform_name IN (SELECT value FROM json_each(?))")
+        params.append(json.dumps([normalize_platform(p) for p in platforms], ensure_ascii=False))
+    if shop_names:
+        where.append("AND s.shop_name IN (SELECT value FROM json_each(?))")
+        params.append(json.dumps(list(shop_names), ensure_ascii=False))
+    return columns, sql.format(where=" ".join(where)), params
+
+
+def iter_rows(db_path: str, sql: str, params: list) -> Iterator[tuple]:
+    """只读连接 + 游标分批取行；生成器关闭（含客户端断开）时释放连接"""
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True, check_same_thread=False)
+    try:
+        conn.execute("BEGIN")  # 整个导出一个读事务，各批次看到同一个一致版本
+        cursor = conn.execute(sql, params)
+        while True:
+            rows = cursor.fetchmany(FETCH_ROWS)
+            if not rows:
+                return
+            yield from rows
+    finally:
+        conn.close()
+
+
+def encode(columns: Sequence[str], rows: Iterable[tuple], fmt: str) -> Iterator[bytes]:
+    """逐行编码，累计到 CHUNK_BYTES 输出一块；CSV 首行为表头"""
+    if fmt not in FORMATS:
+        raise ExportError(f"未知格式: {fmt}（可选 {', '.join(FORMATS)}）")
+    buffer = io.StringIO()
+    if fmt == "csv":
+        writer = csv.writer(buffer, lineterminator="\n")
+        writer.writerow(columns)
+        write = writer.writerow
+    else:
+        def write(row):
+            buffer.write(json.dumps(dict(zip(columns, row)), ensure_ascii=False))
+            buffer.write("\n")
+    for row in rows:
+        write(row)
+        if buffer.tell() >= CHUNK_BYTES:
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf-8")
+
+
+def gzip_chunks(chunks: Iterable[bytes], level: int = GZIP_LEVEL) -> Iterator[bytes]:
+    """流式 gzip（zlib wbits=31 输出标准 gzip 头尾），不缓冲整个文件"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def export(router: ShardRouter, dataset: str, fmt: str = "csv", region: Optional[str] = None,
+           platforms: Sequence[str] = (), shop_names: Sequence[str] = (), compress: bool = False) -> Iterator[bytes]:
+    """
+    导出为字节块生成器。参数在调用时立即校验（抛 ExportError），数据库在第一次取块时才打开。
+    配置了分片时在最前面加 region 列，依次导出各分片。
+    """
+    columns, sql, params = build_query(dataset, platforms, shop_names)
+    if fmt not in FORMATS:
+        raise ExportError(f"未知格式: {fmt}（可选 {', '.join(FORMATS)}）")
+    shards = router.select(region)
+    if shards is None:
+        raise ExportError(f"未知区域: {region}")
+    if router.sharded:
+        columns = ("region",) + columns
+
+    def rows() -> Iterator[tuple]:
+        start = time.perf_counter()
+        count = 0
+        try:
+            for shard in shards:
+                for row in iter_rows(shard.db.db_path, sql, params):
+                    count += 1
+                    yield (shard.region,) + row if router.sharded else row
+        finally:
+            export_rows.inc(count, dataset=dataset, format=fmt)
+            export_seconds.observe(time.perf_counter() - start, dataset=dataset)
+
+    chunks = encode(columns, rows(), fmt)
+    return gzip_chunks(chunks) if compress else chunks
+
+
+def main() -> bool:
+    parser = argparse.ArgumentParser(description="流式导出目录数据（CSV / NDJSON）")
+    parser.add_argument("dataset", choices=list(DATASETS))
+    parser.add_argument("--format", choices=FORMATS, default="csv")
+    parser.add_argument("--region", help="只导出该区域分片")
+    parser.add_argument("--platform", action="append", default=[], help="平台（可多次指定）")
+    parser.add_argument("--shop", action="append", default=[], help="店铺组名（可多次指定）")
+    parser.add_argument("--gzip", action="store_true", help="gzip 压缩输出")
+    parser.add_argument("--out", help="输出文件（默认标准输出）")
+    args = parser.parse_args()
+
+    # 初始化过程中的日志改写到标准错误，标准输出只留导出数据
+    with contextlib.redirect_stdout(sys.stderr):
+        db = FoodPriceDB()
+        if not db.initialize(os.getenv("DB_PATH", "food_price.db")):
+            print("❌ 数据库初始化失败")
+            return False
+        router = ShardRouter(db)
+        if not router.initialize():
+            print("❌ 区域分片初始化失败")
+            return False
+
+    try:
+        chunks = export(router, args.dataset, args.format, args.region, args.platform, args.shop, args.gzip)
+    except ExportError as e:
+        print(f"❌ {e}", file=sys.stderr)
+        return False
+    start = time.perf_counter()
+    written = 0
+    out = open(args.out, "wb") if args.out else sys.stdout.buffer
+    try:
+        for chunk in chunks:
+            out.write(chunk)
+            written += len(chunk)
+    except BrokenPipeError:  # 管道下游（如 head）提前关闭
+        sys.stdout = open(os.devnull, "w")
+        return True
+    finally:
+        if args.out:
+            out.close()
+        else:
+            out.flush()
+    # 进度信息写到标准错误，不混进标准输出的数据
+    print(f"✅ 已导出 {args.dataset}（{args.format}{' + gzip' if args.gzip else ''}）{written / 1024:.1f}KB，"
+          f"耗时 {time.perf_counter() - start:.2f}s", file=sys.stderr)
+    return True
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
@@ -0,0 +1,323 @@
+"""
+店铺图片的本地缓存与缩略图：卡片统一引用 /api/img/<shop_id>，浏览器不再直接请求第三方原图。
+
+- 远程原图只抓取一次：在后台线程池中下载（同一 URL 同时只有一个请求在抓取），
+  缩放成缩略图后写入磁盘目录；抓取完成前以及失败后（IMAGE_RETRY_SECONDS 内不再重试）返回本地生成的占位图，
+  接口本身从不等待远程主机
+- 磁盘目录是带容量上限的 LRU：文件名为 <url 摘要>.<内容摘要>.<扩展名>，启动时按修改时间恢复顺序，
+  命中时刷新修改时间，超过 IMAGE_CACHE_MAX_MB 后淘汰最久未用的文件；多 worker 共用目录时各自计数，
+  文件被其他进程淘汰后按未命中处理
+- ETag 取内容摘要，浏览器带 If-None-Match 时返回 304
+- 抓取函数可替换：fetcher(url) -> (bytes, content_type)，测试时用 DirectoryFetcher 等本地实现代替 HTTP
+- 有 Pillow 时缩放并转为 JPEG；未安装时原样缓存（不超过 IMAGE_MAX_SOURCE_KB）
+
+环境变量: IMAGE_CACHE_DIR（默认系统临时目录下的 savebite_images）  IMAGE_CACHE_MAX_MB（默认 256）
+         IMAGE_FETCH（http / off，默认 http）  IMAGE_FETCH_WORKERS（默认 2）  IMAGE_FETCH_TIMEOUT（秒，默认 5）
+         IMAGE_RETRY_SECONDS（默认 3600）  IMAGE_MAX_SOURCE_KB（默认 5120）
+"""
+import hashlib
+import html
+import os
+import tempfile
+import threading
+import time
+import urllib.parse
+import urllib.request
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from io import BytesIO
+from typing import Any, Callable, Dict, Optional, Tuple
+
+try:
+    from PIL import Image
+except ImportError:  # 可选依赖：未安装时不缩放，原图直接进缓存
+    Image = None
+
+try:
+    from server import metrics
+except ImportError:  # 以脚本方式在 server/ 目录下运行时
+    import metrics
+
+IMAGE_CACHE_DIR = os.getenv("IMAGE_CACHE_DIR") or os.path.join(tempfile.gettempdir(), "savebite_images")
+IMAGE_CACHE_MAX_BYTES = int(float(os.getenv("IMAGE_CACHE_MAX_MB", "256")) * 1024 * 1024)
+IMAGE_FETCH = os.getenv("IMAGE_FETCH", "http").lower()
+IMAGE_FETCH_WORKERS = int(os.getenv("IMAGE_FETCH_WORKERS", "2"))
+IMAGE_FETCH_TIMEOUT = float(os.getenv("IMAGE_FETCH_TIMEOUT", "5"))
+IMAGE_RETRY_SECONDS = float(os.getenv("IMAGE_RETRY_SECONDS", "3600"))
+IMAGE_MAX_SOURCE_BYTES = int(os.getenv("IMAGE_MAX_SOURCE_KB", "5120")) * 1024
+# 与前端卡片 .restaurant-image 的尺寸一致
+THUMBNAIL_SIZE = (300, 160)
+THUMBNAIL_QUALITY = 80
+# 失败记录最多保留的 URL 数
+MAX_FAILED_URLS = 10000
+
+EXTENSIONS = {
+    "image/jpeg": "jpg",
+    "image/png": "png",
+    "image/gif": "gif",
+    "image/webp": "webp",
+    "image/svg+xml": "svg",
+}
+CONTENT_TYPES = {ext: content_type for content_type, ext in EXTENSIONS.items()}
+
+image_requests = metrics.metrics.counter(
+    "image_requests_total", "店铺图片请求数（hit=缓存命中，pending=抓取中返回占位图，placeholder=无图或抓取失败）",
+    ("result",))
+image_fetch_seconds = metrics.metrics.histogram(
+    "image_fetch_seconds", "远程图片抓取 + 缩放耗时（秒）",
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10))
+image_fetch_failures = metrics.metrics.counter(
+    "image_fetch_failures_total", "远程图片抓取失败次数", ("reason",))
+image_cache_evictions = metrics.metrics.counter(
+    "image_cache_evictions_total", "超出容量后淘汰的缓存文件数")
+
+
+class ImageFetchError(Exception):
+    """抓取到的内容不可用（非图片、过大、协议不支持等）"""
+
+    def __init__(self, reason: str, message: str):
+        super().__init__(message)
+        self.reason = reason
+
+
+def http_fetcher(url: str) -> Tuple[bytes, str]:
+    """默认抓取函数：只允许 http(s)，限制超时与大小，要求返回 image/* 内容"""
+    if urllib.parse.urlsplit(url).scheme not in ("http", "https"):
+        raise ImageFetchError("scheme", f"不支持的图片地址: {url}")
+    req = urllib.request.Request(url, headers={"User-Agent": "SaveBite-ImageCache/1.0"})
+    with urllib.request.urlopen(req, timeout=IMAGE_FETCH_TIMEOUT) as resp:
+        content_type = resp.headers.get_content_type()
+        if not content_type.startswith("image/"):
+            raise ImageFetchError("content_type", f"不是图片: {content_type}")
+        data = resp.read(IMAGE_MAX_SOURCE_BYTES + 1)
+    if len(data) > IMAGE_MAX_SOURCE_BYTES:
+        raise ImageFetchError("too_large", f"图片超过 {IMAGE_MAX_SOURCE_BYTES // 1024}KB")
+    return data, content_type
+
+
+class DirectoryFetcher:
+    """本地替身：按 URL 路径的文件名从目录读取图片（测试 / 离线开发用）"""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    def __call__(self, url: str) -> Tuple[bytes, str]:
+        name = os.path.basename(urllib.parse.urlsplit(url).path)
+        path = os.path.join(self.directory, name)
+        if not name or not os.path.isfile(path):
+            raise ImageFetchError("not_found", f"本地没有图片: {name}")
+        with open(path, "rb") as f:
+            data = f.read()
+        return data, CONTENT_TYPES.get(name.rsplit(".", 1)[-1].lower(), "application/octet-stream")
+
+
+def make_thumbnail(data: bytes, content_type: str, size: Tuple[int, int] = THUMBNAIL_SIZE) -> Tuple[bytes, str]:
+    """缩放到不超过 size（保持比例）并转为 JPEG；没有 Pillow 或是 SVG 时原样返回"""
+    if content_type not in EXTENSIONS:
+        raise ImageFetchError("content_type", f"不支持的图片格式: {content_type}")
+    if Image is None or content_type == "image/svg+xml":
+        return data, content_type
+    try:
+        with Image.open(BytesIO(data)) as img:
+            img.thumbnail(size)
+            out = BytesIO()
+            img.convert("RGB").save(out, "JPEG", quality=THUMBNAIL_QUALITY, optimize=True)
+    except Exception as e:
+        raise ImageFetchError("decode", f"图片解码失败: {e}")
+    return out.getvalue(), "image/jpeg"
+
+
+@lru_cache(maxsize=4096)
+def placeholder(shop_name: str, size: Tuple[int, int] = THUMBNAIL_SIZE) -> Tuple[bytes, str, str]:
+    """本地生成的 SVG 占位图（底色由店名决定），返回 (内容, content_type, etag)"""
+    width, height = size
+    hue = int(hashlib.md5(shop_name.encode("utf-8")).hexdigest()[:4], 16) % 360
+    label = shop_name if len(shop_name) <= 12 else shop_name[:11] + "…"
+    svg = (
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" '
+        f'viewBox="0 0 {width} {height}">'
+        f'<rect width="100%" height="100%" fill="hsl({hue},45%,88%)"/>'
+        f'<text x="50%" y="50%" dominant-baseline="middle" text-anchor="middle" '
+        f'font-family="sans-serif" font-size="18" fill="hsl({hue},35%,35%)">{html.escape(label)}</text>'
+        f'</svg>'
+    ).encode("utf-8")
+    return svg, "image/svg+xml", content_etag(svg)
+
+
+def content_etag(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()[:32]
+
+
+def url_key(url: str, size: Tuple[int, int] = THUMBNAIL_SIZE) -> str:
+    return hashlib.sha256(f"{size[0]}x{size[1]}:{url}".encode("utf-8")).hexdigest()[:32]
+
+
+class CachedImage:
+    """磁盘上的一个缓存文件"""
+    __slots__ = ("key", "path", "size", "etag", "content_type")
+
+    def __init__(self, key: str, path: str, size: int, etag: str, content_type: str):
+        self.key = key
+        self.path = path
+        self.size = size
+        self.etag = etag
+        self.content_type = content_type
+
+    def read(self) -> bytes:
+        with open(self.path, "rb") as f:
+            return f.read()
+
+
+class ImageCache:
+    """按源 URL 缓存缩略图的磁盘 LRU；未命中时交给后台线程抓取"""
+
+    def __init__(self, directory: str = IMAGE_CACHE_DIR, max_bytes: int = IMAGE_CACHE_MAX_BYTES,
+                 fetcher: Optional[Callable[[str], Tuple[bytes, str]]] = None,
+                 size: Tuple[int, int] = THUMBNAIL_SIZE, workers: int = IMAGE_FETCH_WORKERS):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        if fetcher is None and IMAGE_FETCH != "off":
+            fetcher = http_fetcher
+        self.fetcher = fetcher
+        self.size = size
+        self.lock = threading.Lock()
+        self.entries: "OrderedDict[str, CachedImage]" = OrderedDict()
+        self.total_bytes = 0
+        self.loaded = False
+        self.in_flight: Dict[str, Any] = {}
+        self.failed: Dict[str, float] = {}  # url → 可再次尝试的时间
+        self.executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="image-fetch")
+
+    def set_fetcher(self, fetcher: Optional[Callable[[str], Tuple[bytes, str]]]) -> None:
+        """替换抓取函数（None 表示不再抓取远程图片，只返回已缓存的和占位图）"""
+        self.fetcher = fetcher
+        with self.lock:
+            self.failed.clear()
+
+    def _load(self) -> None:
+        """首次使用时扫描目录，按修改时间从旧到新恢复 LRU 顺序；调用方持有 self.lock"""
+        self.loaded = True
+        os.makedirs(self.directory, exist_ok=True)
+        found = []
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            parts = name.split(".")
+            if len(parts) != 3 or parts[2] not in CONTENT_TYPES:
+                if name.endswith(".tmp"):  # 上次写入中断留下的临时文件
+                    os.remove(path)
+                continue
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            found.append((stat.st_mtime, CachedImage(parts[0], path, stat.st_size, parts[1], CONTENT_TYPES[parts[2]])))
+        for _, entry in sorted(found, key=lambda item: item[0]):
+            self.entries[entry.key] = entry
+            self.total_bytes += entry.size
+        self._evict()
+
+    def lookup(self, url: str) -> Optional[CachedImage]:
+        """命中时刷新 LRU 位置并返回缓存文件；文件已被外部删除时视为未命中"""
+        key = url_key(url, self.size)
+        with self.lock:
+            if not self.loaded:
+                self._load()
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if not os.path.exists(entry.path):
+                self._drop(entry)
+                return None
+            self.entries.move_to_end(key)
+        try:
+            os.utime(entry.path)
+        except OSError:
+            pass
+        return entry
+
+    def request(self, url: str) -> bool:
+        """安排后台抓取；已在抓取、最近失败或未配置抓取函数时返回 False"""
+        if self.fetcher is None:
+            return False
+        with self.lock:
+            if url in self.in_flight or self.failed.get(url, 0) > time.time():
+                return False
+            self.in_flight[url] = self.executor.submit(self._fetch, url)
+        return True
+
+    def fetch(self, url: str) -> Optional[CachedImage]:
+        """同步抓取并写入缓存（预热 / 命令行用）；失败时返回 None"""
+        cached = self.lookup(url)
+        if cached is not None or self.fetcher is None:
+            return cached
+        return self._fetch(url)
+
+    def _fetch(self, url: str) -> Optional[CachedImage]:
+        start = time.perf_counter()
+        try:
+            data, content_type = self.fetcher(url)
+            data, content_type = make_thumbnail(data, content_type, self.size)
+            entry = self.store(url, data, content_type)
+            image_fetch_seconds.observe(time.perf_counter() - start)
+            return entry
+        except Exception as e:
+            image_fetch_failures.inc(reason=getattr(e, "reason", type(e).__name__))
+            print(f"图片抓取失败 {url}: {e}")
+            with self.lock:
+                if len(self.failed) >= MAX_FAILED_URLS:
+                    self.failed.clear()
+                self.failed[url] = time.time() + IMAGE_RETRY_SECONDS
+            return None
+        finally:
+            with self.lock:
+                self.in_flight.pop(url, None)
+
+    def store(self, url: str, data: bytes, content_type: str) -> CachedImage:
+        """原子写入（临时文件 + rename）后加入 LRU，超出容量时淘汰最久未用的文件"""
+        key = url_key(url, self.size)
+        etag = content_etag(data)
+        path = os.path.join(self.directory, f"{key}.{etag}.{EXTENSIONS[content_type]}")
+        with self.lock:
+            if not self.loaded:
+                self._load()
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        entry = CachedImage(key, path, len(data), etag, content_type)
+        with self.lock:
+            old = self.entries.get(key)
+            if old is not None:
+                self._drop(old, remove_file=old.path != path)
+            self.entries[key] = entry
+            self.total_bytes += entry.size
+            self._evict()
+        return entry
+
+    def _drop(self, entry: CachedImage, remove_file: bool = False) -> None:
+        self.entries.pop(entry.key, None)
+        self.total_bytes -= entry.size
+        if remove_file:
+            try:
+                os.remove(entry.path)
+            except OSError:
+                pass
+
+    def _evict(self) -> None:
+        # 至少保留最新的一个文件，即使它本身超过容量上限
+        while self.total_bytes > self.max_bytes and len(self.entries) > 1:
+            self._drop(next(iter(self.entries.values())), remove_file=True)
+            image_cache_evictions.inc()
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                "directory": self.directory,
+                "files": len(self.entries),
+                "bytes": self.total_bytes,
+                "max_bytes": self.max_bytes,
+                "in_flight": len(self.in_flight),
+                "failed": len(self.failed),
+                "thumbnails": Image is not None,
+            }
@@ -0,0 +1,327 @@
+"""
+多文件并行导入：爬虫按平台 / 城市各产出一份 data.json 格式的数据文件，本命令一次导入一个目录或一组通配符。
+
+- 解析、校验、名称规范化（NFKC + 空白折叠）与内容哈希在工作进程中并行完成，用户密码也在工作进程中哈希
+- 校验通过的行按文件交给 FoodPriceDB 的写队列，由单个写线程整文件一个事务批量提交
+  （店铺按 平台+店名 更新、菜品按 店铺+菜名 更新价格、满减按店铺整体替换）
+- 内容哈希与上次导入相同的文件直接跳过（--force 强制重新导入）
+- 配置了 SHARD_REGIONS 时按店铺的 region 字段写入对应分片，最后登记全局店铺目录
+
+用法:
+    python server/ingest.py dumps/                       # 目录下所有 *.json
+    python server/ingest.py "dumps/meituan_*.json" dumps/eleme_wuhan.json --workers 8
+    python server/ingest.py dumps/ --replace             # 先清空所有业务数据（等同 reload_data.py）
+"""
+import argparse
+import glob
+import hashlib
+import json
+import os
+import re
+import sys
+import time
+import unicodedata
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+try:
+    from server.FoodPriceDB import FoodPriceDB
+    from server.passwords import PasswordHasher
+    from server.shards import ShardRouter
+except ImportError:  # 以脚本方式在 server/ 目录下运行时
+    from FoodPriceDB import FoodPriceDB
+    from passwords import PasswordHasher
+    from shards import ShardRouter
+
+_SPACE_RE = re.compile(r"\s+")
+# 每个文件最多打印的错误条数
+MAX_PRINTED_ERRORS = 5
+
+SHOP_NUMBER_FIELDS = ("delivery_distance", "rating", "delivery_fee", "min_order", "avg_consumption")
+
+
+def normalize_name(value: Any) -> str:
+    """全角 / 兼容字符统一（NFKC），去掉首尾空白并把连续空白折叠成一个空格；两个平台的同一店铺据此才能按店名对齐"""
+    if not isinstance(value, str):
+        raise ValueError("必须是字符串")
+    text = _SPACE_RE.sub(" ", unicodedata.normalize("NFKC", value)).strip()
+    if not text:
+        raise ValueError("不能为空")
+    return text
+
+
+def _number(value: Any, name: str, minimum: float = 0.0, maximum: Optional[float] = None) -> float:
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        try:
+            value = float(value)
+        except (TypeError, ValueError):
+            raise ValueError(f"{name} 不是数字: {value!r}")
+    if value != value or value < minimum or (maximum is not None and value > maximum):
+        raise ValueError(f"{name} 超出范围: {value!r}")
+    return float(value)
+
+
+def _optional_number(row: Dict[str, Any], name: str, minimum: float, maximum: float) -> Optional[float]:
+    value = row.get(name)
+    return None if value is None else _number(value, name, minimum, maximum)
+
+
+# ======================
+# 工作进程：解析 + 校验 + 规范化
+# ======================
+_hasher: Optional[PasswordHasher] = None
+
+
+def parse_dump(path: str, known_hash: Optional[str] = None) -> Dict[str, Any]:
+    """
+    解析一个数据文件，返回校验通过的行（元组）与逐行错误。
+    内容哈希等于 known_hash 时不解析，直接返回 skipped=True。
+    """
+    global _hasher
+    start = time.process_time()
+    result: Dict[str, Any] = {"path": path, "skipped": False, "errors": [], "rows": 0,
+                              "users": [], "shops": [], "dishes": [], "coupons": []}
+    try:
+        with open(path, "rb") as f:
+            raw = f.read()
+    except OSError as e:
+        result["errors"].append(f"读取失败: {e}")
+        return result
+    result["content_hash"] = hashlib.sha256(raw).hexdigest()
+    if known_hash == result["content_hash"]:
+        result["skipped"] = True
+        return result
+    try:
+        data = json.loads(raw)
+        if not isinstance(data, dict):
+            raise ValueError("顶层必须是对象")
+    except ValueError as e:
+        result["errors"].append(f"JSON 解析失败: {e}")
+        return result
+
+    errors = result["errors"]
+
+    def rows(section: str) -> Iterable[Tuple[int, Dict[str, Any]]]:
+        items = data.get(section) or []
+        if not isinstance(items, list):
+            errors.append(f"{section}: 必须是数组")
+            return
+        for index, row in enumerate(items):
+            if isinstance(row, dict):
+                yield index, row
+            else:
+                errors.append(f"{section}[{index}]: 必须是对象")
+
+    users: Dict[str, Tuple[str, str, str]] = {}
+    for index, row in rows("users"):
+        try:
+            username = normalize_name(row.get("username"))
+            email = normalize_name(row.get("email")).lower()
+            password = row.get("password")
+            if not isinstance(password, str) or not password:
+                raise ValueError("password 不能为空")
+            if _hasher is None:
+                _hasher = PasswordHasher()
+            users[username] = (username, email, _hasher.hash_inline(password))
+        except ValueError as e:
+            errors.append(f"users[{index}]: {e}")
+
+    # 同一文件内重复的店铺 / 菜品以最后一次出现为准
+    shops: Dict[Tuple[str, str], tuple] = {}
+    shop_regions: Dict[Tuple[str, str], Optional[str]] = {}
+    for index, row in rows("shops"):
+        try:
+            key = (normalize_name(row.get("platform_name")), normalize_name(row.get("shop_name")))
+            numbers = [_number(row.get(name, 0) or 0, name, 0, 5 if name == "rating" else None)
+                       for name in SHOP_NUMBER_FIELDS]
+            delivery_time = row.get("delivery_time")
+            if delivery_time is not None:
+                delivery_time = int(_number(delivery_time, "delivery_time"))
+            monthly_sales = int(_number(row.get("monthly_sales", 0) or 0, "monthly_sales"))
+            image_url = row.get("image_url") or None
+            if image_url is not None and not isinstance(image_url, str):
+                raise ValueError("image_url 必须是字符串")
+            shops[key] = key + (numbers[0], numbers[1], delivery_time, numbers[2], monthly_sales,
+                                numbers[3], numbers[4], image_url,
+                                _optional_number(row, "latitude", -90, 90),
+                                _optional_number(row, "longitude", -180, 180))
+            shop_regions[key] = row.get("region") or None
+        except ValueError as e:
+            errors.append(f"shops[{index}]: {e}")
+
+    def region_of(key: Tuple[str, str], row: Dict[str, Any]) -> Optional[str]:
+        return shop_regions[key] if key in shop_regions else row.get("region") or None
+
+    dishes: Dict[Tuple[str, str, str], tuple] = {}
+    for index, row in rows("dishes"):
+        try:
+            key = (normalize_name(row.get("platform_name")), normalize_name(row.get("shop_name")))
+            dish_name = normalize_name(row.get("dish_name"))
+            dishes[key + (dish_name,)] = (region_of(key, row),) + key + (dish_name, _number(row.get("price"), "price"))
+        except ValueError as e:
+            errors.append(f"dishes[{index}]: {e}")
+
+    coupons = []
+    for index, row in rows("coupons"):
+        try:
+            key = (normalize_name(row.get("platform_name")), normalize_name(row.get("shop_name")))
+            coupons.append((region_of(key, row),) + key + (
+                _number(row.get("condition_amount"), "condition_amount"),
+                _number(row.get("discount_amount"), "discount_amount"),
+                row.get("valid_from"), row.get("valid_to")))
+        except ValueError as e:
+            errors.append(f"coupons[{index}]: {e}")
+
+    result["users"] = list(users.values())
+    result["shops"] = [(shop_regions[key],) + row for key, row in shops.items()]
+    result["dishes"] = list(dishes.values())
+    result["coupons"] = coupons
+    result["rows"] = len(users) + len(shops) + len(dishes) + len(coupons)
+    result["parse_seconds"] = time.process_time() - start
+    return result
+
+
+# ======================
+# 主进程：调度 + 单写线程提交
+# ======================
+def expand_paths(patterns: List[str]) -> List[str]:
+    """目录取其下所有 *.json，其余按通配符展开；去重并按路径排序"""
+    paths = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            paths.extend(glob.glob(os.path.join(pattern, "*.json")))
+        else:
+            paths.extend(glob.glob(pattern) or [pattern])
+    return sorted({os.path.abspath(p) for p in paths})
+
+
+class Ingestor:
+    def __init__(self, router: ShardRouter, workers: Optional[int] = None, force: bool = False):
+        self.router = router
+        self.workers = workers or os.cpu_count() or 1
+        self.force = force
+        self.stats = {"files": 0, "skipped": 0, "failed": 0, "rows": 0, "written": 0, "errors": 0,
+                      "parse_cpu_seconds": 0.0, "write_seconds": 0.0}
+
+    def write(self, parsed: Dict[str, Any]) -> Tuple[int, List[str]]:
+        """把一个文件的行写入全局库 / 各分片（每个库一个事务），返回 (写入行数, 错误)"""
+        errors: List[str] = []
+        written = 0
+        if parsed["users"]:
+            written += self.router.global_db.bulk_insert_users(parsed["users"])
+        parts: Dict[str, Dict[str, list]] = {}
+        for table in ("shops", "dishes", "coupons"):
+            for region, *row in parsed[table]:
+                if region not in self.router.by_region:
+                    region = self.router.default_region
+                parts.setdefault(region, {"shops": [], "dishes": [], "coupons": []})[table].append(tuple(row))
+        for region, part in parts.items():
+            shard = self.router.by_region[region]
+            try:
+                counts, row_errors = shard.db.bulk_upsert_catalog(part["shops"], part["dishes"], part["coupons"])
+            except Exception as e:
+                errors.append(f"区域 {region} 写入失败（已回滚）: {e}")
+                continue
+            written += sum(counts.values())
+            errors.extend(row_errors)
+        return written, errors
+
+    def run(self, paths: List[str]) -> bool:
+        known = {} if self.force else self.router.global_db.get_ingested_hashes()
+        total = len(paths)
+        wall_start = time.perf_counter()
+        # 同时在途的文件数有上限：已解析未写入的结果不会无限堆积在内存里
+        window = self.workers * 2
+        pending = set()
+        queue = list(reversed(paths))
+        done_count = 0
+        with ProcessPoolExecutor(max_workers=self.workers) as pool:
+            while queue or pending:
+                while queue and len(pending) < window:
+                    path = queue.pop()
+                    pending.add(pool.submit(parse_dump, path, known.get(path)))
+                finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    done_count += 1
+                    self._handle(future.result(), done_count, total)
+
+        if self.router.sharded:
+            for shard in self.router.shards:
+                added = self.router.global_db.register_shop_directory(shard.region, shard.db.list_shop_keys())
+                print(f"区域 {shard.region}: 新登记 {added} 个店铺")
+
+        wall = time.perf_counter() - wall_start
+        s = self.stats
+        print(f"\n📊 文件 {s['files']}（跳过 {s['skipped']}，失败 {s['failed']}），解析 {s['rows']} 行，"
+              f"写入 {s['written']} 行，错误 {s['errors']} 条")
+        print(f"   总耗时 {wall:.2f}s，{s['rows'] / wall if wall else 0:.0f} 行/s；"
+              f"解析 CPU {s['parse_cpu_seconds']:.2f}s（{self.workers} 个进程），"
+              f"写入 {s['write_seconds']:.2f}s（{s['written'] / s['write_seconds'] if s['write_seconds'] else 0:.0f} 行/s）")
+        return s["failed"] == 0
+
+    def _handle(self, parsed: Dict[str, Any], done_count: int, total: int) -> None:
+        s = self.stats
+        s["files"] += 1
+        name = os.path.basename(parsed["path"])
+        if parsed["skipped"]:
+            s["skipped"] += 1
+            print(f"[{done_count}/{total}] {name}: 内容未变，跳过")
+            return
+        errors = list(parsed["errors"])
+        if "parse_seconds" not in parsed:
+            # 读取 / JSON 解析失败：整个文件无法导入
+            s["failed"] += 1
+            s["errors"] += len(errors)
+            print(f"[{done_count}/{total}] ❌ {name}: {errors[0]}")
+            return
+        start = time.perf_counter()
+        written, write_errors = self.write(parsed)
+        elapsed = time.perf_counter() - start
+        errors.extend(write_errors)
+        s["rows"] += parsed["rows"]
+        s["written"] += written
+        s["errors"] += len(errors)
+        s["parse_cpu_seconds"] += parsed["parse_seconds"]
+        s["write_seconds"] += elapsed
+        self.router.global_db.record_ingested_file(parsed["path"], parsed["content_hash"], written, len(errors))
+        marker = "⚠️" if errors else "✅"
+        print(f"[{done_count}/{total}] {marker} {name}: {parsed['rows']} 行，解析 {parsed['parse_seconds']:.2f}s，"
+              f"写入 {elapsed:.2f}s，错误 {len(errors)} 条")
+        for message in errors[:MAX_PRINTED_ERRORS]:
+            print(f"      {message}")
+        if len(errors) > MAX_PRINTED_ERRORS:
+            print(f"      ……另有 {len(errors) - MAX_PRINTED_ERRORS} 条")
+
+
+def main() -> bool:
+    parser = argparse.ArgumentParser(description="并行导入多个数据文件")
+    parser.add_argument("paths", nargs="+", help="数据文件、目录或通配符")
+    parser.add_argument("--workers", type=int, default=None, help="解析进程数（默认 CPU 核数）")
+    parser.add_argument("--force", action="store_true", help="忽略内容哈希，重新导入未变化的文件")
+    parser.add_argument("--replace", action="store_true", help="导入前清空所有业务数据")
+    args = parser.parse_args()
+
+    paths = expand_paths(args.paths)
+    if not paths:
+        print("❌ 没有找到数据文件")
+        return False
+
+    db = FoodPriceDB()
+    if not db.initialize(os.getenv("DB_PATH", "food_price.db")):
+        print("❌ 数据库初始化失败")
+        return False
+    router = ShardRouter(db)
+    if not router.initialize():
+        print("❌ 区域分片初始化失败")
+        return False
+    if args.replace:
+        print("🧹 清空现有数据...")
+        router.clear_all_data()
+        db._write(lambda: db._get_thread_cursor().execute("DELETE FROM ingest_files"))
+
+    print(f"📥 导入 {len(paths)} 个文件...")
+    return Ingestor(router, args.workers, force=args.force or args.replace).run(paths)
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
@@ -0,0 +1,287 @@
+import bisect
+import threading
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+# 默认直方图分桶（秒）
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# 响应体 / 结果集大小分桶
+SIZE_BUCKETS = (64, 256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+ROW_BUCKETS = (0, 1, 5, 10, 50, 100, 500, 1000, 5000, 10000, 100000)
+
+LabelKey = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names: Tuple[str, ...], values: LabelKey, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help_text: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> LabelKey:
+        return tuple(str(labels.get(n, "")) for n in self.labelnames)
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name, help_text, labelnames=()):
+        super().__init__(name, help_text, labelnames)
+        self._values: Dict[LabelKey, float] = {}
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        lines = self.header()
+        for key, value in items:
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+class Gauge(_Metric):
+    """普通 Gauge；传入 callback 时在抓取时取值（callback 返回 {labels_tuple: value}）"""
+    kind = "gauge"
+
+    def __init__(self, name, help_text, labelnames=(), callback: Optional[Callable[[], Dict[LabelKey, float]]] = None):
+        super().__init__(name, help_text, labelnames)
+        self._values: Dict[LabelKey, float] = {}
+        self.callback = callback
+
+    def set(self, value: float, **labels) -> None:
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels) -> None:
+        self.inc(-amount, **labels)
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def render(self) -> List[str]:
+        if self.callback is not None:
+            try:
+                values = dict(self.callback() or {})
+            except Exception as e:
+                print(f"指标 {self.name} 采集失败: {e}")
+                values = {}
+        else:
+            with self._lock:
+                values = dict(self._values)
+        lines = self.header()
+        for key, value in sorted(values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labelnames=(), buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # key -> [每个桶的计数..., +Inf 计数, sum]
+        self._values: Dict[LabelKey, List[float]] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        idx = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [0] * (len(self.buckets) + 2)
+            state[idx] += 1
+            state[-1] += value
+
+    def snapshot(self, **labels) -> Tuple[List[float], float, int]:
+        """返回 (累计桶计数, sum, count)"""
+        with self._lock:
+            state = list(self._values.get(self._key(labels)) or [0] * (len(self.buckets) + 2))
+        cumulative, running = [], 0
+        for c in state[:-1]:
+            running += c
+            cumulative.append(running)
+        return cumulative, state[-1], running
+
+    def quantile(self, q: float, **labels) -> Optional[float]:
+        """按桶上界估算分位数（无数据返回 None）"""
+        cumulative, _, count = self.snapshot(**labels)
+        if count == 0:
+            return None
+        target = q * count
+        for bound, c in zip(self.buckets + (float("inf"),), cumulative):
+            if c >= target:
+                return bound
+        return float("inf")
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted((k, list(v)) for k, v in self._values.items())
+        lines = self.header()
+        bounds = self.buckets + (float("inf"),)
+        for key, state in items:
+            running = 0
+            for bound, c in zip(bounds, state[:-1]):
+                running += c
+                labels = _format_labels(self.labelnames, key, ("le", _format_value(bound)))
+                lines.append(f"{self.name}_bucket{labels} {_format_value(running)}")
+            base = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{base} {_format_value(state[-1])}")
+            lines.append(f"{self.name}_count{base} {_format_value(running)}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self, prefix: str = "savebite_"):
+        self.prefix = prefix
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, cls, name, *args, **kwargs):
+        full_name = self.prefix + name
+        with self._lock:
+            existing = self._metrics.get(full_name)
+            if existing is not None:
+                return existing
+            metric = cls(full_name, *args, **kwargs)
+            self._metrics[full_name] = metric
+            return metric
+
+    def counter(self, name: str, help_text: str, labelnames: Iterable[str] = ()) -> Counter:
+        return self._register(Counter, name, help_text, labelnames)
+
+    def gauge(self, name: str, help_text: str, labelnames: Iterable[str] = (), callback=None) -> Gauge:
+        return self._register(Gauge, name, help_text, labelnames, callback=callback)
+
+    def histogram(self, name: str, help_text: str, labelnames: Iterable[str] = (),
+                  buckets: Tuple[float, ...] = LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram, name, help_text, labelnames, buckets=buckets)
+
+    def get(self, name: str) -> Optional[_Metric]:
+        return self._metrics.get(self.prefix + name)
+
+    def render(self) -> str:
+        """导出 Prometheus 文本格式（text/plain; version=0.0.4）"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines: List[str] = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+# 全局指标注册表
+metrics = MetricsRegistry()
+
+# ======================
+# HTTP 层
+# ======================
+http_requests_total = metrics.counter(
+    "http_requests_total", "HTTP 请求数", ("route", "method", "status"))
+http_request_duration = metrics.histogram(
+    "http_request_duration_seconds", "HTTP 请求耗时（秒）", ("route", "method"))
+http_response_bytes = metrics.histogram(
+    "http_response_bytes", "HTTP 响应体大小（字节）", ("route",), buckets=SIZE_BUCKETS)
+http_in_flight = metrics.gauge(
+    "http_requests_in_flight", "正在处理的 HTTP 请求数")
+
+# ======================
+# 数据库层
+# ======================
+db_method_duration = metrics.histogram(
+    "db_method_duration_seconds", "FoodPriceDB 方法耗时（秒，含重试）", ("method",))
+db_method_rows = metrics.histogram(
+    "db_method_result_rows", "FoodPriceDB 方法返回的记录数", ("method",), buckets=ROW_BUCKETS)
+db_method_errors = metrics.counter(
+    "db_method_errors_total", "FoodPriceDB 方法抛出的异常数", ("method",))
+db_retries_total = metrics.counter(
+    "db_retries_total", "_retry_operation 因数据库锁定而重试的次数", ("method",))
+
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def payload_rows(result) -> Optional[int]:
+    """从 FoodPriceDB 的 (success, ...) 返回值中取出列表长度，没有列表则返回 None"""
+    if isinstance(result, list):
+        return len(result)
+    if isinstance(result, tuple):
+        for item in result:
+            if isinstance(item, list):
+                return len(item)
+    return None
+
+
+def init_app(app) -> None:
+    """给 Flask 应用挂上按路由统计的请求计数 / 延迟 / 响应大小"""
+    import time
+    from flask import g, request
+
+    @app.before_request
+    def _metrics_start():
+        g._metrics_start = time.perf_counter()
+        http_in_flight.inc()
+
+    @app.after_request
+    def _metrics_record(response):
+        start = g.pop("_metrics_start", None)
+        if start is None:
+            return response
+        http_in_flight.dec()
+        route = request.url_rule.rule if request.url_rule is not None else "<unmatched>"
+        elapsed = time.perf_counter() - start
+        http_requests_total.inc(route=route, method=request.method, status=response.status_code)
+        http_request_duration.observe(elapsed, route=route, method=request.method)
+        # 流式响应（生成器）不计算大小，否则会把整个生成器读进内存
+        if not response.direct_passthrough and not response.is_streamed:
+            size = response.calculate_content_length()
+            if size is not None:
+                http_response_bytes.observe(size, route=route)
+        return response
+
+    @app.teardown_request
+    def _metrics_teardown(exc):
+        # after_request 没有执行（视图抛出未处理异常）时补记一次 500
+        start = g.pop("_metrics_start", None)
+        if start is None:
+            return
+        http_in_flight.dec()
+        route = request.url_rule.rule if request.url_rule is not None else "<unmatched>"
+        http_requests_total.inc(route=route, method=request.method, status=500)
+        http_request_duration.observe(time.perf_counter() - start, route=route, method=request.method)
@@ -0,0 +1,193 @@
+import base64
+import hashlib
+import hmac
+import multiprocessing
+import os
+import secrets
+import threading
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from typing import Optional, Tuple
+
+try:
+    from server import metrics
+except ImportError:  # 以脚本方式在 server/ 目录下运行时
+    import metrics
+
+password_hash_seconds = metrics.metrics.histogram(
+    "password_hash_seconds", "密码哈希 / 校验耗时（秒，含排队）", ("op",))
+password_rejections = metrics.metrics.counter(
+    "password_pool_rejections_total", "哈希池饱和或超时被拒绝的请求数", ("reason",))
+password_in_flight = metrics.metrics.gauge(
+    "password_pool_in_flight", "哈希池中排队与执行中的任务数")
+password_rehashes = metrics.metrics.counter(
+    "password_rehashes_total", "登录时从旧格式 / 旧参数重新哈希的次数")
+
+
+class PasswordPoolBusy(Exception):
+    """哈希池已满或等待超时；调用方应返回 429"""
+
+
+def _b64(data: bytes) -> str:
+    return base64.b64encode(data).decode().rstrip("=")
+
+
+def _unb64(text: str) -> bytes:
+    return base64.b64decode(text + "=" * (-len(text) % 4))
+
+
+# ======================
+# 纯函数（在工作进程中执行，必须可 pickle）
+# ======================
+def _hash(password: str, algorithm: str, params: Tuple[int, ...], salt: Optional[bytes] = None) -> str:
+    salt = salt or secrets.token_bytes(16)
+    if algorithm == "scrypt":
+        n, r, p = params
+        digest = hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p,
+                                maxmem=128 * r * (n + p + 2) + 1024 * 1024, dklen=32)
+        return f"scrypt${n}${r}${p}${_b64(salt)}${_b64(digest)}"
+    if algorithm == "pbkdf2_sha256":
+        (iterations,) = params
+        digest = hashlib.pbkdf2_hmac("sha256", password.encode(), salt, iterations)
+        return f"pbkdf2_sha256${iterations}${_b64(salt)}${_b64(digest)}"
+    raise ValueError(f"不支持的算法: {algorithm}")
+
+
+def _verify(password: str, stored: str) -> bool:
+    if "$" not in stored:
+        # 旧格式：无盐 SHA-256 十六进制
+        legacy = hashlib.sha256(password.encode()).hexdigest()
+        return hmac.compare_digest(legacy, stored)
+    parts = stored.split("$")
+    if parts[0] == "scrypt" and len(parts) == 6:
+        params = (int(parts[1]), int(parts[2]), int(parts[3]))
+        salt = _unb64(parts[4])
+    elif parts[0] == "pbkdf2_sha256" and len(parts) == 4:
+        params = (int(parts[1]),)
+        salt = _unb64(parts[2])
+    else:
+        return False
+    return hmac.compare_digest(_hash(password, parts[0], params, salt), stored)
+
+
+class PasswordHasher:
+    """
+    可调参数的密码哈希：
+    - PASSWORD_KDF=scrypt|pbkdf2_sha256，SCRYPT_N/SCRYPT_R/SCRYPT_P，PBKDF2_ITERATIONS
+    - 计算放在有界线程池（hashlib 计算时释放 GIL）；PASSWORD_POOL=process|thread|inline，PASSWORD_POOL_WORKERS
+    - process 模式的工作进程必须在服务进程启动任何线程之前由 start() 一次性 fork 出来
+      （之后再 fork 可能继承其他线程持有的锁而死锁）；没有提前启动时退回线程池
+    - 排队 + 执行中的任务超过 PASSWORD_MAX_PENDING 时立即抛 PasswordPoolBusy；
+      名额在任务真正结束时才归还（超时的调用方放弃等待，但任务仍占着工作线程）
+    """
+
+    def __init__(self):
+        self.algorithm = os.getenv("PASSWORD_KDF", "scrypt")
+        if self.algorithm == "scrypt":
+            self.params: Tuple[int, ...] = (
+                int(os.getenv("SCRYPT_N", str(2 ** 14))),
+                int(os.getenv("SCRYPT_R", "8")),
+                int(os.getenv("SCRYPT_P", "1")),
+            )
+        elif self.algorithm == "pbkdf2_sha256":
+            self.params = (int(os.getenv("PBKDF2_ITERATIONS", "600000")),)
+        else:
+            raise ValueError(f"不支持的 PASSWORD_KDF: {self.algorithm}")
+
+        self.mode = os.getenv("PASSWORD_POOL", "thread")
+        self.workers = int(os.getenv("PASSWORD_POOL_WORKERS", str(min(4, os.cpu_count() or 1))))
+        self.max_pending = int(os.getenv("PASSWORD_MAX_PENDING", str(self.workers * 4)))
+        self.timeout = float(os.getenv("PASSWORD_TIMEOUT_SECONDS", "5"))
+        self.slots = threading.BoundedSemaphore(self.max_pending)
+        self.lock = threading.Lock()
+        self.executor: Optional[Executor] = None
+
+    def start(self) -> None:
+        """process 模式：在单线程阶段创建进程池并一次性 fork 出全部工作进程（其他模式无操作）"""
+        if self.mode != "process":
+            return
+        with self.lock:
+            if self.executor is not None:
+                return
+            if threading.active_count() > 1:
+                print("警告: 已有其他线程在运行，fork 哈希进程不安全，改用线程池")
+                self.mode = "thread"
+                return
+            try:
+                # fork：子进程只执行 hashlib，不重新导入 Flask 应用；fork 方式下首次提交即启动全部工作进程
+                executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("fork"))
+                executor.submit(int).result()
+                self.executor = executor
+            except (OSError, ValueError) as e:
+                print(f"警告: 无法创建哈希进程池（{e}），改用线程池")
+                self.mode = "thread"
+
+    def _get_executor(self) -> Optional[Executor]:
+        if self.mode == "inline":
+            return None
+        with self.lock:
+            if self.executor is None:
+                if self.mode == "process":
+                    print("警告: 哈希进程池未在启动线程前创建，改用线程池")
+                    self.mode = "thread"
+                # hashlib 的 scrypt / pbkdf2 计算时会释放 GIL
+                self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="password")
+            return self.executor
+
+    def _release(self, _future=None) -> None:
+        password_in_flight.dec()
+        self.slots.release()
+
+    def _run(self, op: str, fn, *args):
+        if not self.slots.acquire(blocking=False):
+            password_rejections.inc(reason="saturated")
+            raise PasswordPoolBusy("登录请求过多，请稍后再试")
+        password_in_flight.inc()
+        start = time.perf_counter()
+        try:
+            executor = self._get_executor()
+            if executor is None:
+                try:
+                    return fn(*args)
+                finally:
+                    self._release()
+            try:
+                future = executor.submit(fn, *args)
+            except BaseException:
+                self._release()
+                raise
+            # 名额随任务结束归还：超时后 cancel() 停不下已在执行的任务，不能提前放行新的请求
+            future.add_done_callback(self._release)
+            try:
+                return future.result(timeout=self.timeout)
+            except FutureTimeoutError:
+                future.cancel()
+                password_rejections.inc(reason="timeout")
+                raise PasswordPoolBusy("密码校验超时，请稍后再试")
+        finally:
+            password_hash_seconds.observe(time.perf_counter() - start, op=op)
+
+    def hash(self, password: str) -> str:
+        return self._run("hash", _hash, password, self.algorithm, self.params)
+
+    def hash_inline(self, password: str) -> str:
+        """不经过进程池（离线脚本 / 批量导入使用）"""
+        return _hash(password, self.algorithm, self.params)
+
+    def verify(self, password: str, stored: str) -> Tuple[bool, bool]:
+        """返回 (是否匹配, 是否需要用当前参数重新哈希)"""
+        ok = self._run("verify", _verify, password, stored)
+        return ok, ok and self.needs_rehash(stored)
+
+    def needs_rehash(self, stored: str) -> bool:
+        return not stored.startswith(self.current_prefix())
+
+    def current_prefix(self) -> str:
+        return "$".join([self.algorithm, *map(str, self.params)]) + "$"
+
+    def shutdown(self) -> None:
+        with self.lock:
+            if self.executor is not None:
+                self.executor.shutdown(wait=False, cancel_futures=True)
+                self.executor = None
@@ -0,0 +1,235 @@
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+
+
+class ProfileSession:
+    """一次采样任务：对匹配路由的后续 N 个请求，或在时间窗口内的所有请求采样"""
+
+    def __init__(self, route: Optional[str] = None, requests: Optional[int] = None,
+                 seconds: Optional[float] = None):
+        self.route = route
+        self.remaining = requests
+        self.deadline = time.time() + seconds if seconds else None
+        self.created_at = time.time()
+
+    def matches(self, rule: Optional[str], path: str) -> bool:
+        return self.route is None or self.route in (rule, path)
+
+    def expired(self) -> bool:
+        if self.remaining is not None and self.remaining <= 0:
+            return True
+        return self.deadline is not None and time.time() >= self.deadline
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "route": self.route,
+            "remaining_requests": self.remaining,
+            "seconds_left": round(max(0.0, self.deadline - time.time()), 1) if self.deadline else None
+        }
+
+
+class SamplingProfiler:
+    """
+    基于 sys._current_frames() 的采样分析器。
+    未启用时只有一次布尔判断；启用后由单个后台线程按固定间隔抓取被采样请求线程的调用栈，
+    聚合为 flamegraph.pl / speedscope 可直接读取的折叠栈格式（"a;b;c 次数"）。
+    """
+
+    def __init__(self, interval_ms: Optional[float] = None, output_dir: Optional[str] = None):
+        if interval_ms is None:
+            interval_ms = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+        self.interval = interval_ms / 1000.0
+        self.output_dir = output_dir or os.getenv("PROFILE_DIR", "/tmp/savebite_profiles")
+        self.armed = False
+        self.lock = threading.Lock()
+        self.sessions: List[ProfileSession] = []
+        self._targets: Dict[int, str] = {}  # thread id -> 路由
+        self._thread: Optional[threading.Thread] = None
+        self.stacks: Dict[str, Counter] = defaultdict(Counter)
+        self.requests_profiled: Counter = Counter()
+
+    # ======================
+    # 任务控制
+    # ======================
+    def arm(self, route: Optional[str] = None, requests: Optional[int] = None,
+            seconds: Optional[float] = None) -> ProfileSession:
+        if requests is None and seconds is None:
+            requests = 1
+        session = ProfileSession(route, requests, seconds)
+        with self.lock:
+            self.sessions.append(session)
+            self.armed = True
+        return session
+
+    def disarm(self) -> None:
+        with self.lock:
+            self.sessions.clear()
+            self.armed = False
+
+    def reset(self) -> None:
+        with self.lock:
+            self.stacks.clear()
+            self.requests_profiled.clear()
+
+    def claim(self, rule: Optional[str], path: str) -> bool:
+        """请求开始时调用：若有匹配的任务则占用一个名额并返回 True"""
+        if not self.armed:
+            return False
+        with self.lock:
+            for session in list(self.sessions):
+                if session.expired():
+                    self.sessions.remove(session)
+                    continue
+                if session.matches(rule, path):
+                    if session.remaining is not None:
+                        session.remaining -= 1
+                    return True
+            self.armed = bool(self.sessions)
+        return False
+
+    # ======================
+    # 采样
+    # ======================
+    def begin(self, route: str) -> None:
+        with self.lock:
+            self._targets[threading.get_ident()] = route
+            self.requests_profiled[route] += 1
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+                self._thread.start()
+
+    def end(self) -> None:
+        with self.lock:
+            route = self._targets.pop(threading.get_ident(), None)
+            finished = route is not None and not any(
+                s.route == route or s.route is None for s in self.sessions if not s.expired())
+        if finished:
+            self.dump(route)
+
+    def _run(self) -> None:
+        own = threading.get_ident()
+        while True:
+            with self.lock:
+                if not self._targets:
+                    self._thread = None
+                    return
+                targets = dict(self._targets)
+            frames = sys._current_frames()
+            for tid, route in targets.items():
+                frame = frames.get(tid)
+                if frame is None or tid == own:
+                    continue
+                stack = self._collapse(frame)
+                with self.lock:
+                    self.stacks[route][stack] += 1
+            del frames
+            time.sleep(self.interval)
+
+    @staticmethod
+    def _collapse(frame) -> str:
+        names = []
+        while frame is not None:
+            code = frame.f_code
+            names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+            frame = frame.f_back
+        names.reverse()
+        return ";".join(names)
+
+    # ======================
+    # 输出
+    # ======================
+    def collapsed(self, route: Optional[str] = None) -> str:
+        """折叠栈文本；不指定路由时合并全部路由（以路由名作为根帧）"""
+        with self.lock:
+            if route is not None:
+                items = list(self.stacks.get(route, {}).items())
+            else:
+                items = [(f"{r};{stack}", n) for r, c in self.stacks.items() for stack, n in c.items()]
+        return "".join(f"{stack} {n}\n" for stack, n in sorted(items))
+
+    def dump(self, route: str) -> Optional[str]:
+        text = self.collapsed(route)
+        if not text:
+            return None
+        try:
+            os.makedirs(self.output_dir, exist_ok=True)
+            safe = re.sub(r"[^\w.-]+", "_", route).strip("_") or "root"
+            path = os.path.join(self.output_dir, f"{safe}.collapsed")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(text)
+            return path
+        except OSError as e:
+            print(f"写入采样结果失败: {e}")
+            return None
+
+    def status(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                "armed": self.armed,
+                "interval_ms": self.interval * 1000,
+                "output_dir": self.output_dir,
+                "sessions": [s.to_dict() for s in self.sessions if not s.expired()],
+                "routes": {
+                    r: {"requests": self.requests_profiled[r], "samples": sum(c.values())}
+                    for r, c in self.stacks.items()
+                }
+            }
+
+
+# 全局采样分析器
+profiler = SamplingProfiler()
+
+
+def parse_profile_header(value: str) -> Tuple[Optional[int], Optional[float]]:
+    """
+    X-Profile 请求头 → (requests, seconds)：
+    "requests=20" / "seconds=30" / "requests=20, seconds=60"；其他值（如 "1"）只采样当前请求。
+    无效或非正的数值忽略
+    """
+    requests_n, seconds = None, None
+    for part in re.split(r"[,;]", value):
+        key, _, number = part.partition("=")
+        key = key.strip().lower()
+        try:
+            if key == "requests" and int(number) > 0:
+                requests_n = int(number)
+            elif key == "seconds" and float(number) > 0:
+                seconds = float(number)
+        except ValueError:
+            continue
+    return requests_n, seconds
+
+
+def init_app(app, is_admin) -> None:
+    """
+    挂接请求钩子；is_admin() 用于校验 X-Profile 请求头是否带有管理员令牌。
+    带 X-Profile 的管理员请求为其路由启动采样任务（X-Profile: requests=20 采样包括自身在内的 20 个请求）
+    """
+    from flask import g, request
+
+    @app.before_request
+    def _profile_start():
+        # 未启用时只有一次属性判断和一次请求头查找
+        if not profiler.armed and "X-Profile" not in request.headers:
+            return
+        rule = request.url_rule.rule if request.url_rule is not None else request.path
+        if "X-Profile" in request.headers:
+            if not is_admin():
+                return
+            # 为本路由启动一个采样任务（默认只有当前请求），当前请求占用第一个名额
+            requests_n, seconds = parse_profile_header(request.headers["X-Profile"])
+            profiler.arm(route=rule, requests=requests_n, seconds=seconds)
+        if not profiler.claim(rule, request.path):
+            return
+        g._profiling = True
+        profiler.begin(rule)
+
+    @app.teardown_request
+    def _profile_end(exc):
+        if g.pop("_profiling", False):
+            profiler.end()
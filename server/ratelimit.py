@@ -0,0 +1,248 @@
+import math
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, Optional, Tuple
+
+try:
+    from server import metrics
+except ImportError:  # 以脚本方式在 server/ 目录下运行时
+    import metrics
+
+ratelimit_rejections = metrics.metrics.counter(
+    "ratelimit_rejections_total", "被限流拒绝的请求数", ("route", "scope"))
+shed_rejections = metrics.metrics.counter(
+    "load_shed_rejections_total", "被全局降载拒绝的请求数", ("reason",))
+
+# 各路由的令牌消耗权重；未列出的 /api 路由按 1 计
+ROUTE_COSTS: Dict[str, float] = {
+    "/api/auth/me": 1,
+    "/api/auth/login": 5,
+    "/api/auth/register": 5,
+    "/api/user/favorites": 3,
+    "/api/user/favorites/ids": 1,
+    "/api/user/favorites/bulk": 5,
+    "/api/favorite/toggle": 2,
+    "/api/dish/compare": 4,
+    "/api/dishes/search": 3,
+    "/api/stats": 2,
+    # 卡片图片：一屏十几张，命中缓存时只读本地文件
+    "/api/img/<int:shop_id>": 0.25,
+}
+# 不带关键词的首页推荐会扫描全部店铺和菜品，代价最高
+SEARCH_COST_KEYWORD = 3
+SEARCH_COST_FULL_CATALOG = 8
+
+EXEMPT_PATHS = ('/api/health', '/api/ready', '/api/metrics', '/api/events')
+
+
+def request_cost(rule: Optional[str], args) -> float:
+    if rule == "/api/restaurants/search":
+        # 带关键词或坐标（网格索引）的查询只触及一部分店铺
+        narrowed = args.get("keyword", "").strip() or args.get("lat")
+        return SEARCH_COST_KEYWORD if narrowed else SEARCH_COST_FULL_CATALOG
+    return ROUTE_COSTS.get(rule, 1)
+
+
+class MemoryBucketStore:
+    """进程内令牌桶；多 worker 部署时每个进程各自计数"""
+
+    def __init__(self, max_keys: int = 100000):
+        self.lock = threading.Lock()
+        self.buckets: Dict[str, Tuple[float, float]] = {}
+        self.max_keys = max_keys
+
+    def take(self, key: str, cost: float, rate: float, burst: float) -> Tuple[bool, float, float]:
+        """返回 (是否放行, 剩余令牌, 建议重试秒数)"""
+        now = time.monotonic()
+        with self.lock:
+            tokens, updated = self.buckets.get(key, (burst, now))
+            tokens = min(burst, tokens + (now - updated) * rate)
+            allowed = tokens >= cost
+            if allowed:
+                tokens -= cost
+            if len(self.buckets) >= self.max_keys and key not in self.buckets:
+                self._evict(now, rate, burst)
+            self.buckets[key] = (tokens, now)
+        return allowed, tokens, 0.0 if allowed else (cost - tokens) / rate
+
+    def _evict(self, now: float, rate: float, burst: float) -> None:
+        # 已经回满的桶与新桶等价，可以直接丢弃
+        full_after = burst / rate if rate > 0 else float("inf")
+        for k in [k for k, (_, t) in self.buckets.items() if now - t >= full_after]:
+            del self.buckets[k]
+        if len(self.buckets) >= self.max_keys:
+            self.buckets.clear()
+
+
+class SQLiteBucketStore:
+    """多 worker 共享的令牌桶（同一台机器上的多个进程共用一个 SQLite 文件）"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.local = threading.local()
+        conn = self._conn()
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS rate_buckets (
+                bucket_key TEXT PRIMARY KEY,
+                tokens REAL NOT NULL,
+                updated_at REAL NOT NULL
+            ) WITHOUT ROWID
+        """)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=1.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.execute("PRAGMA synchronous = OFF")
+            self.local.conn = conn
+        return conn
+
+    def take(self, key: str, cost: float, rate: float, burst: float) -> Tuple[bool, float, float]:
+        now = time.time()
+        conn = self._conn()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                "SELECT tokens, updated_at FROM rate_buckets WHERE bucket_key = ?", (key,)).fetchone()
+            tokens, updated = row if row else (burst, now)
+            tokens = min(burst, tokens + max(0.0, now - updated) * rate)
+            allowed = tokens >= cost
+            if allowed:
+                tokens -= cost
+            conn.execute(
+                "INSERT INTO rate_buckets (bucket_key, tokens, updated_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(bucket_key) DO UPDATE SET tokens = excluded.tokens, updated_at = excluded.updated_at",
+                (key, tokens, now))
+            conn.execute("COMMIT")
+        except sqlite3.OperationalError as e:
+            # 共享存储不可用时放行，避免限流组件本身导致整体不可用
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            print(f"限流存储异常，本次放行: {e}")
+            return True, burst, 0.0
+        return allowed, tokens, 0.0 if allowed else (cost - tokens) / rate
+
+
+class LoadShedder:
+    """全局降载：在途请求数或近期 p99 延迟超过阈值时拒绝新请求"""
+
+    def __init__(self, max_in_flight: int, p99_limit: float, window_seconds: float = 10.0):
+        self.max_in_flight = max_in_flight
+        self.p99_limit = p99_limit
+        self.window_seconds = window_seconds
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.samples: deque = deque(maxlen=2048)  # (完成时间, 耗时)
+        self._p99_cache = (0.0, 0.0)  # (计算时间, p99)
+
+    def p99(self) -> float:
+        now = time.monotonic()
+        with self.lock:
+            computed_at, value = self._p99_cache
+            if now - computed_at < 0.5:
+                return value
+            while self.samples and now - self.samples[0][0] > self.window_seconds:
+                self.samples.popleft()
+            # 样本太少时不据此降载
+            if len(self.samples) < 20:
+                value = 0.0
+            else:
+                ordered = sorted(s[1] for s in self.samples)
+                value = ordered[min(len(ordered) - 1, int(math.ceil(0.99 * len(ordered))) - 1)]
+            self._p99_cache = (now, value)
+            return value
+
+    def try_enter(self) -> Optional[str]:
+        """放行返回 None，否则返回拒绝原因"""
+        with self.lock:
+            if self.max_in_flight > 0 and self.in_flight >= self.max_in_flight:
+                return "queue_depth"
+        if self.p99_limit > 0 and self.p99() > self.p99_limit:
+            return "p99_latency"
+        with self.lock:
+            self.in_flight += 1
+        return None
+
+    def leave(self, elapsed: float) -> None:
+        with self.lock:
+            self.in_flight -= 1
+            self.samples.append((time.monotonic(), elapsed))
+
+
+def client_key(user_id: Optional[int], remote_addr: Optional[str], forwarded_for: Optional[str],
+               trust_proxy: bool) -> str:
+    if user_id:
+        return f"user:{user_id}"
+    if trust_proxy and forwarded_for:
+        return f"ip:{forwarded_for.split(',')[0].strip()}"
+    return f"ip:{remote_addr or 'unknown'}"
+
+
+def init_app(app, get_user_id: Callable[[], Optional[int]]) -> None:
+    """
+    挂接限流与降载（环境变量）:
+    RATE_LIMIT_RATE / RATE_LIMIT_BURST  每个用户或 IP 的令牌补充速率（个/秒）与桶容量，RATE 为 0 时关闭限流
+    RATE_LIMIT_DB                       共享 SQLite 令牌桶文件，不设置则使用进程内存储
+    TRUST_PROXY=1                       按 X-Forwarded-For 的第一个地址识别匿名客户端
+    SHED_MAX_IN_FLIGHT / SHED_P99_MS    全局降载阈值，0 为关闭
+    """
+    from flask import g, jsonify, request
+
+    rate = float(os.getenv("RATE_LIMIT_RATE", "20"))
+    burst = float(os.getenv("RATE_LIMIT_BURST", "60"))
+    trust_proxy = os.getenv("TRUST_PROXY", "0") == "1"
+    store_path = os.getenv("RATE_LIMIT_DB")
+    store = SQLiteBucketStore(store_path) if store_path else MemoryBucketStore()
+    shedder = LoadShedder(
+        max_in_flight=int(os.getenv("SHED_MAX_IN_FLIGHT", "64")),
+        p99_limit=float(os.getenv("SHED_P99_MS", "2000")) / 1000
+    )
+    app.extensions["load_shedder"] = shedder
+
+    def reject(status: int, message: str, retry_after: float):
+        response = jsonify({"success": False, "message": message})
+        response.status_code = status
+        response.headers["Retry-After"] = str(max(1, int(math.ceil(retry_after))))
+        return response
+
+    @app.before_request
+    def _admission_control():
+        if not request.path.startswith('/api/') or request.path in EXEMPT_PATHS:
+            return None
+
+        reason = shedder.try_enter()
+        if reason is not None:
+            shed_rejections.inc(reason=reason)
+            return reject(503, "服务繁忙，请稍后重试", 1)
+        g._admitted_at = time.perf_counter()
+
+        if rate > 0:
+            # 未匹配路由（404 扫描）用固定标签，避免按原始路径产生无限多的指标序列
+            rule = request.url_rule.rule if request.url_rule is not None else "<unmatched>"
+            key = client_key(get_user_id(), request.remote_addr,
+                             request.headers.get("X-Forwarded-For"), trust_proxy)
+            # 单次代价不超过桶容量，否则 BURST 调小后这类请求永远拿不到足够的令牌
+            cost = min(request_cost(rule, request.args), burst)
+            allowed, remaining, retry_after = store.take(key, cost, rate, burst)
+            if not allowed:
+                ratelimit_rejections.inc(route=rule, scope=key.split(":", 1)[0])
+                return reject(429, "请求过于频繁，请稍后重试", retry_after)
+            g._ratelimit_remaining = remaining
+        return None
+
+    @app.after_request
+    def _ratelimit_headers(response):
+        remaining = g.get("_ratelimit_remaining")
+        if remaining is not None:
+            response.headers["X-RateLimit-Remaining"] = str(int(remaining))
+        return response
+
+    @app.teardown_request
+    def _admission_release(exc):
+        admitted_at = g.pop("_admitted_at", None)
+        if admitted_at is not None:
+            shedder.leave(time.perf_counter() - admitted_at)
@@ -0,0 +1,259 @@
+"""
+首页个性化推荐：基于收藏的店铺组相似度（item-to-item）。
+
+离线（每次目录快照替换后在后台线程构建）:
+    店铺组用三类特征表示——菜名（按 idf 加权的余弦相似度）、价格带（菜品中位价的对数分档）、
+    共同收藏（同一用户同时收藏的次数，按两组各自的收藏人数归一化），每组只保留得分最高的 top-k 个邻居，
+    以 CSR 列数组存放（offsets / neighbors / scores）。
+在线:
+    取用户收藏所在的店铺组，合并它们的邻居列表按分数累加，去掉已收藏的，取前 k 个；
+    没有收藏或相似度尚未构建时由调用方回退到热门抽样。
+
+环境变量: RECOMMEND_NEIGHBORS（每组保留的邻居数，默认 20）
+"""
+import heapq
+import math
+import os
+import random
+import threading
+import time
+from array import array
+from collections import defaultdict
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+try:
+    from server import metrics
+except ImportError:  # 以脚本方式在 server/ 目录下运行时
+    import metrics
+
+RECOMMEND_NEIGHBORS = int(os.getenv("RECOMMEND_NEIGHBORS", "20"))
+# 每个店铺组只用 idf 最高的若干个菜名参与相似度计算
+RECOMMEND_TOKENS = 8
+# 同一菜名的店铺组随机分块，只在块内两两比较（热门菜名的倒排表很长，全量两两比较是平方级）
+RECOMMEND_BLOCK = 16
+# 单个用户参与共同收藏统计的收藏数上限（收藏特别多的用户对相似度贡献的信息很少，却是平方级的开销）
+MAX_USER_FAVORITES = 50
+# 价格带：菜品中位价每增加 25% 为一档
+PRICE_BAND_RATIO = 1.25
+DISH_WEIGHT = 0.5
+COFAVORITE_WEIGHT = 0.4
+PRICE_WEIGHT = 0.1
+
+recommend_build_seconds = metrics.metrics.histogram(
+    "recommend_build_seconds", "店铺组相似度（top-k 邻居）离线构建耗时（秒）",
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60))
+recommend_seconds = metrics.metrics.histogram(
+    "recommend_seconds", "合并收藏店铺邻居列表的在线耗时（秒）",
+    buckets=(0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.01))
+recommend_requests = metrics.metrics.counter(
+    "recommend_requests_total", "首页推荐请求数（personal=基于收藏，fallback=热门抽样）", ("result",))
+
+
+class ItemSimilarity:
+    """一个快照上的店铺组 top-k 邻居表（只读，按店名对外，快照替换后仍可继续使用）"""
+
+    def __init__(self, group_names: List[str]):
+        self.group_names = group_names
+        self.group_ids = {name: gid for gid, name in enumerate(group_names)}
+        self.offsets = array("i", [0])
+        self.neighbors = array("i")
+        self.scores = array("f")
+        self.generation = 0
+        self.build_seconds = 0.0
+
+    @classmethod
+    def build(cls, snapshot, favorite_pairs: Iterable[Tuple[int, int]],
+              k: int = RECOMMEND_NEIGHBORS) -> "ItemSimilarity":
+        """
+        snapshot: CatalogSnapshot；favorite_pairs: (user_id, shop_id)，按 user_id 聚集、同一用户内最近的在前。
+        不在该快照里的店铺（其他分片）被忽略。
+        """
+        start = time.perf_counter()
+        index = cls(list(snapshot.group_names))
+        index.generation = snapshot.generation
+        n = len(index.group_names)
+        group_ids = index.group_ids
+
+        # 每个店铺组的菜名集合与中位价
+        name_of_row = array("i", bytes(4 * len(snapshot.dish_prices)))
+        for name_id, rows in enumerate(snapshot.dish_index.rows):
+            for row in rows:
+                name_of_row[row] = name_id
+        tokens: List[Set[int]] = [set() for _ in range(n)]
+        bands = array("i", bytes(4 * n))
+        prices = snapshot.dish_prices
+        log_ratio = math.log(PRICE_BAND_RATIO)
+        for gid, name in enumerate(index.group_names):
+            group_prices = []
+            for shop in snapshot.groups[name]:
+                tokens[gid].update(name_of_row[shop.dish_start:shop.dish_end])
+                group_prices.extend(prices[shop.dish_start:shop.dish_end])
+            if group_prices:
+                group_prices.sort()
+                median = group_prices[len(group_prices) // 2]
+                bands[gid] = int(math.log(max(median, 1.0)) / log_ratio)
+
+        # 菜名特征：每组保留 idf 最高的 RECOMMEND_TOKENS 个菜名
+        df: Dict[int, int] = defaultdict(int)
+        for group_tokens in tokens:
+            for token in group_tokens:
+                df[token] += 1
+        # 只出现在一个组里的菜名对相似度没有贡献；每组都有的菜名 idf 为 0，只有这类菜名的组范数为 0，一并去掉
+        idf = {token: math.log(n / count) for token, count in df.items() if 1 < count < n}
+        postings: Dict[int, List[int]] = defaultdict(list)
+        norms = [0.0] * n
+        for gid, group_tokens in enumerate(tokens):
+            kept = heapq.nlargest(RECOMMEND_TOKENS, (t for t in group_tokens if t in idf),
+                                  key=lambda t: (idf[t], -t))
+            norms[gid] = math.sqrt(sum(idf[t] ** 2 for t in kept))
+            for token in kept:
+                postings[token].append(gid)
+        # 每个菜名的倒排表按固定种子打乱后分块：gid → [(权重, 同块的店铺组)]
+        blocks: List[List[Tuple[float, List[int]]]] = [[] for _ in range(n)]
+        for token, members in postings.items():
+            random.Random(token).shuffle(members)
+            weight = idf[token] ** 2
+            for i in range(0, len(members), RECOMMEND_BLOCK):
+                block = members[i:i + RECOMMEND_BLOCK]
+                for gid in block:
+                    blocks[gid].append((weight, block))
+
+        # 共同收藏
+        favorite_counts = [0] * n
+        cofavorites: Dict[int, Dict[int, int]] = defaultdict(lambda: defaultdict(int))
+        for user_groups in _favorite_groups(snapshot, group_ids, favorite_pairs):
+            for gid in user_groups:
+                favorite_counts[gid] += 1
+            for gid in user_groups:
+                row = cofavorites[gid]
+                for other in user_groups:
+                    if other != gid:
+                        row[other] += 1
+
+        # 价格带相差 d 档时的加分，预先算好
+        affinity = [PRICE_WEIGHT / (1 + d) for d in range(max(bands, default=0) - min(bands, default=0) + 1)]
+        offsets, neighbors, scores = index.offsets, index.neighbors, index.scores
+        for gid in range(n):
+            dots: Dict[int, float] = {}
+            for weight, block in blocks[gid]:
+                for other in block:
+                    dots[other] = dots.get(other, 0.0) + weight
+            dots.pop(gid, None)
+            band = bands[gid]
+            scale = DISH_WEIGHT / norms[gid] if norms[gid] else 0.0
+            scored = {other: dot * scale / norms[other] + affinity[abs(band - bands[other])]
+                      for other, dot in dots.items()}
+            if gid in cofavorites:
+                count = favorite_counts[gid]
+                for other, both in cofavorites[gid].items():
+                    if other not in scored:
+                        scored[other] = affinity[abs(band - bands[other])]
+                    scored[other] += COFAVORITE_WEIGHT * both / math.sqrt(count * favorite_counts[other])
+            top = sorted(scored.items(), key=lambda item: (item[1], item[0]), reverse=True)[:k]
+            for other, score in top:
+                neighbors.append(other)
+                scores.append(score)
+            offsets.append(len(neighbors))
+
+        index.build_seconds = time.perf_counter() - start
+        recommend_build_seconds.observe(index.build_seconds)
+        return index
+
+    def recommend(self, favorite_names: Iterable[str], k: int) -> List[Tuple[float, str]]:
+        """合并收藏店铺组的邻居列表（分数累加），去掉已收藏的，返回 [(分数, 店名)] 降序"""
+        start = time.perf_counter()
+        offsets, neighbors, scores = self.offsets, self.neighbors, self.scores
+        favorites = {self.group_ids[name] for name in favorite_names if name in self.group_ids}
+        merged: Dict[int, float] = {}
+        for gid in favorites:
+            for j in range(offsets[gid], offsets[gid + 1]):
+                other = neighbors[j]
+                merged[other] = merged.get(other, 0.0) + scores[j]
+        for gid in favorites:
+            merged.pop(gid, None)
+        top = heapq.nlargest(k, merged.items(), key=lambda item: (item[1], -item[0]))
+        recommend_seconds.observe(time.perf_counter() - start)
+        return [(round(score, 4), self.group_names[gid]) for gid, score in top]
+
+    def neighbors_of(self, name: str) -> List[Tuple[str, float]]:
+        gid = self.group_ids.get(name)
+        if gid is None:
+            return []
+        return [(self.group_names[self.neighbors[j]], round(self.scores[j], 4))
+                for j in range(self.offsets[gid], self.offsets[gid + 1])]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "generation": self.generation,
+            "groups": len(self.group_names),
+            "neighbors": len(self.neighbors),
+            "build_ms": round(self.build_seconds * 1000, 1),
+        }
+
+
+def _favorite_groups(snapshot, group_ids: Dict[str, int],
+                     favorite_pairs: Iterable[Tuple[int, int]]) -> Iterable[List[int]]:
+    """按用户产出其收藏（属于该快照的）店铺组，每个用户最多 MAX_USER_FAVORITES 个"""
+    current_user, groups = None, []
+    for user_id, shop_id in favorite_pairs:
+        if user_id != current_user:
+            if groups:
+                yield groups
+            current_user, groups = user_id, []
+        shop = snapshot.shops.get(shop_id)
+        if shop is None or len(groups) >= MAX_USER_FAVORITES:
+            continue
+        gid = group_ids[shop.shop_name]
+        if gid not in groups:
+            groups.append(gid)
+    if groups:
+        yield groups
+
+
+class Recommender:
+    """
+    持有一个分片当前的相似度表。注册为 CatalogStore 的重建回调：快照替换后在后台线程重建，
+    重建期间继续使用旧表（按店名查询，对新快照仍然有效）。
+    """
+
+    def __init__(self, favorites_db, k: int = RECOMMEND_NEIGHBORS):
+        self.favorites_db = favorites_db  # 收藏所在的库（分片部署时为全局库）
+        self.k = k
+        self.current: Optional[ItemSimilarity] = None
+        self.lock = threading.Lock()
+        self.pending = None  # 重建期间又到来的快照，本轮结束后再建一次
+        self.building = False
+
+    def schedule(self, snapshot) -> None:
+        with self.lock:
+            self.pending = snapshot
+            if self.building:
+                return
+            self.building = True
+        threading.Thread(target=self._run, name="recommend-build", daemon=True).start()
+
+    def _run(self) -> None:
+        while True:
+            with self.lock:
+                snapshot, self.pending = self.pending, None
+                if snapshot is None:
+                    self.building = False
+                    return
+            try:
+                self.rebuild(snapshot)
+            except Exception as e:
+                print(f"推荐相似度构建失败: {e}")
+
+    def rebuild(self, snapshot) -> ItemSimilarity:
+        index = ItemSimilarity.build(snapshot, self.favorites_db.get_favorite_pairs(), self.k)
+        self.current = index
+        print(f"推荐相似度已更新: {index.stats()}")
+        return index
+
+    def recommend(self, snapshot, favorite_shop_ids: Set[int], k: int) -> List[Tuple[float, str]]:
+        """收藏中属于该快照的店铺 → 店铺组 → 相似店铺组；相似度尚未构建时返回空列表"""
+        index = self.current
+        if index is None or not favorite_shop_ids:
+            return []
+        names = {snapshot.shops[shop_id].shop_name for shop_id in favorite_shop_ids if shop_id in snapshot.shops}
+        return index.recommend(names, k) if names else []
@@ -3,7 +3,7 @@ import sys
 sys.path.append(os.path.dirname(__file__))
 
 from FoodPriceDB import FoodPriceDB
-from utils import load_data_from_json
+from shards import ShardRouter
 
 def main():
     db = FoodPriceDB()
@@ -11,12 +11,17 @@ def main():
     if not db.initialize(db_path):
         print("❌ 数据库初始化失败")
         return False
+    # 配置了 SHARD_REGIONS 时按区域写入各分片文件
+    router = ShardRouter(db)
+    if not router.initialize():
+        print("❌ 区域分片初始化失败")
+        return False
 
     print("🧹 清空现有数据...")
-    db.clear_all_data()
+    router.clear_all_data()
 
     print("📥 从 JSON 重新加载数据...")
-    success = load_data_from_json(db, "./data.json")  # 确保 data.json 路径正确
+    success = router.ingest_json("./data.json")  # 确保 data.json 路径正确
     
     if success:
         print("✅ 数据重载成功！")
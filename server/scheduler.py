@@ -0,0 +1,242 @@
+"""
+进程内后台任务调度：周期任务与按需任务（目录导入、过期满减清理、ANALYZE、缓存预热、推荐相似度重建……）
+在调度线程 + 小线程池中执行，请求线程只负责"排队"，从不等待任务本身。
+
+- 任务状态持久化在全局库的 jobs 表（下次运行时间、租约、最近一次结果），运行历史在 job_runs 表
+  （每个任务保留最近 JOB_HISTORY 条）
+- scope="global"：针对共享数据库文件的任务，多 worker / 多进程部署时同一时间只有一个进程运行——
+  到期后各进程用条件 UPDATE 抢租约（locked_until），抢到的运行，结束后释放并排好下次运行时间；
+  进程在运行中崩溃时，租约在 JOB_LEASE_SECONDS 后过期，由其他进程接手
+- scope="local"：针对本进程内存状态的任务（快照、推荐相似度、页缓存预热），每个进程各自按周期运行，
+  只把运行历史写入 job_runs
+- 周期带随机抖动（interval × (1 ± jitter)），多个进程 / 多个任务不会在同一时刻集中触发
+- 同一任务在本进程内不会重叠运行；按需触发一个正在运行的任务时，等本次结束后再运行一次
+
+环境变量: SCHEDULER（0 关闭，默认 1）  JOB_WORKERS（默认 2）  JOB_TICK_SECONDS（默认 1）
+         JOB_LEASE_SECONDS（默认 900）  JOB_HISTORY（默认 100）
+"""
+import os
+import random
+import socket
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+try:
+    from server import metrics
+except ImportError:  # 以脚本方式在 server/ 目录下运行时
+    import metrics
+
+SCHEDULER_ENABLED = os.getenv("SCHEDULER", "1") != "0"
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_TICK_SECONDS = float(os.getenv("JOB_TICK_SECONDS", "1"))
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "900"))
+JOB_HISTORY = int(os.getenv("JOB_HISTORY", "100"))
+
+GLOBAL = "global"
+LOCAL = "local"
+# 写入运行历史的结果说明最多保留的字符数
+MAX_MESSAGE_CHARS = 2000
+
+job_runs = metrics.metrics.counter(
+    "job_runs_total", "后台任务运行次数", ("job", "status"))
+job_seconds = metrics.metrics.histogram(
+    "job_seconds", "后台任务单次运行耗时（秒）", ("job",),
+    buckets=(0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 300, 900))
+job_lag_seconds = metrics.metrics.histogram(
+    "job_lag_seconds", "任务从到期（或被触发）到开始运行的延迟（秒）", ("job",),
+    buckets=(0.01, 0.1, 0.5, 1, 2, 5, 10, 30, 60))
+
+
+class Job:
+    """一个已登记的任务。fn 无参数，返回值（可选）转成字符串记入运行历史"""
+
+    def __init__(self, name: str, fn: Callable[[], Any], interval: Optional[float] = None,
+                 jitter: float = 0.1, scope: str = GLOBAL, description: str = ""):
+        if scope not in (GLOBAL, LOCAL):
+            raise ValueError(f"未知任务范围: {scope}")
+        self.name = name
+        self.fn = fn
+        self.interval = interval if interval and interval > 0 else None  # None = 只按需运行
+        self.jitter = jitter
+        self.scope = scope
+        self.description = description
+        # 以下为本进程内的状态
+        self.next_due: Optional[float] = None  # local 任务的下次运行时间
+        self.requested_at: Optional[float] = None  # 按需触发的时间（尚未开始运行）
+        self.running_since: Optional[float] = None
+        self.last: Optional[Dict[str, Any]] = None
+
+    def next_run(self, now: float) -> Optional[float]:
+        if self.interval is None:
+            return None
+        return now + self.interval * (1 + random.uniform(-self.jitter, self.jitter))
+
+
+class Scheduler:
+    def __init__(self, db, workers: int = JOB_WORKERS, tick: float = JOB_TICK_SECONDS,
+                 lease: float = JOB_LEASE_SECONDS, keep_history: int = JOB_HISTORY):
+        self.db = db  # 全局库：jobs / job_runs 表
+        self.workers = workers
+        self.tick = tick
+        self.lease = lease
+        self.keep_history = keep_history  # 每个任务保留的运行历史条数
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self.jobs: Dict[str, Job] = {}
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.stopped = threading.Event()
+        self.thread: Optional[threading.Thread] = None
+        self.executor: Optional[ThreadPoolExecutor] = None
+
+    def register(self, name: str, fn: Callable[[], Any], interval: Optional[float] = None,
+                 jitter: float = 0.1, scope: str = GLOBAL, description: str = "") -> Job:
+        job = Job(name, fn, interval, jitter, scope, description)
+        with self.lock:
+            self.jobs[name] = job
+        if self.thread is not None:
+            self._persist(job, time.time())
+        return job
+
+    def _persist(self, job: Job, now: float) -> None:
+        if job.scope == GLOBAL:
+            self.db.register_job(job.name, job.interval, job.next_run(now))
+        else:
+            job.next_due = job.next_run(now)
+
+    def start(self) -> None:
+        """在全局库初始化之后调用：登记任务并启动调度线程（SCHEDULER=0 时不启动）"""
+        if not SCHEDULER_ENABLED or self.thread is not None:
+            return
+        now = time.time()
+        for job in list(self.jobs.values()):
+            self._persist(job, now)
+        self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="job")
+        self.thread = threading.Thread(target=self._loop, name="job-scheduler", daemon=True)
+        self.thread.start()
+        print(f"后台任务调度已启动: {', '.join(sorted(self.jobs))}（{self.worker_id}）")
+
+    def stop(self, wait: bool = True) -> None:
+        self.stopped.set()
+        self.wakeup.set()
+        if self.thread is not None:
+            self.thread.join(timeout=5)
+        if self.executor is not None:
+            self.executor.shutdown(wait=wait)
+
+    def trigger(self, name: str) -> bool:
+        """按需运行（只记录请求并唤醒调度线程，立即返回）；未知任务返回 False"""
+        job = self.jobs.get(name)
+        if job is None:
+            return False
+        with self.lock:
+            if job.requested_at is None:
+                job.requested_at = time.time()
+        self.wakeup.set()
+        return True
+
+    # ======================
+    # 调度线程
+    # ======================
+    def _loop(self) -> None:
+        while not self.stopped.is_set():
+            self.wakeup.wait(self.tick)
+            self.wakeup.clear()
+            try:
+                self._dispatch(time.time())
+            except Exception as e:
+                print(f"任务调度失败: {e}")
+
+    def _dispatch(self, now: float) -> None:
+        with self.lock:
+            jobs = list(self.jobs.values())
+        # 本进程收到的全局任务触发请求转交给 jobs 表，由任一进程领取
+        for job in jobs:
+            if job.scope == GLOBAL and job.requested_at is not None:
+                with self.lock:
+                    requested, job.requested_at = job.requested_at, None
+                self.db.request_job(job.name, requested)
+
+        due = None
+        for job in jobs:
+            if job.running_since is not None:
+                continue
+            if job.scope == LOCAL:
+                scheduled = job.requested_at or job.next_due
+                if scheduled is None or (job.requested_at is None and job.next_due > now):
+                    continue
+            else:
+                if due is None:
+                    due = self.db.get_due_jobs(now)
+                if job.name not in due or not self.db.claim_job(job.name, self.worker_id, now, self.lease):
+                    continue  # 未到期，或者其他进程抢到了
+                scheduled = due[job.name]
+            with self.lock:
+                job.requested_at = None
+                job.running_since = now
+            job_lag_seconds.observe(max(0.0, now - scheduled), job=job.name)
+            self.executor.submit(self._run, job)
+
+    def _run(self, job: Job) -> None:
+        started_at = time.time()
+        start = time.perf_counter()
+        status, message = "ok", None
+        try:
+            result = job.fn()
+            if result is not None:
+                message = str(result)[:MAX_MESSAGE_CHARS]
+        except Exception as e:
+            status = "error"
+            message = f"{e}\n{traceback.format_exc()}"[:MAX_MESSAGE_CHARS]
+            print(f"后台任务 {job.name} 失败: {e}")
+        duration = time.perf_counter() - start
+        job_runs.inc(job=job.name, status=status)
+        job_seconds.observe(duration, job=job.name)
+
+        finished = time.time()
+        next_run = job.next_run(finished)
+        with self.lock:
+            job.running_since = None
+            job.last = {"started_at": started_at, "duration": round(duration, 4), "status": status,
+                        "message": message}
+            if job.scope == LOCAL:
+                job.next_due = next_run
+        try:
+            self.db.finish_job(job.name, self.worker_id, started_at, duration, status, message,
+                               next_run, release=job.scope == GLOBAL, history=self.keep_history)
+        except Exception as e:
+            print(f"记录任务 {job.name} 运行结果失败: {e}")
+        if job.requested_at is not None:  # 运行期间又被触发
+            self.wakeup.set()
+
+    # ======================
+    # 状态
+    # ======================
+    def status(self) -> List[Dict[str, Any]]:
+        """各任务的配置、本进程状态与 jobs 表中的共享状态"""
+        persisted = {row["name"]: row for row in self.db.get_jobs()} if self.thread is not None else {}
+        rows = []
+        with self.lock:
+            jobs = list(self.jobs.values())
+        for job in sorted(jobs, key=lambda j: j.name):
+            row = persisted.get(job.name, {})
+            rows.append({
+                "name": job.name,
+                "description": job.description,
+                "scope": job.scope,
+                "interval_seconds": job.interval,
+                "jitter": job.jitter,
+                "running": job.running_since is not None,
+                "requested": job.requested_at is not None,
+                "next_run_at": job.next_due if job.scope == LOCAL else row.get("next_run_at"),
+                "locked_by": row.get("locked_by"),
+                "last_run": job.last,
+                "last_status": row.get("last_status") if job.scope == GLOBAL else None,
+                "last_run_at": row.get("last_run_at") if job.scope == GLOBAL else None,
+            })
+        return rows
+
+    def history(self, name: Optional[str] = None, limit: int = 50) -> List[Dict[str, Any]]:
+        return self.db.get_job_runs(name, limit)
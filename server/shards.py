@@ -0,0 +1,353 @@
+import heapq
+import itertools
+import json
+import os
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+try:
+    from server import metrics
+    from server.FoodPriceDB import FoodPriceDB
+    from server.catalog import CatalogStore
+    from server.dish_search import rank_groups
+    from server.recommend import Recommender, recommend_requests
+    from server.utils import load_data
+except ImportError:  # 以脚本方式在 server/ 目录下运行时
+    import metrics
+    from FoodPriceDB import FoodPriceDB
+    from catalog import CatalogStore
+    from dish_search import rank_groups
+    from recommend import Recommender, recommend_requests
+    from utils import load_data
+
+shard_query_seconds = metrics.metrics.histogram(
+    "shard_query_seconds", "单个区域分片上的查询耗时（秒）", ("region",))
+shard_failures = metrics.metrics.counter(
+    "shard_failures_total", "分片查询超时或出错的次数", ("region", "reason"))
+
+# scatter 未指定超时时使用路由器的默认超时
+_DEFAULT_TIMEOUT = object()
+
+# 拆到分片库的目录表
+CATALOG_TABLES = ("shops", "dishes", "coupons")
+
+# 未分片时唯一的"区域"
+DEFAULT_REGION = "default"
+# 第 i 个分片（从 1 开始）的 shop_id 从 i * SHARD_ID_STRIDE 之后分配
+SHARD_ID_STRIDE = 1 << 40
+
+
+class Shard:
+    """一个区域：独立的 SQLite 文件 + 独立的内存目录快照"""
+
+    def __init__(self, region: str, index: int, db: FoodPriceDB, favorites_db: Optional[FoodPriceDB] = None):
+        self.region = region
+        self.index = index
+        self.db = db
+        self.catalog = CatalogStore(db)
+        # 收藏在全局库：分片的相似度表用全局库的收藏统计共同收藏
+        self.recommender = Recommender(favorites_db or db)
+        self.catalog.on_rebuild(self.recommender.schedule)
+
+
+class ShardRouter:
+    """
+    按区域把店铺 / 菜品 / 满减拆到多个 SQLite 文件，用户与收藏留在全局库。
+    - 请求带 region 时只访问该分片；不带时在线程池上并行查询所有分片，合并排序，整体超时后返回已完成的部分
+    - 全局库的 shops 表只保存店铺目录（ID、平台、店名），收藏相关的 SQL 无需改动
+    - 未配置区域时只有一个分片，就是全局库本身，行为与单库部署一致
+
+    环境变量: SHARD_REGIONS=wuhan,beijing  SHARD_DIR（默认与 DB_PATH 同目录）
+             SHARD_TIMEOUT_MS（默认 2000）  SHARD_WORKERS
+    """
+
+    def __init__(self, global_db: FoodPriceDB, regions: Optional[List[str]] = None,
+                 shard_dir: Optional[str] = None, timeout: Optional[float] = None,
+                 workers: Optional[int] = None):
+        self.global_db = global_db
+        if regions is None:
+            regions = [r.strip() for r in os.getenv("SHARD_REGIONS", "").split(",") if r.strip()]
+        self.sharded = bool(regions)
+        self.shard_dir = shard_dir or os.getenv("SHARD_DIR")
+        self.timeout = timeout if timeout is not None else float(os.getenv("SHARD_TIMEOUT_MS", "2000")) / 1000
+
+        if self.sharded:
+            self.shards = [Shard(region, i + 1, FoodPriceDB(), global_db) for i, region in enumerate(dict.fromkeys(regions))]
+        else:
+            self.shards = [Shard(DEFAULT_REGION, 0, global_db)]
+        self.by_region: Dict[str, Shard] = {s.region: s for s in self.shards}
+        self.default_region = self.shards[0].region
+
+        workers = workers or int(os.getenv("SHARD_WORKERS", str(max(2, len(self.shards) * 2))))
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="shard")
+
+    @property
+    def regions(self) -> List[str]:
+        return [s.region for s in self.shards]
+
+    # ======================
+    # 初始化 / 快照
+    # ======================
+    def shard_path(self, region: str) -> str:
+        base = self.shard_dir or os.path.dirname(self.global_db.db_path or "") or "."
+        return os.path.join(base, f"catalog_{region}.db")
+
+    def initialize(self) -> bool:
+        """在全局库初始化之后调用：建各分片文件并为其预留互不重叠的 shop_id 区间"""
+        if not self.sharded:
+            return True
+        for shard in self.shards:
+            if not shard.db.initialize(self.shard_path(shard.region)):
+                return False
+            shard.db.reserve_shop_id_range(shard.index * SHARD_ID_STRIDE)
+        return True
+
+    def shop_count(self) -> int:
+        return sum(s.db.get_table_counts().get("shops", 0) for s in self.shards)
+
+    def table_counts(self) -> Dict[str, int]:
+        """各表行数：店铺 / 菜品 / 满减按分片求和，用户与收藏取全局库（全局库的 shops 只是目录，不重复计数）"""
+        counts = dict(self.global_db.get_table_counts())
+        if self.sharded:
+            for table in CATALOG_TABLES:
+                counts[table] = sum(s.db.get_table_counts().get(table, 0) for s in self.shards)
+        return counts
+
+    def rebuild_all(self) -> None:
+        self.scatter(lambda shard: shard.catalog.rebuild(), timeout=None)
+
+    def start_watchers(self, interval: float) -> None:
+        for shard in self.shards:
+            shard.catalog.start_watcher(interval)
+
+    def stats(self) -> Dict[str, Any]:
+        stats = {}
+        for shard in self.shards:
+            snapshot, similarity = shard.catalog.current, shard.recommender.current
+            stats[shard.region] = snapshot.stats() if snapshot else None
+            if stats[shard.region] is not None and similarity is not None:
+                stats[shard.region]["recommend"] = similarity.stats()
+        return stats
+
+    def find_shop(self, shop_id: int):
+        """按 shop_id 在各分片的当前快照中查找店铺（分片间 shop_id 区间不重叠）"""
+        for shard in self.shards:
+            snapshot = shard.catalog.current
+            if snapshot is not None and shop_id in snapshot.shops:
+                return snapshot.shops[shop_id]
+        return None
+
+    def databases(self) -> Dict[str, FoodPriceDB]:
+        """全局库与各分片库（未分片时只有全局库）"""
+        databases = {"global": self.global_db}
+        if self.sharded:
+            databases.update((s.region, s.db) for s in self.shards)
+        return databases
+
+    # ======================
+    # 路由 / 分发
+    # ======================
+    def select(self, region: Optional[str]) -> Optional[List[Shard]]:
+        """region 为空返回全部分片；未知区域返回 None"""
+        if not region:
+            return self.shards
+        shard = self.by_region.get(region)
+        return [shard] if shard else None
+
+    def scatter(self, fn: Callable[[Shard], Any], shards: Optional[List[Shard]] = None,
+                timeout: Any = _DEFAULT_TIMEOUT) -> Tuple[List[Tuple[Shard, Any]], List[str]]:
+        """
+        在各分片上并行执行 fn，返回 ([(分片, 结果)], 超时或出错的区域)；结果按分片配置顺序排列。
+        只有一个分片时直接在当前线程执行，不经过线程池。
+        """
+        shards = self.shards if shards is None else shards
+        timeout = self.timeout if timeout is _DEFAULT_TIMEOUT else timeout
+
+        def timed(shard: Shard):
+            start = time.perf_counter()
+            try:
+                return fn(shard)
+            finally:
+                shard_query_seconds.observe(time.perf_counter() - start, region=shard.region)
+
+        if len(shards) == 1:
+            return [(shards[0], timed(shards[0]))], []
+
+        futures = [(shard, self.executor.submit(timed, shard)) for shard in shards]
+        done, _ = wait([f for _, f in futures], timeout=timeout)
+        results, missing = [], []
+        for shard, future in futures:
+            if future not in done:
+                future.cancel()
+                shard_failures.inc(region=shard.region, reason="timeout")
+                missing.append(shard.region)
+            elif future.exception() is not None:
+                print(f"分片 {shard.region} 查询失败: {future.exception()}")
+                shard_failures.inc(region=shard.region, reason="error")
+                missing.append(shard.region)
+            else:
+                results.append((shard, future.result()))
+        return results, missing
+
+    # ======================
+    # 查询
+    # ======================
+    def search(self, keyword: str, shards: List[Shard],
+               favorite_shop_ids: Set[int]) -> Tuple[List[Dict[str, Any]], List[str]]:
+        """关键词搜索：各分片按店名排序返回卡片，归并后整体仍按店名排序"""
+        def run(shard: Shard):
+            snapshot = shard.catalog.current
+            cards = (snapshot.build_card(name, favorite_shop_ids) for name in snapshot.search_names(keyword))
+            return [card for card in cards if card is not None]
+
+        results, missing = self.scatter(run, shards)
+        return list(heapq.merge(*(cards for _, cards in results), key=lambda c: c["name"])), missing
+
+    def home_feed(self, k: int, shards: List[Shard],
+                  favorite_shop_ids: Set[int]) -> Tuple[List[Dict[str, Any]], List[str]]:
+        """
+        首页推荐：有收藏时先取各分片与收藏相似的店铺组，按分数归并取前 k 个；
+        不足 k 个（匿名用户 / 无收藏 / 相似度尚未构建）时，各分片抽样 k 个热门候选，合并后再抽样补齐。
+        只为选中的店铺构建卡片
+        """
+        def run(shard: Shard):
+            snapshot = shard.catalog.current
+            recommended = shard.recommender.recommend(snapshot, favorite_shop_ids, k) if favorite_shop_ids else []
+            return snapshot, recommended, snapshot.sample_popular(k)
+
+        results, missing = self.scatter(run, shards)
+        ranked = heapq.nlargest(k, ((score, name, snapshot) for _, (snapshot, recommended, _) in results
+                                    for score, name in recommended), key=lambda r: r[0])
+        cards, picked = [], set()
+        for _, name, snapshot in ranked:
+            card = snapshot.build_card(name, favorite_shop_ids)
+            if card is not None:
+                cards.append(card)
+                picked.add(name)
+        recommend_requests.inc(result="personal" if cards else "fallback")
+        if len(cards) >= k:
+            return cards, missing
+
+        candidates = [(snapshot, name) for _, (snapshot, _, names) in results for name in names if name not in picked]
+        if len(candidates) > k - len(cards):
+            candidates = random.sample(candidates, k - len(cards))
+        fill = (snapshot.build_card(name, favorite_shop_ids) for snapshot, name in candidates)
+        return cards + [card for card in fill if card is not None], missing
+
+    def nearby(self, latitude: float, longitude: float, radius_km: float, keyword: Optional[str], limit: int,
+               shards: List[Shard], favorite_shop_ids: Set[int]) -> Tuple[List[Dict[str, Any]], List[str]]:
+        """附近搜索：各分片按距离升序返回卡片，归并后取最近的 limit 个"""
+        def run(shard: Shard):
+            snapshot = shard.catalog.current
+            cards = []
+            for distance, name in snapshot.nearby(latitude, longitude, radius_km, keyword, limit):
+                card = snapshot.build_card(name, favorite_shop_ids, distance_km=distance)
+                if card is not None:
+                    cards.append((distance, card))
+            return cards
+
+        results, missing = self.scatter(run, shards)
+        merged = heapq.merge(*(cards for _, cards in results), key=lambda c: c[0])
+        return [card for _, card in itertools.islice(merged, limit)], missing
+
+    def search_dishes(self, terms: Tuple[str, ...], sort: str,
+                      shards: List[Shard]) -> Tuple[List[Dict[str, Any]], List[str]]:
+        """菜品搜索：各分片返回命中的店铺组，合并后统一打分排序（价格归一化需要全量结果）"""
+        def run(shard: Shard):
+            snapshot = shard.catalog.current
+            return snapshot, snapshot.search_dishes(terms)
+
+        results, missing = self.scatter(run, shards)
+        if len(results) == 1 and not missing:
+            # 单个分片：排序结果随快照缓存，翻页时不重复排序
+            snapshot, hits = results[0][1]
+            return snapshot.dish_index.cached(("ranked", terms, sort), lambda: rank_groups(hits, sort)), missing
+        return rank_groups([hit for _, (_, hits) in results for hit in hits], sort), missing
+
+    def compare_dish_price(self, dish_name: str, shop_name: Optional[str],
+                           shards: List[Shard]) -> Tuple[List[Dict[str, Any]], List[str]]:
+        """跨区域比价：各分片已按到手价升序，归并保持有序"""
+        results, missing = self.scatter(
+            lambda shard: shard.catalog.current.compare_dish_price(dish_name=dish_name, shop_name=shop_name),
+            shards)
+        return list(heapq.merge(*(rows for _, rows in results), key=lambda r: r["final_price"])), missing
+
+    def favorite_cards(self, favorites: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """收藏卡片：按全局目录找到店铺所在区域，再用该区域的快照构建"""
+        if self.sharded:
+            regions = self.global_db.get_shop_regions([fav["shop_id"] for fav in favorites])
+        else:
+            regions = {}
+        names: Dict[str, str] = {}
+        for fav in favorites:
+            names.setdefault(fav["shop_name"], regions.get(fav["shop_id"], self.default_region))
+
+        result = []
+        for shop_name in sorted(names):
+            shard = self.by_region.get(names[shop_name])
+            card = shard.catalog.current.build_card(shop_name, force_favorite=True) if shard else None
+            if card is not None:
+                result.append(card)
+        return result
+
+    # ======================
+    # 导入
+    # ======================
+    def ingest(self, data: Dict[str, List[Dict[str, Any]]]) -> bool:
+        """
+        用户写全局库；店铺 / 菜品 / 满减按 region 字段（缺省为第一个区域）拆分后并行写入各分片，
+        最后把各分片的店铺登记到全局目录。
+        """
+        if not self.sharded:
+            return load_data(self.global_db, data)
+
+        success = load_data(self.global_db, {"users": data.get("users", []),
+                                             "platforms": data.get("platforms", [])})
+        parts = {s.region: {"platforms": data.get("platforms", []), "shops": [], "dishes": [], "coupons": []}
+                 for s in self.shards}
+        shop_region: Dict[tuple, str] = {}
+        for shop in data.get("shops", []):
+            region = shop.get("region") or self.default_region
+            if region not in parts:
+                print(f"⚠️ 店铺 {shop['shop_name']} 的区域 {region} 未配置，归入 {self.default_region}")
+                region = self.default_region
+            shop_region[(shop["platform_name"], shop["shop_name"])] = region
+            parts[region]["shops"].append(shop)
+        for table in ("dishes", "coupons"):
+            for row in data.get(table, []):
+                region = shop_region.get((row["platform_name"], row["shop_name"]))
+                if region is None:
+                    region = row.get("region") if row.get("region") in parts else self.default_region
+                parts[region][table].append(row)
+
+        def load_shard(shard: Shard) -> bool:
+            try:
+                return load_data(shard.db, parts[shard.region])
+            finally:
+                shard.db.close_thread_resources()
+
+        results, missing = self.scatter(load_shard, timeout=None)
+        success = success and not missing and all(ok for _, ok in results)
+
+        for shard in self.shards:
+            added = self.global_db.register_shop_directory(shard.region, shard.db.list_shop_keys())
+            print(f"区域 {shard.region}: {len(parts[shard.region]['shops'])} 个店铺，新登记 {added} 个")
+        return success
+
+    def ingest_json(self, json_path: str) -> bool:
+        try:
+            with open(json_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except Exception as e:
+            print(f"❌ 读取 JSON 文件失败: {e}")
+            return False
+        return self.ingest(data)
+
+    def clear_all_data(self) -> bool:
+        ok = self.global_db.clear_all_data()
+        if self.sharded:
+            for shard in self.shards:
+                ok = shard.db.clear_all_data() and ok
+        return ok
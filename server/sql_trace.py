@@ -0,0 +1,254 @@
+import os
+import re
+import sqlite3
+import threading
+import time
+import weakref
+from collections import deque
+from typing import Any, Dict, List, Optional
+
+try:
+    from server import metrics
+except ImportError:  # 以脚本方式在 server/ 目录下运行时
+    import metrics
+
+_IN_LIST_RE = re.compile(r"\bIN\s*\(\s*\?(?:\s*,\s*\?)*\s*\)", re.IGNORECASE)
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?\b")
+_SPACE_RE = re.compile(r"\s+")
+
+db_statement_duration = metrics.metrics.histogram(
+    "db_statement_duration_seconds", "单条 SQL 语句耗时（执行 + 取数，秒）", ("kind",))
+db_slow_statements = metrics.metrics.counter(
+    "db_slow_statements_total", "超过慢查询阈值的 SQL 语句数", ("kind",))
+
+
+def normalize_sql(sql: str) -> str:
+    """归一化 SQL：去掉字面量、压缩空白、把任意长度的 IN (?, ?, ...) 合并成 IN (...)"""
+    text = _STRING_RE.sub("?", sql)
+    text = _NUMBER_RE.sub("?", text)
+    text = _SPACE_RE.sub(" ", text).strip()
+    return _IN_LIST_RE.sub("IN (...)", text)
+
+
+def _statement_kind(sql: str) -> str:
+    head = sql.lstrip().split(None, 1)
+    return head[0].upper() if head else ""
+
+
+class QueryTracer:
+    """记录每条语句的耗时与行数，超过阈值的语句连同 EXPLAIN QUERY PLAN 写入慢查询日志"""
+
+    def __init__(self, slow_threshold_ms: Optional[float] = None, log_size: int = 200):
+        if slow_threshold_ms is None:
+            slow_threshold_ms = float(os.getenv("SLOW_QUERY_MS", "100"))
+        self.slow_threshold = slow_threshold_ms / 1000.0
+        self.enabled = os.getenv("SQL_TRACE", "1") != "0"
+        self.lock = threading.Lock()
+        self.stats: Dict[str, Dict[str, Any]] = {}
+        self.slow_log: deque = deque(maxlen=log_size)
+        self._plans: Dict[str, str] = {}
+
+    def record(self, conn: sqlite3.Connection, sql: str, params, elapsed: float, rows: int) -> None:
+        key = normalize_sql(sql)
+        kind = _statement_kind(key)
+        db_statement_duration.observe(elapsed, kind=kind)
+        with self.lock:
+            entry = self.stats.get(key)
+            if entry is None:
+                entry = self.stats[key] = {
+                    "sql": key, "kind": kind, "calls": 0, "total_time": 0.0,
+                    "max_time": 0.0, "rows": 0, "slow_calls": 0
+                }
+            entry["calls"] += 1
+            entry["total_time"] += elapsed
+            entry["rows"] += rows
+            if elapsed > entry["max_time"]:
+                entry["max_time"] = elapsed
+            is_slow = elapsed >= self.slow_threshold
+            if is_slow:
+                entry["slow_calls"] += 1
+
+        if not is_slow:
+            return
+        db_slow_statements.inc(kind=kind)
+        plan = self._explain(conn, key, sql, params) if conn is not None and kind in ("SELECT", "WITH") else ""
+        record = {
+            "sql": key,
+            "duration_ms": round(elapsed * 1000, 3),
+            "rows": rows,
+            "plan": plan,
+            "at": time.strftime("%Y-%m-%d %H:%M:%S")
+        }
+        with self.lock:
+            self.slow_log.append(record)
+        print(f"🐢 慢查询 {record['duration_ms']}ms rows={rows}: {key}" + (f"\n    {plan}" if plan else ""))
+
+    def _explain(self, conn: sqlite3.Connection, key: str, sql: str, params) -> str:
+        # 同一归一化语句只 EXPLAIN 一次（IN 列表长度不同的语句计划相同）
+        cached = self._plans.get(key)
+        if cached is not None:
+            return cached
+        try:
+            cursor = sqlite3.Cursor(conn)  # 普通游标，避免 EXPLAIN 本身被追踪
+            cursor.execute("EXPLAIN QUERY PLAN " + sql, params if params is not None else ())
+            rows = cursor.fetchall()
+            cursor.close()
+        except sqlite3.Error as e:
+            return f"(EXPLAIN 失败: {e})"
+        depth = {0: -1}
+        lines = []
+        for row in rows:
+            node_id, parent, detail = row[0], row[1], row[-1]
+            depth[node_id] = depth.get(parent, -1) + 1
+            lines.append("  " * depth[node_id] + str(detail))
+        plan = "\n    ".join(lines)
+        with self.lock:
+            self._plans[key] = plan
+        return plan
+
+    def summary(self, top: int = 20, order_by: str = "total_time") -> List[Dict[str, Any]]:
+        """按总耗时（或 calls / max_time / rows）排序的语句汇总"""
+        with self.lock:
+            entries = [dict(e) for e in self.stats.values()]
+        entries.sort(key=lambda e: e.get(order_by, 0), reverse=True)
+        for e in entries:
+            e["avg_ms"] = round(e["total_time"] / e["calls"] * 1000, 3) if e["calls"] else 0
+            e["total_ms"] = round(e.pop("total_time") * 1000, 3)
+            e["max_ms"] = round(e.pop("max_time") * 1000, 3)
+            e["plan"] = self._plans.get(e["sql"], "")
+        return entries[:top]
+
+    def slow_queries(self) -> List[Dict[str, Any]]:
+        with self.lock:
+            return list(self.slow_log)
+
+    def reset(self) -> None:
+        with self.lock:
+            self.stats.clear()
+            self.slow_log.clear()
+            self._plans.clear()
+
+
+# 全局追踪器
+tracer = QueryTracer()
+
+
+def _settle(conn_ref, slot: list) -> None:
+    """结算游标上尚未结束的查询（取完 / 下一次 execute / close / 游标被回收时）"""
+    pending = slot[0]
+    if pending is not None:
+        slot[0] = None
+        tracer.record(conn_ref(), pending[0], pending[1], pending[2], pending[3])
+
+
+class TracingCursor(sqlite3.Cursor):
+    """
+    计时 execute 与后续 fetch；查询语句在取完、下一次 execute、close 或游标被回收时结算。
+    FoodPriceDB 的常见写法是每次调用新建游标、execute 后只 fetchone 一行就丢弃游标，
+    所以用 weakref.finalize 保证这类语句也会被记录（CPython 在最后一个引用消失时立即回收）。
+    """
+
+    _slot = None  # [pending]；pending = [sql, params, elapsed, rows]
+
+    def _pending(self):
+        slot = self._slot
+        return slot[0] if slot is not None else None
+
+    def _finish(self) -> None:
+        slot = self._slot
+        if slot is not None:
+            _settle(weakref.ref(self.connection), slot)
+
+    def _begin(self, sql, parameters, elapsed: float) -> None:
+        slot = self._slot
+        if slot is None:
+            slot = self._slot = [None]
+            weakref.finalize(self, _settle, weakref.ref(self.connection), slot)
+        slot[0] = [sql, parameters, elapsed, 0]
+
+    def execute(self, sql, parameters=()):
+        if not tracer.enabled:
+            return super().execute(sql, parameters)
+        self._finish()
+        start = time.perf_counter()
+        super().execute(sql, parameters)
+        elapsed = time.perf_counter() - start
+        if self.description is None:
+            # 非查询语句：执行完即结束
+            tracer.record(self.connection, sql, parameters, elapsed, max(self.rowcount, 0))
+        else:
+            self._begin(sql, parameters, elapsed)
+        return self
+
+    def executemany(self, sql, seq_of_parameters):
+        if not tracer.enabled:
+            return super().executemany(sql, seq_of_parameters)
+        self._finish()
+        start = time.perf_counter()
+        super().executemany(sql, seq_of_parameters)
+        tracer.record(self.connection, sql, None, time.perf_counter() - start, max(self.rowcount, 0))
+        return self
+
+    def fetchone(self):
+        pending = self._pending()
+        if pending is None:
+            return super().fetchone()
+        start = time.perf_counter()
+        row = super().fetchone()
+        pending[2] += time.perf_counter() - start
+        if row is None:
+            self._finish()
+        else:
+            pending[3] += 1
+        return row
+
+    def fetchmany(self, size=None):
+        pending = self._pending()
+        if pending is None:
+            return super().fetchmany(size) if size is not None else super().fetchmany()
+        start = time.perf_counter()
+        rows = super().fetchmany(size) if size is not None else super().fetchmany()
+        pending[2] += time.perf_counter() - start
+        pending[3] += len(rows)
+        if not rows:
+            self._finish()
+        return rows
+
+    def fetchall(self):
+        pending = self._pending()
+        if pending is None:
+            return super().fetchall()
+        start = time.perf_counter()
+        rows = super().fetchall()
+        pending[2] += time.perf_counter() - start
+        pending[3] += len(rows)
+        self._finish()
+        return rows
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        row = self.fetchone()
+        if row is None:
+            raise StopIteration
+        return row
+
+    def close(self):
+        self._finish()
+        super().close()
+
+
+class TracingConnection(sqlite3.Connection):
+    """sqlite3.connect(..., factory=TracingConnection)：所有游标（含 conn.execute / executemany）都会被追踪"""
+
+    def cursor(self, factory=TracingCursor):
+        return super().cursor(factory)
+
+    # C 实现的 Connection.execute 直接创建普通游标，不经过 cursor()，这里改为走追踪游标
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
@@ -0,0 +1,264 @@
+"""
+SQLite 调优与存储统计：
+- SqliteTuning：每个连接打开时执行的 PRAGMA（cache_size / mmap_size / temp_store / synchronous / busy_timeout），
+  以及库级设置（journal_mode / auto_vacuum），默认全部保持 SQLite 默认值，由环境变量或构造参数开启
+- page_cache_status：连接的页缓存命中 / 未命中 / 写出次数（sqlite3_db_status，标准库未暴露，经 ctypes 读取）
+- storage_stats：页数、空闲页、WAL 大小、各表 / 索引占用（dbstat 虚表）
+- maintain：ANALYZE / PRAGMA optimize / 增量 VACUUM
+
+环境变量:
+    SQLITE_CACHE_SIZE（同 PRAGMA cache_size：正数为页数，负数为 KiB）  SQLITE_MMAP_SIZE（字节）
+    SQLITE_TEMP_STORE=default|file|memory  SQLITE_SYNCHRONOUS=off|normal|full|extra
+    SQLITE_JOURNAL_MODE=delete|truncate|persist|memory|wal|off  SQLITE_AUTO_VACUUM=none|full|incremental
+    SQLITE_BUSY_TIMEOUT_MS  SQLITE_DB_STATUS=0（关闭页缓存计数读取）
+"""
+import ctypes
+import os
+import sqlite3
+import sys
+import sysconfig
+from typing import Any, Dict, Iterable, Optional
+
+TEMP_STORE_VALUES = ("default", "file", "memory")
+SYNCHRONOUS_VALUES = ("off", "normal", "full", "extra")
+JOURNAL_MODE_VALUES = ("delete", "truncate", "persist", "memory", "wal", "off")
+AUTO_VACUUM_VALUES = ("none", "full", "incremental")
+
+# sqlite3_db_status 的操作码
+DBSTATUS_CACHE_USED = 1
+DBSTATUS_CACHE_HIT = 7
+DBSTATUS_CACHE_MISS = 8
+DBSTATUS_CACHE_WRITE = 9
+
+
+def _env_int(name: str) -> Optional[int]:
+    value = os.getenv(name, "").strip()
+    if not value:
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        print(f"⚠️ 忽略无效的 {name}={value!r}（应为整数）")
+        return None
+
+
+def _env_choice(name: str, choices: Iterable[str]) -> Optional[str]:
+    value = os.getenv(name, "").strip().lower()
+    if not value:
+        return None
+    if value not in choices:
+        print(f"⚠️ 忽略无效的 {name}={value!r}（可选 {'/'.join(choices)}）")
+        return None
+    return value
+
+
+class SqliteTuning:
+    """为 None 的项不执行对应 PRAGMA，保持 SQLite 默认值"""
+
+    def __init__(self, cache_size: Optional[int] = None, mmap_size: Optional[int] = None,
+                 temp_store: Optional[str] = None, synchronous: Optional[str] = None,
+                 journal_mode: Optional[str] = None, auto_vacuum: Optional[str] = None,
+                 busy_timeout_ms: Optional[int] = None):
+        for value, choices, name in ((temp_store, TEMP_STORE_VALUES, "temp_store"),
+                                     (synchronous, SYNCHRONOUS_VALUES, "synchronous"),
+                                     (journal_mode, JOURNAL_MODE_VALUES, "journal_mode"),
+                                     (auto_vacuum, AUTO_VACUUM_VALUES, "auto_vacuum")):
+            if value is not None and value not in choices:
+                raise ValueError(f"{name} 只能是 {'/'.join(choices)}: {value!r}")
+        self.cache_size = cache_size
+        self.mmap_size = mmap_size
+        self.temp_store = temp_store
+        self.synchronous = synchronous
+        self.journal_mode = journal_mode
+        self.auto_vacuum = auto_vacuum
+        self.busy_timeout_ms = busy_timeout_ms
+
+    @classmethod
+    def from_env(cls) -> "SqliteTuning":
+        return cls(
+            cache_size=_env_int("SQLITE_CACHE_SIZE"),
+            mmap_size=_env_int("SQLITE_MMAP_SIZE"),
+            temp_store=_env_choice("SQLITE_TEMP_STORE", TEMP_STORE_VALUES),
+            synchronous=_env_choice("SQLITE_SYNCHRONOUS", SYNCHRONOUS_VALUES),
+            journal_mode=_env_choice("SQLITE_JOURNAL_MODE", JOURNAL_MODE_VALUES),
+            auto_vacuum=_env_choice("SQLITE_AUTO_VACUUM", AUTO_VACUUM_VALUES),
+            busy_timeout_ms=_env_int("SQLITE_BUSY_TIMEOUT_MS"),
+        )
+
+    def apply(self, conn: sqlite3.Connection) -> None:
+        """连接级设置：每个新连接都要执行（值已校验过，可以直接拼进 PRAGMA）"""
+        if self.cache_size is not None:
+            conn.execute(f"PRAGMA cache_size = {int(self.cache_size)}")
+        if self.mmap_size is not None:
+            conn.execute(f"PRAGMA mmap_size = {int(self.mmap_size)}")
+        if self.temp_store is not None:
+            conn.execute(f"PRAGMA temp_store = {self.temp_store}")
+        if self.synchronous is not None:
+            conn.execute(f"PRAGMA synchronous = {self.synchronous}")
+        if self.busy_timeout_ms is not None:
+            conn.execute(f"PRAGMA busy_timeout = {int(self.busy_timeout_ms)}")
+
+    def apply_database(self, conn: sqlite3.Connection) -> None:
+        """
+        库级设置：初始化时执行一次。journal_mode=WAL 会持久化到库文件；
+        auto_vacuum 只对还没有表的新库立即生效，已有数据的库需要一次完整 VACUUM 才会切换。
+        """
+        if self.auto_vacuum is not None:
+            current = AUTO_VACUUM_VALUES[conn.execute("PRAGMA auto_vacuum").fetchone()[0]]
+            if current != self.auto_vacuum:
+                conn.execute(f"PRAGMA auto_vacuum = {self.auto_vacuum}")
+                if conn.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()[0]:
+                    print(f"⚠️ auto_vacuum 从 {current} 改为 {self.auto_vacuum} 需要执行一次 VACUUM 才会生效")
+        if self.journal_mode is not None:
+            conn.execute(f"PRAGMA journal_mode = {self.journal_mode}")
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "cache_size": self.cache_size,
+            "mmap_size": self.mmap_size,
+            "temp_store": self.temp_store,
+            "synchronous": self.synchronous,
+            "journal_mode": self.journal_mode,
+            "auto_vacuum": self.auto_vacuum,
+            "busy_timeout_ms": self.busy_timeout_ms,
+        }
+
+
+# ======================
+# 页缓存计数（sqlite3_db_status）
+# ======================
+def _load_db_status():
+    """
+    标准库 sqlite3 没有暴露 sqlite3_db_status。CPython 的 Connection 对象在对象头之后第一个字段就是
+    sqlite3* 句柄（3.8 起未变），这里经 ctypes 取出句柄并调用 _sqlite3 模块所链接的那份 SQLite。
+    非 CPython、调试构建、无 GIL 构建或找不到符号时返回 None，统计中相应字段为 null。
+    """
+    if os.getenv("SQLITE_DB_STATUS", "1") == "0":
+        return None
+    if sys.implementation.name != "cpython" or hasattr(sys, "gettotalrefcount") \
+            or sysconfig.get_config_var("Py_GIL_DISABLED"):
+        return None
+    try:
+        import _sqlite3
+        lib = ctypes.CDLL(_sqlite3.__file__)
+        db_status = lib.sqlite3_db_status
+        db_filename = lib.sqlite3_db_filename
+    except (ImportError, OSError, AttributeError):
+        return None
+    db_status.argtypes = [ctypes.c_void_p, ctypes.c_int, ctypes.POINTER(ctypes.c_int),
+                          ctypes.POINTER(ctypes.c_int), ctypes.c_int]
+    db_status.restype = ctypes.c_int
+    db_filename.argtypes = [ctypes.c_void_p, ctypes.c_char_p]
+    db_filename.restype = ctypes.c_char_p
+    return db_status, db_filename
+
+
+_DB_STATUS = _load_db_status()
+_HANDLE_OFFSET = 2 * ctypes.sizeof(ctypes.c_ssize_t)  # PyObject_HEAD：引用计数 + 类型指针
+
+
+def page_cache_status(conn: sqlite3.Connection, db_path: str) -> Optional[Dict[str, int]]:
+    """
+    单个连接的页缓存命中 / 未命中 / 写出次数与占用字节数（自连接打开起累计）。
+    调用方必须持有连接的强引用，并保证读取期间连接不会被 close()。
+    句柄对应的库文件与 db_path 不一致时（对象布局不符合预期）返回 None。
+    """
+    if _DB_STATUS is None or not db_path or db_path == ":memory:":
+        return None
+    db_status, db_filename = _DB_STATUS
+    handle = ctypes.c_void_p.from_address(id(conn) + _HANDLE_OFFSET).value
+    if not handle:
+        return None  # 连接已关闭
+    filename = db_filename(handle, b"main")
+    if not filename or os.path.realpath(filename.decode()) != os.path.realpath(db_path):
+        return None
+    result = {}
+    current, highwater = ctypes.c_int(), ctypes.c_int()
+    for name, op in (("hits", DBSTATUS_CACHE_HIT), ("misses", DBSTATUS_CACHE_MISS),
+                     ("writes", DBSTATUS_CACHE_WRITE), ("used_bytes", DBSTATUS_CACHE_USED)):
+        if db_status(handle, op, ctypes.byref(current), ctypes.byref(highwater), 0) != 0:
+            return None
+        result[name] = current.value
+    return result
+
+
+# ======================
+# 存储统计 / 维护
+# ======================
+def _file_size(path: str) -> int:
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+def storage_stats(conn: sqlite3.Connection, db_path: str, objects: bool = True) -> Dict[str, Any]:
+    """页数、空闲页、文件与 WAL 大小；objects=True 时再按表 / 索引汇总 dbstat（需扫描全部页，大库较慢）"""
+    pragma = lambda name: conn.execute(f"PRAGMA {name}").fetchone()[0]
+    page_size = pragma("page_size")
+    page_count = pragma("page_count")
+    freelist = pragma("freelist_count")
+    stats: Dict[str, Any] = {
+        "path": db_path,
+        "page_size": page_size,
+        "page_count": page_count,
+        "freelist_count": freelist,
+        "freelist_bytes": freelist * page_size,
+        "database_bytes": page_count * page_size,
+        "file_bytes": _file_size(db_path),
+        "wal_bytes": _file_size(f"{db_path}-wal"),
+        "shm_bytes": _file_size(f"{db_path}-shm"),
+        "journal_mode": pragma("journal_mode"),
+        "auto_vacuum": AUTO_VACUUM_VALUES[pragma("auto_vacuum")],
+        "cache_size": pragma("cache_size"),
+        "mmap_size": pragma("mmap_size"),
+        "synchronous": SYNCHRONOUS_VALUES[pragma("synchronous")],
+    }
+    if not objects:
+        return stats
+    try:
+        kinds = {row[0]: (row[1], row[2]) for row in conn.execute("SELECT name, type, tbl_name FROM sqlite_master")}
+        rows = conn.execute("""
+            SELECT name, COUNT(*), SUM(pgsize), SUM(unused), SUM(ncell)
+            FROM dbstat GROUP BY name ORDER BY SUM(pgsize) DESC
+        """).fetchall()
+    except sqlite3.OperationalError as e:
+        stats["objects"] = None
+        stats["objects_error"] = str(e)  # SQLite 未启用 SQLITE_ENABLE_DBSTAT_VTAB
+        return stats
+    stats["objects"] = [{
+        "name": name,
+        "type": kinds.get(name, ("internal", None))[0],
+        "table": kinds.get(name, (None, None))[1],
+        "pages": pages,
+        "bytes": size,
+        "unused_bytes": unused,
+        "cells": cells,
+    } for name, pages, size, unused, cells in rows]
+    return stats
+
+
+def maintain(conn: sqlite3.Connection, analyze: bool = False, optimize: bool = True,
+             vacuum_pages: int = 0) -> Dict[str, Any]:
+    """
+    在调用方的事务中执行维护：ANALYZE（全量重采样）/ PRAGMA optimize（只分析统计过期的表）/
+    PRAGMA incremental_vacuum(N)（归还最多 N 个空闲页，auto_vacuum=incremental 时才有效果）
+    """
+    result: Dict[str, Any] = {}
+    if analyze:
+        conn.execute("ANALYZE")
+        result["analyze"] = True
+    if optimize:
+        conn.execute("PRAGMA optimize")
+        result["optimize"] = True
+    if vacuum_pages > 0:
+        # 该 PRAGMA 没有结果列，sqlite3 模块每次 execute 只 step 一次（只归还一页），需要循环执行
+        before = remaining = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        for _ in range(min(vacuum_pages, before)):
+            conn.execute("PRAGMA incremental_vacuum")
+            freelist = conn.execute("PRAGMA freelist_count").fetchone()[0]
+            if freelist >= remaining:
+                break  # auto_vacuum 不是 incremental，不会归还
+            remaining = freelist
+        result["vacuumed_pages"] = before - remaining
+    return result
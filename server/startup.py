@@ -0,0 +1,119 @@
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+try:
+    from server import metrics
+except ImportError:  # 以脚本方式在 server/ 目录下运行时
+    import metrics
+
+startup_phase_seconds = metrics.metrics.gauge(
+    "startup_phase_seconds", "启动各阶段耗时（秒）", ("phase",))
+startup_phase_done = metrics.metrics.gauge(
+    "startup_phase_done", "启动阶段是否完成（1=完成，0=未完成，-1=失败）", ("phase",))
+
+
+class Phase:
+    def __init__(self, name: str, fn: Callable[[], Any], required: bool = True):
+        self.name = name
+        self.fn = fn
+        self.required = required  # 必需阶段失败则服务不可用；非必需阶段失败只影响性能
+        self.status = "pending"   # pending / running / done / failed
+        self.started_at: Optional[float] = None
+        self.duration: Optional[float] = None
+        self.error: Optional[str] = None
+        self.event = threading.Event()
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "status": self.status,
+            "required": self.required,
+            "duration_ms": round(self.duration * 1000, 2) if self.duration is not None else None,
+            "error": self.error
+        }
+
+
+class Startup:
+    """
+    分阶段启动：导入时只登记阶段，由后台线程依次执行（建表 → 加载数据 → 缓存预热）。
+    请求可通过 is_done(phase) 判断所需阶段是否就绪，未就绪时返回降级响应而不是阻塞。
+    """
+
+    def __init__(self):
+        self.phases: Dict[str, Phase] = {}
+        self.order: List[str] = []
+        self.import_seconds: Optional[float] = None
+        self.thread: Optional[threading.Thread] = None
+        self.started = False
+        self.lock = threading.Lock()
+
+    def add_phase(self, name: str, fn: Callable[[], Any], required: bool = True) -> None:
+        with self.lock:
+            if self.started:
+                raise RuntimeError(f"启动已开始，无法再登记阶段 {name}")
+            self.phases[name] = Phase(name, fn, required)
+            self.order.append(name)
+        startup_phase_done.set(0, phase=name)
+
+    def start(self, background: bool = True) -> None:
+        with self.lock:
+            if self.started:
+                return
+            self.started = True
+        if background:
+            self.thread = threading.Thread(target=self._run, name="startup-warmup", daemon=True)
+            self.thread.start()
+        else:
+            self._run()
+
+    def _run(self) -> None:
+        for name in self.order:
+            phase = self.phases[name]
+            phase.status = "running"
+            phase.started_at = time.time()
+            start = time.perf_counter()
+            try:
+                phase.fn()
+                phase.status = "done"
+                startup_phase_done.set(1, phase=name)
+            except Exception as e:
+                phase.status = "failed"
+                phase.error = str(e)
+                startup_phase_done.set(-1, phase=name)
+                print(f"❌ 启动阶段 {name} 失败: {e}")
+            phase.duration = time.perf_counter() - start
+            startup_phase_seconds.set(phase.duration, phase=name)
+            phase.event.set()
+            print(f"启动阶段 {name}: {phase.status}，耗时 {phase.duration * 1000:.1f}ms")
+            if phase.status == "failed" and phase.required:
+                # 必需阶段失败，后续阶段全部标记失败并唤醒等待者
+                for rest in self.order[self.order.index(name) + 1:]:
+                    self.phases[rest].status = "failed"
+                    self.phases[rest].error = f"依赖阶段 {name} 失败"
+                    self.phases[rest].event.set()
+                return
+
+    def is_done(self, name: str) -> bool:
+        phase = self.phases.get(name)
+        return phase is not None and phase.status == "done"
+
+    def wait(self, name: Optional[str] = None, timeout: Optional[float] = None) -> bool:
+        """等待某个阶段（默认最后一个阶段）结束；返回该阶段是否成功"""
+        name = name or (self.order[-1] if self.order else None)
+        if name is None:
+            return True
+        phase = self.phases[name]
+        phase.event.wait(timeout)
+        return phase.status == "done"
+
+    @property
+    def ready(self) -> bool:
+        return all(p.status == "done" for p in self.phases.values() if p.required)
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "ready": self.ready,
+            "warm": all(p.status == "done" for p in self.phases.values()),
+            "import_ms": round(self.import_seconds * 1000, 2) if self.import_seconds is not None else None,
+            "phases": {name: self.phases[name].to_dict() for name in self.order}
+        }
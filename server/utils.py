@@ -17,6 +17,13 @@ def load_data_from_json(db: 'FoodPriceDB', json_path: str) -> bool:
         print(f"❌ 读取 JSON 文件失败: {e}")
         return False
 
+    return load_data(db, data)
+
+
+def load_data(db: 'FoodPriceDB', data: Dict[str, List[Dict[str, Any]]]) -> bool:
+    """
+    把已解析的数据字典（users / platforms / shops / dishes / coupons）写入数据库
+    """
     success = True
 
     # 1. 导入用户
@@ -50,7 +57,9 @@ def load_data_from_json(db: 'FoodPriceDB', json_path: str) -> bool:
             monthly_sales=shop.get("monthly_sales", 0),
             min_order=shop.get("min_order", 0),
             avg_consumption=shop.get("avg_consumption", 0),
-            image_url=shop.get("image_url")  # ← 新增字段，可为 None
+            image_url=shop.get("image_url"),  # ← 新增字段，可为 None
+            latitude=shop.get("latitude"),
+            longitude=shop.get("longitude")
         )
         if ok and shop_id is not None:
             shop_key_to_id[(shop["platform_name"], shop["shop_name"])] = shop_id
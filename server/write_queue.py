@@ -0,0 +1,183 @@
+import os
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, List, Optional, Tuple
+
+try:
+    from server import metrics
+except ImportError:  # 以脚本方式在 server/ 目录下运行时
+    import metrics
+
+# 单个事务最多合并的写操作数
+WRITE_BATCH_MAX_OPS = int(os.getenv("WRITE_BATCH_MAX_OPS", "64"))
+# 出现并发写入时，为凑批最多再等待的时间（毫秒）
+WRITE_BATCH_MAX_WAIT_MS = float(os.getenv("WRITE_BATCH_MAX_WAIT_MS", "2"))
+# 队列中已取到的操作数达到该值才等待凑批；单个顺序写入（如数据导入）不额外等待
+WRITE_BATCH_SIBLINGS = int(os.getenv("WRITE_BATCH_SIBLINGS", "2"))
+# 数据库被锁定时整批重试的次数
+WRITE_BATCH_RETRIES = int(os.getenv("WRITE_BATCH_RETRIES", "5"))
+# 调用方等待一个写操作提交的最长时间（秒）；超时抛 concurrent.futures.TimeoutError，而不是无限期挂起
+WRITE_TIMEOUT_SECONDS = float(os.getenv("WRITE_TIMEOUT_SECONDS", "300"))
+
+BATCH_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256)
+
+write_queue_depth = metrics.metrics.gauge(
+    "write_queue_depth", "写队列中等待提交的操作数", ("db",))
+write_batch_size = metrics.metrics.histogram(
+    "write_batch_size", "每次提交合并的写操作数", ("db",), buckets=BATCH_BUCKETS)
+write_commit_seconds = metrics.metrics.histogram(
+    "write_commit_seconds", "一批写操作从 BEGIN 到 COMMIT 的耗时（秒）", ("db",))
+write_wait_seconds = metrics.metrics.histogram(
+    "write_wait_seconds", "写操作从入队到结果可用的耗时（秒）", ("db",))
+write_batch_retries = metrics.metrics.counter(
+    "write_batch_retries_total", "因数据库锁定而整批重试的次数", ("db",))
+write_ops_total = metrics.metrics.counter(
+    "write_ops_total", "经写队列执行的操作数", ("db", "result"))
+
+
+class WriteQueue:
+    """
+    组提交写队列：所有变更由一个写线程执行，多个调用方的小写操作合并到同一个事务里提交，
+    每批只 fsync 一次。每个操作在自己的 SAVEPOINT 中执行，单个操作抛异常只回滚它自己；
+    调用方拿到 Future，提交成功后才得到结果。
+
+    operation 是无参可调用对象，在写线程中执行，通过 db._get_thread_cursor() 取写线程自己的连接，
+    不能自行 commit / rollback。
+    """
+
+    def __init__(self, db, max_ops: int = WRITE_BATCH_MAX_OPS, max_wait_ms: float = WRITE_BATCH_MAX_WAIT_MS,
+                 siblings: int = WRITE_BATCH_SIBLINGS, retries: int = WRITE_BATCH_RETRIES):
+        self.db = db
+        self.max_ops = max(1, max_ops)
+        self.max_wait = max_wait_ms / 1000.0
+        self.siblings = siblings
+        self.retries = retries
+        self.queue: "queue.Queue[Tuple[Callable[[], Any], Future, float]]" = queue.Queue()
+        self.lock = threading.Lock()
+        self.thread: Optional[threading.Thread] = None
+        self.label = ""
+
+    def submit(self, operation: Callable[[], Any]) -> Future:
+        future: Future = Future()
+        if threading.current_thread() is self.thread:
+            # 写操作里再发起写操作：直接在当前批次中执行，避免写线程等待自己
+            try:
+                future.set_result(operation())
+            except BaseException as e:
+                future.set_exception(e)
+            return future
+        self._ensure_started()
+        self.queue.put((operation, future, time.perf_counter()))
+        write_queue_depth.set(self.queue.qsize(), db=self.label)
+        return future
+
+    def run(self, operation: Callable[[], Any], timeout: Optional[float] = WRITE_TIMEOUT_SECONDS) -> Any:
+        """提交并等待结果（操作抛出的异常原样抛给调用方）"""
+        return self.submit(operation).result(timeout)
+
+    def _ensure_started(self) -> None:
+        if self.thread is not None:
+            return
+        with self.lock:
+            if self.thread is None:
+                self.label = os.path.basename(self.db.db_path or "")
+                self.thread = threading.Thread(target=self._loop, name=f"db-writer-{self.label}", daemon=True)
+                self.thread.start()
+
+    # ======================
+    # 写线程
+    # ======================
+    def _collect(self) -> List[Tuple[Callable[[], Any], Future, float]]:
+        batch = [self.queue.get()]
+        while len(batch) < self.max_ops:
+            try:
+                batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        # 已经有并发写入时再等一小会儿凑批（类似 PostgreSQL 的 commit_delay / commit_siblings）
+        if self.max_wait > 0 and self.siblings <= len(batch) < self.max_ops:
+            deadline = time.perf_counter() + self.max_wait
+            while len(batch) < self.max_ops:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self.queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+        write_queue_depth.set(self.queue.qsize(), db=self.label)
+        return batch
+
+    def _loop(self) -> None:
+        conn = self.db._get_thread_connection()
+        conn.isolation_level = None  # 事务由写线程显式控制
+        while True:
+            batch = self._collect()
+            # 写线程只有一个，任何异常（含操作抛出的 BaseException）都只让本批失败，不能让线程退出
+            try:
+                write_batch_size.observe(len(batch), db=self.label)
+                outcomes = self._commit(conn, batch)
+                done = time.perf_counter()
+                for (_, future, queued_at), (ok, value) in zip(batch, outcomes):
+                    write_wait_seconds.observe(done - queued_at, db=self.label)
+                    write_ops_total.inc(db=self.label, result="ok" if ok else "error")
+                    if ok:
+                        future.set_result(value)
+                    else:
+                        future.set_exception(value)
+            except BaseException as e:
+                print(f"写线程处理批次失败（{len(batch)} 个操作）: {e!r}")
+                self._rollback(conn)
+                for _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+
+    @staticmethod
+    def _rollback(conn: sqlite3.Connection) -> None:
+        """回滚当前事务；ROLLBACK 本身失败（如连接已损坏）时只打印，不向上抛"""
+        try:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+        except sqlite3.Error as e:
+            print(f"写队列回滚失败: {e}")
+
+    def _commit(self, conn: sqlite3.Connection, batch) -> List[Tuple[bool, Any]]:
+        """执行一批操作并提交；锁定时回滚整批后重试（提交前结果都未生效，重新执行是安全的）"""
+        for attempt in range(self.retries + 1):
+            start = time.perf_counter()
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                outcomes = [self._apply(conn, operation) for operation, _, _ in batch]
+                conn.execute("COMMIT")
+                write_commit_seconds.observe(time.perf_counter() - start, db=self.label)
+                return outcomes
+            except sqlite3.OperationalError as e:
+                self._rollback(conn)
+                if "database is locked" in str(e) and attempt < self.retries:
+                    write_batch_retries.inc(db=self.label)
+                    time.sleep(0.05 * (attempt + 1))
+                    continue
+                print(f"写队列提交失败（{len(batch)} 个操作）: {e}")
+                return [(False, e)] * len(batch)
+            except Exception as e:
+                self._rollback(conn)
+                print(f"写队列提交失败（{len(batch)} 个操作）: {e}")
+                return [(False, e)] * len(batch)
+        return [(False, sqlite3.OperationalError("database is locked"))] * len(batch)
+
+    @staticmethod
+    def _apply(conn: sqlite3.Connection, operation) -> Tuple[bool, Any]:
+        conn.execute("SAVEPOINT write_op")
+        try:
+            result = operation()
+        except Exception as e:
+            if isinstance(e, sqlite3.OperationalError) and "database is locked" in str(e):
+                raise  # 交给 _commit 整批重试
+            conn.execute("ROLLBACK TO write_op")
+            conn.execute("RELEASE write_op")
+            return (False, e)
+        conn.execute("RELEASE write_op")
+        return (True, result)
@@ -0,0 +1,94 @@
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+# 与 server/app.py 相同：把项目根目录加入 Python 路径，测试按 server.xxx 导入
+ROOT_DIR = Path(__file__).parent.parent
+if str(ROOT_DIR) not in sys.path:
+    sys.path.insert(0, str(ROOT_DIR))
+
+# 测试使用快速的密码哈希参数，不启动后台任务调度
+os.environ.setdefault("PASSWORD_KDF", "pbkdf2_sha256")
+os.environ.setdefault("PBKDF2_ITERATIONS", "1000")
+os.environ.setdefault("SCHEDULER", "0")
+
+from bench.synthetic_data import SyntheticCatalog  # noqa: E402
+from server.FoodPriceDB import FoodPriceDB  # noqa: E402
+from server.catalog import ELEME, MEITUAN  # noqa: E402
+from server.shards import ShardRouter  # noqa: E402
+
+
+@pytest.fixture
+def db(tmp_path):
+    """空的全局库（临时文件）"""
+    database = FoodPriceDB()
+    assert database.initialize(str(tmp_path / "food_price.db"))
+    return database
+
+
+@pytest.fixture
+def router(db):
+    """装入小规模合成数据（约 100 个店铺组）并构建好目录快照的单分片路由"""
+    SyntheticCatalog(seed=7, scale=0.1).bulk_load(db)
+    shard_router = ShardRouter(db, regions=[])
+    assert shard_router.initialize()
+    shard_router.rebuild_all()
+    return shard_router
+
+
+REGIONS = ("wuhan", "beijing")
+
+
+def _region_data(region, count):
+    """count 个店铺组，每组两个平台各一家店、两道菜、一条满减"""
+    data = {"shops": [], "dishes": [], "coupons": []}
+    for i in range(count):
+        name = f"{region}店{i:02d}"
+        for platform in (MEITUAN, ELEME):
+            data["shops"].append({"platform_name": platform, "shop_name": name, "region": region,
+                                  "rating": 4.0 + i / 100, "delivery_fee": 2})
+            data["dishes"].extend({"platform_name": platform, "shop_name": name, "dish_name": dish,
+                                   "price": 10 + i} for dish in ("米饭", f"招牌菜{i}"))
+            data["coupons"].append({"platform_name": platform, "shop_name": name,
+                                    "condition_amount": 20, "discount_amount": 3})
+    return data
+
+
+@pytest.fixture
+def sharded(db, tmp_path):
+    """两个区域分片：武汉 3 个店铺组，北京 2 个"""
+    router = ShardRouter(db, regions=list(REGIONS), shard_dir=str(tmp_path))
+    assert router.initialize()
+    data = {"users": [], "platforms": [{"platform_name": p} for p in (MEITUAN, ELEME)],
+            "shops": [], "dishes": [], "coupons": []}
+    for region, count in zip(REGIONS, (3, 2)):
+        for table, rows in _region_data(region, count).items():
+            data[table].extend(rows)
+    assert router.ingest(data)
+    router.rebuild_all()
+    return router
+
+
+@pytest.fixture(scope="session")
+def app_module(tmp_path_factory):
+    """
+    导入 server.app（导入时同步完成启动阶段，空库时从 server/data.json 加载数据）。
+    server.app 是模块级单例，整个测试会话只导入一次。
+    """
+    os.environ.update({
+        "DB_PATH": str(tmp_path_factory.mktemp("app") / "food_price.db"),
+        "STARTUP_MODE": "sync",
+        "RATE_LIMIT_RATE": "0",
+        "IMAGE_FETCH": "off",
+        "ADMIN_TOKEN": "test-admin-token",
+    })
+    cwd = os.getcwd()
+    os.chdir(ROOT_DIR)  # init_catalog 按相对路径查找 server/data.json
+    try:
+        from server import app as module
+    finally:
+        os.chdir(cwd)
+    assert module.startup.ready
+    return module
@@ -0,0 +1,38 @@
+import pytest
+
+from server import analytics
+from server.analytics import CatalogAnalytics
+
+
+def _without_timing(stats):
+    return {k: v for k, v in stats.items() if k not in ("backend", "computed_ms")}
+
+
+def test_numpy_and_array_backends_agree(router):
+    pytest.importorskip("numpy")
+    snapshots = [shard.catalog.current for shard in router.shards]
+    vectorized = CatalogAnalytics(use_numpy=True).stats(snapshots)
+    looped = CatalogAnalytics(use_numpy=False).stats(snapshots)
+    assert vectorized["backend"] == "numpy" and looped["backend"] == "array"
+    assert vectorized["dishes"] > 0
+    assert _without_timing(vectorized) == _without_timing(looped)
+
+
+def test_cache_keeps_one_entry_per_selection(router, monkeypatch):
+    snapshot = router.shards[0].catalog.current
+    stats = CatalogAnalytics(use_numpy=False, max_entries=2)
+    calls = []
+    compute = analytics._python_stats
+    monkeypatch.setattr(analytics, "_python_stats", lambda cols: calls.append(1) or compute(cols))
+
+    first = stats.stats([snapshot], ("all",))
+    stats.stats([snapshot], ("wuhan",))
+    # 交替请求不同选择不会互相挤掉缓存
+    assert stats.stats([snapshot], ("all",)) is first
+    assert len(calls) == 2
+
+    # 超过 max_entries 时淘汰最久未用的选择
+    stats.stats([snapshot], ("beijing",))
+    assert list(stats.cache) == [("all",), ("beijing",)]
+    stats.stats([snapshot], ("wuhan",))
+    assert len(calls) == 4
@@ -0,0 +1,80 @@
+import threading
+import time
+
+from server.catalog import CatalogStore
+
+
+def _bump_prices(db, shop_id, delta):
+    db._write(lambda: db._get_thread_cursor().execute(
+        "UPDATE dishes SET price = price + ? WHERE shop_id = ?", (delta, shop_id)))
+
+
+def test_rebuild_swaps_snapshot_and_leaves_old_one_intact(router):
+    db = router.global_db
+    store = CatalogStore(db, use_file=False)
+    rebuilt = []
+    store.on_rebuild(lambda snapshot: 1 / 0)  # 回调出错不影响替换
+    store.on_rebuild(rebuilt.append)
+    old = store.rebuild()
+    assert store.current is old and rebuilt == [old]
+    assert old.generation == db.get_catalog_generation()
+    assert len(old.shops) == db.get_table_counts()["shops"]
+    assert len(old.dish_names) == db.get_table_counts()["dishes"]
+
+    shop_id = next(iter(old.shops))
+    before = old.dishes_of(old.shops[shop_id])
+    card = old.build_card(old.shops[shop_id].shop_name)
+    _bump_prices(db, shop_id, 1)
+    assert db.get_catalog_generation() > old.generation
+    assert store.current is old  # 不重建不会看到新数据
+
+    new = store.rebuild()
+    assert store.current is new is not old and rebuilt == [old, new]
+    assert new.generation == db.get_catalog_generation()
+    assert new.dishes_of(new.shops[shop_id]) == [{"name": d["name"], "price": round(d["price"] + 1, 2)}
+                                                 for d in before]
+    # 旧快照仍被读者持有：内容不变
+    assert old.dishes_of(old.shops[shop_id]) == before
+    assert old.build_card(old.shops[shop_id].shop_name) == card
+
+
+def test_readers_only_see_complete_snapshots_during_rebuilds(router):
+    db = router.global_db
+    store = CatalogStore(db, use_file=False)
+    first = store.rebuild()
+    expected = (len(first.shops), len(first.dish_names), len(first.group_names))
+    shop_id = next(iter(first.shops))
+    stop, seen, errors = threading.Event(), set(), []
+
+    def read():
+        while not stop.is_set():
+            snapshot = store.current
+            shape = (len(snapshot.shops), len(snapshot.dish_names), len(snapshot.group_names))
+            if shape != expected:
+                errors.append(shape)
+            seen.add(snapshot.generation)
+
+    readers = [threading.Thread(target=read) for _ in range(4)]
+    for reader in readers:
+        reader.start()
+    for i in range(5):
+        _bump_prices(db, shop_id, 1)
+        store.rebuild_async().join()
+    stop.set()
+    for reader in readers:
+        reader.join()
+    assert errors == []
+    assert store.current.generation == db.get_catalog_generation()
+    assert len(seen) > 1
+
+
+def test_watcher_rebuilds_once_generation_settles(router):
+    db = router.global_db
+    store = CatalogStore(db, use_file=False)
+    first = store.rebuild()
+    store.start_watcher(interval=0.05)
+    _bump_prices(db, next(iter(first.shops)), 1)
+    deadline = time.time() + 5
+    while store.current is first and time.time() < deadline:
+        time.sleep(0.02)
+    assert store.current.generation == db.get_catalog_generation() != first.generation
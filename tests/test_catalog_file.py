@@ -0,0 +1,67 @@
+from bench.synthetic_data import CITY_CENTER
+from server.catalog import CatalogSnapshot, CatalogStore
+from server.catalog_file import catalog_file_path, write_catalog
+from server.dish_search import parse_terms
+
+
+def _api_output(snapshot, favorite_shop_ids):
+    """快照对外（接口层）可见的全部结果"""
+    names = list(snapshot.group_names)
+    dish_names = sorted(set(snapshot.dish_names[i] for i in range(0, len(snapshot.dish_names), 7)))
+    output = {
+        "generation": snapshot.generation,
+        "groups": names,
+        "popular": list(snapshot.popular_names),
+        "cards": [snapshot.build_card(name, favorite_shop_ids) for name in names],
+        "search_names": [snapshot.search_names(name[:1]) for name in names[::10]],
+        "compare": [snapshot.compare_dish_price(dish) for dish in dish_names[:30]],
+        "nearby": snapshot.nearby(CITY_CENTER[0], CITY_CENTER[1], 10.0, limit=50),
+        "dishes": [],
+    }
+    for dish in dish_names[:30]:
+        terms = parse_terms(dish)
+        hits = sorted(snapshot.search_dishes(terms), key=lambda h: h.name)
+        output["dishes"].append([
+            (hit.name, hit.relevance, hit.min_price, hit.rating, snapshot.dish_group_detail(hit, terms))
+            for hit in hits
+        ])
+    return output
+
+
+def test_file_snapshot_matches_sqlite_snapshot(router, tmp_path):
+    db_path = router.global_db.db_path
+    built = CatalogSnapshot.build(db_path)
+    path = str(tmp_path / "food_price.db.catalog")
+    assert write_catalog(built, path) > 0
+
+    loaded = CatalogSnapshot.from_file(path)
+    assert built.source == "sqlite" and loaded.source == "file"
+    favorites = set(list(built.shops)[:5])
+    assert _api_output(loaded, favorites) == _api_output(built, favorites)
+    built_stats, loaded_stats = built.stats(), loaded.stats()
+    for stats in (built_stats, loaded_stats):
+        stats.pop("built_at")
+        stats.pop("source")
+    assert loaded_stats == built_stats
+
+
+def test_store_loads_file_only_for_current_generation(router):
+    db = router.global_db
+    store = CatalogStore(db, use_file=True)
+    first = store.rebuild()
+    assert first.source == "sqlite"  # 还没有目录文件：查库构建并导出
+
+    assert store.rebuild().source == "file"
+
+    # 目录变更后版本号递增，旧文件不再使用
+    shop_id = next(iter(first.shops))
+    db._write(lambda: db._get_thread_cursor().execute(
+        "UPDATE dishes SET price = price + 1 WHERE shop_id = ?", (shop_id,)))
+    rebuilt = store.rebuild()
+    assert rebuilt.source == "sqlite"
+    assert rebuilt.generation == db.get_catalog_generation() != first.generation
+    shop = rebuilt.shops[shop_id]
+    assert rebuilt.dishes_of(shop) == [
+        {"name": d["name"], "price": round(d["price"] + 1, 2)} for d in first.dishes_of(first.shops[shop_id])
+    ]
+    assert CatalogSnapshot.from_file(catalog_file_path(db.db_path)).generation == rebuilt.generation
@@ -0,0 +1,99 @@
+from server.catalog import ELEME, MEITUAN, CatalogSnapshot
+from server.dish_search import GroupHit, paginate, parse_terms, rank_groups, term_relevance
+from server.utils import load_data
+
+
+def _load_menus(db, menus):
+    """menus: {店名: (评分, {菜名: (美团价, 饿了么价)})}"""
+    data = {"platforms": [{"platform_name": p} for p in (MEITUAN, ELEME)], "shops": [], "dishes": [], "coupons": []}
+    for name, (rating, dishes) in menus.items():
+        for i, platform in enumerate((MEITUAN, ELEME)):
+            data["shops"].append({"platform_name": platform, "shop_name": name, "rating": rating})
+            data["dishes"].extend({"platform_name": platform, "shop_name": name, "dish_name": dish,
+                                   "price": prices[i]} for dish, prices in dishes.items())
+    assert load_data(db, data)
+    return CatalogSnapshot.build(db.db_path)
+
+
+def test_index_matches_substring_scan(router):
+    snapshot = router.shards[0].catalog.current
+    index = snapshot.dish_index
+    assert len(index.names) == len(set(snapshot.dish_names))
+    terms = {name[:1] for name in index.names[:20]} | {name[1:3] for name in index.names[:20]} | \
+        {name for name in index.names[:5]} | {"不存在的菜"}
+    for term in terms:
+        expected = [i for i, lower in enumerate(index.lower) if term.lower() in lower]
+        assert index.match(term) == expected, term
+    for name_id, name in enumerate(index.names[:50]):
+        assert [snapshot.dish_names[row] for row in index.rows[name_id]] == [name] * len(index.rows[name_id])
+
+
+def test_relevance_prefers_exact_then_prefix_then_contains():
+    assert parse_terms("  牛肉  拌饭 牛肉 ") == ("牛肉", "拌饭")
+    exact, prefix, contains = (term_relevance("牛肉拌饭", name) for name in ("牛肉拌饭", "牛肉拌饭套餐", "红烧牛肉拌饭"))
+    assert exact == 1.0 > prefix > contains
+    assert term_relevance("牛肉", "牛肉面") > term_relevance("牛肉", "牛肉拌饭套餐")
+
+
+def test_search_groups_by_shop_with_cheapest_platform(db):
+    snapshot = _load_menus(db, {
+        "甲店": (4.0, {"牛肉拌饭": (25, 23), "米饭": (2, 2)}),
+        "乙店": (4.8, {"红烧牛肉拌饭": (20, 22), "牛肉拌饭套餐": (30, 28)}),
+        "丙店": (4.5, {"鸡肉拌饭": (15, 15)}),
+    })
+    terms = parse_terms("牛肉拌饭")
+    hits = {hit.name: hit for hit in snapshot.search_dishes(terms)}
+    assert set(hits) == {"甲店", "乙店"}
+    assert hits["甲店"].relevance == 1.0 and hits["甲店"].min_price == 23
+    # 组相关度取最高的菜（前缀），最低价取全部命中菜品
+    assert hits["乙店"].relevance == round(term_relevance("牛肉拌饭", "牛肉拌饭套餐"), 4)
+    assert hits["乙店"].min_price == 20
+
+    detail = snapshot.dish_group_detail(hits["乙店"], terms)
+    assert detail["matched"] == 2 and detail["cheapest_platform"] == "meituan"
+    assert [dish["name"] for dish in detail["dishes"]] == ["牛肉拌饭套餐", "红烧牛肉拌饭"]
+    assert detail["dishes"][0]["cheapest_platform"] == "ele" and detail["dishes"][0]["cheapest_price"] == 28
+
+    # 多个词同时命中
+    assert {hit.name for hit in snapshot.search_dishes(parse_terms("拌饭 鸡肉"))} == {"丙店"}
+    assert snapshot.search_dishes(parse_terms("拌饭 寿司")) == []
+
+
+def test_rank_blends_relevance_price_and_rating():
+    hits = [GroupHit("精确但贵", 1.0, 40.0, 4.0), GroupHit("包含且便宜", 0.6, 10.0, 4.0),
+            GroupHit("前缀高分", 0.9, 20.0, 5.0)]
+    ranked = rank_groups(hits)
+    assert [hit.name for hit in ranked] == ["前缀高分", "精确但贵", "包含且便宜"]
+    assert [hit.score for hit in ranked] == [0.815, 0.7825, 0.73]
+    assert [hit.name for hit in rank_groups(hits, "price")] == ["包含且便宜", "前缀高分", "精确但贵"]
+    assert [hit.name for hit in rank_groups(hits, "rating")][0] == "前缀高分"
+    assert all(hit.score == 0.0 for hit in hits)  # 不修改输入
+    assert rank_groups([]) == []
+
+
+def test_pages_cover_ranked_results_without_overlap(router):
+    snapshot = router.shards[0].catalog.current
+    terms = parse_terms(snapshot.dish_names[0][:1])
+    ranked = rank_groups(snapshot.search_dishes(terms))
+    assert len(ranked) > 15
+    pages = [paginate(ranked, page, 7) for page in range(1, len(ranked) // 7 + 3)]
+    assert [hit for page in pages for hit in page] == ranked
+    assert all(len(page) == 7 for page in pages[:len(ranked) // 7]) and pages[-1] == []
+
+
+def test_endpoint_paginates_and_validates(app_module):
+    client = app_module.app.test_client()
+    snapshot = app_module.router.shards[0].catalog.current
+    query = snapshot.dish_names[0][:1]
+    full = client.get("/api/dishes/search", query_string={"q": query, "page_size": 50}).get_json()
+    assert full["success"] and full["total"] >= 1
+    names = [group["name"] for group in full["results"]]
+    second = client.get("/api/dishes/search", query_string={"q": query, "page": 2, "page_size": 1}).get_json()
+    assert second["total"] == full["total"]
+    assert [group["name"] for group in second["results"]] == names[1:2]
+    scores = [group["score"] for group in full["results"]]
+    assert scores == sorted(scores, reverse=True)
+
+    for params in ({"q": ""}, {"q": query, "sort": "distance"}, {"q": query, "page": 0},
+                   {"q": query, "page_size": 51}, {"q": query, "page": "x"}, {"q": query, "region": "火星"}):
+        assert client.get("/api/dishes/search", query_string=params).status_code == 400
@@ -0,0 +1,86 @@
+import csv
+import gzip
+import io
+import json
+
+import pytest
+
+from server import export as export_module
+from server.catalog import ELEME, MEITUAN
+from server.export import DATASETS, ExportError, export
+
+
+def _csv(router, dataset, **kwargs):
+    text = b"".join(export(router, dataset, "csv", **kwargs)).decode("utf-8")
+    header, *rows = list(csv.reader(io.StringIO(text)))
+    return header, rows
+
+
+def _ndjson(router, dataset, **kwargs):
+    return [json.loads(line) for line in b"".join(export(router, dataset, "ndjson", **kwargs)).splitlines()]
+
+
+def test_csv_and_ndjson_export_every_row(router, monkeypatch):
+    monkeypatch.setattr(export_module, "CHUNK_BYTES", 512)  # 多块输出
+    counts = router.global_db.get_table_counts()
+    for dataset in ("shops", "dishes", "coupons"):
+        header, rows = _csv(router, dataset)
+        assert tuple(header) == DATASETS[dataset][0]
+        assert len(rows) == counts[dataset] > 0
+        records = _ndjson(router, dataset)
+        assert [list(record) for record in records[:1]] == [header]
+        assert [str(record[header[0]]) for record in records] == [row[0] for row in rows]
+    # 未过滤时按主键顺序输出
+    ids = [int(row[0]) for row in _csv(router, "dishes")[1]]
+    assert ids == sorted(ids)
+
+    cursor = router.global_db._get_thread_cursor()
+    cursor.execute("SELECT dish_id, price FROM dishes")
+    prices = {row[0]: row[1] for row in cursor.fetchall()}
+    assert all(record["price"] == prices[record["dish_id"]] for record in _ndjson(router, "dishes"))
+
+
+def test_gzip_output_decompresses_to_plain_output(router):
+    plain = b"".join(export(router, "dishes", "ndjson"))
+    chunks = list(export(router, "dishes", "ndjson", compress=True))
+    assert gzip.decompress(b"".join(chunks)) == plain
+    assert sum(map(len, chunks)) < len(plain)
+
+
+def test_platform_and_shop_filters(router):
+    snapshot = router.shards[0].catalog.current
+    names = [name for name in snapshot.group_names if len(snapshot.groups[name]) == 2][:2]
+
+    _, rows = _csv(router, "dishes", platforms=["meituan"])
+    assert rows and {row[2] for row in rows} == {MEITUAN}
+    _, both = _csv(router, "dishes", platforms=[MEITUAN, "eleme"])
+    assert len(both) == router.global_db.get_table_counts()["dishes"]
+
+    records = _ndjson(router, "shops", shop_names=names)
+    assert sorted(record["shop_name"] for record in records) == sorted(names * 2)
+    records = _ndjson(router, "coupons", platforms=["ele"], shop_names=names[:1])
+    assert {(record["platform"], record["shop_name"]) for record in records} <= {(ELEME, names[0])}
+
+    comparisons = _ndjson(router, "comparisons", platforms=["ele"], shop_names=names)
+    assert comparisons and {record["shop_name"] for record in comparisons} <= set(names)
+    for record in comparisons:
+        assert record["difference"] == round(record["meituan_price"] - record["ele_price"], 2)
+        expected = "meituan" if record["difference"] < 0 else "ele" if record["difference"] > 0 else "tie"
+        assert record["cheaper"] == expected
+    keys = [(record["shop_name"], record["dish_name"]) for record in comparisons]
+    assert keys == sorted(keys)
+
+
+def test_invalid_arguments_fail_before_streaming(router):
+    for kwargs in ({"dataset": "users"}, {"dataset": "shops", "fmt": "xml"},
+                   {"dataset": "shops", "platforms": ["京东"]}, {"dataset": "shops", "region": "火星"}):
+        with pytest.raises(ExportError):
+            export(router, **kwargs)
+
+
+def test_sharded_export_adds_region_column(sharded):
+    header, rows = _csv(sharded, "shops")
+    assert header[0] == "region" and len(rows) == 10
+    assert [row[0] for row in rows] == ["wuhan"] * 6 + ["beijing"] * 4
+    _, rows = _csv(sharded, "dishes", region="beijing")
+    assert len(rows) == 8 and {row[0] for row in rows} == {"beijing"}
@@ -0,0 +1,61 @@
+from server import FoodPriceDB as food_price_db
+
+
+def _delta(db, user_id, since):
+    ok, delta = db.get_favorite_changes(user_id, since)
+    assert ok
+    return delta
+
+
+def test_since_returns_changes_after_version(router):
+    db = router.global_db
+    ok, user_id, _ = db.register_user("alice", "alice@example.com", "secret123")
+    assert ok
+    snapshot = router.shards[0].catalog.current
+    first, second = snapshot.group_names[:2]
+    first_shops = [shop.shop_id for shop in snapshot.groups[first]]
+    second_shop = snapshot.groups[second][0].shop_id
+
+    assert _delta(db, user_id, 0) == {"version": 0, "full": True, "added": [], "removed": []}
+
+    for shop_id in first_shops:
+        assert db.add_favorite(user_id, shop_id)[0]
+    base = _delta(db, user_id, 0)
+    assert base["full"] and base["added"] == [first]
+    version = base["version"]
+    assert version == len(first_shops)  # 每次收藏变更版本号 +1
+    assert _delta(db, user_id, version) == {"version": version, "full": False, "added": [], "removed": []}
+
+    assert db.add_favorite(user_id, second_shop)[0]
+    assert _delta(db, user_id, version) == {"version": version + 1, "full": False, "added": [second], "removed": []}
+
+    # 区间内先收藏后取消：按当前状态报告为移除
+    assert db.remove_favorite(user_id, second_shop)[0]
+    assert _delta(db, user_id, version) == {"version": version + 2, "full": False, "added": [], "removed": [second]}
+
+    # 同一店铺组只取消了其中一个平台的店铺：仍被收藏，报告为新增（当前状态）
+    assert db.remove_favorite(user_id, first_shops[0])[0]
+    later = _delta(db, user_id, version + 2)
+    assert later["added"] == ([first] if len(first_shops) > 1 else [])
+    assert later["removed"] == ([] if len(first_shops) > 1 else [first])
+
+    # 客户端版本号比服务端新（如库被重建）：返回全量
+    stale = _delta(db, user_id, version + 100)
+    assert stale["full"] and stale["version"] == version + 3
+
+
+def test_since_older_than_retained_window_returns_full(router, monkeypatch):
+    monkeypatch.setattr(food_price_db, "FAVORITE_CHANGES_KEEP", 2)
+    db = router.global_db
+    ok, user_id, _ = db.register_user("bob", "bob@example.com", "secret123")
+    assert ok
+    snapshot = router.shards[0].catalog.current
+    names = snapshot.group_names[:4]
+    for name in names:
+        assert db.add_favorite(user_id, snapshot.groups[name][0].shop_id)[0]
+
+    assert db.prune_favorite_changes(keep=2) > 0
+    # 版本 4，保留版本 3、4：since=2 仍可增量，since=1 早于窗口
+    assert _delta(db, user_id, 2) == {"version": 4, "full": False, "added": sorted(names[2:]), "removed": []}
+    full = _delta(db, user_id, 1)
+    assert full["full"] and full["added"] == sorted(names)
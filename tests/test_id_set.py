@@ -0,0 +1,50 @@
+import json
+import random
+import sqlite3
+
+from server.FoodPriceDB import id_set
+from server.shards import SHARD_ID_STRIDE
+
+JSON_EACH = "SELECT * FROM dishes WHERE shop_id IN (SELECT value FROM json_each(?)) ORDER BY dish_id"
+
+
+def _in_list(cursor, ids):
+    cursor.execute(f"SELECT * FROM dishes WHERE shop_id IN ({','.join('?' * len(ids))}) ORDER BY dish_id", ids)
+    return [tuple(row) for row in cursor.fetchall()]
+
+
+def test_encodes_any_iterable_as_json_integers():
+    assert id_set([3, 1, 2]) == "[3, 1, 2]"
+    assert json.loads(id_set({5})) == [5]
+    assert id_set(str(i) for i in (7, 8)) == "[7, 8]"
+    assert id_set([]) == "[]"
+
+
+def test_json_each_returns_same_rows_as_in_list(router):
+    db = router.global_db
+    cursor = db._get_thread_cursor()
+    shop_ids = list(router.shards[0].catalog.current.shops)
+    rng = random.Random(41)
+    for size in (0, 1, 10, 100, len(shop_ids)):
+        ids = rng.sample(shop_ids, size) + [max(shop_ids) + 1, -1]  # 含不存在的 ID
+        rng.shuffle(ids)
+        cursor.execute(JSON_EACH, (id_set(ids),))
+        rows = [tuple(row) for row in cursor.fetchall()]
+        assert rows == _in_list(cursor, ids), size
+        # 重复 ID 不产生重复行
+        cursor.execute(JSON_EACH, (id_set(ids + ids),))
+        assert [tuple(row) for row in cursor.fetchall()] == rows
+
+
+def test_json_each_handles_sets_beyond_variable_limit_and_large_ids():
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE t (id INTEGER PRIMARY KEY)")
+    big = [SHARD_ID_STRIDE * 3 + i for i in range(5)]
+    conn.executemany("INSERT INTO t VALUES (?)", [(i,) for i in list(range(0, 100000, 2)) + big])
+    ids = list(range(50000)) + big
+    (count,) = conn.execute("SELECT COUNT(*) FROM t WHERE id IN (SELECT value FROM json_each(?))",
+                            (id_set(ids),)).fetchone()
+    assert count == 25000 + len(big)
+    assert [row[0] for row in conn.execute(
+        "SELECT id FROM t WHERE id IN (SELECT value FROM json_each(?)) AND id > ?",
+        (id_set(big), SHARD_ID_STRIDE))] == big
@@ -0,0 +1,111 @@
+import os
+import struct
+import time
+import urllib.parse
+import zlib
+
+from server import images as images_module
+from server.images import DirectoryFetcher, ImageCache, content_etag, placeholder
+
+
+def _png(width: int = 40, height: int = 20, rgb=(200, 80, 40)) -> bytes:
+    """不依赖 Pillow 生成一张纯色 PNG"""
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+    row = b"\x00" + bytes(rgb) * width
+    return (b"\x89PNG\r\n\x1a\n"
+            + chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+            + chunk(b"IDAT", zlib.compress(row * height))
+            + chunk(b"IEND", b""))
+
+
+def _wait_idle(cache: ImageCache, timeout: float = 5.0) -> None:
+    deadline = time.time() + timeout
+    while cache.in_flight and time.time() < deadline:
+        time.sleep(0.01)
+    assert not cache.in_flight
+
+
+def _cache(tmp_path, source, **kwargs) -> ImageCache:
+    return ImageCache(str(tmp_path / "cache"), fetcher=DirectoryFetcher(str(source)), workers=1, **kwargs)
+
+
+def test_background_fetch_then_hit_and_reload(tmp_path):
+    source = tmp_path / "source"
+    source.mkdir()
+    (source / "a.png").write_bytes(_png())
+    cache = _cache(tmp_path, source)
+    url = "https://img.example.com/shops/a.png"
+
+    assert cache.lookup(url) is None
+    assert cache.request(url)
+    _wait_idle(cache)
+
+    hit = cache.lookup(url)
+    assert hit is not None
+    assert hit.content_type in ("image/png", "image/jpeg")  # 有 Pillow 时转成 JPEG 缩略图
+    assert hit.etag == content_etag(hit.read())
+    assert cache.stats()["files"] == 1
+
+    # 新进程（新实例）从磁盘恢复索引
+    reloaded = _cache(tmp_path, source)
+    again = reloaded.lookup(url)
+    assert again is not None and again.etag == hit.etag
+
+
+def test_missing_image_is_not_retried_until_backoff_expires(tmp_path):
+    source = tmp_path / "source"
+    source.mkdir()
+    cache = _cache(tmp_path, source)
+    url = "https://img.example.com/shops/missing.png"
+
+    assert cache.fetch(url) is None
+    assert cache.lookup(url) is None
+    assert not cache.request(url)  # IMAGE_RETRY_SECONDS 内不再抓取
+    assert cache.stats()["failed"] == 1
+
+    body, content_type, etag = placeholder("测试店铺")
+    assert content_type == "image/svg+xml" and b"<svg" in body and etag == content_etag(body)
+
+
+def test_lru_evicts_least_recently_used(tmp_path):
+    cache = _cache(tmp_path, tmp_path, max_bytes=250)
+    evictions = images_module.image_cache_evictions.value()
+    a = cache.store("https://x/a.png", b"a" * 100, "image/png")
+    b = cache.store("https://x/b.png", b"b" * 100, "image/png")
+    assert cache.lookup("https://x/a.png") is not None  # a 变为最近使用
+    cache.store("https://x/c.png", b"c" * 100, "image/png")
+
+    assert cache.lookup("https://x/b.png") is None
+    assert not os.path.exists(b.path)
+    assert cache.lookup("https://x/a.png").path == a.path
+    assert cache.lookup("https://x/c.png") is not None
+    assert cache.stats()["bytes"] == 200
+    assert images_module.image_cache_evictions.value() == evictions + 1
+
+
+def test_endpoint_serves_placeholder_then_thumbnail_with_etag(app_module, tmp_path, monkeypatch):
+    snapshot = app_module.router.shards[0].catalog.current
+    shop = next(s for s in snapshot.shops.values() if s.image_url)
+    source = tmp_path / "source"
+    source.mkdir()
+    (source / os.path.basename(urllib.parse.urlsplit(shop.image_url).path)).write_bytes(_png())
+    cache = _cache(tmp_path, source)
+    monkeypatch.setattr(app_module, "images", cache)
+    client = app_module.app.test_client()
+
+    first = client.get(f"/api/img/{shop.shop_id}")
+    assert first.status_code == 200
+    assert first.mimetype == "image/svg+xml"  # 抓取完成前返回占位图
+    _wait_idle(cache)
+
+    second = client.get(f"/api/img/{shop.shop_id}")
+    assert second.status_code == 200
+    assert second.mimetype in ("image/png", "image/jpeg")
+    etag = second.headers["ETag"].strip('"')
+    assert etag == content_etag(second.data)
+
+    cached = client.get(f"/api/img/{shop.shop_id}", headers={"If-None-Match": f'"{etag}"'})
+    assert cached.status_code == 304 and cached.data == b""
+
+    assert client.get("/api/img/999999999").status_code == 404
@@ -0,0 +1,114 @@
+import json
+
+import pytest
+
+from server.ingest import Ingestor, normalize_name, parse_dump
+from server.shards import ShardRouter
+
+
+def _dump(tmp_path, name, data):
+    path = tmp_path / name
+    path.write_text(json.dumps(data, ensure_ascii=False), encoding="utf-8")
+    return str(path)
+
+
+GOOD = {
+    "users": [{"username": " ｔｏｍ ", "email": "Tom@Example.com", "password": "secret123"}],
+    "shops": [
+        {"platform_name": "美团", "shop_name": "牛肉拌饭　 小馆", "rating": 4.6, "delivery_fee": "3",
+         "region": "wuhan", "latitude": 30.5, "longitude": 114.3},
+        {"platform_name": "饿了么", "shop_name": "牛肉拌饭 小馆", "rating": 4.4},
+    ],
+    "dishes": [
+        {"platform_name": "美团", "shop_name": "牛肉拌饭   小馆", "dish_name": "招牌拌饭", "price": 20},
+        {"platform_name": "美团", "shop_name": "牛肉拌饭 小馆", "dish_name": "招牌拌饭", "price": 18.5},
+        {"platform_name": "饿了么", "shop_name": "牛肉拌饭 小馆", "dish_name": "招牌拌饭", "price": 19},
+    ],
+    "coupons": [{"platform_name": "美团", "shop_name": "牛肉拌饭 小馆", "condition_amount": 30, "discount_amount": 5}],
+}
+
+
+def test_normalize_name_folds_width_and_whitespace():
+    assert normalize_name("  ＫＦＣ　（光谷店）\t ") == "KFC (光谷店)"
+    for value in ("   ", None, 12):
+        with pytest.raises(ValueError):
+            normalize_name(value)
+
+
+def test_parse_normalizes_rows_and_keeps_last_duplicate(tmp_path):
+    parsed = parse_dump(_dump(tmp_path, "good.json", GOOD))
+    assert parsed["errors"] == [] and not parsed["skipped"]
+    (username, email, password_hash), = parsed["users"]
+    assert (username, email) == ("tom", "tom@example.com") and password_hash != "secret123"
+    shops = {(row[1], row[2]): row for row in parsed["shops"]}
+    assert set(shops) == {("美团", "牛肉拌饭 小馆"), ("饿了么", "牛肉拌饭 小馆")}
+    assert shops[("美团", "牛肉拌饭 小馆")][0] == "wuhan"
+    assert shops[("美团", "牛肉拌饭 小馆")][6] == 3.0  # delivery_fee 字符串转数字
+    # 规范化后同名的菜品只保留最后一条；菜品与满减继承店铺的区域
+    assert sorted(parsed["dishes"], key=lambda row: row[1]) == [("wuhan", "美团", "牛肉拌饭 小馆", "招牌拌饭", 18.5),
+                                        (None, "饿了么", "牛肉拌饭 小馆", "招牌拌饭", 19.0)]
+    assert parsed["coupons"][0][:5] == ("wuhan", "美团", "牛肉拌饭 小馆", 30.0, 5.0)
+    assert parsed["rows"] == 1 + 2 + 2 + 1
+
+
+def test_parse_reports_row_errors_and_keeps_valid_rows(tmp_path):
+    data = {
+        "users": [{"username": "amy", "email": "amy@example.com", "password": ""}, "amy"],
+        "shops": [{"platform_name": "美团", "shop_name": "好店", "rating": 6},
+                  {"platform_name": "美团", "shop_name": "", "rating": 4},
+                  {"platform_name": "美团", "shop_name": "坐标店", "latitude": 91},
+                  {"platform_name": "美团", "shop_name": "正常店", "rating": 4.8, "monthly_sales": "abc"},
+                  {"platform_name": "美团", "shop_name": "正常店", "rating": 4.8}],
+        "dishes": [{"platform_name": "美团", "shop_name": "正常店", "dish_name": "面", "price": -1},
+                   {"platform_name": "美团", "shop_name": "正常店", "dish_name": "饭", "price": "NaN"},
+                   {"platform_name": "美团", "shop_name": "正常店", "dish_name": "粥"},
+                   {"platform_name": "美团", "shop_name": "正常店", "dish_name": "汤", "price": 8}],
+        "coupons": {"platform_name": "美团"},
+    }
+    parsed = parse_dump(_dump(tmp_path, "bad.json", data))
+    prefixes = sorted(error.split(":")[0] for error in parsed["errors"])
+    assert prefixes == ["coupons", "dishes[0]", "dishes[1]", "dishes[2]", "shops[0]", "shops[1]", "shops[2]",
+                        "shops[3]", "users[0]", "users[1]"]
+    assert [row[2] for row in parsed["shops"]] == ["正常店"]
+    assert [row[3] for row in parsed["dishes"]] == ["汤"]
+    assert parsed["users"] == [] and parsed["coupons"] == []
+
+    for name, content in (("list.json", "[]"), ("broken.json", "{")):
+        path = tmp_path / name
+        path.write_text(content)
+        failed = parse_dump(str(path))
+        assert failed["errors"][0].startswith("JSON 解析失败") and "parse_seconds" not in failed
+    assert parse_dump(str(tmp_path / "missing.json"))["errors"][0].startswith("读取失败")
+
+
+def test_unchanged_files_are_skipped_by_content_hash(db, tmp_path):
+    router = ShardRouter(db, regions=[])
+    assert router.initialize()
+    path = _dump(tmp_path, "dump.json", GOOD)
+    parsed = parse_dump(path)
+    assert parse_dump(path, known_hash=parsed["content_hash"])["skipped"]
+
+    first = Ingestor(router, workers=1)
+    assert first.run([path])
+    assert first.stats["skipped"] == 0 and first.stats["written"] > 0
+    assert db.get_ingested_hashes() == {path: parsed["content_hash"]}
+    counts = db.get_table_counts()
+    assert (counts["users"], counts["shops"], counts["dishes"], counts["coupons"]) == (1, 2, 2, 1)
+
+    again = Ingestor(router, workers=1)
+    assert again.run([path])
+    assert again.stats["skipped"] == 1 and again.stats["written"] == 0
+
+    # 内容变化后重新导入：菜品按 店铺 + 菜名 更新价格
+    changed = json.loads(json.dumps(GOOD))
+    changed["dishes"][2]["price"] = 17
+    _dump(tmp_path, "dump.json", changed)
+    third = Ingestor(router, workers=1)
+    assert third.run([path]) and third.stats["skipped"] == 0
+    assert db.get_table_counts()["dishes"] == 2
+    cursor = db._get_thread_cursor()
+    cursor.execute("SELECT price FROM dishes ORDER BY price")
+    assert [row[0] for row in cursor.fetchall()] == [17.0, 18.5]
+
+    forced = Ingestor(router, workers=1, force=True)
+    assert forced.run([path]) and forced.stats["skipped"] == 0
@@ -0,0 +1,48 @@
+import pytest
+
+from server.profiler import parse_profile_header, profiler
+
+ADMIN = {"X-Admin-Token": "test-admin-token"}
+ROUTE = "/api/restaurants/search"
+
+
+@pytest.fixture
+def client(app_module, tmp_path, monkeypatch):
+    monkeypatch.setattr(profiler, "output_dir", str(tmp_path))
+    profiler.disarm()
+    profiler.reset()
+    yield app_module.app.test_client()
+    profiler.disarm()
+    profiler.reset()
+
+
+def test_parse_profile_header():
+    assert parse_profile_header("1") == (None, None)
+    assert parse_profile_header("requests=20") == (20, None)
+    assert parse_profile_header("Seconds=1.5; requests=3") == (3, 1.5)
+    assert parse_profile_header("requests=0, seconds=abc") == (None, None)
+
+
+def test_header_arms_session_for_following_requests(client):
+    assert client.get(ROUTE, headers=dict(ADMIN, **{"X-Profile": "requests=3"})).status_code == 200
+    (session,) = profiler.status()["sessions"]
+    assert session == {"route": ROUTE, "remaining_requests": 2, "seconds_left": None}
+
+    # 后续请求不带请求头、不带令牌也被采样，直到名额用完；其他路由不受影响
+    assert client.get("/api/stats").status_code == 200
+    for _ in range(3):
+        client.get(ROUTE)
+    assert profiler.requests_profiled[ROUTE] == 3 and not profiler.requests_profiled["/api/stats"]
+    assert profiler.status()["sessions"] == []
+
+
+def test_header_without_admin_token_is_ignored(client):
+    client.get(ROUTE, headers={"X-Profile": "requests=5"})
+    client.get(ROUTE, headers={"X-Profile": "1", "X-Admin-Token": "wrong"})
+    assert profiler.status()["sessions"] == [] and not profiler.requests_profiled
+
+
+def test_plain_header_profiles_only_current_request(client):
+    client.get(ROUTE, headers=dict(ADMIN, **{"X-Profile": "1"}))
+    client.get(ROUTE)
+    assert profiler.requests_profiled[ROUTE] == 1 and profiler.status()["sessions"] == []
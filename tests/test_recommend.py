@@ -0,0 +1,106 @@
+from server.catalog import MEITUAN, ELEME, CatalogSnapshot
+from server import recommend as recommend_module
+from server.recommend import ItemSimilarity
+from server.utils import load_data
+
+
+def _load_groups(db, menus):
+    """menus: {店名: [菜名...]}，每个店铺组在两个平台各一家店"""
+    data = {"platforms": [{"platform_name": p} for p in (MEITUAN, ELEME)], "shops": [], "dishes": [], "coupons": []}
+    for name, dishes in menus.items():
+        for platform in (MEITUAN, ELEME):
+            data["shops"].append({"platform_name": platform, "shop_name": name, "rating": 4.5, "delivery_fee": 2})
+            data["dishes"].extend({"platform_name": platform, "shop_name": name, "dish_name": dish, "price": 20}
+                                  for dish in dishes)
+    assert load_data(db, data)
+    return CatalogSnapshot.build(db.db_path)
+
+
+def test_build_tolerates_groups_with_only_ubiquitous_dishes(db):
+    # "米饭" 每组都有（idf 为 0）；丙只有这一道菜，菜名特征范数为 0
+    snapshot = _load_groups(db, {
+        "甲": ["米饭", "宫保鸡丁", "鱼香肉丝"],
+        "乙": ["米饭", "宫保鸡丁", "麻婆豆腐"],
+        "丙": ["米饭"],
+    })
+    index = ItemSimilarity.build(snapshot, [], k=5)
+    assert [name for name, _ in index.neighbors_of("甲")][:1] == ["乙"]
+    assert index.recommend(["甲"], 5)[0][1] == "乙"
+
+
+def test_cofavorites_link_groups_without_shared_dishes(db):
+    snapshot = _load_groups(db, {
+        "甲": ["宫保鸡丁", "鱼香肉丝"],
+        "乙": ["牛肉拉面", "凉皮"],
+        "丙": ["寿司", "味增汤"],
+    })
+    shop = {name: snapshot.groups[name][0].shop_id for name in ("甲", "乙", "丙")}
+    assert ItemSimilarity.build(snapshot, [], k=5).neighbors_of("甲") == []
+
+    # 两个用户同时收藏了甲和乙
+    pairs = [(1, shop["甲"]), (1, shop["乙"]), (2, shop["甲"]), (2, shop["乙"]), (3, shop["丙"])]
+    index = ItemSimilarity.build(snapshot, pairs, k=5)
+    assert [name for name, _ in index.neighbors_of("甲")] == ["乙"]
+    assert [name for name, _ in index.neighbors_of("丙")] == []
+    assert index.recommend(["甲"], 5) == [(round(index.neighbors_of("甲")[0][1], 4), "乙")]
+
+
+def test_neighbors_are_top_k_by_score(router):
+    snapshot = router.shards[0].catalog.current
+    index = router.shards[0].recommender.rebuild(snapshot)
+    assert index.generation == snapshot.generation
+    linked = 0
+    for name in snapshot.group_names:
+        neighbors = index.neighbors_of(name)
+        assert len(neighbors) <= router.shards[0].recommender.k
+        assert name not in [other for other, _ in neighbors]
+        scores = [score for _, score in neighbors]
+        assert scores == sorted(scores, reverse=True)
+        linked += bool(neighbors)
+    assert linked > len(snapshot.group_names) // 2
+
+
+def test_recommend_merges_neighbor_lists_and_excludes_favorites(router):
+    snapshot = router.shards[0].catalog.current
+    index = router.shards[0].recommender.rebuild(snapshot)
+    favorites = [name for name in snapshot.group_names if index.neighbors_of(name)][:3]
+
+    expected = {}
+    for name in favorites:
+        for other, score in index.neighbors_of(name):
+            expected[other] = expected.get(other, 0.0) + score
+    for name in favorites:
+        expected.pop(name, None)
+
+    result = index.recommend(favorites, 10)
+    assert len(result) == min(10, len(expected))
+    assert not set(favorites) & {name for _, name in result}
+    for score, name in result:
+        assert abs(score - expected[name]) < 1e-3
+    assert [score for score, _ in result] == sorted((score for score, _ in result), reverse=True)
+    # 没进结果的候选分数都不高于结果中的最低分
+    assert max((s for n, s in expected.items() if n not in {name for _, name in result}), default=0) \
+        <= result[-1][0] + 1e-3
+
+
+def test_home_feed_personalized_then_popular_fallback(router):
+    shard = router.shards[0]
+    snapshot = shard.catalog.current
+    shard.recommender.rebuild(snapshot)
+    counter = recommend_module.recommend_requests
+
+    fallback = counter.value(result="fallback")
+    cards, missing = router.home_feed(6, router.shards, set())
+    assert missing == [] and len(cards) == 6
+    assert len({card["name"] for card in cards}) == 6
+    assert counter.value(result="fallback") == fallback + 1
+
+    favorite = next(name for name in snapshot.group_names if shard.recommender.current.neighbors_of(name))
+    favorite_ids = {shop.shop_id for shop in snapshot.groups[favorite]}
+    expected = [name for _, name in shard.recommender.recommend(snapshot, favorite_ids, 6)]
+    personal = counter.value(result="personal")
+    cards, _ = router.home_feed(6, router.shards, favorite_ids)
+    assert len(cards) == 6
+    assert [card["name"] for card in cards[:len(expected)]] == expected
+    assert favorite not in expected
+    assert counter.value(result="personal") == personal + 1
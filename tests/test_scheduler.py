@@ -0,0 +1,129 @@
+import threading
+import time
+
+import pytest
+
+from server import scheduler as scheduler_module
+from server.scheduler import LOCAL, Scheduler
+
+
+def _wait_until(predicate, timeout=5.0):
+    deadline = time.time() + timeout
+    while not predicate():
+        if time.time() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+@pytest.fixture
+def schedulers(db, monkeypatch):
+    """同一个库上的两个调度器（模拟两个进程），测试结束时停止"""
+    monkeypatch.setattr(scheduler_module, "SCHEDULER_ENABLED", True)  # conftest 默认关闭调度
+    created = []
+
+    def make(worker_id, **kwargs):
+        scheduler = Scheduler(db, tick=0.05, **kwargs)
+        scheduler.worker_id = worker_id
+        created.append(scheduler)
+        return scheduler
+
+    yield make
+    for scheduler in created:
+        scheduler.stop()
+
+
+def test_lease_claimed_by_one_worker_until_released_or_expired(db):
+    now = time.time()
+    db.register_job("sweep", None, None)
+    assert not db.claim_job("sweep", "A", now, 10)  # 未到期
+    db.request_job("sweep", now)
+    assert db.claim_job("sweep", "A", now, 10)
+    assert not db.claim_job("sweep", "B", now + 1, 10)  # 租约未过期
+    assert db.get_jobs()[0]["locked_by"] == "A"
+
+    # 持有者崩溃、租约过期后其他进程可以接手
+    assert db.claim_job("sweep", "B", now + 11, 10)
+    db.finish_job("sweep", "B", now + 11, 0.1, "ok", None, None, release=True, history=10)
+    job = db.get_jobs()[0]
+    assert job["locked_by"] is None and job["last_status"] == "ok"
+    assert not db.claim_job("sweep", "A", now + 12, 10)  # 只按需运行的任务释放后不再到期
+
+
+def test_global_job_never_overlaps_across_workers(schedulers, db):
+    lock = threading.Lock()
+    state = {"running": 0, "max": 0, "runs": 0}
+
+    def sweep():
+        with lock:
+            state["running"] += 1
+            state["max"] = max(state["max"], state["running"])
+        time.sleep(0.15)
+        with lock:
+            state["running"] -= 1
+            state["runs"] += 1
+
+    workers = [schedulers("A"), schedulers("B")]
+    for scheduler in workers:
+        scheduler.register("sweep", sweep, interval=0.1, jitter=0.0)
+        scheduler.start()
+    assert _wait_until(lambda: state["runs"] >= 4)
+    for scheduler in workers:
+        scheduler.stop()
+    assert state["max"] == 1
+    history = db.get_job_runs("sweep", 100)
+    assert len(history) == state["runs"]
+    assert {run["worker"] for run in history} <= {"A", "B"}
+    starts = sorted((run["started_at"], run["started_at"] + run["duration"]) for run in history)
+    assert all(end <= next_start + 0.01 for (_, end), (next_start, _) in zip(starts, starts[1:]))
+
+
+@pytest.mark.parametrize("scope", ["global", LOCAL])
+def test_trigger_during_run_reruns_once(schedulers, scope):
+    started, release = threading.Event(), threading.Event()
+    runs = []
+
+    def job():
+        runs.append(time.time())
+        started.set()
+        release.wait(5)
+
+    first, second = schedulers("A"), schedulers("B")
+    for scheduler in (first, second):
+        scheduler.register("once", job, scope=scope)
+        scheduler.start()
+    assert first.trigger("once")
+    assert started.wait(5)
+    # 运行期间的多次触发合并为一次补跑；全局任务的触发可以来自另一个进程
+    other = second if scope == "global" else first
+    assert other.trigger("once") and other.trigger("once")
+    time.sleep(0.3)
+    assert len(runs) == 1
+    release.set()
+    assert _wait_until(lambda: len(runs) == 2)
+    time.sleep(0.3)
+    assert len(runs) == 2
+    assert not first.trigger("missing")
+
+
+def test_failures_are_recorded_and_history_trimmed(schedulers, db):
+    calls = []
+
+    def flaky():
+        calls.append(1)
+        if len(calls) % 2:
+            raise RuntimeError("上游超时")
+        return f"第 {len(calls)} 次成功"
+
+    scheduler = schedulers("A", keep_history=3)
+    scheduler.register("flaky", flaky, interval=0.05, jitter=0.0)
+    scheduler.start()
+    assert _wait_until(lambda: len(calls) >= 5 and scheduler.status()[0]["last_run"] is not None)
+    scheduler.stop()
+    history = scheduler.history("flaky")
+    assert len(history) == 3
+    statuses = {run["status"] for run in history}
+    assert statuses == {"ok", "error"}
+    error = next(run for run in history if run["status"] == "error")
+    assert "上游超时" in error["message"] and "Traceback" in error["message"]
+    assert scheduler.status()[0]["scope"] == "global"
@@ -0,0 +1,74 @@
+import threading
+import time
+
+from server import shards as shards_module
+
+
+def test_table_counts_sum_catalog_tables_over_shards(sharded):
+    ok, user_id, _ = sharded.global_db.register_user("carol", "carol@example.com", "secret123")
+    assert ok
+    shop_id = next(iter(sharded.shards[0].catalog.current.shops))
+    assert sharded.global_db.add_favorite(user_id, shop_id)[0]
+
+    counts = sharded.table_counts()
+    # 全局库的 shops 只是目录：店铺数按分片计，不重复
+    assert counts["shops"] == sharded.shop_count() == 10
+    assert counts["dishes"] == 20 and counts["coupons"] == 10
+    assert counts["users"] == 1 and counts["user_favorites"] == 1
+    assert sharded.global_db.get_table_counts().get("dishes", 0) == 0
+
+
+def test_shards_get_disjoint_id_ranges_and_global_directory(sharded):
+    wuhan, beijing = sharded.shards
+    assert {shop.shop_name for shop in wuhan.catalog.current.shops.values()} == {f"wuhan店{i:02d}" for i in range(3)}
+    assert min(beijing.catalog.current.shops) > max(wuhan.catalog.current.shops)
+    shop_ids = list(wuhan.catalog.current.shops) + list(beijing.catalog.current.shops)
+    regions = sharded.global_db.get_shop_regions(shop_ids)
+    assert regions == {shop_id: shard.region for shard in sharded.shards for shop_id in shard.catalog.current.shops}
+
+
+def test_scatter_merges_results_across_shards(sharded):
+    assert sharded.select(None) == sharded.shards
+    assert sharded.select("beijing") == [sharded.shards[1]]
+    assert sharded.select("shanghai") is None
+
+    cards, missing = sharded.search("店", sharded.shards, set())
+    names = [card["name"] for card in cards]
+    assert missing == [] and len(names) == 5 and names == sorted(names)
+    cards, _ = sharded.search("店", sharded.select("beijing"), set())
+    assert [card["name"] for card in cards] == ["beijing店00", "beijing店01"]
+
+    rows, missing = sharded.compare_dish_price("米饭", None, sharded.shards)
+    prices = [row["final_price"] for row in rows]
+    assert missing == [] and len(rows) == 10 and prices == sorted(prices)
+
+
+def test_scatter_returns_partial_results_on_timeout_and_error(sharded):
+    failures = shards_module.shard_failures
+    timeouts = failures.value(region="wuhan", reason="timeout")
+    release = threading.Event()
+
+    def slow_wuhan(shard):
+        if shard.region == "wuhan":
+            release.wait(5)
+        return shard.region
+
+    start = time.perf_counter()
+    results, missing = sharded.scatter(slow_wuhan, timeout=0.1)
+    assert time.perf_counter() - start < 2
+    release.set()
+    assert [(shard.region, result) for shard, result in results] == [("beijing", "beijing")]
+    assert missing == ["wuhan"]
+    assert failures.value(region="wuhan", reason="timeout") == timeouts + 1
+
+    errors = failures.value(region="beijing", reason="error")
+
+    def broken_beijing(shard):
+        if shard.region == "beijing":
+            raise RuntimeError("磁盘错误")
+        return len(shard.catalog.current.group_names)
+
+    results, missing = sharded.scatter(broken_beijing)
+    assert [(shard.region, result) for shard, result in results] == [("wuhan", 3)]
+    assert missing == ["beijing"]
+    assert failures.value(region="beijing", reason="error") == errors + 1
@@ -0,0 +1,82 @@
+import threading
+
+import pytest
+
+from server.FoodPriceDB import FoodPriceDB
+from server.sqlite_tuning import SqliteTuning
+
+TUNED = dict(cache_size=-4096, mmap_size=1 << 20, temp_store="memory", synchronous="normal",
+             journal_mode="wal", auto_vacuum="incremental", busy_timeout_ms=1234)
+
+
+@pytest.fixture
+def tuned_db(tmp_path):
+    db = FoodPriceDB(SqliteTuning(**TUNED))
+    assert db.initialize(str(tmp_path / "tuned.db"))
+    return db
+
+
+def _pragmas(conn):
+    names = ("cache_size", "mmap_size", "temp_store", "synchronous", "journal_mode", "auto_vacuum", "busy_timeout")
+    return {name: conn.execute(f"PRAGMA {name}").fetchone()[0] for name in names}
+
+
+def test_pragmas_apply_to_every_connection(tuned_db):
+    expected = {"cache_size": -4096, "mmap_size": 1 << 20, "temp_store": 2, "synchronous": 1,
+                "journal_mode": "wal", "auto_vacuum": 2, "busy_timeout": 1234}
+    assert _pragmas(tuned_db._get_thread_connection()) == expected
+    seen = []
+    thread = threading.Thread(target=lambda: seen.append(_pragmas(tuned_db._get_thread_connection())))
+    thread.start()
+    thread.join()
+    assert seen == [expected]
+
+    # 未设置的项保持 SQLite 默认值
+    plain = FoodPriceDB(SqliteTuning())
+    assert plain.initialize(tuned_db.db_path.replace("tuned", "plain"))
+    defaults = _pragmas(plain._get_thread_connection())
+    assert defaults["cache_size"] == -2000 and defaults["temp_store"] == 0 and defaults["auto_vacuum"] == 0
+
+
+def test_invalid_settings_are_rejected_or_ignored(monkeypatch):
+    with pytest.raises(ValueError):
+        SqliteTuning(journal_mode="fast")
+    monkeypatch.setenv("SQLITE_CACHE_SIZE", "lots")
+    monkeypatch.setenv("SQLITE_SYNCHRONOUS", "sometimes")
+    monkeypatch.setenv("SQLITE_MMAP_SIZE", "4096")
+    monkeypatch.setenv("SQLITE_JOURNAL_MODE", "WAL")
+    tuning = SqliteTuning.from_env().to_dict()
+    assert tuning["cache_size"] is None and tuning["synchronous"] is None
+    assert tuning["mmap_size"] == 4096 and tuning["journal_mode"] == "wal"
+
+
+def test_storage_stats_and_incremental_vacuum(tuned_db):
+    stats = tuned_db.storage_stats()
+    assert stats["path"] == tuned_db.db_path
+    assert stats["database_bytes"] == stats["page_count"] * stats["page_size"] == stats["file_bytes"]
+    assert (stats["journal_mode"], stats["auto_vacuum"], stats["synchronous"]) == ("wal", "incremental", "normal")
+    assert stats["cache_size"] == -4096 and stats["tuning"] == TUNED
+    if stats["objects"] is not None:  # SQLite 编译时未启用 dbstat 时为 None
+        objects = {obj["name"]: obj for obj in stats["objects"]}
+        assert objects["dishes"]["type"] == "table"
+        assert all(obj["pages"] >= 1 and obj["bytes"] >= obj["unused_bytes"] for obj in objects.values())
+    assert "objects" not in tuned_db.storage_stats(objects=False)
+    cache = stats["page_cache"]
+    if cache is not None:  # 非 CPython 等情况下读不到 sqlite3_db_status
+        assert cache["connections"] >= 1 and cache["hits"] + cache["misses"] > 0
+
+    def fill_and_clear():
+        cursor = tuned_db._get_thread_cursor()
+        cursor.execute("CREATE TABLE filler (blob BLOB)")
+        cursor.executemany("INSERT INTO filler VALUES (?)", [(b"x" * 4000,) for _ in range(200)])
+        cursor.execute("DROP TABLE filler")
+
+    tuned_db._write(fill_and_clear)
+    freed = tuned_db.storage_stats(objects=False)["freelist_count"]
+    assert freed > 100
+    result = tuned_db.maintain(optimize=False, vacuum_pages=50)
+    assert result["vacuumed_pages"] == 50
+    assert tuned_db.storage_stats(objects=False)["freelist_count"] == freed - 50
+    # ANALYZE 建 sqlite_stat1 会用掉空闲页，之后的增量 VACUUM 归还剩余全部空闲页
+    assert tuned_db.maintain(analyze=True, vacuum_pages=1000)["vacuumed_pages"] > 0
+    assert tuned_db.storage_stats(objects=False)["freelist_count"] == 0
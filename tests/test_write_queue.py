@@ -0,0 +1,99 @@
+import os
+import threading
+from concurrent.futures import TimeoutError
+
+import pytest
+
+from server import write_queue
+
+
+class _Abort(BaseException):
+    pass
+
+
+def _insert(db, value, fail=None):
+    def operation():
+        db._get_thread_cursor().execute("INSERT INTO t (x) VALUES (?)", (value,))
+        if fail is not None:
+            raise fail
+        return value
+    return operation
+
+
+def _values(db):
+    cursor = db._get_thread_cursor()
+    cursor.execute("SELECT x FROM t ORDER BY x")
+    return [row[0] for row in cursor.fetchall()]
+
+
+@pytest.fixture
+def queue_db(db):
+    db._write(lambda: db._get_thread_cursor().execute("CREATE TABLE t (x INTEGER UNIQUE)"))
+    return db
+
+
+def _blocked(db):
+    """占住写线程，直到返回的 Event 被 set；期间提交的操作会合并成同一批"""
+    started, release = threading.Event(), threading.Event()
+
+    def block():
+        started.set()
+        release.wait(5)
+
+    future = db.writes.submit(block)
+    assert started.wait(5)
+    return future, release
+
+
+def test_failed_op_rolls_back_only_itself(queue_db):
+    label = os.path.basename(queue_db.db_path)
+    _, batch_sum, batch_count = write_queue.write_batch_size.snapshot(db=label)
+    blocker, release = _blocked(queue_db)
+    futures = [queue_db.writes.submit(_insert(queue_db, 1)),
+               queue_db.writes.submit(_insert(queue_db, 2, fail=ValueError("坏数据"))),
+               queue_db.writes.submit(_insert(queue_db, 1)),  # 违反唯一约束
+               queue_db.writes.submit(_insert(queue_db, 3))]
+    release.set()
+    blocker.result(5)
+
+    assert futures[0].result(5) == 1 and futures[3].result(5) == 3
+    with pytest.raises(ValueError):
+        futures[1].result(5)
+    with pytest.raises(Exception, match="UNIQUE"):
+        futures[2].result(5)
+    assert _values(queue_db) == [1, 3]
+    # 阻塞操作单独一批，其余 4 个合并成一批提交
+    _, new_sum, new_count = write_queue.write_batch_size.snapshot(db=label)
+    assert (new_sum - batch_sum, new_count - batch_count) == (5, 2)
+
+
+def test_writer_survives_base_exception(queue_db):
+    blocker, release = _blocked(queue_db)
+    ok = queue_db.writes.submit(_insert(queue_db, 1))
+    aborted = queue_db.writes.submit(_insert(queue_db, 2, fail=_Abort()))
+    release.set()
+    blocker.result(5)
+    # BaseException 使整批失败并回滚，写线程继续处理后续操作
+    with pytest.raises(_Abort):
+        aborted.result(5)
+    assert ok.exception(5) is not None
+    assert _values(queue_db) == []
+    assert queue_db._write(_insert(queue_db, 4)) == 4
+    assert _values(queue_db) == [4]
+
+
+def test_nested_write_runs_in_same_batch_and_run_times_out(queue_db):
+    def outer():
+        inner = queue_db.writes.submit(_insert(queue_db, 5))
+        return inner.result(0) + 1
+
+    assert queue_db._write(outer) == 6
+    assert _values(queue_db) == [5]
+
+    blocker, release = _blocked(queue_db)
+    with pytest.raises(TimeoutError):
+        queue_db.writes.run(_insert(queue_db, 6), timeout=0.05)
+    release.set()
+    blocker.result(5)
+    assert queue_db._write(lambda: None) is None
+    assert _values(queue_db) == [5, 6]  # 超时只影响等待，操作仍会执行